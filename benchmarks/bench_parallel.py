@@ -0,0 +1,55 @@
+"""
+Benchmark serial vs. parallel item rendering for a large exam.
+
+Usage:
+    python benchmarks/bench_parallel.py [--questions N] [--workers 1,2,4]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from markdown_to_qti.parser import parse_markdown_exam  # noqa: E402
+from markdown_to_qti.qti_generator import generate_qti_assessment  # noqa: E402
+
+
+def build_exam(count: int) -> str:
+    """Build a synthetic exam with a code block in every stem."""
+    blocks = []
+    for i in range(1, count + 1):
+        blocks.append(
+            f"{i}. What does this print?\n\n"
+            "```python\n"
+            + "".join(f"x_{j} = {i} * {j}  # <{j}>\n" for j in range(20))
+            + "print(x_0)\n"
+            "```\n\n"
+            f"*a. `{i}`\n"
+            "b. `0`\n"
+            "c. Error\n"
+            "d. None\n"
+        )
+    return "\n".join(blocks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--questions', type=int, default=5000)
+    parser.add_argument('--workers', type=str, default='1,2,4')
+    args = parser.parse_args()
+    
+    questions = parse_markdown_exam(build_exam(args.questions))
+    print(f"{len(questions)} questions")
+    
+    baseline = None
+    for workers in (int(w) for w in args.workers.split(',')):
+        start = time.perf_counter()
+        generate_qti_assessment(questions, "Benchmark", "bench", workers=workers)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(f"workers={workers:<3} {elapsed:8.3f}s  speedup={baseline / elapsed:5.2f}x")
+
+
+if __name__ == '__main__':
+    main()
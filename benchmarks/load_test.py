@@ -0,0 +1,386 @@
+"""
+Load-test conversions followed by uploads to a local stand-in for Canvas.
+
+Each of --exams exam files is converted to a package and imported through
+a mock of Canvas's content migration API, with --concurrency pipelines
+running at a time. With --mode api the conversions call the package
+writers in worker processes; with --mode cli each runs the
+markdown-to-qti command in its own process.
+
+The mock runs in a separate process and follows the calls a Canvas
+import makes: a content migration is created with a pre_attachment, the
+package is uploaded to the returned upload_url, and the migration is
+polled until it completes. An upload is unzipped, checked against its
+CRCs, and every XML file the manifest lists is parsed and its items
+counted, as Canvas does before importing. Unlike Canvas, the mock takes
+the package as the raw request body rather than as multipart form data,
+and imports it before answering the upload.
+
+The report gives the throughput, the 50th, 90th and 99th percentile and
+the maximum latency of the conversion, the upload and import, and the
+whole pipeline, and the peak resident memory of the converter processes
+and the mock. Memory is measured with the resource module, so this runs
+on Unix only.
+
+Usage:
+    python benchmarks/load_test.py [--exams N] [--questions N] [--concurrency N]
+                                   [--mode api|cli] [--format qti12|qti21]
+                                   [--exam PATH] [--json]
+"""
+import argparse
+import io
+import json
+import math
+import multiprocessing
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.etree.ElementTree import ParseError, fromstring
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC)
+
+from markdown_to_qti.parser import parse_markdown_exam  # noqa: E402
+from markdown_to_qti.plugins import get_package_writer  # noqa: E402
+from markdown_to_qti.sinks import run_pipeline  # noqa: E402
+
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+RSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+COURSE_ID = 1
+
+# Latency percentiles reported
+PERCENTILES = (50, 90, 99)
+
+STAGES = ('convert', 'import', 'total')
+
+
+def build_exam(number: int, count: int) -> str:
+    """Build a synthetic exam with code, math and a question group."""
+    blocks = []
+    for i in range(1, count + 1):
+        if i == count // 2:
+            blocks.append("## Group: Variants (pick 1, 2 points)\n")
+        if i % 3 == 0:
+            blocks.append(
+                f"{i}. What does this print in exam {number}?\n\n"
+                "```python\n"
+                + "".join(f"x_{j} = {i} * {j}  # <{j}>\n" for j in range(10))
+                + "print(x_0)\n"
+                "```\n\n"
+                f"*a. `0`\nb. `{i}`\nc. Error\nd. None\n"
+            )
+        elif i % 3 == 1:
+            blocks.append(
+                f"{i}. Solve $x^2 = {i * i}$ for $x > 0$ (exam {number}).\n\n"
+                f"a. $x = {i + 1}$\n*b. $x = {i}$\nc. $x = \\sqrt{{{i}}}$\n"
+            )
+        else:
+            blocks.append(
+                f"{i}. Which **keyword** defines a function in exam {number}?\n\n"
+                "a. `function`\n*b. `def`\nc. `fun`\nd. `lambda`\n"
+            )
+        if i == count // 2 + 2:
+            blocks.append("## End group\n")
+    return "\n".join(blocks)
+
+
+# Mock Canvas
+
+def _local(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1]
+
+
+def import_package(data: bytes) -> int:
+    """
+    Unzip and parse a package as a Canvas import would.
+    
+    Returns:
+        The number of items in the package.
+    
+    Raises:
+        ValueError: If the package cannot be imported.
+    """
+    try:
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            damaged = zf.testzip()
+            if damaged is not None:
+                raise ValueError(f"{damaged} is damaged")
+            manifest = fromstring(zf.read('imsmanifest.xml'))
+            hrefs = {elem.get('href') for elem in manifest.iter() if _local(elem.tag) == 'file'}
+            if not hrefs:
+                raise ValueError("the manifest lists no files")
+            items = 0
+            for href in sorted(hrefs):
+                root = fromstring(zf.read(href))
+                items += sum(1 for elem in root.iter()
+                             if _local(elem.tag) in ('item', 'assessmentItem'))
+            return items
+    except (zipfile.BadZipFile, KeyError, ParseError) as e:
+        raise ValueError(f"cannot read the package: {e}")
+
+
+class MockCanvasHandler(BaseHTTPRequestHandler):
+    """The content migration calls of a Canvas QTI import."""
+    
+    migrations = {}
+    lock = threading.Lock()
+    
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        match = re.fullmatch(r'/api/v1/courses/(\d+)/content_migrations', self.path)
+        if match:
+            request = json.loads(body or b'{}')
+            if request.get('migration_type') != 'qti_converter':
+                self._send(400, {'message': 'migration_type must be qti_converter'})
+                return
+            with self.lock:
+                migration_id = len(self.migrations) + 1
+                migration = {'id': migration_id, 'migration_type': 'qti_converter',
+                             'workflow_state': 'pre_processing', 'migration_issues': []}
+                self.migrations[migration_id] = migration
+            host, port = self.server.server_address[:2]
+            self._send(200, dict(migration, pre_attachment={
+                'upload_url': f"http://{host}:{port}/files_api/migrations/{migration_id}",
+                'upload_params': {'filename': request.get('pre_attachment', {}).get('name')},
+            }))
+            return
+        match = re.fullmatch(r'/files_api/migrations/(\d+)', self.path)
+        migration = match and self.migrations.get(int(match.group(1)))
+        if not migration:
+            self._send(404, {'message': 'not found'})
+            return
+        migration['workflow_state'] = 'running'
+        try:
+            migration['imported_items'] = import_package(body)
+            migration['workflow_state'] = 'completed'
+        except ValueError as e:
+            migration['migration_issues'].append(str(e))
+            migration['workflow_state'] = 'failed'
+        self._send(201, {'id': migration['id'], 'size': len(body)})
+    
+    def do_GET(self):
+        if self.path == '/stats':
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            self._send(200, {'migrations': len(self.migrations),
+                             'peak_rss': usage.ru_maxrss * RSS_UNIT})
+            return
+        match = re.fullmatch(r'/api/v1/courses/(\d+)/content_migrations/(\d+)', self.path)
+        migration = match and self.migrations.get(int(match.group(2)))
+        if not migration:
+            self._send(404, {'message': 'not found'})
+            return
+        self._send(200, migration)
+    
+    def _send(self, status: int, body: dict):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+def _serve(ports):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockCanvasHandler)
+    ports.put(server.server_address[1])
+    server.serve_forever()
+
+
+def start_mock_canvas() -> tuple:
+    """Start the mock in its own process; return the process and its URL."""
+    ports = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=(ports,), daemon=True)
+    process.start()
+    return process, f"http://127.0.0.1:{ports.get(timeout=30)}"
+
+
+# Pipeline
+
+def _request(url: str, data: bytes = None, content_type: str = 'application/json') -> dict:
+    request = urllib.request.Request(url, data=data, method='GET' if data is None else 'POST')
+    if data is not None:
+        request.add_header('Content-Type', content_type)
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def upload(canvas: str, path: str) -> dict:
+    """Import a package through the mock's content migration calls."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    migrations = f"{canvas}/api/v1/courses/{COURSE_ID}/content_migrations"
+    migration = _request(migrations, json.dumps({
+        'migration_type': 'qti_converter',
+        'pre_attachment': {'name': os.path.basename(path), 'size': len(data)},
+    }).encode('utf-8'))
+    _request(migration['pre_attachment']['upload_url'], data, 'application/zip')
+    while True:
+        migration = _request(f"{migrations}/{migration['id']}")
+        if migration['workflow_state'] in ('completed', 'failed'):
+            return migration
+        time.sleep(0.01)
+
+
+def convert_api(exam: str, output: str, format: str) -> int:
+    """Convert through the package writer API; return this process's peak RSS."""
+    with open(exam, encoding='utf-8') as f:
+        questions = parse_markdown_exam(f.read())
+    run_pipeline(questions, [get_package_writer(format)(output, "Load test")])
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * RSS_UNIT
+
+
+def convert_cli(exam: str, output: str, format: str) -> int:
+    """Convert with the command in a new process; return its peak RSS."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        filter(None, [SRC, os.environ.get('PYTHONPATH')])))
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'markdown_to_qti.cli', exam, '-o', output, '--format', format],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    errors = process.stderr.read()
+    process.stderr.close()
+    # wait4 gives the process's own resource usage
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -1
+    if process.returncode:
+        lines = errors.decode('utf-8', 'replace').strip().splitlines()
+        raise RuntimeError(lines[-1] if lines else f"exit status {process.returncode}")
+    return usage.ru_maxrss * RSS_UNIT
+
+
+def run_one(mode: str, exam: str, output: str, format: str, canvas: str) -> dict:
+    """Convert one exam and import it, timing each stage."""
+    start = time.perf_counter()
+    try:
+        convert = convert_api if mode == 'api' else convert_cli
+        rss = convert(exam, output, format)
+        converted = time.perf_counter()
+        migration = upload(canvas, output)
+    except Exception as e:
+        return {'error': f"{type(e).__name__}: {e}"}
+    done = time.perf_counter()
+    if migration['workflow_state'] != 'completed':
+        return {'error': '; '.join(migration['migration_issues'])}
+    return {'convert': converted - start, 'import': done - converted, 'total': done - start,
+            'rss': rss, 'items': migration['imported_items'], 'bytes': os.path.getsize(output)}
+
+
+def percentile(values: list, p: float) -> float:
+    """Return the nearest-rank percentile of sorted values."""
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def summarize(results: list, wall: float) -> dict:
+    """Summarize the pipelines' results."""
+    done = [result for result in results if 'error' not in result]
+    summary = {
+        'pipelines': len(results),
+        'completed': len(done),
+        'failed': len(results) - len(done),
+        'errors': sorted({result['error'] for result in results if 'error' in result}),
+        'wall_seconds': wall,
+        'exams_per_second': len(done) / wall,
+        'items_per_second': sum(result['items'] for result in done) / wall,
+        'megabytes_per_second': sum(result['bytes'] for result in done) / wall / 1024 ** 2,
+        'latency': {},
+        'converter_peak_rss': max((result['rss'] for result in done), default=0),
+    }
+    for stage in STAGES:
+        values = sorted(result[stage] for result in done)
+        if values:
+            summary['latency'][stage] = dict(
+                {f"p{p}": percentile(values, p) for p in PERCENTILES}, max=values[-1])
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split('\n\n')[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--exams', type=int, default=100, help='number of pipelines (default: 100)')
+    parser.add_argument('--questions', type=int, default=50,
+                        help='questions per generated exam (default: 50)')
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help='pipelines running at a time (default: 4)')
+    parser.add_argument('--mode', choices=['api', 'cli'], default='api',
+                        help='convert through the API in worker processes, or with the command')
+    parser.add_argument('--format', type=str, default='qti12',
+                        help='package writer plugin (default: qti12)')
+    parser.add_argument('--exam', type=str, default=None,
+                        help='convert this exam file every time instead of generated exams')
+    parser.add_argument('--json', action='store_true', help='print the summary as JSON')
+    args = parser.parse_args()
+    if args.exams < 1 or args.concurrency < 1:
+        parser.error("--exams and --concurrency must be at least 1")
+    
+    with tempfile.TemporaryDirectory(prefix='markdown-to-qti-load-') as scratch:
+        exams = []
+        for number in range(args.exams):
+            if args.exam:
+                exams.append(os.path.abspath(args.exam))
+                continue
+            path = os.path.join(scratch, f"exam{number:05d}.md")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(build_exam(number, args.questions))
+            exams.append(path)
+        
+        process, canvas = start_mock_canvas()
+        # Worker processes convert through the API; for the command, threads
+        # wait on the processes it runs
+        pool = ProcessPoolExecutor if args.mode == 'api' else ThreadPoolExecutor
+        try:
+            start = time.perf_counter()
+            with pool(max_workers=args.concurrency) as executor:
+                futures = [
+                    executor.submit(run_one, args.mode, exam,
+                                    os.path.join(scratch, f"exam{number:05d}.zip"),
+                                    args.format, canvas)
+                    for number, exam in enumerate(exams)
+                ]
+                results = [future.result() for future in as_completed(futures)]
+            wall = time.perf_counter() - start
+            stats = _request(f"{canvas}/stats")
+        finally:
+            process.terminate()
+            process.join()
+    
+    summary = summarize(results, wall)
+    summary.update(mode=args.mode, format=args.format, concurrency=args.concurrency,
+                   mock_canvas_peak_rss=stats['peak_rss'])
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return 1 if summary['failed'] else 0
+    
+    print(f"{summary['pipelines']} pipeline(s), {args.mode} mode, {args.format}, "
+          f"concurrency {args.concurrency}: {summary['completed']} imported, "
+          f"{summary['failed']} failed")
+    for error in summary['errors']:
+        print(f"  error: {error}")
+    print(f"wall {wall:.2f}s  {summary['exams_per_second']:.2f} exams/s  "
+          f"{summary['items_per_second']:.0f} items/s  "
+          f"{summary['megabytes_per_second']:.2f} MiB/s")
+    print(f"{'latency (s)':<14}" + ''.join(f"{name:>9}" for name in
+                                           [f"p{p}" for p in PERCENTILES] + ['max']))
+    for stage, values in summary['latency'].items():
+        print(f"  {stage:<12}" + ''.join(f"{value:9.3f}" for value in values.values()))
+    print(f"peak RSS  converter {summary['converter_peak_rss'] / 1024 ** 2:.1f} MiB  "
+          f"mock Canvas {stats['peak_rss'] / 1024 ** 2:.1f} MiB")
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
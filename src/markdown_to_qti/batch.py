@@ -0,0 +1,382 @@
+"""
+Resumable conversion of many exam files.
+
+`markdown-to-qti batch` converts each input to a package in an output
+directory. As each package is completed, a line is appended to a journal
+with the hashes of its source and package and the options it was written
+with. A restarted run reads the journal and redoes only what is missing:
+
+- an input whose source, options and package match its journal entry is
+  skipped
+- a package without a journal entry, e.g. one renamed into place just
+  before a crash, is kept if its record shows it was written from the
+  same source with the same options and it verifies against the source's
+  questions, and journaled
+- anything else is converted again
+
+Packages are written under a temporary name and renamed into place, so an
+interrupted run never leaves a truncated package behind, and a journal
+line torn by a crash is ignored. Before the rename, the hashes and
+options are recorded next to the package in a hidden file, removed once
+the package is journaled; a package without one, such as one written by
+another command, is never adopted. One run at a time may use a journal.
+"""
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .parser import parse_markdown_exam
+from .plugins import DEFAULT_PACKAGE_WRITER, get_emitter, get_package_writer, get_renderer
+from .qti_generator import atomic_write
+from .sinks import run_pipeline
+from .verify import verify_package
+
+# Journal file name used when none is given, in the output directory
+JOURNAL_NAME = 'batch-journal.jsonl'
+
+# Bytes read at a time when hashing a file
+_CHUNK_SIZE = 1 << 20
+
+# Outcomes of converting one input
+CONVERTED = 'converted'
+VERIFIED = 'verified'
+
+
+@dataclass
+class BatchReport:
+    """What a batch run did with each input, by source path."""
+    converted: List[str] = field(default_factory=list)
+    skipped: List[str] = field(default_factory=list)
+    verified: List[str] = field(default_factory=list)
+    failed: List[Tuple[str, str]] = field(default_factory=list)
+
+
+def file_digest(path) -> str:
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_journal(path) -> Dict[str, dict]:
+    """
+    Read a batch journal.
+    
+    Args:
+        path: Path of the journal; a missing journal is empty.
+    
+    Returns:
+        The latest entry for each source path. Lines that are not complete
+        entries, such as one cut short by a crash, are ignored.
+    """
+    entries = {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    entries[entry['source']] = entry
+                except (ValueError, TypeError, KeyError):
+                    continue
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+class _Journal:
+    """An append-only journal, each entry synced to disk as it is written."""
+    
+    def __init__(self, path):
+        self._file = open(path, 'a', encoding='utf-8')
+        # Start on a new line after a line torn by a crash
+        if self._file.tell() and not _ends_with_newline(path):
+            self._file.write('\n')
+    
+    def append(self, entry: dict):
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+    
+    def close(self):
+        self._file.close()
+
+
+def _ends_with_newline(path) -> bool:
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+
+def _output_paths(inputs: Sequence[Path], output_dir: Path) -> List[Path]:
+    """Return each input's package path, refusing inputs that would share one."""
+    outputs = []
+    seen = {}
+    for source in inputs:
+        output = output_dir / f"{source.stem}.zip"
+        if output in seen:
+            raise ValueError(f"'{seen[output]}' and '{source}' would both be written to {output}")
+        seen[output] = source
+        outputs.append(output)
+    return outputs
+
+
+def _record_path(output) -> Path:
+    """Return the path of the record written with a package before it is journaled."""
+    output = Path(output)
+    return output.with_name(f".{output.name}.batch.json")
+
+
+def _read_record(output) -> Optional[dict]:
+    """Read the record written with a package, or None if it has none."""
+    try:
+        with open(_record_path(output), encoding='utf-8') as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return record if isinstance(record, dict) else None
+
+
+def _is_done(entry: Optional[dict], source_hash: str, output: Path, options: dict) -> bool:
+    """Return whether a journal entry records this source's current package."""
+    if entry is None or entry.get('source_hash') != source_hash:
+        return False
+    if entry.get('output') != str(output) or entry.get('options') != options:
+        return False
+    try:
+        return file_digest(output) == entry.get('output_hash')
+    except OSError:
+        return False
+
+
+def _convert(source: str, output: str, options: dict, adopt: bool) -> Tuple[str, str, str]:
+    """
+    Convert one input, or keep an existing package that verifies.
+    
+    Returns:
+        CONVERTED or VERIFIED, with the hashes of the source that was read
+        and of the package.
+    """
+    with open(source, 'rb') as f:
+        data = f.read()
+    source_hash = hashlib.sha256(data).hexdigest()
+    questions = parse_markdown_exam(data.decode('utf-8'))
+    if not questions:
+        raise ValueError("no questions found")
+    if adopt:
+        # Only a package this batch wrote, from this source with these
+        # options, is kept; verifying checks that it is intact
+        record = _read_record(output)
+        output_hash = file_digest(output)
+        expected = {'source_hash': source_hash, 'output_hash': output_hash, 'options': options}
+        if record == expected and not verify_package(output, questions):
+            return VERIFIED, source_hash, output_hash
+    
+    package_writer = get_package_writer(options['format'])
+    with atomic_write(output) as stream:
+        package = package_writer(stream, options['title'], compact=options['compact'],
+                                 renderer=options['renderer'], emitter=options['emitter'])
+        run_pipeline(questions, [package])
+        stream.flush()
+        output_hash = file_digest(stream.name)
+        record = {'source_hash': source_hash, 'output_hash': output_hash, 'options': options}
+        with atomic_write(_record_path(output)) as f:
+            f.write(json.dumps(record, ensure_ascii=False).encode('utf-8'))
+    return CONVERTED, source_hash, output_hash
+
+
+def convert_batch(
+    inputs: Sequence[str],
+    output_dir: str,
+    journal: str = None,
+    title: str = None,
+    format: str = None,
+    compact: bool = False,
+    renderer: str = None,
+    emitter: str = None,
+    workers: int = 1,
+    log: Callable[[str], None] = None
+) -> BatchReport:
+    """
+    Convert exam files to packages, resuming from a journal of earlier runs.
+    
+    Args:
+        inputs: Paths of markdown exam files. Each is written to the output
+            directory under its own name with a .zip suffix.
+        output_dir: Directory for the packages, created if missing.
+        journal: Path of the journal (default: batch-journal.jsonl in the
+            output directory).
+        title: Title of every assessment (default: each input's file name
+            without its suffix).
+        format: Name of the package writer plugin (default: qti12).
+        compact: Write items without indentation.
+        renderer: Name of the renderer plugin for markdown text.
+        emitter: Name of the item emitter plugin.
+        workers: Number of processes converting inputs at a time.
+        log: Called with a line describing each input as it is done.
+    
+    Returns:
+        A BatchReport. An input that fails is reported there and is
+        converted again by the next run.
+    """
+    output_dir = Path(output_dir).resolve()
+    sources = [Path(source).resolve() for source in inputs]
+    outputs = _output_paths(sources, output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    journal_path = Path(journal) if journal else output_dir / JOURNAL_NAME
+    entries = read_journal(journal_path)
+    log = log or (lambda line: None)
+    report = BatchReport()
+    
+    tasks = []
+    for source, output in zip(sources, outputs):
+        options = {'format': format or DEFAULT_PACKAGE_WRITER, 'title': title or source.stem,
+                   'compact': compact, 'renderer': renderer, 'emitter': emitter}
+        try:
+            source_hash = file_digest(source)
+        except OSError as e:
+            report.failed.append((str(source), f"cannot be read: {e}"))
+            continue
+        if _is_done(entries.get(str(source)), source_hash, output, options):
+            report.skipped.append(str(source))
+            log(f"Up to date: {output}")
+            continue
+        # A package with no entry may have been completed just before a
+        # crash; one recorded for other content is written again
+        adopt = str(source) not in entries and output.exists()
+        tasks.append((str(source), str(output), options, adopt))
+    
+    journal_file = _Journal(journal_path)
+    try:
+        if workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(_convert, *task): task for task in tasks}
+                for future in as_completed(futures):
+                    _record(futures[future], future.result, journal_file, report, log)
+        else:
+            for task in tasks:
+                _record(task, lambda: _convert(*task), journal_file, report, log)
+    finally:
+        journal_file.close()
+    return report
+
+
+def _record(task: tuple, result: Callable, journal: _Journal, report: BatchReport,
+            log: Callable[[str], None]):
+    """Journal a finished input, or record why it failed."""
+    source, output, options, _ = task
+    try:
+        outcome, source_hash, output_hash = result()
+    except OSError as e:
+        report.failed.append((source, f"cannot be read: {e}"))
+        return
+    except ValueError as e:
+        report.failed.append((source, str(e)))
+        return
+    except BrokenProcessPool:
+        # A worker was killed, e.g. for running out of memory; the input
+        # is converted again by the next run
+        report.failed.append((source, "the worker process converting it stopped"))
+        return
+    journal.append({'source': source, 'source_hash': source_hash, 'output': output,
+                    'output_hash': output_hash, 'options': options})
+    with contextlib.suppress(OSError):
+        os.unlink(_record_path(output))
+    if outcome == VERIFIED:
+        report.verified.append(source)
+        log(f"Verified existing package: {output}")
+    else:
+        report.converted.append(source)
+        log(f"QTI package created: {output}")
+
+
+def main(argv: List[str] = None) -> int:
+    """Entry point for the `batch` subcommand."""
+    parser = argparse.ArgumentParser(
+        prog='markdown-to-qti batch',
+        description='Convert many exam files, journaling each completed package so that '
+                    'a run that is interrupted can be restarted where it stopped.'
+    )
+    parser.add_argument('inputs', nargs='+', metavar='INPUT', help='Markdown exam files')
+    parser.add_argument(
+        '-o', '--output-dir',
+        type=str,
+        required=True,
+        metavar='DIR',
+        help='Directory for the packages, each named after its input, e.g. exam.zip'
+    )
+    parser.add_argument(
+        '--journal',
+        type=str,
+        default=None,
+        metavar='PATH',
+        help=f'Journal of completed packages (default: {JOURNAL_NAME} in the output directory)'
+    )
+    parser.add_argument(
+        '-t', '--title',
+        type=str,
+        default=None,
+        help="Title for every assessment (default: each input's file name)"
+    )
+    parser.add_argument(
+        '--format',
+        type=str,
+        default=None,
+        metavar='NAME',
+        help='Package writer plugin used to create the packages (default: qti12)'
+    )
+    parser.add_argument(
+        '--compact',
+        action='store_true',
+        help='Write compact XML without indentation, with HTML in CDATA sections'
+    )
+    parser.add_argument(
+        '--renderer',
+        type=str,
+        default=None,
+        metavar='NAME',
+        help='Renderer plugin used to turn markdown into HTML (default: markdown)'
+    )
+    parser.add_argument(
+        '--emitter',
+        type=str,
+        default=None,
+        metavar='NAME',
+        help='Item emitter plugin used to build each question item'
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=1,
+        help='Number of inputs converted at a time, in separate processes (default: 1)'
+    )
+    args = parser.parse_args(argv)
+    
+    if args.jobs < 1:
+        print("Error: --jobs must be at least 1.", file=sys.stderr)
+        return 1
+    try:
+        get_renderer(args.renderer)
+        get_emitter(args.emitter)
+        get_package_writer(args.format)
+        report = convert_batch(args.inputs, args.output_dir, args.journal, args.title,
+                               args.format, args.compact, args.renderer, args.emitter,
+                               args.jobs, log=print)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    
+    print(f"{len(report.converted)} converted, {len(report.skipped)} up to date, "
+          f"{len(report.verified)} verified, {len(report.failed)} failed.")
+    for source, message in report.failed:
+        print(f"Error: {source}: {message}", file=sys.stderr)
+    return 1 if report.failed else 0
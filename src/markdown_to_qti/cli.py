@@ -2,15 +2,65 @@
 Command-line interface for markdown-to-qti converter.
 """
 import argparse
+import itertools
 import sys
 from pathlib import Path
 
-from .parser import parse_markdown_exam
-from .qti_generator import create_qti_package, generate_qti_assessment
+from .ir import load_ir, save_ir
+from .latex import configure_math_cache
+from .parser import iter_markdown_exam, parse_markdown_exam
+from .plugins import get_emitter, get_package_writer, get_renderer, resolve_reference
+from .verify import ExpectationSink, verify_packages
+from .sinks import (
+    AnswerKeySink, QtiXmlSink, SplitPackageSink, TagReportSink, prerendered, run_pipeline
+)
+
+# Subcommands, selected by the first argument, as "module:function"
+# references so that a module is only imported when its command runs.
+# Anything else is treated as an input file to convert.
+COMMANDS = {
+    'batch': 'markdown_to_qti.batch:main',
+    'dedupe': 'markdown_to_qti.dedupe:main',
+    'diff': 'markdown_to_qti.diff:main',
+    'lsp': 'markdown_to_qti.lsp:main',
+    'merge': 'markdown_to_qti.shards:merge_main',
+    'plugins': 'markdown_to_qti.plugins:main',
+    'preview': 'markdown_to_qti.preview:main',
+    'score': 'markdown_to_qti.score:main',
+    'shard': 'markdown_to_qti.shards:shard_main',
+}
+
+
+# Multipliers for --max-package-size suffixes
+_SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def _parse_size(text: str) -> int:
+    """Parse a size in bytes with an optional K, M or G suffix, e.g. 50M."""
+    number = text.strip().upper()
+    if number.endswith('B'):
+        number = number[:-1]
+    unit = number[-1:] if number[-1:] in _SIZE_UNITS else ''
+    try:
+        size = float(number[:len(number) - len(unit)]) * _SIZE_UNITS[unit]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size: '{text}' (e.g. 500K, 50M or 1G)")
+    if size < 1:
+        raise argparse.ArgumentTypeError("size must be positive")
+    return int(size)
+
+
+def _package_paths(package, path: str) -> list:
+    """Return the files a package sink wrote: its parts, or its single package."""
+    return getattr(package, 'paths', None) or [getattr(package, 'path', None) or path]
 
 
 def main():
     """Main entry point for the CLI."""
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        command = resolve_reference(COMMANDS[sys.argv[1]])
+        sys.exit(command(sys.argv[2:]))
+    
     parser = argparse.ArgumentParser(
         description='Convert Markdown exam files to QTI format for Canvas LMS import.',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -26,7 +76,7 @@ Example markdown format:
      b. World
      *c. Hello, World!
      d. Error
-
+  
   2. Which of these is a Python keyword?
      a. function
      *b. def
@@ -34,20 +84,32 @@ Example markdown format:
      d. procedure
 
 Note: Mark the correct answer with an asterisk (*) before the choice letter.
+
+Other commands:
+  markdown-to-qti batch    Convert many exam files, resuming an interrupted run
+  markdown-to-qti dedupe   Find near-duplicate questions across exam files
+  markdown-to-qti diff     Show questions changed, added, removed or moved between versions
+  markdown-to-qti lsp      Run a language server for exam authoring (stdio)
+  markdown-to-qti merge    Merge shard files into one QTI package
+  markdown-to-qti plugins  List the available renderers, item emitters and package writers
+  markdown-to-qti preview  Render an HTML preview with answers (--serve to live-reload)
+  markdown-to-qti score    Score student responses and report item statistics
+  markdown-to-qti shard    Convert one shard of a large bank on any machine
 """
     )
     
     parser.add_argument(
         'input',
         type=str,
-        help='Path to the input Markdown file'
+        help='Path to the input Markdown file, or - to read from stdin'
     )
     
     parser.add_argument(
         '-o', '--output',
         type=str,
         default=None,
-        help='Path for the output QTI package (ZIP file). Defaults to input filename with .zip extension.'
+        help='Path for the output QTI package (ZIP file), or - to write it to stdout. '
+             'Defaults to input filename with .zip extension.'
     )
     
     parser.add_argument(
@@ -63,47 +125,312 @@ Note: Mark the correct answer with an asterisk (*) before the choice letter.
         help='Output only the QTI XML to stdout instead of creating a ZIP package'
     )
     
+    parser.add_argument(
+        '--compact',
+        action='store_true',
+        help='Write compact XML without indentation, with HTML in CDATA sections'
+    )
+    
+    parser.add_argument(
+        '--from-ir',
+        action='store_true',
+        help='Read the input as an IR file written by --emit-ir instead of markdown'
+    )
+    
+    parser.add_argument(
+        '--emit-ir',
+        type=str,
+        default=None,
+        metavar='PATH',
+        help='Write the parsed questions to an IR file for fast reloading. '
+             'A QTI package is only created as well when -o or --xml-only is given.'
+    )
+    
+    parser.add_argument(
+        '--ir-html',
+        action='store_true',
+        help='Store pre-rendered HTML in the IR file written by --emit-ir'
+    )
+    
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=1,
+        help='Number of processes used to render questions (default: 1)'
+    )
+    
+    parser.add_argument(
+        '--format',
+        type=str,
+        default=None,
+        metavar='NAMES',
+        help='Package writer plugins used to create packages, separated by commas, '
+             'e.g. qti12,qti21 for QTI 1.2 and QTI 2.1 packages (default: qti12). '
+             'With several, each package is named after its format, e.g. exam.qti21.zip.'
+    )
+    
+    parser.add_argument(
+        '--max-items',
+        type=int,
+        default=None,
+        metavar='N',
+        help='Split the output into packages of at most N questions each, '
+             'named e.g. exam.part001.zip'
+    )
+    
+    parser.add_argument(
+        '--max-package-size',
+        type=_parse_size,
+        default=None,
+        metavar='SIZE',
+        help='Split the output into packages of at most SIZE bytes each, e.g. 50M, '
+             'named e.g. exam.part001.zip'
+    )
+    
+    parser.add_argument(
+        '--verify',
+        action='store_true',
+        help='Reopen the written packages and check their items against the questions'
+    )
+    
+    parser.add_argument(
+        '--renderer',
+        type=str,
+        default=None,
+        metavar='NAME',
+        help='Renderer plugin used to turn markdown into HTML (default: markdown)'
+    )
+    
+    parser.add_argument(
+        '--emitter',
+        type=str,
+        default=None,
+        metavar='NAME',
+        help='Item emitter plugin used to build each question item (default: qti12)'
+    )
+    
+    parser.add_argument(
+        '--answer-key',
+        type=str,
+        default=None,
+        metavar='PATH',
+        help='Also write an answer key: JSON if PATH ends in .json, otherwise CSV. '
+             'Use - for stdout.'
+    )
+    
+    parser.add_argument(
+        '--report',
+        type=str,
+        default=None,
+        metavar='PATH',
+        help='Also write a report of question counts per tag and Bloom level: '
+             'JSON if PATH ends in .json, otherwise a Markdown table. Use - for stdout.'
+    )
+    
+    parser.add_argument(
+        '--math-cache',
+        type=str,
+        default=None,
+        metavar='PATH',
+        help='File used to cache rendered math between runs '
+             '(default: $MARKDOWN_TO_QTI_MATH_CACHE if set, otherwise none)'
+    )
+    
+    parser.add_argument(
+        '--no-math-cache',
+        action='store_true',
+        help='Do not read or write a persistent math cache, even if '
+             'MARKDOWN_TO_QTI_MATH_CACHE is set'
+    )
+    
     args = parser.parse_args()
     
+    if args.jobs < 1:
+        print("Error: --jobs must be at least 1.", file=sys.stderr)
+        sys.exit(1)
+    if args.max_items is not None and args.max_items < 1:
+        print("Error: --max-items must be at least 1.", file=sys.stderr)
+        sys.exit(1)
+    split = args.max_items is not None or args.max_package_size is not None
+    if split and (args.xml_only or args.output == '-'):
+        print("Error: Split packages cannot be written to stdout.", file=sys.stderr)
+        sys.exit(1)
+    if args.verify and (args.xml_only or args.output == '-'):
+        print("Error: --verify needs a package file, not stdout.", file=sys.stderr)
+        sys.exit(1)
+    
+    if args.no_math_cache:
+        configure_math_cache(None)
+    elif args.math_cache:
+        configure_math_cache(args.math_cache)
+    
+    names = (name.strip() for name in (args.format or '').split(','))
+    formats = list(dict.fromkeys(name for name in names if name)) or [None]
+    if len(formats) > 1:
+        if args.xml_only or args.output == '-':
+            print("Error: Several formats cannot be written to stdout.", file=sys.stderr)
+            sys.exit(1)
+        if args.emitter:
+            print("Error: --emitter can only be used with a single format.", file=sys.stderr)
+            sys.exit(1)
+    
+    # Selected plugins are imported now, so a bad name is reported before
+    # any input is read
+    try:
+        get_renderer(args.renderer)
+        get_emitter(args.emitter)
+        package_writers = [get_package_writer(name) for name in formats]
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    
+    from_stdin = args.input == '-'
+    if from_stdin and args.from_ir:
+        print("Error: --from-ir needs an input file, not stdin.", file=sys.stderr)
+        sys.exit(1)
+    if from_stdin and not (args.output or args.xml_only or args.emit_ir
+                           or args.answer_key or args.report):
+        print("Error: Use -o to choose the output when reading from stdin (-o - for stdout).",
+              file=sys.stderr)
+        sys.exit(1)
+    stdout_outputs = [args.xml_only, args.output == '-', args.answer_key == '-', args.report == '-']
+    if sum(stdout_outputs) > 1:
+        print("Error: Only one output can be written to stdout.", file=sys.stderr)
+        sys.exit(1)
+    
     # Read input file
     input_path = Path(args.input)
-    if not input_path.exists():
+    if not from_stdin and not input_path.exists():
         print(f"Error: Input file '{args.input}' not found.", file=sys.stderr)
         sys.exit(1)
     
+    # Markdown from stdin is converted as it arrives, unless it is all
+    # needed at once for an IR file
+    streaming = from_stdin and not args.emit_ir
+    
     try:
-        with open(input_path, 'r', encoding='utf-8') as f:
-            markdown_content = f.read()
+        if args.from_ir:
+            questions = load_ir(input_path, args.renderer)
+        elif streaming:
+            questions = iter_markdown_exam(sys.stdin)
+            # Read up to the first question, so that empty input is
+            # reported before any output is written
+            first = next(questions, None)
+            questions = itertools.chain([first], questions) if first is not None else []
+        elif from_stdin:
+            questions = list(iter_markdown_exam(sys.stdin))
+        else:
+            with open(input_path, 'r', encoding='utf-8') as f:
+                markdown_content = f.read()
+            
+            # Parse markdown
+            questions = parse_markdown_exam(markdown_content)
     except IOError as e:
         print(f"Error reading input file: {e}", file=sys.stderr)
         sys.exit(1)
-    
-    # Parse markdown
-    questions = parse_markdown_exam(markdown_content)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
     
     if not questions:
         print("Error: No questions found in the input file.", file=sys.stderr)
         sys.exit(1)
     
-    print(f"Found {len(questions)} question(s).", file=sys.stderr)
+    if not streaming:
+        print(f"Found {len(questions)} question(s).", file=sys.stderr)
     
-    # Generate output
+    # A QTI package is written unless the only outputs asked for are others
+    extra_outputs = args.emit_ir or args.answer_key or args.report
+    write_package = args.output or args.xml_only or not (extra_outputs or from_stdin)
+    
+    if args.emit_ir:
+        try:
+            ir_path = save_ir(questions, args.emit_ir, include_html=args.ir_html,
+                              renderer=args.renderer)
+            print(f"IR file created: {ir_path}", file=sys.stderr)
+        except IOError as e:
+            print(f"Error creating IR file: {e}", file=sys.stderr)
+            sys.exit(1)
+    
+    # Every output is written from one pass over the questions
+    sinks = []
+    packages = []
+    options = dict(workers=args.jobs, compact=args.compact,
+                   renderer=args.renderer, emitter=args.emitter)
     if args.xml_only:
-        xml_output = generate_qti_assessment(questions, args.title)
-        print(xml_output)
-    else:
+        sinks.append(QtiXmlSink(sys.stdout, args.title, **options))
+    elif args.output == '-':
+        sinks.append(package_writers[0](sys.stdout.buffer, args.title, **options))
+    elif write_package:
         # Determine output path
         if args.output:
-            output_path = args.output
+            output_path = Path(args.output)
         else:
-            output_path = str(input_path.with_suffix('.zip'))
-        
-        try:
-            result_path = create_qti_package(questions, output_path, args.title)
-            print(f"QTI package created: {result_path}", file=sys.stderr)
-        except IOError as e:
-            print(f"Error creating output file: {e}", file=sys.stderr)
+            output_path = input_path.with_suffix('.zip')
+        for name, package_writer in zip(formats, package_writers):
+            path = output_path
+            if len(formats) > 1:
+                path = path.with_name(f"{path.stem}.{name}{path.suffix or '.zip'}")
+            if split:
+                package = SplitPackageSink(package_writer, path, args.title, args.max_items,
+                                           args.max_package_size, **options)
+            else:
+                package = package_writer(str(path), args.title, **options)
+            packages.append((package, str(path)))
+            sinks.append(package)
+        # The packages share each question's HTML, rendered once. Packages
+        # split by size are written with one worker, so the HTML is
+        # rendered in parallel beforehand.
+        if len(packages) > 1 or (args.max_package_size and args.jobs > 1):
+            questions = prerendered(questions, args.renderer, args.jobs)
+    if args.answer_key:
+        sinks.append(AnswerKeySink(args.answer_key))
+    if args.report:
+        sinks.append(TagReportSink(args.report))
+    if not sinks:
+        return
+    expectations = None
+    if args.verify and packages:
+        expectations = ExpectationSink()
+        sinks.append(expectations)
+    
+    # Generate output
+    try:
+        count = run_pipeline(questions, sinks)
+        if args.xml_only:
+            sys.stdout.write('\n')
+        elif args.output == '-':
+            sys.stdout.buffer.flush()
+    except IOError as e:
+        print(f"Error creating output file: {e}", file=sys.stderr)
+        sys.exit(1)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    
+    for package, path in packages:
+        for written in _package_paths(package, path):
+            print(f"QTI package created: {written}", file=sys.stderr)
+    if args.answer_key and args.answer_key != '-':
+        print(f"Answer key created: {args.answer_key}", file=sys.stderr)
+    if args.report and args.report != '-':
+        print(f"Report created: {args.report}", file=sys.stderr)
+    if streaming:
+        print(f"Converted {count} question(s).", file=sys.stderr)
+    
+    if expectations is not None:
+        problems = []
+        verified = 0
+        for package, path in packages:
+            paths = _package_paths(package, path)
+            problems.extend(verify_packages(paths, expectations.items))
+            verified += len(paths)
+        if problems:
+            print("Error: Verification failed:", file=sys.stderr)
+            for problem in problems:
+                print(f"  {problem}", file=sys.stderr)
             sys.exit(1)
+        print(f"Verified {verified} package(s).", file=sys.stderr)
 
 
 if __name__ == '__main__':
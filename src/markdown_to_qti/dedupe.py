@@ -0,0 +1,403 @@
+"""
+Near-duplicate question detection with a MinHash locality-sensitive index.
+
+Each question's stem and choice texts are normalized and split into
+character shingles. A MinHash signature estimates the Jaccard similarity
+of two questions' shingle sets from the fraction of signature values they
+share. Signatures are split into bands, and questions with an identical
+band land in the same bucket; only questions sharing a bucket are
+compared, so finding near-duplicates takes roughly linear time.
+
+Signatures use one-permutation hashing: each shingle is hashed once and
+the hash picks both a bin of the signature and the value competing for
+that bin's minimum. Bins no shingle fell in borrow from the next filled
+bin. This costs one hash per shingle instead of one per shingle per
+signature value.
+
+The index is an SQLite file, so banks can be added to over time; adding a
+file again replaces its earlier questions.
+"""
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+from array import array
+from dataclasses import asdict, dataclass
+from typing import Iterable, List, Optional, Set
+
+from .parser import Question, parse_markdown_exam
+
+# Settings baked into an index file; changing them needs a new version
+INDEX_VERSION = 1
+SHINGLE_SIZE = 5
+SIGNATURE_SIZE = 128
+BANDS = 16
+_ROWS = SIGNATURE_SIZE // BANDS
+_BIN_BITS = SIGNATURE_SIZE.bit_length() - 1
+_BIN_MASK = SIGNATURE_SIZE - 1
+_EMPTY = 0xFFFFFFFF
+
+# Estimated similarity from which questions are reported as near-duplicates
+DEFAULT_THRESHOLD = 0.8
+
+_EXCERPT_LENGTH = 60
+
+
+@dataclass
+class IndexedQuestion:
+    """A question stored in the index, by where it came from."""
+    source: str
+    number: int
+    line: int
+    excerpt: str
+
+
+@dataclass
+class Match:
+    """A question that is a near-duplicate of one already in the index."""
+    question: IndexedQuestion
+    duplicate_of: IndexedQuestion
+    similarity: float
+
+
+def shingles(question: Question) -> Set[bytes]:
+    """
+    Return the character shingles of a question's stem and choices.
+    
+    Case and runs of whitespace are ignored. Shingles are UTF-8 encoded.
+    """
+    text = '\n'.join([question.stem, *(choice.text for choice in question.choices)])
+    data = ' '.join(text.lower().split()).encode('utf-8')
+    if len(data) <= SHINGLE_SIZE:
+        return {data}
+    return {data[i:i + SHINGLE_SIZE] for i in range(len(data) - SHINGLE_SIZE + 1)}
+
+
+def signature(question_shingles: Iterable[bytes]) -> array:
+    """
+    Compute the MinHash signature of a set of shingles.
+    
+    Returns:
+        An array of SIGNATURE_SIZE unsigned 32-bit values.
+    """
+    minimums = [_EMPTY] * SIGNATURE_SIZE
+    blake2b = hashlib.blake2b
+    from_bytes = int.from_bytes
+    for shingle in question_shingles:
+        hashed = from_bytes(blake2b(shingle, digest_size=8).digest(), 'little')
+        index = hashed & _BIN_MASK
+        value = (hashed >> _BIN_BITS) & 0xFFFFFFFE
+        if value < minimums[index]:
+            minimums[index] = value
+    
+    # Densify: an empty bin takes the value of the next filled bin, offset
+    # by the distance so that borrowed values differ from the originals
+    if _EMPTY in minimums and len(set(minimums)) > 1:
+        for index in range(SIGNATURE_SIZE):
+            if minimums[index] == _EMPTY:
+                distance = 1
+                while minimums[(index + distance) % SIGNATURE_SIZE] == _EMPTY:
+                    distance += 1
+                borrowed = minimums[(index + distance) % SIGNATURE_SIZE]
+                minimums[index] = ((borrowed + distance) & 0xFFFFFFFF) | 1
+    return array('I', minimums)
+
+
+def similarity(first: array, second: array) -> float:
+    """Estimate the Jaccard similarity of two questions from their signatures."""
+    return sum(a == b for a, b in zip(first, second)) / SIGNATURE_SIZE
+
+
+def _band_keys(values: array) -> List[int]:
+    """Return the bucket key of each band of a signature."""
+    data = _to_bytes(values)
+    width = _ROWS * values.itemsize
+    keys = []
+    for band in range(BANDS):
+        digest = hashlib.blake2b(
+            bytes([band]) + data[band * width:(band + 1) * width], digest_size=8).digest()
+        keys.append(int.from_bytes(digest, 'little', signed=True))
+    return keys
+
+
+def _to_bytes(values: array) -> bytes:
+    # Stored little-endian, so index files can be moved between machines
+    if sys.byteorder == 'big':
+        values = array('I', values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_bytes(data: bytes) -> array:
+    values = array('I')
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def _excerpt(stem: str) -> str:
+    text = ' '.join(stem.split())
+    if len(text) > _EXCERPT_LENGTH:
+        text = text[:_EXCERPT_LENGTH - 3] + '...'
+    return text
+
+
+class DedupeIndex:
+    """
+    A MinHash LSH index of questions, stored in an SQLite file.
+    
+    With no path the index is kept in memory.
+    """
+    
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._connection = sqlite3.connect(path or ':memory:')
+        self._connection.executescript('''
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS questions (
+                id INTEGER PRIMARY KEY,
+                source TEXT NOT NULL,
+                number INTEGER NOT NULL,
+                line INTEGER NOT NULL,
+                excerpt TEXT NOT NULL,
+                signature BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS questions_source ON questions (source);
+            CREATE TABLE IF NOT EXISTS buckets (key INTEGER NOT NULL, question INTEGER NOT NULL);
+            CREATE INDEX IF NOT EXISTS buckets_key ON buckets (key);
+        ''')
+        
+        settings = {
+            'version': INDEX_VERSION,
+            'shingle_size': SHINGLE_SIZE,
+            'signature_size': SIGNATURE_SIZE,
+            'bands': BANDS,
+        }
+        stored = dict(self._connection.execute('SELECT key, value FROM meta'))
+        if not stored:
+            with self._connection:
+                self._connection.executemany(
+                    'INSERT INTO meta (key, value) VALUES (?, ?)', settings.items())
+        elif stored != settings:
+            self._connection.close()
+            raise ValueError(
+                f"Index '{path}' was built with different settings; delete it to rebuild")
+    
+    def __len__(self) -> int:
+        return self._connection.execute('SELECT COUNT(*) FROM questions').fetchone()[0]
+    
+    def add(
+        self,
+        source: str,
+        questions: Iterable[Question],
+        threshold: Optional[float] = None
+    ) -> List[Match]:
+        """
+        Add the questions of a source file, replacing any it had before.
+        
+        Args:
+            source: Name of the file the questions come from.
+            questions: The parsed questions.
+            threshold: If given, look up each question before adding it and
+                return those with an estimated similarity of at least
+                threshold to a question already in the index.
+        
+        Returns:
+            The near-duplicates found, or an empty list without a threshold.
+        """
+        matches = []
+        connection = self._connection
+        with connection:
+            connection.execute(
+                'DELETE FROM buckets WHERE question IN (SELECT id FROM questions WHERE source = ?)',
+                (source,))
+            connection.execute('DELETE FROM questions WHERE source = ?', (source,))
+            
+            for question in questions:
+                values = signature(shingles(question))
+                keys = _band_keys(values)
+                line = question.span.start_line + 1 if question.span is not None else 0
+                entry = IndexedQuestion(source, question.number, line, _excerpt(question.stem))
+                
+                if threshold is not None:
+                    best = self._best_match(values, keys, threshold)
+                    if best is not None:
+                        matches.append(Match(entry, *best))
+                
+                question_id = connection.execute(
+                    'INSERT INTO questions (source, number, line, excerpt, signature) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (entry.source, entry.number, entry.line, entry.excerpt, _to_bytes(values))
+                ).lastrowid
+                connection.executemany(
+                    'INSERT INTO buckets (key, question) VALUES (?, ?)',
+                    [(key, question_id) for key in keys])
+        return matches
+    
+    def _best_match(self, values: array, keys: List[int], threshold: float):
+        """Return the most similar indexed question and its similarity, if any."""
+        placeholders = ','.join('?' * len(keys))
+        rows = self._connection.execute(
+            f'SELECT DISTINCT q.source, q.number, q.line, q.excerpt, q.signature '
+            f'FROM buckets b JOIN questions q ON q.id = b.question '
+            f'WHERE b.key IN ({placeholders})', keys)
+        best = None
+        for source, number, line, excerpt, data in rows:
+            score = similarity(values, _from_bytes(data))
+            if score >= threshold and (best is None or score > best[1]):
+                best = (IndexedQuestion(source, number, line, excerpt), score)
+        return best
+    
+    def clusters(self, threshold: float = DEFAULT_THRESHOLD) -> List[List[IndexedQuestion]]:
+        """
+        Group the indexed questions into clusters of near-duplicates.
+        
+        Each bucket's questions are compared with the bucket's first
+        question, and matching questions are joined into one cluster.
+        Questions with no near-duplicate are not reported.
+        
+        Args:
+            threshold: Estimated similarity from which questions match.
+        
+        Returns:
+            Clusters of two or more questions, largest first, each ordered
+            by source and line.
+        """
+        connection = self._connection
+        signatures = {}
+        
+        def signature_of(question_id):
+            if question_id not in signatures:
+                data = connection.execute(
+                    'SELECT signature FROM questions WHERE id = ?', (question_id,)).fetchone()[0]
+                signatures[question_id] = _from_bytes(data)
+            return signatures[question_id]
+        
+        parent = {}
+        
+        def find(question_id):
+            root = question_id
+            while parent.get(root, root) != root:
+                root = parent[root]
+            while question_id != root:
+                parent[question_id], question_id = root, parent.get(question_id, root)
+            return root
+        
+        rows = connection.execute(
+            'SELECT key, question FROM buckets WHERE key IN '
+            '(SELECT key FROM buckets GROUP BY key HAVING COUNT(*) > 1) ORDER BY key, question')
+        bucket_key = first = None
+        for key, question_id in rows:
+            if key != bucket_key:
+                bucket_key, first = key, question_id
+                continue
+            if find(question_id) == find(first):
+                continue
+            if similarity(signature_of(first), signature_of(question_id)) >= threshold:
+                root = find(first)
+                parent[find(question_id)] = root
+                parent.setdefault(root, root)
+        
+        members = {}
+        if parent:
+            for row in connection.execute(
+                    'SELECT id, source, number, line, excerpt FROM questions ORDER BY source, line'):
+                if row[0] in parent:
+                    members.setdefault(find(row[0]), []).append(IndexedQuestion(*row[1:]))
+        clusters = list(members.values())
+        clusters.sort(key=lambda cluster: (-len(cluster), cluster[0].source, cluster[0].line))
+        return clusters
+    
+    def close(self):
+        """Close the index file."""
+        self._connection.close()
+
+
+def main(argv: List[str] = None) -> int:
+    """Entry point for the `dedupe` subcommand."""
+    parser = argparse.ArgumentParser(
+        prog='markdown-to-qti dedupe',
+        description='Find near-duplicate questions across markdown exam files.'
+    )
+    parser.add_argument(
+        'inputs',
+        nargs='*',
+        metavar='FILE',
+        help='Markdown exam files to add to the index'
+    )
+    parser.add_argument(
+        '--index',
+        type=str,
+        default=None,
+        metavar='PATH',
+        help='Index file to update and report on. Without it only the given files are checked.'
+    )
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help=f'Estimated similarity from which questions are near-duplicates '
+             f'(default: {DEFAULT_THRESHOLD})'
+    )
+    parser.add_argument(
+        '--warn',
+        action='store_true',
+        help='Warn about each added question that duplicates one already in the index'
+    )
+    parser.add_argument(
+        '--json',
+        action='store_true',
+        help='Print the clusters as JSON'
+    )
+    args = parser.parse_args(argv)
+    
+    if not 0 < args.threshold <= 1:
+        print("Error: --threshold must be between 0 and 1.", file=sys.stderr)
+        return 1
+    if not args.inputs and not args.index:
+        print("Error: Give files to check, an --index to report on, or both.", file=sys.stderr)
+        return 1
+    
+    try:
+        index = DedupeIndex(args.index)
+    except (sqlite3.Error, ValueError) as e:
+        print(f"Error opening index: {e}", file=sys.stderr)
+        return 1
+    
+    try:
+        for input_path in args.inputs:
+            try:
+                with open(input_path, 'r', encoding='utf-8') as f:
+                    questions = parse_markdown_exam(f.read())
+            except (IOError, ValueError) as e:
+                print(f"Error reading '{input_path}': {e}", file=sys.stderr)
+                return 1
+            
+            matches = index.add(input_path, questions, args.threshold if args.warn else None)
+            for match in matches:
+                question, original = match.question, match.duplicate_of
+                print(f"{question.source}:{question.line}: Question {question.number} "
+                      f"is a near-duplicate of {original.source}:{original.line} "
+                      f"Question {original.number} ({match.similarity:.0%} similar)",
+                      file=sys.stderr)
+        
+        clusters = index.clusters(args.threshold)
+        total = len(index)
+    finally:
+        index.close()
+    
+    if args.json:
+        print(json.dumps([[asdict(question) for question in cluster] for cluster in clusters],
+                         ensure_ascii=False, indent=2))
+        return 0
+    
+    duplicates = sum(len(cluster) for cluster in clusters)
+    print(f"{duplicates} of {total} question(s) in {len(clusters)} cluster(s) of near-duplicates.")
+    for number, cluster in enumerate(clusters, 1):
+        print(f"\nCluster {number} ({len(cluster)} questions):")
+        for question in cluster:
+            print(f"  {question.source}:{question.line}  Question {question.number}: "
+                  f"{question.excerpt}")
+    return 0
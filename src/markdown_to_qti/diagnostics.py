@@ -0,0 +1,122 @@
+"""
+Diagnostics for authoring mistakes in markdown exam questions.
+"""
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from .parser import BLOOM_LEVELS, Question, SourceSpan, parse_question_block
+
+ERROR = 'error'
+WARNING = 'warning'
+
+
+@dataclass
+class Diagnostic:
+    """A problem found in the source markdown."""
+    span: SourceSpan
+    message: str
+    severity: str = ERROR
+
+
+def _fence_diagnostics(text: str, line: int, column: int) -> List[Diagnostic]:
+    """
+    Report a code fence that is opened but never closed.
+    
+    Fences are tracked the same way the parser tracks them: a line with an
+    odd number of ``` markers toggles the code block state.
+    """
+    in_code_block = False
+    open_index = 0
+    for index, text_line in enumerate(text.split('\n')):
+        if text_line.count('```') % 2 == 1:
+            in_code_block = not in_code_block
+            if in_code_block:
+                open_index = index
+    
+    if not in_code_block:
+        return []
+    
+    text_line = text.split('\n', open_index + 1)[open_index]
+    fence_column = text_line.rfind('```') + (column if open_index == 0 else 0)
+    return [Diagnostic(
+        SourceSpan(line + open_index, fence_column, line + open_index, fence_column + 3),
+        "Unbalanced code fence: ``` is never closed"
+    )]
+
+
+def check_question(question: Question, header: SourceSpan) -> List[Diagnostic]:
+    """
+    Check a parsed question for answer key problems.
+    
+    Args:
+        question: The Question object to check.
+        header: Span of the question's first line, where question-level
+            problems are reported.
+    
+    Returns:
+        A list of Diagnostic objects.
+    """
+    diagnostics = []
+    
+    correct = [choice for choice in question.choices if choice.is_correct]
+    if not correct:
+        diagnostics.append(Diagnostic(
+            header, f"Question {question.number} has no correct answer marked with '*'"))
+    elif len(correct) > 1:
+        for choice in correct[1:]:
+            diagnostics.append(Diagnostic(
+                choice.span or header,
+                f"Question {question.number} has more than one correct answer; "
+                f"only '{question.correct_answer}' is used",
+                WARNING))
+    
+    seen = set()
+    for choice in question.choices:
+        if choice.letter in seen:
+            diagnostics.append(Diagnostic(
+                choice.span or header,
+                f"Duplicate choice letter '{choice.letter}' in question {question.number}"))
+        seen.add(choice.letter)
+    
+    if question.bloom is not None and question.bloom not in BLOOM_LEVELS:
+        diagnostics.append(Diagnostic(
+            header,
+            f"Unknown Bloom level '{question.bloom}' in question {question.number}; "
+            f"expected one of {', '.join(BLOOM_LEVELS)}",
+            WARNING))
+    
+    return diagnostics
+
+
+def check_question_block(
+    question_num: int,
+    text: str,
+    line: int,
+    column: int,
+    header: SourceSpan
+) -> Tuple[Optional[Question], List[Diagnostic]]:
+    """
+    Parse a single question block and check it for problems.
+    
+    Args:
+        question_num: The question number.
+        text: The text content of the question (stem + choices).
+        line: Source line on which the text starts.
+        column: Source column at which the text starts.
+        header: Span of the question's first line.
+    
+    Returns:
+        A tuple of the parsed Question (None if it has no choices) and the
+        list of diagnostics for the block.
+    """
+    diagnostics = _fence_diagnostics(text, line, column)
+    question = parse_question_block(question_num, text, line, column)
+    
+    if question is None:
+        diagnostics.append(Diagnostic(
+            header, f"Question {question_num} has no answer choices and will be skipped"))
+    else:
+        diagnostics.extend(check_question(question, header))
+    
+    return question, diagnostics
+
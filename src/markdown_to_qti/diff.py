@@ -0,0 +1,468 @@
+"""
+Semantic diff between two versions of an exam.
+
+Questions are compared by content, not by position or by the random
+identifiers in generated packages. Each question's stem, choices and
+correct answer are hashed, and the two versions are aligned in passes
+that each take linear time:
+
+1. questions with identical content are paired, in order;
+2. remaining questions with the same stem are paired (choices or answer
+   changed), then those with the same choices and answer (stem changed);
+3. what is still unpaired is paired by position between the paired
+   questions around it, if the two questions' texts are similar.
+
+Paired questions that are out of order relative to the rest are reported
+as moved. The fewest such questions are found from the longest run of
+pairs that stay in order, which takes O(n log n).
+
+Either version may be a markdown file or a QTI 1.2 or QTI 2.1 package.
+Packages hold rendered HTML, so when one is compared with markdown the
+markdown is rendered first, and QTI 2.1 XHTML is compared in a form
+serialized the same way for both versions.
+"""
+import argparse
+import bisect
+import hashlib
+import html
+import json
+import re
+import sys
+import zipfile
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+from xml.etree.ElementTree import Element, ParseError, fromstring, iterparse
+
+from .parser import Choice, Question, parse_markdown_exam
+from .qti_generator import prerender_html, write_compact
+from .verify import QTI12_ASSESSMENT, QTI21_TEST, iter_elements, local_name, tag_namespace
+
+# Kinds of input, as returned by load_questions
+MARKDOWN = 'markdown'
+QTI12 = 'qti12'
+QTI21 = 'qti21'
+
+# Share of words from which unpaired questions in the same place are taken to
+# be one question that changed, rather than one removed and one added
+SIMILARITY = 0.5
+
+_EXCERPT_LENGTH = 60
+_TAG_PATTERN = re.compile(r'<[^>]*>')
+
+
+@dataclass
+class QuestionChange:
+    """A difference between the two versions of one question."""
+    kind: str  # 'added', 'removed', 'changed' or 'moved'
+    old: Optional[int]
+    new: Optional[int]
+    # What changed, e.g. "stem", "choice b", "correct answer a -> c", "moved"
+    changes: List[str] = field(default_factory=list)
+    excerpt: str = ''
+
+
+class _Entry:
+    """The compared content of a question, with digests to align on."""
+    __slots__ = ('position', 'stem', 'choices', 'correct', 'stem_key', 'choices_key', 'key')
+    
+    def __init__(self, position: int, stem: str, choices: Tuple[tuple, ...], correct: Optional[str]):
+        self.position = position
+        self.stem = stem
+        self.choices = choices
+        self.correct = correct
+        self.stem_key = _digest(stem)
+        self.choices_key = _digest('\0'.join(f"{letter}\0{text}" for letter, text in choices),
+                                   correct or '')
+        self.key = self.stem_key + self.choices_key
+
+
+def _digest(*parts: str) -> bytes:
+    return hashlib.blake2b('\0'.join(parts).encode('utf-8'), digest_size=16).digest()
+
+
+def _entries(questions: List[Question], use_html: bool) -> List[_Entry]:
+    if use_html:
+        return [_Entry(position, question.stem_html,
+                       tuple((choice.letter, choice.html) for choice in question.choices),
+                       question.correct_answer)
+                for position, question in enumerate(questions, 1)]
+    return [_Entry(position, question.stem,
+                   tuple((choice.letter, choice.text) for choice in question.choices),
+                   question.correct_answer)
+            for position, question in enumerate(questions, 1)]
+
+
+def _plain(text: str, use_html: bool) -> str:
+    if use_html:
+        text = html.unescape(_TAG_PATTERN.sub(' ', text))
+    return ' '.join(text.split())
+
+
+def _excerpt(text: str, use_html: bool) -> str:
+    text = _plain(text, use_html)
+    if len(text) > _EXCERPT_LENGTH:
+        text = text[:_EXCERPT_LENGTH - 3] + '...'
+    return text
+
+
+def _similar(old: _Entry, new: _Entry, use_html: bool) -> bool:
+    """Return whether two questions share enough words, ignoring markup."""
+    old_words = set(_plain('\n'.join([old.stem, *(text for _, text in old.choices)]), use_html).split())
+    new_words = set(_plain('\n'.join([new.stem, *(text for _, text in new.choices)]), use_html).split())
+    union = len(old_words | new_words)
+    return not union or len(old_words & new_words) / union >= SIMILARITY
+
+
+def _pair_by(key: str, old: List[_Entry], new: List[_Entry], pairs: dict):
+    """Pair unpaired old and new entries with the same key, in order."""
+    waiting = {}
+    for entry in new:
+        if entry.position not in pairs['new']:
+            waiting.setdefault(getattr(entry, key), deque()).append(entry)
+    for entry in old:
+        if entry.position in pairs['old']:
+            continue
+        queue = waiting.get(getattr(entry, key))
+        if queue:
+            match = queue.popleft()
+            pairs['old'][entry.position] = match
+            pairs['new'][match.position] = entry
+
+
+def _in_order(pairs: List[Tuple[_Entry, _Entry]]) -> set:
+    """
+    Return the old positions of the longest run of pairs in new order.
+    
+    Pairs are given in old order; this is the longest increasing
+    subsequence of their new positions.
+    """
+    tails = []  # new position ending the best run of each length
+    tail_index = []
+    previous = [None] * len(pairs)
+    for index, (_, new) in enumerate(pairs):
+        length = bisect.bisect_left(tails, new.position)
+        if length == len(tails):
+            tails.append(new.position)
+            tail_index.append(index)
+        else:
+            tails[length] = new.position
+            tail_index[length] = index
+        previous[index] = tail_index[length - 1] if length else None
+    
+    positions = set()
+    index = tail_index[-1] if tail_index else None
+    while index is not None:
+        positions.add(pairs[index][0].position)
+        index = previous[index]
+    return positions
+
+
+def _compare(old: _Entry, new: _Entry) -> List[str]:
+    """Return what changed between two versions of a question."""
+    changes = []
+    if old.stem != new.stem:
+        changes.append("stem")
+    old_choices, new_choices = dict(old.choices), dict(new.choices)
+    for letter, text in old.choices:
+        if letter not in new_choices:
+            changes.append(f"choice {letter} removed")
+        elif new_choices[letter] != text:
+            changes.append(f"choice {letter}")
+    for letter, _ in new.choices:
+        if letter not in old_choices:
+            changes.append(f"choice {letter} added")
+    if [letter for letter, _ in old.choices if letter in new_choices] != \
+            [letter for letter, _ in new.choices if letter in old_choices]:
+        changes.append("choice order")
+    if old.correct != new.correct:
+        changes.append(f"correct answer {old.correct or 'none'} -> {new.correct or 'none'}")
+    return changes
+
+
+def diff_questions(
+    old_questions: List[Question],
+    new_questions: List[Question],
+    use_html: bool = False
+) -> List[QuestionChange]:
+    """
+    Compare two versions of an exam question by question.
+    
+    Args:
+        old_questions: Questions of the earlier version.
+        new_questions: Questions of the later version.
+        use_html: Compare the questions' rendered HTML (stem_html and
+            choice html) instead of their markdown.
+    
+    Returns:
+        The differences in the order of the new version, with each removed
+        question where it used to be. Unchanged questions are left out.
+    """
+    old = _entries(old_questions, use_html)
+    new = _entries(new_questions, use_html)
+    
+    pairs = {'old': {}, 'new': {}}
+    for key in ('key', 'stem_key', 'choices_key'):
+        _pair_by(key, old, new, pairs)
+    
+    paired = [(entry, pairs['old'][entry.position]) for entry in old if entry.position in pairs['old']]
+    in_order = _in_order(paired)
+    
+    # Unpaired questions between the same two questions kept in order are
+    # paired by position if they are similar
+    anchors = [(entry.position, match.position) for entry, match in paired
+               if entry.position in in_order]
+    anchors.append((len(old) + 1, len(new) + 1))
+    old_start = new_start = 1
+    for old_end, new_end in anchors:
+        old_gap = [entry for entry in old[old_start - 1:old_end - 1]
+                   if entry.position not in pairs['old']]
+        new_gap = [entry for entry in new[new_start - 1:new_end - 1]
+                   if entry.position not in pairs['new']]
+        for old_entry, new_entry in zip(old_gap, new_gap):
+            if _similar(old_entry, new_entry, use_html):
+                pairs['old'][old_entry.position] = new_entry
+                pairs['new'][new_entry.position] = old_entry
+                in_order.add(old_entry.position)
+        old_start, new_start = old_end + 1, new_end + 1
+    
+    # Walk the new version, putting removed questions after the question
+    # kept in order that they followed
+    removed_after = {}
+    last_kept = 0
+    for entry in old:
+        match = pairs['old'].get(entry.position)
+        if match is None:
+            removed_after.setdefault(last_kept, []).append(entry)
+        elif entry.position in in_order:
+            last_kept = match.position
+    
+    result = []
+    
+    def report_removed(new_position):
+        for entry in removed_after.get(new_position, ()):
+            result.append(QuestionChange('removed', entry.position, None, [],
+                                         _excerpt(entry.stem, use_html)))
+    
+    report_removed(0)
+    for entry in new:
+        match = pairs['new'].get(entry.position)
+        if match is None:
+            result.append(QuestionChange('added', None, entry.position, [],
+                                         _excerpt(entry.stem, use_html)))
+            continue
+        changes = [] if match.key == entry.key else _compare(match, entry)
+        if match.position not in in_order:
+            changes.insert(0, "moved")
+        if changes:
+            kind = 'moved' if changes == ["moved"] else 'changed'
+            result.append(QuestionChange(kind, match.position, entry.position, changes,
+                                         _excerpt(entry.stem, use_html)))
+        if match.position in in_order:
+            report_removed(entry.position)
+    return result
+
+
+def _read_markdown(path: str) -> List[Question]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return parse_markdown_exam(f.read())
+
+
+def _find_assessment(zf: zipfile.ZipFile) -> Tuple[Optional[str], Optional[str]]:
+    """Return the type and path of the document in a package holding the items."""
+    with zf.open('imsmanifest.xml') as stream:
+        for elem, parent in iter_elements(stream):
+            if local_name(elem.tag) == 'resource' and elem.get('type') in (QTI12_ASSESSMENT, QTI21_TEST):
+                return elem.get('type'), elem.get('href')
+    return None, None
+
+
+def _letter(ident: Optional[str]) -> Optional[str]:
+    """Return the choice letter from a generated choice id, "<item id>_<letter>"."""
+    return ident.rsplit('_', 1)[-1] if ident else None
+
+
+def _package_question(stem: str, choices: List[tuple], correct_id: Optional[str]) -> Question:
+    """Return a question read from a package; its number is set once all are read."""
+    return Question(
+        number=0,
+        stem=stem,
+        stem_html=stem,
+        choices=[Choice(letter=_letter(ident), text=text, is_correct=ident == correct_id, html=text)
+                 for ident, text in choices],
+        correct_answer=_letter(correct_id)
+    )
+
+
+def _iter_qti12(stream: BinaryIO) -> Iterator[Question]:
+    for elem, parent in iter_elements(stream):
+        if local_name(elem.tag) != 'item':
+            continue
+        ns = tag_namespace(elem)
+        stem = elem.findtext(f"{ns}presentation/{ns}material/{ns}mattext") or ''
+        choices = [(label.get('ident'), label.findtext(f"{ns}material/{ns}mattext") or '')
+                   for label in elem.iter(f"{ns}response_label")]
+        varequal = elem.find(f".//{ns}varequal")
+        yield _package_question(stem, choices, varequal.text if varequal is not None else None)
+        parent.remove(elem)
+
+
+def _xhtml(elem: Element) -> str:
+    """
+    Serialize parsed XHTML content the same way for both versions.
+    
+    QTI 2.1 elements lose their namespace, so the content serializes as
+    the rendered HTML it was built from does with _canonical_html. Other
+    namespaces stay in the tags: the result is only compared, not parsed.
+    """
+    ns = tag_namespace(elem)
+    if ns:
+        for child in elem.iter():
+            if child.tag.startswith(ns):
+                child.tag = child.tag[len(ns):]
+    elem.tag = 'div'
+    elem.attrib.clear()
+    elem.tail = None
+    parts = []
+    write_compact(elem, parts)
+    return ''.join(parts)
+
+
+def _canonical_html(text: str) -> str:
+    try:
+        return _xhtml(fromstring(f"<div>{text}</div>"))
+    except ParseError:
+        return text
+
+
+def _iter_qti21(zf: zipfile.ZipFile, href: str) -> Iterator[Question]:
+    with zf.open(href) as stream:
+        for elem, parent in iter_elements(stream):
+            if local_name(elem.tag) != 'assessmentItemRef':
+                continue
+            item = fromstring(zf.read(elem.get('href')))
+            ns = tag_namespace(item)
+            stem = item.find(f"{ns}itemBody/{ns}div")
+            choices = [(choice.get('identifier'), _xhtml(choice))
+                       for choice in list(item.iter(f"{ns}simpleChoice"))]
+            correct = item.findtext(f"{ns}responseDeclaration/{ns}correctResponse/{ns}value")
+            yield _package_question(_xhtml(stem) if stem is not None else '', choices, correct)
+            parent.remove(elem)
+
+
+def load_questions(path: str) -> Tuple[List[Question], str]:
+    """
+    Load the questions of a markdown file or a QTI package.
+    
+    Questions read from a package hold their HTML as both text and HTML,
+    and the letter of each choice from its generated id.
+    
+    Returns:
+        The questions and the kind of input: MARKDOWN, QTI12 or QTI21.
+    
+    Raises:
+        ValueError: If the file is not a markdown exam or QTI package.
+    """
+    if not zipfile.is_zipfile(path):
+        return _read_markdown(path), MARKDOWN
+    try:
+        with zipfile.ZipFile(path) as zf:
+            kind, href = _find_assessment(zf)
+            if kind == QTI12_ASSESSMENT:
+                with zf.open(href) as stream:
+                    questions, kind = list(_iter_qti12(stream)), QTI12
+            elif kind == QTI21_TEST:
+                questions, kind = list(_iter_qti21(zf, href)), QTI21
+            else:
+                raise ValueError("the manifest has no QTI 1.2 assessment or QTI 2.1 test")
+    except (zipfile.BadZipFile, KeyError, ParseError) as e:
+        raise ValueError(f"cannot read the package: {e}") from e
+    for number, question in enumerate(questions, 1):
+        question.number = number
+    return questions, kind
+
+
+def _comparable(versions: List[Tuple[List[Question], str]], renderer: str = None) -> bool:
+    """
+    Make loaded versions comparable, returning whether to compare HTML.
+    
+    Markdown is rendered when compared with a package, and HTML is
+    serialized like QTI 2.1 XHTML when compared with a QTI 2.1 package.
+    """
+    kinds = {kind for _, kind in versions}
+    if kinds == {MARKDOWN}:
+        return False
+    for questions, kind in versions:
+        if kind == MARKDOWN:
+            prerender_html(questions, renderer)
+    if QTI21 in kinds and len(kinds) > 1:
+        for questions, kind in versions:
+            if kind != QTI21:
+                for question in questions:
+                    question.stem_html = _canonical_html(question.stem_html)
+                    for choice in question.choices:
+                        choice.html = _canonical_html(choice.html)
+    return True
+
+
+def _describe(change: QuestionChange) -> str:
+    if change.kind == 'added':
+        return f"Question {change.new}: added: {change.excerpt}"
+    if change.kind == 'removed':
+        return f"Question {change.old} (old): removed: {change.excerpt}"
+    was = f" (was {change.old})" if change.old != change.new else ''
+    return f"Question {change.new}{was}: {', '.join(change.changes)}"
+
+
+def main(argv: List[str] = None) -> int:
+    """Entry point for the `diff` subcommand."""
+    parser = argparse.ArgumentParser(
+        prog='markdown-to-qti diff',
+        description='Show which questions changed, were added, removed or moved between two '
+                    'versions of an exam. Exits with 0 if they are the same, 1 if they differ '
+                    'and 2 on errors.'
+    )
+    parser.add_argument('old', metavar='OLD', help='Earlier version: a markdown file or QTI package')
+    parser.add_argument('new', metavar='NEW', help='Later version: a markdown file or QTI package')
+    parser.add_argument(
+        '--renderer',
+        type=str,
+        default=None,
+        metavar='NAME',
+        help='Renderer plugin for markdown compared with a package (default: markdown)'
+    )
+    parser.add_argument(
+        '--json',
+        action='store_true',
+        help='Print the differences as JSON'
+    )
+    args = parser.parse_args(argv)
+    
+    versions = []
+    for path in (args.old, args.new):
+        try:
+            versions.append(load_questions(path))
+        except (IOError, ValueError) as e:
+            print(f"Error reading '{path}': {e}", file=sys.stderr)
+            return 2
+    try:
+        use_html = _comparable(versions, args.renderer)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    
+    (old, _), (new, _) = versions
+    changes = diff_questions(old, new, use_html)
+    
+    if args.json:
+        print(json.dumps([asdict(change) for change in changes], ensure_ascii=False, indent=2))
+        return 1 if changes else 0
+    
+    counts = {kind: sum(1 for change in changes if change.kind == kind)
+              for kind in ('changed', 'added', 'removed', 'moved')}
+    unchanged = len(new) - counts['changed'] - counts['added'] - counts['moved']
+    print(f"{args.old}: {len(old)} question(s), {args.new}: {len(new)} question(s)")
+    print(', '.join(f"{count} {kind}" for kind, count in counts.items()) + f", {unchanged} unchanged.")
+    for change in changes:
+        print(f"  {_describe(change)}")
+    return 1 if changes else 0
@@ -0,0 +1,209 @@
+"""
+Incrementally reparsed model of a markdown exam being edited.
+"""
+import bisect
+import re
+from dataclasses import replace
+from typing import List, Optional
+
+from .diagnostics import Diagnostic, check_question_block
+from .parser import FENCE_LINE_PATTERN, GROUP_HEADING_PATTERN, Question, SourceSpan
+
+# Same rule as the parser's question pattern, applied to a single line. A
+# bare "12." only starts a question when a line break follows it.
+_QUESTION_START = re.compile(r'(\d{1,9})\.(?=\s|$)')
+
+
+def _shift_span(span: Optional[SourceSpan], lines: int) -> Optional[SourceSpan]:
+    """Move a span down by a number of lines."""
+    if span is None:
+        return None
+    return SourceSpan(span.start_line + lines, span.start_column,
+                      span.end_line + lines, span.end_column)
+
+
+class _Block:
+    """
+    A question block: the lines from one question start up to the next.
+    
+    A group heading inside the block, outside fenced code, ends the
+    question text as in the parser, but the block still runs to the next question so that edits
+    to the heading reparse the question before it.
+    
+    The parsed question and diagnostics use line numbers relative to the
+    block start, so blocks after an edit only need their start moved.
+    """
+    __slots__ = ('start', 'end', 'question', 'diagnostics')
+    
+    def __init__(self, start: int, end: int, lines: List[str]):
+        self.start = start
+        self.end = end
+        
+        stop = start + 1
+        in_fence = False
+        while stop < end:
+            if FENCE_LINE_PATTERN.match(lines[stop]):
+                in_fence = not in_fence
+            elif not in_fence and GROUP_HEADING_PATTERN.match(lines[stop]):
+                break
+            stop += 1
+        raw = '\n'.join(lines[start:stop])
+        match = _QUESTION_START.match(raw)
+        raw_text = raw[match.end():]
+        text = raw_text.strip()
+        text_start = match.end() + len(raw_text) - len(raw_text.lstrip())
+        text_line = raw.count('\n', 0, text_start)
+        text_column = text_start - (raw.rfind('\n', 0, text_start) + 1)
+        
+        header = SourceSpan(0, 0, 0, len(lines[start].rstrip()))
+        self.question, self.diagnostics = check_question_block(
+            int(match.group(1)), text, text_line, text_column, header)
+        
+        if self.question is not None:
+            text_end = text_start + len(text)
+            self.question.span = SourceSpan(
+                0, 0,
+                raw.count('\n', 0, text_end),
+                text_end - (raw.rfind('\n', 0, text_end) + 1)
+            )
+
+
+class ExamDocument:
+    """
+    A markdown exam kept parsed across edits.
+    
+    The document is split into question blocks. An edit reparses only the
+    blocks it touches; blocks after it are moved without being reparsed.
+    Parsing a document from scratch gives the same questions as
+    parse_markdown_exam, with source spans. Question groups are not
+    tracked, as they don't affect diagnostics.
+    """
+    
+    def __init__(self, text: str = ''):
+        self.lines = text.split('\n')
+        self._blocks = self._scan(0, len(self.lines))
+        self._starts = [block.start for block in self._blocks]
+    
+    @property
+    def text(self) -> str:
+        """The full text of the document."""
+        return '\n'.join(self.lines)
+    
+    def _is_question_start(self, index: int) -> bool:
+        match = _QUESTION_START.match(self.lines[index])
+        if match is None:
+            return False
+        # "12." on the last line has no line break after it
+        return match.end() < len(self.lines[index]) or index < len(self.lines) - 1
+    
+    def _scan(self, start: int, end: int) -> List[_Block]:
+        """Split lines start..end into blocks and parse them."""
+        starts = [i for i in range(start, end) if self._is_question_start(i)]
+        return [
+            _Block(block_start, block_end, self.lines)
+            for block_start, block_end in zip(starts, starts[1:] + [end])
+        ]
+    
+    def apply_change(
+        self,
+        start_line: int,
+        start_column: int,
+        end_line: int,
+        end_column: int,
+        new_text: str
+    ):
+        """
+        Replace a range of the document and reparse the affected blocks.
+        
+        Args:
+            start_line: Line of the start of the replaced range.
+            start_column: Column of the start of the replaced range.
+            end_line: Line of the end of the replaced range.
+            end_column: Column of the end of the replaced range (exclusive).
+            new_text: Text inserted in place of the range.
+        """
+        line_count = len(self.lines)
+        start_line = min(start_line, line_count - 1)
+        end_line = min(end_line, line_count - 1)
+        
+        prefix = self.lines[start_line][:start_column]
+        suffix = self.lines[end_line][end_column:]
+        new_lines = (prefix + new_text + suffix).split('\n')
+        self.lines[start_line:end_line + 1] = new_lines
+        delta = len(new_lines) - (end_line - start_line + 1)
+        
+        # The block holding the start of the edit is reparsed. If the edit
+        # touches its first line the question start may be gone, merging the
+        # block into the one before it.
+        first = bisect.bisect_right(self._starts, start_line) - 1
+        if first >= 0 and self._starts[first] == start_line:
+            first -= 1
+        last = bisect.bisect_right(self._starts, end_line) - 1
+        
+        region_start = self._blocks[first].start if first >= 0 else 0
+        if last >= 0:
+            region_end = self._blocks[last].end + delta
+        elif self._blocks:
+            region_end = self._blocks[0].start + delta
+        else:
+            region_end = len(self.lines)
+        
+        for block in self._blocks[last + 1:]:
+            block.start += delta
+            block.end += delta
+        
+        first = max(first, 0)
+        self._blocks[first:last + 1] = self._scan(region_start, region_end)
+        self._starts = [block.start for block in self._blocks]
+    
+    def replace_text(self, text: str):
+        """Replace the whole document."""
+        self.__init__(text)
+    
+    def questions(self) -> List[Question]:
+        """
+        Return the parsed questions with spans in document coordinates.
+        
+        Returns:
+            A list of Question objects.
+        """
+        questions = []
+        for block in self._blocks:
+            question = block.question
+            if question is None:
+                continue
+            questions.append(replace(
+                question,
+                choices=[
+                    replace(choice, span=_shift_span(choice.span, block.start))
+                    for choice in question.choices
+                ],
+                span=_shift_span(question.span, block.start)
+            ))
+        return questions
+    
+    def diagnostics(self) -> List[Diagnostic]:
+        """
+        Return the diagnostics for the document in source order.
+        
+        Returns:
+            A list of Diagnostic objects.
+        """
+        return [
+            replace(diagnostic, span=_shift_span(diagnostic.span, block.start))
+            for block in self._blocks
+            for diagnostic in block.diagnostics
+        ]
+
+
+def check_markdown_exam(markdown_content: str) -> List[Diagnostic]:
+    """
+    Check a whole markdown exam for authoring problems.
+    
+    Args:
+        markdown_content: The markdown content to check.
+    
+    Returns:
+        A list of Diagnostic objects in source order.
+    """
+    return ExamDocument(markdown_content).diagnostics()
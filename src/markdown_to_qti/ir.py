@@ -0,0 +1,172 @@
+"""
+Compact intermediate representation (IR) of parsed exams.
+
+An IR file stores parsed questions, and optionally their rendered HTML, so
+later runs can skip parsing and rendering. The format is JSON lines: a
+header object followed by one JSON array per question. Files ending in
+``.gz`` are gzip-compressed.
+
+Header layout:
+    {"format", "version", "questions", "renderer",
+     "groups": [[title, pick, points]...]}
+Question line layout:
+    [number, stem, correct_answer, choices, stem_html, span, group, tags, bloom]
+Choice layout:
+    [letter, text, is_correct, html, span]
+Spans are [start_line, start_column, end_line, end_column] or null. The
+group is an index into the header's groups, or null. The renderer names
+the renderer plugin that produced the stored HTML, or is null if no HTML
+is stored; HTML from another renderer than the one asked for on loading
+is dropped, so that it is rendered again.
+"""
+import gzip
+import json
+from pathlib import Path
+from typing import IO, List
+
+from .parser import Choice, Question, QuestionGroup, SourceSpan
+from .plugins import DEFAULT_RENDERER
+from .qti_generator import prerender_html
+
+IR_FORMAT = 'markdown-to-qti-ir'
+IR_VERSION = 1
+
+
+def open_text(path: Path, mode: str) -> IO[str]:
+    if path.suffix == '.gz':
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def _span_to_list(span):
+    if span is None:
+        return None
+    return [span.start_line, span.start_column, span.end_line, span.end_column]
+
+
+def _span_from_list(values):
+    if values is None:
+        return None
+    return SourceSpan(*values)
+
+
+def save_ir(
+    questions: List[Question],
+    output_path: str,
+    include_html: bool = False,
+    renderer: str = None
+) -> str:
+    """
+    Write parsed questions to an IR file.
+    
+    Args:
+        questions: List of Question objects to store.
+        output_path: Path of the IR file. A ``.gz`` suffix compresses it.
+        include_html: Render and store the HTML for stems and choices.
+        renderer: Name of the renderer plugin used for the stored HTML.
+    
+    Returns:
+        Path to the written IR file.
+    """
+    if include_html:
+        prerender_html(questions, renderer)
+    
+    output_path = Path(output_path)
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+    
+    # Questions refer to their group by index, so shared groups stay shared
+    group_indexes = {}
+    groups = []
+    for question in questions:
+        group = question.group
+        if group is not None and id(group) not in group_indexes:
+            group_indexes[id(group)] = len(groups)
+            groups.append([group.title, group.pick, group.points])
+    
+    with open_text(output_path, 'w') as f:
+        f.write(dumps({
+            'format': IR_FORMAT,
+            'version': IR_VERSION,
+            'questions': len(questions),
+            'renderer': (renderer or DEFAULT_RENDERER) if include_html else None,
+            'groups': groups,
+        }))
+        f.write('\n')
+        for question in questions:
+            f.write(dumps([
+                question.number,
+                question.stem,
+                question.correct_answer,
+                [
+                    [c.letter, c.text, c.is_correct, c.html, _span_to_list(c.span)]
+                    for c in question.choices
+                ],
+                question.stem_html,
+                _span_to_list(question.span),
+                group_indexes.get(id(question.group)),
+                question.tags,
+                question.bloom,
+            ]))
+            f.write('\n')
+    
+    return str(output_path)
+
+
+def load_ir(input_path: str, renderer: str = None) -> List[Question]:
+    """
+    Load parsed questions from an IR file.
+    
+    Args:
+        input_path: Path of the IR file.
+        renderer: Name of the renderer plugin the questions will be
+            rendered with. Stored HTML from another renderer is dropped.
+    
+    Returns:
+        A list of Question objects, with pre-rendered HTML if it was stored
+        by the same renderer.
+    
+    Raises:
+        ValueError: If the file is not an IR file or has an unsupported version.
+    """
+    with open_text(Path(input_path), 'r') as f:
+        lines = f.read().split('\n')
+    
+    try:
+        header = json.loads(lines[0])
+    except ValueError:
+        header = None
+    if not isinstance(header, dict) or header.get('format') != IR_FORMAT:
+        raise ValueError(f"'{input_path}' is not a markdown-to-qti IR file")
+    if header.get('version') != IR_VERSION:
+        raise ValueError(
+            f"Unsupported IR version {header.get('version')} (expected {IR_VERSION})")
+    
+    groups = [QuestionGroup(*values) for values in header.get('groups', [])]
+    keep_html = header.get('renderer') == (renderer or DEFAULT_RENDERER)
+    
+    loads = json.loads
+    questions = []
+    for line in lines[1:]:
+        if not line:
+            continue
+        number, stem, correct_answer, choices, stem_html, span, group, tags, bloom = loads(line)
+        questions.append(Question(
+            number=number,
+            stem=stem,
+            choices=[
+                Choice(letter, text, is_correct, _span_from_list(c_span),
+                       html if keep_html else None)
+                for letter, text, is_correct, html, c_span in choices
+            ],
+            correct_answer=correct_answer,
+            span=_span_from_list(span),
+            stem_html=stem_html if keep_html else None,
+            group=groups[group] if group is not None else None,
+            tags=tags,
+            bloom=bloom,
+        ))
+    
+    if len(questions) != header.get('questions'):
+        raise ValueError(f"IR file '{input_path}' is truncated")
+    
+    return questions
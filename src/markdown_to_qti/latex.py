@@ -0,0 +1,529 @@
+"""
+Offline LaTeX to MathML conversion with a persistent render cache.
+
+Math in stems and choices ($...$ inline, $$...$$ display) is converted to
+MathML, which Canvas displays without an equation server. The converter
+covers the LaTeX commonly used in exams: scripts, fractions, roots, Greek
+letters, operators and relations, big operators, functions, delimiters,
+text and font styles. Anything it does not understand is shown as its
+escaped source, dollar signs included, rather than dropped.
+
+Rendered expressions are cached in memory for the run. A persistent
+cache, an SQLite database shared by all runs and exams that makes banks
+where the same formulas recur convert at close to plain-text speed, is
+used only when a file is chosen with the MARKDOWN_TO_QTI_MATH_CACHE
+environment variable or configure_math_cache.
+"""
+import hashlib
+import html
+import os
+import re
+import sqlite3
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# Bump when the converter output changes so stale cache entries are ignored
+CONVERTER_VERSION = 1
+
+MATH_CACHE_ENV = 'MARKDOWN_TO_QTI_MATH_CACHE'
+
+# Expressions kept in memory; the least recently used are dropped first
+MEMORY_ENTRIES = 4096
+
+_MATHML_NAMESPACE = 'http://www.w3.org/1998/Math/MathML'
+
+# Nesting limit for groups and command arguments, so hostile input can't
+# exhaust the stack
+_MAX_DEPTH = 50
+
+_TOKEN_PATTERN = re.compile(
+    r'\\([a-zA-Z]+)\s*'       # command
+    r'|\\(.)'                 # escaped symbol, e.g. \{ or \,
+    r'|(\d+(?:\.\d+)?)'       # number
+    r'|([a-zA-Z])'            # identifier
+    r'|(\s+)'                 # whitespace
+    r'|(.)',                  # any other character
+    re.DOTALL
+)
+
+_GREEK = {
+    'alpha': 'α', 'beta': 'β', 'gamma': 'γ', 'delta': 'δ', 'epsilon': 'ϵ',
+    'varepsilon': 'ε', 'zeta': 'ζ', 'eta': 'η', 'theta': 'θ', 'vartheta': 'ϑ',
+    'iota': 'ι', 'kappa': 'κ', 'lambda': 'λ', 'mu': 'μ', 'nu': 'ν', 'xi': 'ξ',
+    'pi': 'π', 'varpi': 'ϖ', 'rho': 'ρ', 'varrho': 'ϱ', 'sigma': 'σ',
+    'varsigma': 'ς', 'tau': 'τ', 'upsilon': 'υ', 'phi': 'ϕ', 'varphi': 'φ',
+    'chi': 'χ', 'psi': 'ψ', 'omega': 'ω',
+    'Gamma': 'Γ', 'Delta': 'Δ', 'Theta': 'Θ', 'Lambda': 'Λ', 'Xi': 'Ξ',
+    'Pi': 'Π', 'Sigma': 'Σ', 'Upsilon': 'Υ', 'Phi': 'Φ', 'Psi': 'Ψ',
+    'Omega': 'Ω',
+}
+
+_SYMBOL_CHARS = {
+    'infty': '∞', 'emptyset': '∅', 'nabla': '∇', 'partial': '∂', 'ell': 'ℓ',
+    'hbar': 'ℏ', 'aleph': 'ℵ',
+}
+
+_OPERATORS = {
+    'times': '×', 'cdot': '⋅', 'div': '÷', 'pm': '±', 'mp': '∓', 'ast': '∗',
+    'circ': '∘', 'bullet': '∙', 'oplus': '⊕', 'otimes': '⊗',
+    'leq': '≤', 'le': '≤', 'geq': '≥', 'ge': '≥', 'neq': '≠', 'ne': '≠',
+    'approx': '≈', 'equiv': '≡', 'sim': '∼', 'simeq': '≃', 'cong': '≅',
+    'propto': '∝', 'll': '≪', 'gg': '≫',
+    'in': '∈', 'notin': '∉', 'ni': '∋', 'subset': '⊂', 'subseteq': '⊆',
+    'supset': '⊃', 'supseteq': '⊇', 'cup': '∪', 'cap': '∩', 'setminus': '∖',
+    'land': '∧', 'wedge': '∧', 'lor': '∨', 'vee': '∨', 'lnot': '¬', 'neg': '¬',
+    'forall': '∀', 'exists': '∃', 'therefore': '∴', 'because': '∵',
+    'to': '→', 'rightarrow': '→', 'leftarrow': '←', 'leftrightarrow': '↔',
+    'Rightarrow': '⇒', 'Leftarrow': '⇐', 'Leftrightarrow': '⇔',
+    'implies': '⟹', 'iff': '⟺', 'mapsto': '↦',
+    'ldots': '…', 'cdots': '⋯', 'vdots': '⋮', 'ddots': '⋱', 'dots': '…',
+    'mid': '∣', 'parallel': '∥', 'perp': '⊥', 'angle': '∠', 'prime': '′',
+    'langle': '⟨', 'rangle': '⟩', 'lfloor': '⌊', 'rfloor': '⌋',
+    'lceil': '⌈', 'rceil': '⌉', 'vert': '|', 'Vert': '‖',
+    'lbrace': '{', 'rbrace': '}',
+}
+
+# Operators whose limits go above and below
+_BIG_OPERATORS = {
+    'sum': '∑', 'prod': '∏', 'coprod': '∐', 'bigcup': '⋃', 'bigcap': '⋂',
+}
+
+# Operators whose limits are attached as scripts
+_INTEGRALS = {'int': '∫', 'iint': '∬', 'iiint': '∭', 'oint': '∮'}
+
+_FUNCTIONS = {
+    'sin', 'cos', 'tan', 'cot', 'sec', 'csc', 'arcsin', 'arccos', 'arctan',
+    'sinh', 'cosh', 'tanh', 'log', 'ln', 'lg', 'exp', 'det', 'dim', 'gcd',
+    'deg', 'arg', 'ker', 'Pr',
+}
+
+# Functions whose limits go underneath
+_LIMIT_FUNCTIONS = {'lim', 'max', 'min', 'sup', 'inf', 'limsup', 'liminf'}
+
+_SPACES = {',': '0.167em', ':': '0.222em', ';': '0.278em', '!': '-0.167em',
+           ' ': '0.278em', 'quad': '1em', 'qquad': '2em'}
+
+_FONTS = {
+    'mathbf': 'bold', 'mathit': 'italic',
+    'mathbb': 'double-struck', 'mathcal': 'script', 'mathsf': 'sans-serif',
+    'mathtt': 'monospace', 'boldsymbol': 'bold-italic', 'mathfrak': 'fraktur',
+}
+
+_ACCENTS = {
+    'hat': '^', 'bar': '¯', 'overline': '¯', 'vec': '→', 'dot': '˙',
+    'ddot': '¨', 'tilde': '~', 'widehat': '^', 'widetilde': '~',
+}
+
+_TEXT_COMMANDS = {'text', 'textrm', 'mbox', 'mathrm', 'operatorname'}
+
+
+class LatexError(ValueError):
+    """Raised when an expression can't be converted."""
+
+
+def _escape(text: str) -> str:
+    return html.escape(text, quote=False)
+
+
+class _Parser:
+    """Recursive-descent parser from LaTeX tokens to MathML markup."""
+    
+    def __init__(self, expression: str):
+        self.tokens = []
+        for match in _TOKEN_PATTERN.finditer(expression):
+            command, escaped, number, identifier, space, other = match.groups()
+            if space is not None:
+                self.tokens.append(('space', ' '))
+            elif command is not None:
+                self.tokens.append(('command', command))
+            elif escaped is not None:
+                self.tokens.append(('escaped', escaped))
+            elif number is not None:
+                self.tokens.append(('number', number))
+            elif identifier is not None:
+                self.tokens.append(('identifier', identifier))
+            else:
+                self.tokens.append(('char', other))
+        self.pos = 0
+        self.depth = 0
+    
+    def _peek(self, raw: bool = False):
+        # Whitespace only matters inside text arguments
+        if not raw:
+            while self.pos < len(self.tokens) and self.tokens[self.pos][0] == 'space':
+                self.pos += 1
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return None
+    
+    def _next(self, raw: bool = False):
+        token = self._peek(raw)
+        if token is None:
+            raise LatexError("Unexpected end of expression")
+        self.pos += 1
+        return token
+    
+    def parse(self) -> str:
+        nodes = self._parse_sequence(None)
+        if self._peek() is not None:
+            raise LatexError(f"Unexpected '{self._peek()[1]}'")
+        return _row(nodes)
+    
+    def _descend(self):
+        """
+        Count one level of nesting.
+        
+        Every recursion passes through _parse_sequence or _parse_atom, which
+        call this on entry and decrement depth on return.
+        """
+        self.depth += 1
+        if self.depth > _MAX_DEPTH:
+            raise LatexError("Expression is nested too deeply")
+    
+    def _parse_sequence(self, end: Optional[str]) -> List[str]:
+        """Parse atoms until a closing brace, \\right or the end."""
+        self._descend()
+        nodes = []
+        while True:
+            token = self._peek()
+            if token is None:
+                if end is not None:
+                    raise LatexError(f"Missing '{end}'")
+                break
+            if token == ('char', '}') and end == '}':
+                self.pos += 1
+                break
+            if token == ('command', 'right') and end == 'right':
+                break
+            if token in (('char', '}'), ('command', 'right')):
+                raise LatexError(f"Unexpected '{token[1]}'")
+            nodes.append(self._parse_scripts(self._parse_atom()))
+        self.depth -= 1
+        return nodes
+    
+    def _parse_group(self) -> str:
+        """Parse a braced group or a single atom as an argument."""
+        token = self._peek()
+        if token == ('char', '{'):
+            self.pos += 1
+            return _row(self._parse_sequence('}'))
+        if token is None:
+            raise LatexError("Missing argument")
+        return self._parse_atom()
+    
+    def _parse_text_argument(self) -> str:
+        """Read a braced argument as literal text."""
+        if self._next() != ('char', '{'):
+            raise LatexError("Expected '{'")
+        parts = []
+        depth = 1
+        while True:
+            kind, value = self._next(raw=True)
+            if (kind, value) == ('char', '{'):
+                depth += 1
+            elif (kind, value) == ('char', '}'):
+                depth -= 1
+                if depth == 0:
+                    break
+            parts.append('\\' + value if kind == 'command' else value)
+        return ''.join(parts)
+    
+    def _parse_scripts(self, base: str) -> str:
+        """Attach ^ and _ scripts following an atom."""
+        sub = sup = None
+        primes = []
+        while True:
+            token = self._peek()
+            if token == ('char', '^') and sup is None:
+                self.pos += 1
+                sup = self._parse_group()
+            elif token == ('char', '_') and sub is None:
+                self.pos += 1
+                sub = self._parse_group()
+            elif token == ('char', "'") and sup is None:
+                self.pos += 1
+                primes.append('<mo>′</mo>')
+            else:
+                break
+        if primes:
+            sup = _row(primes + ([sup] if sup is not None else []))
+        
+        under_over = base.startswith('<mo movablelimits') or base.startswith('<mi movablelimits')
+        if sub is not None and sup is not None:
+            tag = 'munderover' if under_over else 'msubsup'
+            return f'<{tag}>{base}{sub}{sup}</{tag}>'
+        if sub is not None:
+            tag = 'munder' if under_over else 'msub'
+            return f'<{tag}>{base}{sub}</{tag}>'
+        if sup is not None:
+            tag = 'mover' if under_over else 'msup'
+            return f'<{tag}>{base}{sup}</{tag}>'
+        return base
+    
+    def _parse_atom(self) -> str:
+        """Parse one atom, with its arguments."""
+        self._descend()
+        atom = self._parse_token(*self._next())
+        self.depth -= 1
+        return atom
+    
+    def _parse_token(self, kind: str, value: str) -> str:
+        
+        if kind == 'number':
+            return f'<mn>{value}</mn>'
+        if kind == 'identifier':
+            return f'<mi>{value}</mi>'
+        if kind == 'escaped':
+            if value in _SPACES:
+                return f'<mspace width="{_SPACES[value]}"/>'
+            if value == '\\':
+                # Line breaks are not supported inline; show a space
+                return f'<mspace width="{_SPACES[" "]}"/>'
+            return f'<mo>{_escape(value)}</mo>'
+        if kind == 'char':
+            if value == '{':
+                return _row(self._parse_sequence('}'))
+            if value in '^_':
+                raise LatexError(f"Misplaced '{value}'")
+            if value == '&':
+                raise LatexError("Alignment is not supported")
+            if value == '-':
+                return '<mo>−</mo>'
+            return f'<mo>{_escape(value)}</mo>'
+        return self._parse_command(value)
+    
+    def _parse_command(self, name: str) -> str:
+        if name in _GREEK:
+            return f'<mi>{_GREEK[name]}</mi>'
+        if name in _SYMBOL_CHARS:
+            return f'<mi>{_SYMBOL_CHARS[name]}</mi>'
+        if name in _OPERATORS:
+            return f'<mo>{_escape(_OPERATORS[name])}</mo>'
+        if name in _BIG_OPERATORS:
+            return f'<mo movablelimits="true" largeop="true">{_BIG_OPERATORS[name]}</mo>'
+        if name in _INTEGRALS:
+            return f'<mo largeop="true">{_INTEGRALS[name]}</mo>'
+        if name in _FUNCTIONS:
+            return f'<mi>{name}</mi>'
+        if name in _LIMIT_FUNCTIONS:
+            label = {'limsup': 'lim sup', 'liminf': 'lim inf'}.get(name, name)
+            return f'<mi movablelimits="true">{label}</mi>'
+        if name in _SPACES:
+            return f'<mspace width="{_SPACES[name]}"/>'
+        
+        if name in ('frac', 'dfrac', 'tfrac'):
+            numerator = self._parse_group()
+            denominator = self._parse_group()
+            return f'<mfrac>{numerator}{denominator}</mfrac>'
+        if name == 'binom':
+            top = self._parse_group()
+            bottom = self._parse_group()
+            return f'<mrow><mo>(</mo><mfrac linethickness="0">{top}{bottom}</mfrac><mo>)</mo></mrow>'
+        if name == 'sqrt':
+            if self._peek() == ('char', '['):
+                self.pos += 1
+                index = []
+                while self._peek() != ('char', ']'):
+                    if self._peek() is None:
+                        raise LatexError("Missing ']'")
+                    index.append(self._parse_scripts(self._parse_atom()))
+                self.pos += 1
+                radicand = self._parse_group()
+                return f'<mroot>{radicand}{_row(index)}</mroot>'
+            return f'<msqrt>{self._parse_group()}</msqrt>'
+        if name in _TEXT_COMMANDS:
+            text = self._parse_text_argument()
+            if name == 'operatorname':
+                return f'<mi>{_escape(text)}</mi>'
+            if name == 'mathrm':
+                return f'<mi mathvariant="normal">{_escape(text)}</mi>'
+            return f'<mtext>{_escape(text)}</mtext>'
+        if name in _FONTS:
+            return f'<mstyle mathvariant="{_FONTS[name]}">{self._parse_group()}</mstyle>'
+        if name in _ACCENTS:
+            return f'<mover accent="true">{self._parse_group()}<mo>{_ACCENTS[name]}</mo></mover>'
+        if name == 'underline':
+            return f'<munder accentunder="true">{self._parse_group()}<mo>_</mo></munder>'
+        if name == 'left':
+            opening = self._parse_delimiter()
+            body = self._parse_sequence('right')
+            self._next()  # \right
+            closing = self._parse_delimiter()
+            return f'<mrow>{opening}{"".join(body)}{closing}</mrow>'
+        if name in ('big', 'Big', 'bigg', 'Bigg', 'bigl', 'bigr', 'Bigl', 'Bigr'):
+            return self._parse_delimiter()
+        
+        raise LatexError(f"Unsupported command \\{name}")
+    
+    def _parse_delimiter(self) -> str:
+        kind, value = self._next()
+        if kind == 'char' and value == '.':
+            return ''
+        if kind == 'command':
+            if value not in _OPERATORS:
+                raise LatexError(f"Unsupported delimiter \\{value}")
+            value = _OPERATORS[value]
+        return f'<mo fence="true" stretchy="true">{_escape(value)}</mo>'
+
+
+def _row(nodes: List[str]) -> str:
+    if len(nodes) == 1:
+        return nodes[0]
+    return '<mrow>' + ''.join(nodes) + '</mrow>'
+
+
+def latex_to_mathml(expression: str, display: bool = False) -> str:
+    """
+    Convert a LaTeX math expression to MathML.
+    
+    Args:
+        expression: LaTeX source without the surrounding dollar signs.
+        display: Render as a display (block) equation.
+    
+    Returns:
+        A <math> element as a string.
+    
+    Raises:
+        LatexError: If the expression uses unsupported or malformed syntax.
+    """
+    body = _Parser(expression).parse()
+    display_attr = 'block' if display else 'inline'
+    annotation = _escape(expression.strip())
+    return (
+        f'<math xmlns="{_MATHML_NAMESPACE}" display="{display_attr}">'
+        f'<semantics>{body}'
+        f'<annotation encoding="application/x-tex">{annotation}</annotation>'
+        f'</semantics></math>'
+    )
+
+
+def _configured_cache_path() -> Optional[Path]:
+    value = os.environ.get(MATH_CACHE_ENV)
+    return Path(value) if value else None
+
+
+class MathCache:
+    """
+    Cache of rendered expressions, in memory and optionally on disk.
+    
+    Args:
+        path: SQLite database file shared across runs, or None to keep
+            the cache in memory only.
+    """
+    
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path
+        self._memory: Dict[Tuple[str, bool], str] = {}
+        self._connection = None
+        if path is not None:
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                connection = sqlite3.connect(str(path), timeout=30, isolation_level=None)
+                connection.execute('PRAGMA journal_mode=WAL')
+                connection.execute('PRAGMA synchronous=OFF')
+                connection.execute(
+                    'CREATE TABLE IF NOT EXISTS math (key TEXT PRIMARY KEY, markup TEXT NOT NULL)')
+                self._connection = connection
+            except (OSError, sqlite3.Error):
+                # An unusable cache directory only costs speed
+                self._connection = None
+    
+    @staticmethod
+    def key(expression: str, display: bool) -> str:
+        """Hash identifying an expression's rendering in the cache file."""
+        data = f"{CONVERTER_VERSION}\0{int(display)}\0{expression}".encode('utf-8')
+        return hashlib.sha256(data).hexdigest()
+    
+    def get(self, expression: str, display: bool) -> Optional[str]:
+        """Return the cached markup for an expression, or None."""
+        markup = self._memory.pop((expression, display), None)
+        if markup is not None:
+            self._memory[(expression, display)] = markup
+        elif self._connection is not None:
+            try:
+                row = self._connection.execute(
+                    'SELECT markup FROM math WHERE key = ?',
+                    (self.key(expression, display),)).fetchone()
+            except sqlite3.Error:
+                row = None
+            if row is not None:
+                markup = row[0]
+                self._remember(expression, display, markup)
+        return markup
+    
+    def put(self, expression: str, display: bool, markup: str):
+        """Store the markup for an expression."""
+        self._remember(expression, display, markup)
+        if self._connection is not None:
+            try:
+                self._connection.execute(
+                    'INSERT OR REPLACE INTO math (key, markup) VALUES (?, ?)',
+                    (self.key(expression, display), markup))
+            except sqlite3.Error:
+                pass
+    
+    def _remember(self, expression: str, display: bool, markup: str):
+        self._memory.pop((expression, display), None)
+        if len(self._memory) >= MEMORY_ENTRIES:
+            # Dicts keep insertion order, and hits are moved to the end
+            del self._memory[next(iter(self._memory))]
+        self._memory[(expression, display)] = markup
+    
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+_cache: Optional[MathCache] = None
+_cache_pid: Optional[int] = None
+
+
+def get_math_cache() -> MathCache:
+    """Return the cache for this process, opening it on first use."""
+    global _cache, _cache_pid
+    # SQLite connections must not be shared with forked worker processes
+    if _cache is None or _cache_pid != os.getpid():
+        _cache = MathCache(_configured_cache_path())
+        _cache_pid = os.getpid()
+    return _cache
+
+
+def configure_math_cache(path: Optional[str]):
+    """
+    Choose the persistent math cache file, or disable it with None.
+    
+    The setting is stored in the environment so worker processes use the
+    same cache.
+    """
+    global _cache
+    os.environ[MATH_CACHE_ENV] = str(path) if path is not None else ''
+    if _cache is not None and _cache_pid == os.getpid():
+        _cache.close()
+    _cache = None
+
+
+def render_math(expression: str, display: bool = False) -> str:
+    """
+    Render a math expression to MathML, using the render cache.
+    
+    Expressions that can't be converted are returned as escaped source
+    text, with their dollar signs, so nothing is lost.
+    
+    Args:
+        expression: LaTeX source without the surrounding dollar signs.
+        display: Render as a display (block) equation.
+    
+    Returns:
+        HTML for the expression.
+    """
+    cache = get_math_cache()
+    markup = cache.get(expression, display)
+    if markup is None:
+        try:
+            markup = latex_to_mathml(expression, display)
+        except LatexError:
+            delimiter = '$$' if display else '$'
+            markup = html.escape(f"{delimiter}{expression}{delimiter}")
+        cache.put(expression, display, markup)
+    return markup
@@ -0,0 +1,248 @@
+"""
+Language server for markdown exam files.
+
+Speaks the Language Server Protocol over stdio. Each open document is kept
+as an ExamDocument that is reparsed incrementally on every edit, and the
+authoring diagnostics are pushed back to the editor.
+"""
+import argparse
+import json
+import sys
+from typing import BinaryIO, Dict, List, Optional
+
+from .diagnostics import ERROR
+from .document import ExamDocument
+
+# LSP constants
+_SYNC_INCREMENTAL = 2
+_SEVERITY_ERROR = 1
+_SEVERITY_WARNING = 2
+_PARSE_ERROR = -32700
+_INVALID_REQUEST = -32600
+_METHOD_NOT_FOUND = -32601
+_INTERNAL_ERROR = -32603
+
+
+def _utf16_to_column(line: str, character: int) -> int:
+    """Convert a UTF-16 code unit offset in a line to a string index."""
+    if line.isascii():
+        return character
+    units = 0
+    for column, char in enumerate(line):
+        if units >= character:
+            return column
+        units += 2 if ord(char) > 0xFFFF else 1
+    return len(line)
+
+
+def _column_to_utf16(line: str, column: int) -> int:
+    """Convert a string index in a line to a UTF-16 code unit offset."""
+    if line.isascii():
+        return column
+    prefix = line[:column]
+    return column + sum(1 for char in prefix if ord(char) > 0xFFFF)
+
+
+class LanguageServer:
+    """
+    A minimal LSP server for exam authoring.
+    
+    Args:
+        reader: Binary stream the client writes requests to.
+        writer: Binary stream the server writes responses to.
+    """
+    
+    def __init__(self, reader: BinaryIO, writer: BinaryIO):
+        self.reader = reader
+        self.writer = writer
+        self.documents: Dict[str, ExamDocument] = {}
+        self.utf16 = True
+        self.running = True
+        self.exit_code = 0
+        self._shutdown_requested = False
+    
+    def _read_message(self) -> Optional[dict]:
+        """Read one framed JSON-RPC message, or None at end of input."""
+        content_length = None
+        while True:
+            header = self.reader.readline()
+            if not header:
+                return None
+            header = header.strip()
+            if not header:
+                break
+            name, _, value = header.decode('ascii').partition(':')
+            if name.lower() == 'content-length':
+                content_length = int(value.strip())
+        
+        if content_length is None:
+            return {}
+        return json.loads(self.reader.read(content_length).decode('utf-8'))
+    
+    def _send(self, message: dict):
+        """Write one framed JSON-RPC message."""
+        body = json.dumps(message, separators=(',', ':')).encode('utf-8')
+        self.writer.write(f"Content-Length: {len(body)}\r\n\r\n".encode('ascii') + body)
+        self.writer.flush()
+    
+    def _notify(self, method: str, params: dict):
+        self._send({'jsonrpc': '2.0', 'method': method, 'params': params})
+    
+    def serve(self) -> int:
+        """
+        Handle messages until the client exits.
+        
+        Returns:
+            The process exit code requested by the protocol.
+        """
+        while self.running:
+            try:
+                message = self._read_message()
+            except ValueError as e:
+                error = {'code': _PARSE_ERROR, 'message': f"Invalid message: {e}"}
+                self._send({'jsonrpc': '2.0', 'id': None, 'error': error})
+                continue
+            if message is None:
+                break
+            self.handle(message)
+        return self.exit_code
+    
+    def handle(self, message: dict):
+        """
+        Dispatch a single JSON-RPC message.
+        
+        A handler that fails answers its request with an internal error;
+        failed notifications have no one to answer, so they are logged to
+        stderr. Either way the server keeps running.
+        """
+        if not isinstance(message, dict):
+            error = {'code': _INVALID_REQUEST, 'message': "Message is not an object"}
+            self._send({'jsonrpc': '2.0', 'id': None, 'error': error})
+            return
+        method = message.get('method')
+        params = message.get('params') or {}
+        handler = getattr(self, '_on_' + str(method or '').replace('/', '_'), None)
+        
+        if 'id' not in message:
+            # Notification: unknown ones are ignored
+            if handler is not None:
+                try:
+                    handler(params)
+                except Exception as e:
+                    print(f"Error: {method} failed: {type(e).__name__}: {e}", file=sys.stderr)
+            return
+        
+        if handler is None:
+            error = {'code': _METHOD_NOT_FOUND if method else _INVALID_REQUEST,
+                     'message': f"Method not found: {method}"}
+            self._send({'jsonrpc': '2.0', 'id': message['id'], 'error': error})
+            return
+        
+        try:
+            result = handler(params)
+        except Exception as e:
+            error = {'code': _INTERNAL_ERROR,
+                     'message': f"{method} failed: {type(e).__name__}: {e}"}
+            self._send({'jsonrpc': '2.0', 'id': message['id'], 'error': error})
+            return
+        self._send({'jsonrpc': '2.0', 'id': message['id'], 'result': result})
+    
+    def _on_initialize(self, params: dict) -> dict:
+        general = (params.get('capabilities') or {}).get('general') or {}
+        encodings = general.get('positionEncodings') or []
+        self.utf16 = 'utf-32' not in encodings
+        return {
+            'capabilities': {
+                'positionEncoding': 'utf-16' if self.utf16 else 'utf-32',
+                'textDocumentSync': {'openClose': True, 'change': _SYNC_INCREMENTAL},
+            },
+            'serverInfo': {'name': 'markdown-to-qti'},
+        }
+    
+    def _on_initialized(self, params: dict):
+        pass
+    
+    def _on_shutdown(self, params: dict):
+        self._shutdown_requested = True
+        return None
+    
+    def _on_exit(self, params: dict):
+        self.running = False
+        self.exit_code = 0 if self._shutdown_requested else 1
+    
+    def _on_textDocument_didOpen(self, params: dict):
+        text_document = params['textDocument']
+        self.documents[text_document['uri']] = ExamDocument(text_document['text'])
+        self._publish(text_document['uri'])
+    
+    def _on_textDocument_didChange(self, params: dict):
+        uri = params['textDocument']['uri']
+        document = self.documents.get(uri)
+        if document is None:
+            return
+        
+        for change in params['contentChanges']:
+            if 'range' not in change:
+                document.replace_text(change['text'])
+                continue
+            start = change['range']['start']
+            end = change['range']['end']
+            document.apply_change(
+                start['line'], self._column(document, start),
+                end['line'], self._column(document, end),
+                change['text']
+            )
+        self._publish(uri)
+    
+    def _on_textDocument_didClose(self, params: dict):
+        uri = params['textDocument']['uri']
+        self.documents.pop(uri, None)
+        self._notify('textDocument/publishDiagnostics', {'uri': uri, 'diagnostics': []})
+    
+    def _column(self, document: ExamDocument, position: dict) -> int:
+        """Convert an LSP position's character offset to a string index."""
+        if not self.utf16 or position['line'] >= len(document.lines):
+            return position['character']
+        return _utf16_to_column(document.lines[position['line']], position['character'])
+    
+    def _character(self, document: ExamDocument, line: int, column: int) -> int:
+        """Convert a string index to an LSP character offset."""
+        if not self.utf16 or line >= len(document.lines):
+            return column
+        return _column_to_utf16(document.lines[line], column)
+    
+    def _publish(self, uri: str):
+        """Push the current diagnostics for a document to the client."""
+        document = self.documents[uri]
+        diagnostics: List[dict] = []
+        for diagnostic in document.diagnostics():
+            span = diagnostic.span
+            diagnostics.append({
+                'range': {
+                    'start': {'line': span.start_line,
+                              'character': self._character(document, span.start_line, span.start_column)},
+                    'end': {'line': span.end_line,
+                            'character': self._character(document, span.end_line, span.end_column)},
+                },
+                'severity': _SEVERITY_ERROR if diagnostic.severity == ERROR else _SEVERITY_WARNING,
+                'source': 'markdown-to-qti',
+                'message': diagnostic.message,
+            })
+        self._notify('textDocument/publishDiagnostics', {'uri': uri, 'diagnostics': diagnostics})
+
+
+def main(argv: List[str] = None) -> int:
+    """Entry point for the `lsp` subcommand."""
+    parser = argparse.ArgumentParser(
+        prog='markdown-to-qti lsp',
+        description='Run a language server for markdown exam files over stdio.'
+    )
+    parser.add_argument(
+        '--stdio',
+        action='store_true',
+        help='Communicate over stdin/stdout (the default and only transport)'
+    )
+    parser.parse_args(argv)
+    
+    server = LanguageServer(sys.stdin.buffer, sys.stdout.buffer)
+    return server.serve()
@@ -1,9 +1,71 @@
 """
 Parser module for converting Markdown exam questions to structured data.
 """
+import bisect
+import heapq
 import re
 from dataclasses import dataclass, field
-from typing import List, Optional
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# Questions start at the beginning of a line with a number followed by a
+# period. Numbers are capped at 9 digits so a hostile run of digits can't
+# make int() expensive or raise.
+QUESTION_START_PATTERN = re.compile(r'(?:^|\n)(\d{1,9})\.(?=\s)')
+# The same rule applied to a single line, including its line ending
+_LINE_QUESTION_START_PATTERN = re.compile(r'(\d{1,9})\.(?=\s)')
+
+# Answer choices (a., b., c., etc. or *a., *b., etc.) with optional leading
+# whitespace. Uses (?:\s+|$) to match either whitespace after period or
+# end-of-line, enabling choices like "*a.\n```python" where code block is on
+# next line
+CHOICE_PATTERN = re.compile(r'^\s*(\*?)([a-zA-Z])\.(?:\s+|$)')
+
+# Question group headings, e.g. "## Group: Loops (pick 2, 1.5 points)".
+# "## End group" ends the current group.
+GROUP_HEADING_PATTERN = re.compile(
+    r'^##[ \t]+(?:(end[ \t]+group)[ \t]*|group\b:?(.*))$',
+    re.IGNORECASE | re.MULTILINE
+)
+# A line opening or closing fenced code. Group headings inside a fence are
+# code, e.g. a comment in a Python block; a fence ends at the next question.
+FENCE_LINE_PATTERN = re.compile(r'^[ \t]*```', re.MULTILINE)
+_GROUP_OPTIONS_PATTERN = re.compile(r'(.*)\(([^()]*)\)')
+_PICK_OPTION_PATTERN = re.compile(r'pick\s+(\d{1,9})', re.IGNORECASE)
+_POINTS_OPTION_PATTERN = re.compile(r'(\d{1,9}(?:\.\d+)?)\s+points?(?:\s+each)?', re.IGNORECASE)
+
+# Question metadata on a line of its own, e.g.
+# "<!-- tags: loops, recursion; bloom: apply -->"
+_METADATA_PATTERN = re.compile(r'<!--(.*)-->')
+_METADATA_KEYS = ('tags', 'bloom')
+
+# Levels of Bloom's taxonomy, from lowest to highest
+BLOOM_LEVELS = ('remember', 'understand', 'apply', 'analyze', 'evaluate', 'create')
+
+
+@dataclass
+class SourceSpan:
+    """
+    A region of the source markdown.
+    
+    Lines and columns are zero-based; the end position is exclusive.
+    """
+    start_line: int
+    start_column: int
+    end_line: int
+    end_column: int
+
+
+@dataclass
+class QuestionGroup:
+    """
+    A pool of questions from which Canvas draws some for each student.
+    
+    A pick of None draws every question in the group. Points of None
+    leaves each question at the default of one point.
+    """
+    title: str
+    pick: Optional[int] = None
+    points: Optional[float] = None
 
 
 @dataclass
@@ -12,6 +74,9 @@ class Choice:
     letter: str
     text: str
     is_correct: bool = False
+    span: Optional[SourceSpan] = field(default=None, compare=False, repr=False)
+    # Pre-rendered HTML for the text, when loaded from an IR file
+    html: Optional[str] = field(default=None, compare=False, repr=False)
 
 
 @dataclass
@@ -21,6 +86,14 @@ class Question:
     stem: str
     choices: List[Choice] = field(default_factory=list)
     correct_answer: Optional[str] = None
+    span: Optional[SourceSpan] = field(default=None, compare=False, repr=False)
+    # Pre-rendered HTML for the stem, when loaded from an IR file
+    stem_html: Optional[str] = field(default=None, compare=False, repr=False)
+    # Group the question belongs to; questions in a group share the object
+    group: Optional[QuestionGroup] = field(default=None, compare=False, repr=False)
+    tags: List[str] = field(default_factory=list)
+    # Bloom's taxonomy level, lowercased; usually one of BLOOM_LEVELS
+    bloom: Optional[str] = None
 
 
 def _update_code_block_state(text: str, in_code_block: bool) -> bool:
@@ -42,6 +115,73 @@ def _update_code_block_state(text: str, in_code_block: bool) -> bool:
     return in_code_block
 
 
+def _parse_metadata(text: str) -> Optional[List[tuple]]:
+    """
+    Parse a question metadata comment line.
+    
+    Args:
+        text: A line of a question block.
+    
+    Returns:
+        A list of (key, value) pairs, or None if the line is not a comment
+        holding only known metadata keys.
+    """
+    match = _METADATA_PATTERN.fullmatch(text.strip())
+    if match is None:
+        return None
+    entries = []
+    for entry in match.group(1).split(';'):
+        if not entry.strip():
+            continue
+        key, separator, value = entry.partition(':')
+        key = key.strip().lower()
+        if not separator or key not in _METADATA_KEYS:
+            return None
+        entries.append((key, value.strip()))
+    return entries or None
+
+
+def parse_group_heading(match: re.Match, index: int) -> Optional[QuestionGroup]:
+    """
+    Build the group started by a group heading.
+    
+    The heading text is the group title, optionally followed by options in
+    parentheses: "pick N" to draw N questions and "P points" for the
+    points of each question. Parentheses that don't hold options are kept
+    as part of the title.
+    
+    Args:
+        match: A GROUP_HEADING_PATTERN match.
+        index: One-based number of the group, used to name untitled groups.
+    
+    Returns:
+        A QuestionGroup, or None for an "## End group" heading.
+    """
+    if match.group(1):
+        return None
+    title = match.group(2).strip()
+    pick = points = None
+    
+    options = _GROUP_OPTIONS_PATTERN.fullmatch(title)
+    if options is not None:
+        parsed_pick = parsed_points = None
+        for option in options.group(2).split(','):
+            option = option.strip()
+            pick_match = _PICK_OPTION_PATTERN.fullmatch(option)
+            points_match = _POINTS_OPTION_PATTERN.fullmatch(option)
+            if pick_match and parsed_pick is None:
+                parsed_pick = int(pick_match.group(1))
+            elif points_match and parsed_points is None:
+                parsed_points = float(points_match.group(1))
+            else:
+                break
+        else:
+            title = options.group(1).strip()
+            pick, points = parsed_pick, parsed_points
+    
+    return QuestionGroup(title=title or f"Group {index}", pick=pick, points=points)
+
+
 def parse_markdown_exam(markdown_content: str) -> List[Question]:
     """
     Parse a markdown exam file and extract questions.
@@ -60,20 +200,38 @@ def parse_markdown_exam(markdown_content: str) -> List[Question]:
        *c. Correct choice (marked with asterisk)
        d. Choice D text
     
+    Questions after a "## Group: Title (pick N, P points)" heading belong
+    to that group, up to the next group heading or "## End group". A line
+    such as "<!-- tags: loops, recursion; bloom: apply -->" in a question
+    sets its tags and Bloom level.
+    
     Args:
         markdown_content: The markdown content to parse.
         
     Returns:
         A list of Question objects.
+    
+    Raises:
+        ValueError: If a group picks more questions than it contains, or none.
     """
     questions = []
     
-    # Split content into question blocks
-    # Questions start with a number followed by a period
-    question_pattern = r'(?:^|\n)(\d+)\.\s+'
+    # Offsets of line starts, used to turn offsets into line/column positions
+    line_starts = [0] + [m.end() for m in re.finditer('\n', markdown_content)]
     
+    def position(offset: int):
+        line = bisect.bisect_right(line_starts, offset) - 1
+        return line, offset - line_starts[line]
+    
+    # Split content into question blocks
     # Find all question starts
-    matches = list(re.finditer(question_pattern, markdown_content))
+    matches = list(QUESTION_START_PATTERN.finditer(markdown_content))
+    
+    # Group headings, in order; each one ends the question before it
+    headings = _group_headings(markdown_content, matches)
+    heading_index = 0
+    group = None
+    group_count = 0
     
     for i, match in enumerate(matches):
         question_num = int(match.group(1))
@@ -85,44 +243,218 @@ def parse_markdown_exam(markdown_content: str) -> List[Question]:
         else:
             end_pos = len(markdown_content)
         
-        question_text = markdown_content[start_pos:end_pos].strip()
+        # Headings before this question select its group
+        while heading_index < len(headings) and headings[heading_index].start() < match.start():
+            group = parse_group_heading(headings[heading_index], group_count + 1)
+            if group is not None:
+                group_count += 1
+            heading_index += 1
+        if heading_index < len(headings) and headings[heading_index].start() < end_pos:
+            end_pos = headings[heading_index].start()
+        
+        raw_text = markdown_content[start_pos:end_pos]
+        question_text = raw_text.strip()
+        text_start = start_pos + len(raw_text) - len(raw_text.lstrip())
         
         # Parse the question
-        question = _parse_question_block(question_num, question_text)
+        text_line, text_column = position(text_start)
+        question = parse_question_block(question_num, question_text, text_line, text_column)
         if question:
+            question.span = SourceSpan(
+                *position(match.start(1)),
+                *position(text_start + len(question_text))
+            )
+            question.group = group
             questions.append(question)
     
+    counts = {}
+    for question in questions:
+        if question.group is not None:
+            counts[id(question.group)] = counts.get(id(question.group), 0) + 1
+    for question in questions:
+        if question.group is not None:
+            check_group(question.group, counts[id(question.group)])
+    
     return questions
 
 
-def _parse_question_block(question_num: int, text: str) -> Optional[Question]:
+def iter_markdown_exam(lines: Iterable[str]) -> Iterator[Question]:
+    """
+    Parse a markdown exam as it is read, yielding each question when complete.
+    
+    Gives the same questions as parse_markdown_exam. A question is complete
+    once the next question or group heading starts, so questions can be
+    processed as the input arrives and only one is held at a time.
+    
+    Args:
+        lines: Lines of the exam including their line endings, e.g. an
+            open file or sys.stdin.
+    
+    Yields:
+        Question objects in source order.
+    
+    Raises:
+        ValueError: When a group ends that picks more questions than it
+            contains, or none.
+    """
+    group = None
+    group_size = 0
+    
+    for block_line, block, block_group in iter_question_blocks(lines):
+        if block_group is not group:
+            if group is not None and group_size:
+                check_group(group, group_size)
+            group = block_group
+            group_size = 0
+        
+        # Each block holds one question and is parsed on its own
+        for question in parse_markdown_exam(block):
+            _shift_spans(question, block_line)
+            question.group = group
+            group_size += 1
+            yield question
+    
+    if group is not None and group_size:
+        check_group(group, group_size)
+
+
+def _group_headings(text: str, question_starts: List[re.Match]) -> List[re.Match]:
+    """Find the group headings in text that are not inside fenced code."""
+    markers = heapq.merge(
+        ((match.start(), 0, match) for match in FENCE_LINE_PATTERN.finditer(text)),
+        ((match.start(), 1, match) for match in question_starts),
+        ((match.start(), 2, match) for match in GROUP_HEADING_PATTERN.finditer(text)),
+        key=lambda marker: marker[:2]
+    )
+    headings = []
+    in_fence = False
+    for _, kind, match in markers:
+        if kind == 0:
+            in_fence = not in_fence
+        elif kind == 1:
+            in_fence = False
+        elif not in_fence:
+            headings.append(match)
+    return headings
+
+
+def iter_question_blocks(lines: Iterable[str]) -> Iterator[Tuple[int, str, Optional[QuestionGroup]]]:
+    """
+    Split a markdown exam into question blocks as it is read.
+    
+    A block runs from a question's first line up to the next question or
+    group heading outside fenced code. Parsing a block with parse_markdown_exam gives its
+    question, if it has any choices.
+    
+    Args:
+        lines: Lines of the exam including their line endings.
+    
+    Yields:
+        Tuples of the block's zero-based first line, its text and the group
+        it belongs to. Blocks in the same group share the group object.
+    """
+    block = []
+    block_line = 0
+    group = None
+    group_count = 0
+    
+    in_fence = False
+    
+    for line_number, line in enumerate(lines):
+        question_start = _LINE_QUESTION_START_PATTERN.match(line)
+        if question_start:
+            in_fence = False
+        elif FENCE_LINE_PATTERN.match(line):
+            in_fence = not in_fence
+        heading = None if in_fence else GROUP_HEADING_PATTERN.match(line)
+        if heading is None and not question_start:
+            if block:
+                block.append(line)
+            continue
+        
+        if block:
+            yield block_line, ''.join(block), group
+        block = []
+        
+        if heading is None:
+            block = [line]
+            block_line = line_number
+            continue
+        
+        group = parse_group_heading(heading, group_count + 1)
+        if group is not None:
+            group_count += 1
+    
+    if block:
+        yield block_line, ''.join(block), group
+
+
+def _shift_spans(question: Question, lines: int):
+    """Move the spans of a question and its choices down by a number of lines."""
+    for item in [question, *question.choices]:
+        span = item.span
+        if span is not None:
+            item.span = SourceSpan(span.start_line + lines, span.start_column,
+                                   span.end_line + lines, span.end_column)
+
+
+def check_group(group: QuestionGroup, count: int):
+    """Check that a group can draw the number of questions it picks."""
+    if group.pick is not None and not 0 < group.pick <= count:
+        raise ValueError(
+            f"Group '{group.title}' picks {group.pick} of {count} question(s)")
+
+
+def parse_question_block(
+    question_num: int,
+    text: str,
+    line: int = 0,
+    column: int = 0
+) -> Optional[Question]:
     """
     Parse a single question block into a Question object.
     
     Args:
         question_num: The question number.
         text: The text content of the question (stem + choices).
+        line: Source line on which the text starts, used for choice spans.
+        column: Source column at which the text starts.
         
     Returns:
         A Question object or None if parsing fails.
     """
-    # Pattern to match answer choices (a., b., c., etc. or *a., *b., etc.)
-    # Must handle multi-line choices that may contain code blocks
-    # Allows optional leading whitespace
-    # Uses (?:\s+|$) to match either whitespace after period or end-of-line,
-    # enabling choices like "*a.\n```python" where code block is on next line
-    choice_pattern = r'^\s*(\*?)([a-zA-Z])\.(?:\s+|$)'
-    
     lines = text.split('\n')
     stem_lines = []
     choices = []
     current_choice = None
     current_choice_lines = []
     in_code_block = False
+    tags = []
+    bloom = None
     
-    for line in lines:
+    def choice_span(end_index: int) -> SourceSpan:
+        # The choice ends on its last non-blank line
+        while end_index > current_choice[2] and not lines[end_index].strip():
+            end_index -= 1
+        end_column = len(lines[end_index].rstrip())
+        if end_index == 0:
+            end_column += column
+        return SourceSpan(line + current_choice[2], current_choice[3],
+                          line + end_index, end_column)
+    
+    for index, text_line in enumerate(lines):
+        # Metadata comments can go anywhere outside code blocks
+        metadata = _parse_metadata(text_line) if not in_code_block else None
+        if metadata is not None:
+            for key, value in metadata:
+                if key == 'tags':
+                    tags.extend(tag.strip() for tag in value.split(',') if tag.strip())
+                else:
+                    bloom = value.lower() or None
+            continue
+        
         # Check if this line starts a new choice (only when not in code block)
-        choice_match = re.match(choice_pattern, line) if not in_code_block else None
+        choice_match = CHOICE_PATTERN.match(text_line) if not in_code_block else None
         
         if choice_match:
             # Save previous choice if any
@@ -131,28 +463,30 @@ def _parse_question_block(question_num: int, text: str) -> Optional[Question]:
                 choices.append(Choice(
                     letter=current_choice[0],
                     text=choice_text,
-                    is_correct=current_choice[1]
+                    is_correct=current_choice[1],
+                    span=choice_span(index - 1)
                 ))
             
             # Start new choice
             is_correct = choice_match.group(1) == '*'
             letter = choice_match.group(2).lower()
-            remainder = line[choice_match.end():].strip()
-            current_choice = (letter, is_correct)
+            remainder = text_line[choice_match.end():].strip()
+            start_column = choice_match.start(1) + (column if index == 0 else 0)
+            current_choice = (letter, is_correct, index, start_column)
             current_choice_lines = [remainder] if remainder else []
             
             # Update code block state based on fence markers in remainder
             in_code_block = _update_code_block_state(remainder, in_code_block)
         elif current_choice is not None:
             # Continue current choice
-            current_choice_lines.append(line)
+            current_choice_lines.append(text_line)
             # Track code blocks in choice content
-            in_code_block = _update_code_block_state(line, in_code_block)
+            in_code_block = _update_code_block_state(text_line, in_code_block)
         else:
             # Still in question stem
-            stem_lines.append(line)
+            stem_lines.append(text_line)
             # Track code blocks in stem
-            in_code_block = _update_code_block_state(line, in_code_block)
+            in_code_block = _update_code_block_state(text_line, in_code_block)
     
     # Don't forget the last choice
     if current_choice is not None:
@@ -160,7 +494,8 @@ def _parse_question_block(question_num: int, text: str) -> Optional[Question]:
         choices.append(Choice(
             letter=current_choice[0],
             text=choice_text,
-            is_correct=current_choice[1]
+            is_correct=current_choice[1],
+            span=choice_span(len(lines) - 1)
         ))
     
     if not choices:
@@ -177,5 +512,7 @@ def _parse_question_block(question_num: int, text: str) -> Optional[Question]:
         number=question_num,
         stem='\n'.join(stem_lines).strip(),
         choices=choices,
-        correct_answer=correct_answer
+        correct_answer=correct_answer,
+        tags=list(dict.fromkeys(tags)),
+        bloom=bloom
     )
@@ -0,0 +1,169 @@
+"""
+Registries of pluggable renderers, item emitters and package writers.
+
+Other packages add plugins through entry points in these groups:
+
+``markdown_to_qti.renderers``
+    A callable taking markdown text and returning HTML.
+``markdown_to_qti.item_emitters``
+    A callable taking a Question and a renderer and returning the item
+    Element, like the built-in ``qti12`` emitter.
+``markdown_to_qti.package_writers``
+    A Sink factory called as ``factory(output, title, workers=...,
+    compact=..., renderer=..., emitter=...)`` where output is a path or a
+    binary stream, like the built-in ``qti12`` QtiPackageSink and ``qti21``
+    Qti21PackageSink.
+
+For example, in a plugin's pyproject.toml::
+    
+    [project.entry-points."markdown_to_qti.renderers"]
+    commonmark = "my_plugin:render"
+
+Plugins are listed from installed package metadata, and a plugin's module
+is only imported when the plugin is selected. Installed metadata is not
+even read unless a name other than a built-in is asked for, so plugins
+cost nothing for conversions that don't use them.
+"""
+import argparse
+import importlib
+from typing import Callable, Dict, List
+
+# Names used when no plugin is selected
+DEFAULT_RENDERER = 'markdown'
+DEFAULT_EMITTER = 'qti12'
+DEFAULT_PACKAGE_WRITER = 'qti12'
+
+
+class PluginRegistry:
+    """
+    The plugins of one kind, by name.
+    
+    Built-ins are given as "module:attribute" references and are resolved
+    the same way as entry points. A plugin cannot replace a built-in.
+    """
+    
+    def __init__(self, group: str, kind: str, builtins: Dict[str, str]):
+        self.group = group
+        self.kind = kind
+        self._builtins = dict(builtins)
+        self._entry_points = None
+        self._loaded = {}
+    
+    def _discover(self) -> Dict[str, object]:
+        # Reading package metadata is slow enough to do only when needed
+        if self._entry_points is None:
+            self._entry_points = {
+                entry_point.name: entry_point
+                for entry_point in _entry_points(self.group)
+                if entry_point.name not in self._builtins
+            }
+        return self._entry_points
+    
+    def names(self) -> List[str]:
+        """Return the names of the built-ins, then of the installed plugins."""
+        return list(self._builtins) + sorted(self._discover())
+    
+    def is_builtin(self, name: str) -> bool:
+        """Return whether a name is a built-in."""
+        return name in self._builtins
+    
+    def load(self, name: str) -> object:
+        """
+        Import and return a plugin.
+        
+        Args:
+            name: Name of a built-in or installed plugin.
+        
+        Returns:
+            The object the plugin's entry point refers to.
+        
+        Raises:
+            ValueError: If there is no such plugin or it fails to import.
+        """
+        try:
+            return self._loaded[name]
+        except KeyError:
+            pass
+        
+        if name in self._builtins:
+            plugin = resolve_reference(self._builtins[name])
+        else:
+            entry_point = self._discover().get(name)
+            if entry_point is None:
+                raise ValueError(
+                    f"Unknown {self.kind} '{name}' (available: {', '.join(self.names())})")
+            try:
+                plugin = entry_point.load()
+            except (ImportError, AttributeError) as e:
+                raise ValueError(f"Could not load {self.kind} '{name}': {e}") from e
+        
+        self._loaded[name] = plugin
+        return plugin
+
+
+def resolve_reference(reference: str) -> object:
+    """Import the object named by a "module:attribute" reference."""
+    module_name, _, attribute = reference.partition(':')
+    plugin = importlib.import_module(module_name)
+    for part in attribute.split('.'):
+        plugin = getattr(plugin, part)
+    return plugin
+
+
+def _entry_points(group: str) -> list:
+    """Return the installed entry points in a group."""
+    from importlib.metadata import entry_points
+    
+    found = entry_points()
+    if hasattr(found, 'select'):
+        return list(found.select(group=group))
+    # Python 3.8 and 3.9 return a dict of lists
+    return list(found.get(group, []))
+
+
+RENDERERS = PluginRegistry('markdown_to_qti.renderers', 'renderer', {
+    'markdown': 'markdown_to_qti.renderer:markdown_to_html',
+})
+
+ITEM_EMITTERS = PluginRegistry('markdown_to_qti.item_emitters', 'item emitter', {
+    'qti12': 'markdown_to_qti.qti_generator:create_question_item',
+    'qti21': 'markdown_to_qti.qti21:create_assessment_item',
+})
+
+PACKAGE_WRITERS = PluginRegistry('markdown_to_qti.package_writers', 'package writer', {
+    'qti12': 'markdown_to_qti.sinks:QtiPackageSink',
+    'qti21': 'markdown_to_qti.sinks:Qti21PackageSink',
+})
+
+REGISTRIES = [RENDERERS, ITEM_EMITTERS, PACKAGE_WRITERS]
+
+
+def get_renderer(name: str = None) -> Callable[[str], str]:
+    """Return a renderer by name, or the default markdown renderer."""
+    return RENDERERS.load(name or DEFAULT_RENDERER)
+
+
+def get_emitter(name: str = None) -> Callable:
+    """Return an item emitter by name, or the default QTI 1.2 emitter."""
+    return ITEM_EMITTERS.load(name or DEFAULT_EMITTER)
+
+
+def get_package_writer(name: str = None) -> Callable:
+    """Return a package writer by name, or the default QTI 1.2 writer."""
+    return PACKAGE_WRITERS.load(name or DEFAULT_PACKAGE_WRITER)
+
+
+def main(argv: List[str] = None) -> int:
+    """Entry point for the `plugins` subcommand: list the available plugins."""
+    parser = argparse.ArgumentParser(
+        prog='markdown-to-qti plugins',
+        description='List the available renderers, item emitters and package writers.'
+    )
+    parser.parse_args(argv)
+    
+    for registry in REGISTRIES:
+        print(f"{registry.kind}s ({registry.group}):")
+        for name in registry.names():
+            builtin = ' (built-in)' if registry.is_builtin(name) else ''
+            print(f"  {name}{builtin}")
+    return 0
@@ -0,0 +1,389 @@
+"""
+HTML preview of a markdown exam, with a live-reloading local server.
+
+The preview is a single self-contained HTML page showing every question
+with its correct answer marked, so an exam can be proofread without a
+round trip through Canvas. Question HTML is rendered the same way as in
+the QTI package.
+
+Each question block's HTML is cached by its source text, so refreshing the
+preview after an edit only parses and renders the questions that changed.
+"""
+import argparse
+import html
+import io
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from .parser import QuestionGroup, check_group, iter_question_blocks, parse_markdown_exam
+from .qti_generator import format_points
+from .renderer import markdown_to_html
+
+_STYLE = """
+body { font-family: system-ui, sans-serif; max-width: 50rem; margin: 2rem auto; padding: 0 1rem;
+       color: #222; line-height: 1.5; }
+header h1 { margin-bottom: 0; }
+.summary { color: #666; margin-top: 0.25rem; }
+.problems { background: #fdecea; border: 1px solid #f5c2c0; padding: 0.5rem 1rem; border-radius: 4px; }
+.group { border-left: 4px solid #8ab4f8; padding-left: 1rem; margin: 2rem 0; }
+.group > h2 { font-size: 1.1rem; margin: 0; }
+.group > h2 span { font-weight: normal; color: #666; }
+.question { border-bottom: 1px solid #ddd; padding: 1rem 0; }
+.question > h3 { font-size: 1rem; margin: 0 0 0.5rem; }
+.badge { font-size: 0.75rem; font-weight: normal; background: #eee; border-radius: 3px;
+         padding: 0.1rem 0.4rem; margin-left: 0.4rem; }
+.bloom { background: #e6f4ea; }
+.choices { list-style: none; padding-left: 0; }
+.choices li { display: flex; gap: 0.5rem; padding: 0.25rem 0.5rem; border-radius: 4px; }
+.choices li.correct { background: #e6f4ea; font-weight: 600; }
+.choices li.correct .letter::after { content: " \\2713"; }
+.letter { min-width: 2.5rem; }
+pre { background: #f6f8fa; padding: 0.5rem; overflow-x: auto; }
+"""
+
+# Swaps in the new preview whenever the server reports a new version,
+# keeping the scroll position
+_LIVE_RELOAD_SCRIPT = """
+<script>
+(function () {
+  var version = %d;
+  function poll() {
+    fetch('/content?version=' + version).then(function (response) {
+      return response.json();
+    }).then(function (data) {
+      if (data.version !== version) {
+        version = data.version;
+        document.getElementById('preview').innerHTML = data.html;
+        document.title = data.title;
+      }
+      poll();
+    }).catch(function () { setTimeout(poll, 1000); });
+  }
+  poll();
+})();
+</script>
+"""
+
+
+def _question_html(question_block: str, group: Optional[QuestionGroup]) -> Tuple[str, int]:
+    """
+    Render the question in a question block.
+    
+    Returns:
+        Tuple of the question's HTML and the number of questions (0 or 1).
+    """
+    questions = parse_markdown_exam(question_block)
+    parts = []
+    for question in questions:
+        badges = ''.join(
+            f'<span class="badge">{html.escape(tag)}</span>' for tag in question.tags)
+        if question.bloom:
+            badges += f'<span class="badge bloom">{html.escape(question.bloom)}</span>'
+        points = group.points if group is not None else None
+        plural = '' if format_points(points) == '1' else 's'
+        
+        parts.append(f'<article class="question" id="question-{question.number}">')
+        parts.append(f'<h3>Question {question.number} '
+                     f'<span class="badge">{format_points(points)} point{plural}</span>'
+                     f'{badges}</h3>')
+        parts.append(f'<div class="stem">{markdown_to_html(question.stem)}</div>')
+        parts.append('<ol class="choices">')
+        for choice in question.choices:
+            css = ' class="correct"' if choice.is_correct else ''
+            parts.append(f'<li{css}><span class="letter">{choice.letter}.</span>'
+                         f'<div>{markdown_to_html(choice.text)}</div></li>')
+        parts.append('</ol>')
+        if question.correct_answer is None:
+            parts.append('<p class="problems">No correct answer is marked.</p>')
+        parts.append('</article>\n')
+    return ''.join(parts), len(questions)
+
+
+class ExamPreview:
+    """
+    Renders the preview of an exam, reusing the HTML of unchanged questions.
+    
+    Call render with the whole markdown after every change; only question
+    blocks whose text (or group) changed are parsed and rendered again.
+    """
+    
+    def __init__(self, title: str = "Assessment"):
+        self.title = title
+        self._cache: Dict[tuple, Tuple[str, int]] = {}
+        self.questions = 0
+    
+    def render_content(self, markdown_content: str) -> str:
+        """Render the preview body: problems, groups and questions."""
+        cache = {}
+        parts = []
+        problems = []
+        questions = 0
+        group = None
+        group_parts = []
+        group_size = 0
+        
+        def end_group():
+            try:
+                check_group(group, group_size)
+            except ValueError as e:
+                problems.append(str(e))
+            selected = group.pick if group.pick is not None else group_size
+            parts.append(
+                f'<section class="group"><h2>{html.escape(group.title)} '
+                f'<span>(pick {selected} of {group_size})</span></h2>\n')
+            parts.extend(group_parts)
+            parts.append('</section>\n')
+        
+        for _, block, block_group in iter_question_blocks(io.StringIO(markdown_content)):
+            if block_group is not group:
+                if group is not None:
+                    end_group()
+                group = block_group
+                group_parts = []
+                group_size = 0
+            
+            group_key = None if group is None else (group.title, group.pick, group.points)
+            key = (block, group_key)
+            rendered = cache.get(key) or self._cache.get(key)
+            if rendered is None:
+                rendered = _question_html(block, group)
+            cache[key] = rendered
+            
+            fragment, count = rendered
+            questions += count
+            if group is None:
+                parts.append(fragment)
+            else:
+                group_parts.append(fragment)
+                group_size += count
+        if group is not None:
+            end_group()
+        
+        # Only the current questions are kept, so the cache can't grow
+        self._cache = cache
+        self.questions = questions
+        
+        if problems:
+            items = ''.join(f'<li>{html.escape(problem)}</li>' for problem in problems)
+            parts.insert(0, f'<ul class="problems">{items}</ul>\n')
+        parts.insert(0, f'<p class="summary">{questions} question(s)</p>\n')
+        return ''.join(parts)
+    
+    def render(self, markdown_content: str, live_version: Optional[int] = None) -> str:
+        """
+        Render the whole preview page.
+        
+        Args:
+            markdown_content: The exam markdown.
+            live_version: Version number for the live-reload script, which
+                is only included when this is given.
+        
+        Returns:
+            A self-contained HTML document.
+        """
+        content = self.render_content(markdown_content)
+        return self.page(content, live_version)
+    
+    def page(self, content: str, live_version: Optional[int] = None) -> str:
+        """Wrap rendered content in the preview page."""
+        title = html.escape(self.title)
+        script = _LIVE_RELOAD_SCRIPT % live_version if live_version is not None else ''
+        return (
+            '<!DOCTYPE html>\n<html lang="en">\n<head>\n<meta charset="utf-8">\n'
+            f'<title>{title}</title>\n<style>{_STYLE}</style>\n</head>\n<body>\n'
+            f'<header><h1>{title}</h1></header>\n<main id="preview">\n{content}</main>\n'
+            f'{script}</body>\n</html>\n'
+        )
+
+
+class PreviewServer:
+    """
+    Serves the preview of a file and updates it when the file is saved.
+    
+    The file is polled for changes. Open pages long-poll /content and swap
+    in the new preview as soon as it has been rendered.
+    """
+    
+    def __init__(self, path: str, title: str = "Assessment", host: str = '127.0.0.1',
+                 port: int = 8000, interval: float = 0.1):
+        self.path = Path(path)
+        self.interval = interval
+        self.preview = ExamPreview(title)
+        self.version = 0
+        self.content = ''
+        self._stat = None
+        self._changed = threading.Condition()
+        self._stopped = threading.Event()
+        self.refresh()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+    
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+    
+    def refresh(self) -> bool:
+        """Render the file again if it changed; return whether it did."""
+        try:
+            stat = os.stat(self.path)
+            stat = (stat.st_mtime_ns, stat.st_size)
+            if stat == self._stat:
+                return False
+            content = self.path.read_text(encoding='utf-8')
+        except (OSError, UnicodeDecodeError) as e:
+            stat = None
+            rendered = f'<ul class="problems"><li>{html.escape(str(e))}</li></ul>\n'
+        else:
+            rendered = self.preview.render_content(content)
+        
+        with self._changed:
+            self._stat = stat
+            self.content = rendered
+            self.version += 1
+            self._changed.notify_all()
+        return True
+    
+    def wait(self, version: int, timeout: float) -> Tuple[int, str]:
+        """Wait until the preview is newer than a version, or the timeout."""
+        with self._changed:
+            self._changed.wait_for(
+                lambda: self.version != version or self._stopped.is_set(), timeout)
+            return self.version, self.content
+    
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            self.refresh()
+    
+    def serve_forever(self):
+        """Watch the file and serve the preview until shutdown is called."""
+        watcher = threading.Thread(target=self._watch, daemon=True)
+        watcher.start()
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self._stopped.set()
+            with self._changed:
+                self._changed.notify_all()
+            self.httpd.server_close()
+    
+    def shutdown(self):
+        """Stop serve_forever from another thread."""
+        self._stopped.set()
+        self.httpd.shutdown()
+    
+    def _handler(self):
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == '/':
+                    with server._changed:
+                        version, content = server.version, server.content
+                    self._send('text/html', server.preview.page(content, version))
+                elif url.path == '/content':
+                    try:
+                        known = int(parse_qs(url.query).get('version', ['-1'])[0])
+                    except ValueError:
+                        known = -1
+                    version, content = server.wait(known, timeout=25)
+                    self._send('application/json', json.dumps({
+                        'version': version, 'html': content, 'title': server.preview.title}))
+                else:
+                    self.send_error(404)
+            
+            def _send(self, content_type: str, body: str):
+                data = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', f'{content_type}; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.send_header('Cache-Control', 'no-store')
+                self.end_headers()
+                self.wfile.write(data)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        return Handler
+
+
+def main(argv: List[str] = None) -> int:
+    """Entry point for the `preview` subcommand."""
+    parser = argparse.ArgumentParser(
+        prog='markdown-to-qti preview',
+        description='Render a markdown exam to an HTML page showing the correct answers.'
+    )
+    parser.add_argument('input', help='Path to the input Markdown file')
+    parser.add_argument(
+        '-o', '--output',
+        default=None,
+        help='Path for the HTML page, or - for stdout. '
+             'Defaults to the input filename with .html extension.'
+    )
+    parser.add_argument(
+        '-t', '--title',
+        default=None,
+        help='Title of the preview (default: the input filename)'
+    )
+    parser.add_argument(
+        '--serve',
+        action='store_true',
+        help='Serve the preview locally and update it whenever the file is saved'
+    )
+    parser.add_argument(
+        '--port',
+        type=int,
+        default=8000,
+        help='Port for --serve (default: 8000)'
+    )
+    args = parser.parse_args(argv)
+    
+    input_path = Path(args.input)
+    if not input_path.exists():
+        print(f"Error: Input file '{args.input}' not found.", file=sys.stderr)
+        return 1
+    title = args.title or input_path.name
+    
+    if args.serve:
+        try:
+            server = PreviewServer(input_path, title, port=args.port)
+        except OSError as e:
+            print(f"Error starting server: {e}", file=sys.stderr)
+            return 1
+        print(f"Previewing {input_path} at {server.url} (Ctrl+C to stop)", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+    
+    try:
+        markdown_content = input_path.read_text(encoding='utf-8')
+    except IOError as e:
+        print(f"Error reading input file: {e}", file=sys.stderr)
+        return 1
+    
+    start = time.perf_counter()
+    page = ExamPreview(title).render(markdown_content)
+    elapsed = time.perf_counter() - start
+    
+    if args.output == '-':
+        sys.stdout.write(page)
+        return 0
+    output_path = args.output or str(input_path.with_suffix('.html'))
+    try:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(page)
+    except IOError as e:
+        print(f"Error creating output file: {e}", file=sys.stderr)
+        return 1
+    print(f"Preview created: {output_path} ({elapsed * 1000:.0f} ms)", file=sys.stderr)
+    return 0
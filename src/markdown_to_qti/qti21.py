@@ -0,0 +1,439 @@
+"""
+QTI 2.1 package generator for Canvas New Quizzes import.
+
+A QTI 2.1 package holds one assessmentItem document per question, an
+assessmentTest referring to the items, and a manifest listing both. Items
+are built from the same Question model and rendered HTML as QTI 1.2 items,
+so questions with pre-rendered HTML (see prerender_html) can be written in
+both formats from one rendering pass.
+
+Unlike QTI 1.2, where HTML is escaped text, item bodies hold the HTML as
+XHTML elements. The built-in renderer writes well-formed XHTML; output of
+a renderer plugin that isn't is reported as an error.
+"""
+import contextlib
+import zipfile
+from typing import BinaryIO, Callable, Iterable, List, Optional, Tuple
+from xml.etree.ElementTree import Element, ParseError, SubElement, fromstring
+
+from .parser import Question, QuestionGroup
+from .plugins import get_emitter, get_renderer
+from .qti_generator import (
+    XML_DECLARATION, atomic_write, escape_attrib, format_points, generate_identifier,
+    package_path, render_html, render_items_parallel, serialize_xml, write_compact
+)
+from .renderer import markdown_to_html
+
+# Item emitter used for QTI 2.1 packages when none is selected
+DEFAULT_EMITTER = 'qti21'
+
+_QTI_NAMESPACE = 'http://www.imsglobal.org/xsd/imsqti_v2p1'
+_QTI_SCHEMA = 'http://www.imsglobal.org/xsd/qti/qtiv2p1/imsqti_v2p1.xsd'
+
+# Elements whose content is rendered HTML, which pretty-printing must not
+# add whitespace to (it would show up in code blocks)
+_HTML_CONTAINERS = {'div', 'simpleChoice'}
+
+
+def _set_namespace(elem: Element):
+    """Set the QTI 2.1 namespace and schema location on a root element."""
+    elem.set('xmlns', _QTI_NAMESPACE)
+    elem.set('xmlns:xsi', 'http://www.w3.org/2001/XMLSchema-instance')
+    elem.set('xsi:schemaLocation', f"{_QTI_NAMESPACE} {_QTI_SCHEMA}")
+
+
+def _append_html(parent: Element, html: str):
+    """
+    Append rendered HTML to an element as XHTML content.
+    
+    Raises:
+        ValueError: If the HTML is not well-formed XML.
+    """
+    try:
+        fragment = fromstring(f"<div>{html}</div>")
+    except ParseError as e:
+        raise ValueError(f"QTI 2.1 items need well-formed XHTML, but rendered HTML is not: {e}") from e
+    _local_names(fragment)
+    parent.text = fragment.text
+    parent.extend(fragment)
+
+
+def _local_names(elem: Element, namespace: str = None):
+    """
+    Replace parsed namespaced tags, e.g. MathML, by plain tags.
+    
+    The rest of the document is built with plain tags and an xmlns
+    attribute, so a namespace is kept the same way.
+    """
+    for child in elem:
+        child_namespace = namespace
+        if child.tag[:1] == '{':
+            child_namespace, child.tag = child.tag[1:].split('}', 1)
+            if child_namespace != namespace:
+                child.set('xmlns', child_namespace)
+        _local_names(child, child_namespace)
+
+
+def _outcome_declaration(parent: Element, identifier: str, value: str):
+    """Add a float outcome declaration with a default value."""
+    outcome = SubElement(parent, 'outcomeDeclaration')
+    outcome.set('identifier', identifier)
+    outcome.set('cardinality', 'single')
+    outcome.set('baseType', 'float')
+    default = SubElement(outcome, 'defaultValue')
+    SubElement(default, 'value').text = value
+
+
+def create_assessment_item(
+    question: Question,
+    render: Callable[[str], str] = markdown_to_html
+) -> Element:
+    """
+    Create a QTI 2.1 assessmentItem element for a question.
+    
+    This is the built-in "qti21" item emitter. Choice identifiers follow
+    the QTI 1.2 items, as the item identifier and the choice letter.
+    
+    Args:
+        question: The Question object to convert.
+        render: Function rendering markdown text to HTML.
+    
+    Returns:
+        An Element representing the assessment item.
+    """
+    item_id = generate_identifier()
+    
+    item = Element('assessmentItem')
+    _set_namespace(item)
+    item.set('identifier', item_id)
+    item.set('title', f"Question {question.number}")
+    item.set('adaptive', 'false')
+    item.set('timeDependent', 'false')
+    
+    response = SubElement(item, 'responseDeclaration')
+    response.set('identifier', 'RESPONSE')
+    response.set('cardinality', 'single')
+    response.set('baseType', 'identifier')
+    if question.correct_answer:
+        correct = SubElement(response, 'correctResponse')
+        SubElement(correct, 'value').text = f"{item_id}_{question.correct_answer}"
+    
+    points = question.group.points if question.group is not None else None
+    _outcome_declaration(item, 'SCORE', '0')
+    _outcome_declaration(item, 'MAXSCORE', format_points(points))
+    
+    # Item body: the stem, then the choices
+    body = SubElement(item, 'itemBody')
+    _append_html(SubElement(body, 'div'),
+                 render_html(question.stem, question.stem_html, render))
+    
+    interaction = SubElement(body, 'choiceInteraction')
+    interaction.set('responseIdentifier', 'RESPONSE')
+    interaction.set('shuffle', 'false')
+    interaction.set('maxChoices', '1')
+    for choice in question.choices:
+        simple_choice = SubElement(interaction, 'simpleChoice')
+        simple_choice.set('identifier', f"{item_id}_{choice.letter}")
+        _append_html(simple_choice, render_html(choice.text, choice.html, render))
+    
+    # Response processing: the correct choice scores the item's points
+    if question.correct_answer:
+        processing = SubElement(item, 'responseProcessing')
+        condition = SubElement(processing, 'responseCondition')
+        response_if = SubElement(condition, 'responseIf')
+        match = SubElement(response_if, 'match')
+        SubElement(match, 'variable').set('identifier', 'RESPONSE')
+        SubElement(match, 'correct').set('identifier', 'RESPONSE')
+        set_score = SubElement(response_if, 'setOutcomeValue')
+        set_score.set('identifier', 'SCORE')
+        SubElement(set_score, 'variable').set('identifier', 'MAXSCORE')
+    
+    return item
+
+
+def _write_pretty(elem: Element, parts: List[str], indent: str = ''):
+    """
+    Append the indented serialization of an element to parts.
+    
+    Elements holding HTML or text are written compactly on one line, so
+    no whitespace is added to their content.
+    """
+    if elem.tag in _HTML_CONTAINERS or elem.text or not len(elem):
+        parts.append(indent)
+        write_compact(elem, parts)
+        parts.append('\n')
+        return
+    
+    attributes = ''.join(f' {name}="{escape_attrib(value)}"' for name, value in elem.attrib.items())
+    parts.append(f"{indent}<{elem.tag}{attributes}>\n")
+    for child in elem:
+        _write_pretty(child, parts, indent + '  ')
+    parts.append(f"{indent}</{elem.tag}>\n")
+
+
+def _serialize_item(item: Element, compact: bool = False) -> str:
+    """Serialize an item document, pretty-printed unless compact."""
+    parts = [XML_DECLARATION]
+    if compact:
+        write_compact(item, parts)
+    else:
+        parts.append('\n')
+        _write_pretty(item, parts)
+    return ''.join(parts)
+
+
+def render_item(
+    question: Question,
+    compact: bool = False,
+    renderer: str = None,
+    emitter: str = None
+) -> Tuple[str, str]:
+    """
+    Render a question to a serialized item document.
+    
+    Returns:
+        Tuple of the item identifier and the item XML.
+    """
+    item = get_emitter(emitter or DEFAULT_EMITTER)(question, get_renderer(renderer))
+    identifier = item.get('identifier')
+    if not identifier:
+        identifier = generate_identifier()
+        item.set('identifier', identifier)
+    return identifier, _serialize_item(item, compact)
+
+
+def render_items(
+    questions: Iterable[Question],
+    workers: int = 1,
+    compact: bool = False,
+    renderer: str = None,
+    emitter: str = None
+) -> Iterable[Tuple[Question, Tuple[str, str]]]:
+    """Render items as questions arrive, or in a process pool with several workers."""
+    if workers > 1:
+        questions = list(questions)
+        if len(questions) > 1:
+            return zip(questions, render_items_parallel(
+                questions, workers, None, compact, renderer, emitter, render_item))
+    return ((question, render_item(question, compact, renderer, emitter))
+            for question in questions)
+
+
+def _create_test(
+    test_id: str,
+    title: str,
+    sections: List[Tuple[Optional[QuestionGroup], List[str]]]
+) -> Element:
+    """
+    Create the assessmentTest element referring to the items.
+    
+    Args:
+        test_id: Identifier of the test.
+        title: Title of the test.
+        sections: Runs of consecutive item identifiers with their question
+            group, or None for ungrouped items.
+    
+    Returns:
+        The assessmentTest element.
+    """
+    test = Element('assessmentTest')
+    _set_namespace(test)
+    test.set('identifier', test_id)
+    test.set('title', title)
+    
+    score = SubElement(test, 'outcomeDeclaration')
+    score.set('identifier', 'SCORE')
+    score.set('cardinality', 'single')
+    score.set('baseType', 'float')
+    
+    part = SubElement(test, 'testPart')
+    part.set('identifier', 'test_part')
+    part.set('navigationMode', 'nonlinear')
+    part.set('submissionMode', 'simultaneous')
+    
+    # Grouped items go in a nested section from which the group's pick is
+    # drawn for each student
+    root_section = SubElement(part, 'assessmentSection')
+    root_section.set('identifier', 'root_section')
+    root_section.set('title', title)
+    root_section.set('visible', 'true')
+    for group, item_ids in sections:
+        section = root_section
+        if group is not None:
+            section = SubElement(root_section, 'assessmentSection')
+            section.set('identifier', generate_identifier())
+            section.set('title', group.title)
+            section.set('visible', 'true')
+            selection = SubElement(section, 'selection')
+            selection.set('select', str(group.pick if group.pick is not None else len(item_ids)))
+        for item_id in item_ids:
+            item_ref = SubElement(section, 'assessmentItemRef')
+            item_ref.set('identifier', item_id)
+            item_ref.set('href', _item_path(item_id))
+    
+    processing = SubElement(test, 'outcomeProcessing')
+    set_score = SubElement(processing, 'setOutcomeValue')
+    set_score.set('identifier', 'SCORE')
+    total = SubElement(set_score, 'sum')
+    SubElement(total, 'testVariables').set('variableIdentifier', 'SCORE')
+    return test
+
+
+def _item_path(item_id: str) -> str:
+    return f"items/{item_id}.xml"
+
+
+def generate_qti21_manifest(test_id: str, item_ids: List[str], compact: bool = False) -> str:
+    """
+    Generate the imsmanifest.xml content for a QTI 2.1 package.
+    
+    Args:
+        test_id: Identifier of the assessment test.
+        item_ids: Identifiers of the items, in order.
+        compact: Skip pretty-printing.
+    
+    Returns:
+        XML string for the manifest.
+    """
+    manifest = Element('manifest')
+    manifest.set('identifier', f"manifest_{test_id}")
+    manifest.set('xmlns', 'http://www.imsglobal.org/xsd/imscp_v1p1')
+    manifest.set('xmlns:xsi', 'http://www.w3.org/2001/XMLSchema-instance')
+    
+    metadata = SubElement(manifest, 'metadata')
+    schema = SubElement(metadata, 'schema')
+    schema.text = 'QTIv2.1 Package'
+    schemaversion = SubElement(metadata, 'schemaversion')
+    schemaversion.text = '1.0.0'
+    
+    SubElement(manifest, 'organizations')
+    
+    resources = SubElement(manifest, 'resources')
+    test = SubElement(resources, 'resource')
+    test.set('identifier', test_id)
+    test.set('type', 'imsqti_test_xmlv2p1')
+    test.set('href', f"{test_id}.xml")
+    SubElement(test, 'file').set('href', f"{test_id}.xml")
+    for item_id in item_ids:
+        SubElement(test, 'dependency').set('identifierref', item_id)
+    
+    for item_id in item_ids:
+        resource = SubElement(resources, 'resource')
+        resource.set('identifier', item_id)
+        resource.set('type', 'imsqti_item_xmlv2p1')
+        resource.set('href', _item_path(item_id))
+        SubElement(resource, 'file').set('href', _item_path(item_id))
+    
+    return serialize_xml(manifest, compact)
+
+
+class _PackageWriter:
+    """
+    Write a QTI 2.1 package as rendered items are added one at a time.
+    
+    Each item is compressed into the package as it is added. Only the item
+    identifiers are kept, for the test and manifest written at the end.
+    """
+    
+    def __init__(self, zf: zipfile.ZipFile, title: str, compact: bool = False):
+        self._zf = zf
+        self._title = title
+        self._compact = compact
+        self.test_id = generate_identifier()
+        self._sections = []
+    
+    def add(self, question: Question, item_id: str, item: str):
+        """Add the rendered item document for a question."""
+        self._zf.writestr(_item_path(item_id), item)
+        if not self._sections or self._sections[-1][0] is not question.group:
+            self._sections.append((question.group, []))
+        self._sections[-1][1].append(item_id)
+    
+    def close(self):
+        """Write the test and the manifest."""
+        test = _create_test(self.test_id, self._title, self._sections)
+        self._zf.writestr(f"{self.test_id}.xml", serialize_xml(test, self._compact))
+        item_ids = [item_id for _, section in self._sections for item_id in section]
+        self._zf.writestr('imsmanifest.xml',
+                          generate_qti21_manifest(self.test_id, item_ids, self._compact))
+
+
+@contextlib.contextmanager
+def open_package(output: BinaryIO, title: str, compact: bool = False):
+    """
+    Start a QTI 2.1 package on a binary stream.
+    
+    Yields a _PackageWriter; the package is complete once the context exits.
+    """
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as zf:
+        writer = _PackageWriter(zf, title, compact)
+        yield writer
+        writer.close()
+
+
+def write_qti21_package(
+    questions: Iterable[Question],
+    output: BinaryIO,
+    title: str = "Assessment",
+    workers: int = 1,
+    compact: bool = False,
+    renderer: str = None,
+    emitter: str = None
+) -> int:
+    """
+    Write a QTI 2.1 package (ZIP file) to a binary stream.
+    
+    As with write_qti_package the stream does not need to be seekable, and
+    with one worker each item is written as its question arrives.
+    
+    Args:
+        questions: Question objects to convert, e.g. from iter_markdown_exam.
+        output: Binary stream to write the package to.
+        title: Title of the assessment.
+        workers: Number of processes used to render question items.
+        compact: Write items without indentation.
+        renderer: Name of the renderer plugin for markdown text.
+        emitter: Name of the item emitter plugin (default: qti21).
+    
+    Returns:
+        The number of questions written.
+    """
+    count = 0
+    with open_package(output, title, compact) as writer:
+        for question, (item_id, item) in render_items(
+                questions, workers, compact, renderer, emitter):
+            writer.add(question, item_id, item)
+            count += 1
+    return count
+
+
+def create_qti21_package(
+    questions: List[Question],
+    output_path: str,
+    title: str = "Assessment",
+    workers: int = 1,
+    compact: bool = False,
+    renderer: str = None,
+    emitter: str = None
+) -> str:
+    """
+    Create a QTI 2.1 package (ZIP file) for import into Canvas New Quizzes.
+    
+    Args:
+        questions: List of Question objects to convert.
+        output_path: Path for the output ZIP file.
+        title: Title of the assessment.
+        workers: Number of processes used to render question items.
+        compact: Write items without indentation.
+        renderer: Name of the renderer plugin for markdown text.
+        emitter: Name of the item emitter plugin (default: qti21).
+    
+    Returns:
+        Path to the created ZIP file.
+    """
+    output_path = package_path(output_path)
+    with atomic_write(output_path) as f:
+        write_qti21_package(questions, f, title, workers=workers, compact=compact,
+                            renderer=renderer, emitter=emitter)
+    
+    return str(output_path)
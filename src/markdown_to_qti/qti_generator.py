@@ -3,23 +3,57 @@ QTI 1.2 XML generator for Canvas LMS import.
 
 Note: Canvas LMS uses QTI 1.2 format (compatible with IMS QTI specification).
 """
-import html
-import re
+import contextlib
+import hashlib
+import io
+import itertools
+import os
 import uuid
 import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List
-from xml.etree.ElementTree import Element, SubElement, tostring
+from typing import BinaryIO, Callable, Iterable, Iterator, List
+from xml.etree.ElementTree import Comment, Element, SubElement, tostring
 from xml.dom import minidom
 
-from .parser import Question
+from .parser import Question, QuestionGroup
+from .plugins import get_emitter, get_renderer
+from .renderer import markdown_to_html
 
 
-def _generate_identifier() -> str:
+# Identifiers handed out while stable_identifiers is in effect
+_stable_identifiers = None
+
+
+def generate_identifier() -> str:
     """Generate a unique identifier for QTI elements."""
+    if _stable_identifiers is not None:
+        return next(_stable_identifiers)
     return f"g{uuid.uuid4().hex[:24]}"
 
 
+@contextlib.contextmanager
+def stable_identifiers(seed: str):
+    """
+    Derive the identifiers generated in the context from a seed.
+    
+    The n-th identifier is a hash of the seed and n instead of a random
+    UUID, so generating the same items again, e.g. on another machine,
+    gives the same identifiers. Identifiers generated in worker processes
+    are not affected.
+    """
+    global _stable_identifiers
+    previous = _stable_identifiers
+    _stable_identifiers = (
+        f"g{hashlib.blake2b(f'{seed}:{n}'.encode('utf-8'), digest_size=12).hexdigest()}"
+        for n in itertools.count())
+    try:
+        yield
+    finally:
+        _stable_identifiers = previous
+
+
 def _markdown_to_html(text: str) -> str:
     """
     Convert markdown text with code blocks to HTML.
@@ -30,50 +64,146 @@ def _markdown_to_html(text: str) -> str:
     Returns:
         HTML formatted text.
     """
-    # First, escape HTML in the text but preserve code blocks
-    code_block_pattern = r'```(\w*)\n(.*?)```'
-    
-    # Find all code blocks and replace with placeholders
-    code_blocks = []
-    
-    def save_code_block(match):
-        lang = match.group(1) or ''
-        code = match.group(2)
-        placeholder = f"__CODE_BLOCK_{len(code_blocks)}__"
-        code_blocks.append((lang, code))
-        return placeholder
-    
-    text_with_placeholders = re.sub(code_block_pattern, save_code_block, text, flags=re.DOTALL)
+    return markdown_to_html(text)
+
+
+def render_html(
+    text: str,
+    prerendered: str = None,
+    render: Callable[[str], str] = _markdown_to_html
+) -> str:
+    """Return pre-rendered HTML if available, otherwise render the markdown."""
+    if prerendered is not None:
+        return prerendered
+    return render(text)
+
+
+def prerender_html(
+    questions: List[Question],
+    renderer: str = None,
+    workers: int = 1
+) -> List[Question]:
+    """
+    Render the HTML for each stem and choice and store it on the questions.
     
-    # Escape HTML in the remaining text
-    escaped_text = html.escape(text_with_placeholders)
+    Later generation reuses the stored HTML instead of rendering again, so
+    several outputs can share one rendering pass.
     
-    # Convert newlines to <br/> tags (except before/after code blocks)
-    escaped_text = escaped_text.replace('\n', '<br/>\n')
+    Args:
+        questions: List of Question objects to render.
+        renderer: Name of the renderer plugin to use.
+        workers: Number of processes used to render. With 1 (the default)
+            questions are rendered serially.
+        
+    Returns:
+        The same list of questions.
+    """
+    if workers > 1 and len(questions) > 1:
+        chunks = split_chunks(questions, workers)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for chunk, rendered in zip(chunks, executor.map(
+                    _prerender_chunk, chunks, [renderer] * len(chunks))):
+                for question, (stem_html, choice_html) in zip(chunk, rendered):
+                    question.stem_html = stem_html
+                    for choice, html in zip(question.choices, choice_html):
+                        choice.html = html
+        return questions
+    
+    render = get_renderer(renderer)
+    for question in questions:
+        question.stem_html = render_html(question.stem, question.stem_html, render)
+        for choice in question.choices:
+            choice.html = render_html(choice.text, choice.html, render)
+    return questions
+
+
+def _prerender_chunk(questions: List[Question], renderer: str = None) -> List[tuple]:
+    """Render a chunk of questions in a worker process and return their HTML."""
+    return [(question.stem_html, [choice.html for choice in question.choices])
+            for question in prerender_html(questions, renderer)]
+
+
+XML_DECLARATION = '<?xml version="1.0" ?>'
+
+# Elements whose text is HTML and is written as a CDATA section in compact mode
+_CDATA_ELEMENTS = {'mattext'}
+
+
+def _escape_text(text: str) -> str:
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def escape_attrib(value: str) -> str:
+    return (_escape_text(value).replace('"', '&quot;')
+            .replace('\n', '&#10;').replace('\r', '&#13;').replace('\t', '&#09;'))
+
+
+def _cdata(text: str) -> str:
+    # "]]>" cannot appear inside a CDATA section, so split it across two
+    return '<![CDATA[' + text.replace(']]>', ']]]]><![CDATA[>') + ']]>'
+
+
+def write_compact(elem: Element, parts: List[str]):
+    """Append the compact serialization of an element to parts."""
+    if elem.tag is Comment:
+        parts.append(f"<!--{elem.text}-->")
+        return
+    
+    parts.append('<' + elem.tag)
+    for name, value in elem.attrib.items():
+        parts.append(f' {name}="{escape_attrib(value)}"')
+    
+    if not elem.text and not len(elem):
+        parts.append('/>')
+        if elem.tail:
+            parts.append(_escape_text(elem.tail))
+        return
+    
+    parts.append('>')
+    if elem.text:
+        if elem.tag in _CDATA_ELEMENTS:
+            parts.append(_cdata(elem.text))
+        else:
+            parts.append(_escape_text(elem.text))
+    for child in elem:
+        write_compact(child, parts)
+    parts.append(f'</{elem.tag}>')
+    # Only HTML parsed into elements has text after its elements
+    if elem.tail:
+        parts.append(_escape_text(elem.tail))
+
+
+def serialize_xml(root: Element, compact: bool = False) -> str:
+    """
+    Serialize an XML document.
     
-    # Handle inline code
-    escaped_text = re.sub(r'`([^`]+)`', r'<code>\1</code>', escaped_text)
+    By default the document is pretty-printed. In compact mode no
+    indentation is added and HTML text is written as CDATA sections.
     
-    # Restore code blocks as HTML
-    for i, (lang, code) in enumerate(code_blocks):
-        placeholder = f"__CODE_BLOCK_{i}__"
-        escaped_code = html.escape(code.rstrip())
-        if lang:
-            html_code = f'<pre><code class="language-{lang}">{escaped_code}</code></pre>'
-        else:
-            html_code = f'<pre><code>{escaped_code}</code></pre>'
-        escaped_text = escaped_text.replace(placeholder, html_code)
+    Args:
+        root: The root element of the document.
+        compact: Whether to use compact output.
+        
+    Returns:
+        XML string including the XML declaration.
+    """
+    if compact:
+        parts = [XML_DECLARATION]
+        write_compact(root, parts)
+        return ''.join(parts)
     
-    return escaped_text
+    xml_str = tostring(root, encoding='unicode')
+    return minidom.parseString(xml_str).toprettyxml(indent="  ")
 
 
-def generate_qti_manifest(assessment_id: str, title: str) -> str:
+def generate_qti_manifest(assessment_id: str, title: str, compact: bool = False) -> str:
     """
     Generate the imsmanifest.xml content for the QTI package.
     
     Args:
         assessment_id: Unique identifier for the assessment.
         title: Title of the assessment.
+        compact: Skip pretty-printing.
         
     Returns:
         XML string for the manifest.
@@ -105,59 +235,338 @@ def generate_qti_manifest(assessment_id: str, title: str) -> str:
     file_elem = SubElement(resource, 'file')
     file_elem.set('href', f"{assessment_id}/{assessment_id}.xml")
     
-    # Pretty print
-    xml_str = tostring(manifest, encoding='unicode')
-    return minidom.parseString(xml_str).toprettyxml(indent="  ")
+    return serialize_xml(manifest, compact)
 
 
 def generate_qti_assessment(
     questions: List[Question],
     title: str = "Assessment",
-    assessment_id: str = None
+    assessment_id: str = None,
+    workers: int = 1,
+    chunk_size: int = None,
+    compact: bool = False,
+    renderer: str = None,
+    emitter: str = None
 ) -> str:
     """
-    Generate QTI 2.2 compatible XML for Canvas LMS.
+    Generate QTI 1.2 XML for Canvas LMS.
     
     Args:
         questions: List of Question objects to convert.
         title: Title of the assessment.
         assessment_id: Unique identifier for the assessment.
+        workers: Number of processes used to render question items.
+            With 1 (the default) items are rendered serially.
+        chunk_size: Number of questions handed to a worker at a time.
+            Defaults to an even split of several chunks per worker.
+        compact: Skip pretty-printing and write question and choice HTML
+            as CDATA sections instead of escaped text.
+        renderer: Name of the renderer plugin for markdown text.
+        emitter: Name of the item emitter plugin.
         
     Returns:
         QTI XML string.
     """
+    return ''.join(iter_qti_assessment(
+        questions, title, assessment_id, workers, chunk_size, compact, renderer, emitter))
+
+
+def iter_qti_assessment(
+    questions: Iterable[Question],
+    title: str = "Assessment",
+    assessment_id: str = None,
+    workers: int = 1,
+    chunk_size: int = None,
+    compact: bool = False,
+    renderer: str = None,
+    emitter: str = None
+) -> Iterator[str]:
+    """
+    Generate QTI XML in pieces, rendering each question as it arrives.
+    
+    Joined together the pieces are the output of generate_qti_assessment.
+    With one worker only a single question is held at a time, except that
+    the questions of a group are held until the group ends, as the group's
+    section starts with its size.
+    
+    Args:
+        questions: Question objects to convert, e.g. from iter_markdown_exam.
+        title: Title of the assessment.
+        assessment_id: Unique identifier for the assessment.
+        workers: Number of processes used to render question items. More
+            than one reads all the questions before rendering.
+        chunk_size: Number of questions handed to a worker at a time.
+        compact: Skip pretty-printing and write HTML as CDATA sections.
+        renderer: Name of the renderer plugin for markdown text.
+        emitter: Name of the item emitter plugin.
+        
+    Yields:
+        Consecutive pieces of the QTI XML document.
+    """
     if assessment_id is None:
-        assessment_id = _generate_identifier()
-    
-    # Root element - using QTI 1.2 format which Canvas accepts
-    questestinterop = Element('questestinterop')
-    questestinterop.set('xmlns', 'http://www.imsglobal.org/xsd/ims_qtiasiv1p2')
-    questestinterop.set('xmlns:xsi', 'http://www.w3.org/2001/XMLSchema-instance')
-    questestinterop.set('xsi:schemaLocation', 
-        'http://www.imsglobal.org/xsd/ims_qtiasiv1p2 http://www.imsglobal.org/xsd/ims_qtiasiv1p2p1.xsd')
-    
-    # Assessment element
-    assessment = SubElement(questestinterop, 'assessment')
-    assessment.set('ident', assessment_id)
-    assessment.set('title', title)
-    
-    # Assessment metadata
-    qtimetadata = SubElement(assessment, 'qtimetadata')
-    _add_metadata_field(qtimetadata, 'qmd_timelimit', '')
-    _add_metadata_field(qtimetadata, 'cc_maxattempts', '1')
-    
-    # Section containing all items
-    section = SubElement(assessment, 'section')
-    section.set('ident', 'root_section')
-    
-    # Add each question as an item
-    for question in questions:
-        item = _create_question_item(question)
-        section.append(item)
+        assessment_id = generate_identifier()
+    
+    questions = iter(questions)
+    if workers > 1:
+        questions = list(questions)
+    if workers > 1 and len(questions) > 1:
+        rendered = zip(questions, render_items_parallel(
+            questions, workers, chunk_size, compact, renderer, emitter))
+    else:
+        rendered = ((question, render_item(question, compact, renderer, emitter))
+                    for question in questions)
+    
+    parts = []
+    writer = AssessmentWriter(parts.append, title, assessment_id, compact)
+    for question, item in rendered:
+        writer.add(question, item)
+        yield from parts
+        parts.clear()
+    writer.close()
+    yield from parts
+
+
+class AssessmentWriter:
+    """
+    Write assessment XML as rendered items are added one at a time.
     
-    # Pretty print
-    xml_str = tostring(questestinterop, encoding='unicode')
-    return minidom.parseString(xml_str).toprettyxml(indent="  ")
+    Items are serialized one at a time (or by worker processes) and spliced
+    into the serialized skeleton in place of placeholder comments, so the
+    whole document is never held as a tree.
+    """
+    
+    def __init__(self, write: Callable[[str], object], title: str, assessment_id: str,
+                 compact: bool = False):
+        self._write = write
+        self._compact = compact
+        self._tail = None
+        self._group = None
+        self._group_items = []
+        
+        # Root element - using QTI 1.2 format which Canvas accepts
+        questestinterop = Element('questestinterop')
+        questestinterop.set('xmlns', 'http://www.imsglobal.org/xsd/ims_qtiasiv1p2')
+        questestinterop.set('xmlns:xsi', 'http://www.w3.org/2001/XMLSchema-instance')
+        questestinterop.set('xsi:schemaLocation', 
+            'http://www.imsglobal.org/xsd/ims_qtiasiv1p2 http://www.imsglobal.org/xsd/ims_qtiasiv1p2p1.xsd')
+        
+        # Assessment element
+        assessment = SubElement(questestinterop, 'assessment')
+        assessment.set('ident', assessment_id)
+        assessment.set('title', title)
+        
+        # Assessment metadata
+        qtimetadata = SubElement(assessment, 'qtimetadata')
+        _add_metadata_field(qtimetadata, 'qmd_timelimit', '')
+        _add_metadata_field(qtimetadata, 'cc_maxattempts', '1')
+        
+        # Section containing all items. Grouped questions go in a nested
+        # section from which Canvas draws the group's pick for each student.
+        self._root = questestinterop
+        self._section = SubElement(assessment, 'section')
+        self._section.set('ident', 'root_section')
+    
+    def add(self, question: Question, item: str):
+        """Add the rendered item for a question."""
+        if self._tail is None:
+            self._section.append(Comment(_ITEMS_PLACEHOLDER))
+            head, self._tail = _split_skeleton(serialize_xml(self._root, self._compact), self._compact)
+            self._write(head)
+        
+        if question.group is not self._group:
+            self._end_group()
+            self._group = question.group
+        if self._group is None:
+            self._write(item)
+        else:
+            self._group_items.append(item)
+    
+    @property
+    def held_bytes(self) -> int:
+        """Size in bytes of the items held until their group ends."""
+        return sum(len(item.encode('utf-8')) for item in self._group_items)
+    
+    def close(self):
+        """Write the end of the document."""
+        if self._tail is None:
+            self._write(serialize_xml(self._root, self._compact))
+            return
+        self._end_group()
+        self._write(self._tail)
+    
+    def _end_group(self):
+        # A group's section starts with its size, so its items are held
+        # until the group ends
+        if self._group is not None:
+            for part in _group_parts(self._group, self._group_items, self._compact):
+                self._write(part)
+        self._group = None
+        self._group_items = []
+
+
+# Depth of <item> elements in the pretty-printed assessment document
+# (questestinterop > assessment > section > item), and of items in a
+# question group's nested section
+_ITEM_INDENT = "  " * 3
+_GROUP_ITEM_INDENT = "  " * 4
+_ITEMS_PLACEHOLDER = "__QTI_ITEMS__"
+
+
+def _split_skeleton(xml: str, compact: bool):
+    """
+    Split serialized XML at its items placeholder.
+    
+    Returns:
+        Tuple of the XML before and after the placeholder, without the
+        indentation and line break pretty-printing gave the placeholder.
+    """
+    head, tail = xml.split(f"<!--{_ITEMS_PLACEHOLDER}-->", 1)
+    if compact:
+        return head, tail
+    return head.rstrip(' '), tail[1:]
+
+
+def _group_parts(group: QuestionGroup, items: List[str], compact: bool) -> Iterator[str]:
+    """Yield the serialized section for a question group around its items."""
+    section = _create_group_section(group, len(items))
+    section.append(Comment(_ITEMS_PLACEHOLDER))
+    if compact:
+        parts = []
+        write_compact(section, parts)
+        xml = ''.join(parts)
+    else:
+        writer = io.StringIO()
+        minidom.parseString(tostring(section, encoding='unicode')).documentElement.writexml(
+            writer, _ITEM_INDENT, "  ", "\n")
+        xml = writer.getvalue()
+    
+    head, tail = _split_skeleton(xml, compact)
+    yield head
+    yield from items
+    yield tail
+
+
+def _create_group_section(group: QuestionGroup, count: int) -> Element:
+    """
+    Create the nested section for a question group.
+    
+    Args:
+        group: The question group.
+        count: Number of questions in the group.
+        
+    Returns:
+        The group's section element, without its items.
+    """
+    section = Element('section')
+    section.set('ident', generate_identifier())
+    section.set('title', group.title)
+    
+    selection_ordering = SubElement(section, 'selection_ordering')
+    selection = SubElement(selection_ordering, 'selection')
+    selection_number = SubElement(selection, 'selection_number')
+    selection_number.text = str(group.pick if group.pick is not None else count)
+    selection_extension = SubElement(selection, 'selection_extension')
+    points_per_item = SubElement(selection_extension, 'points_per_item')
+    points_per_item.text = format_points(group.points)
+    return section
+
+
+def format_points(points: float = None) -> str:
+    """Format a point value, defaulting to one point."""
+    if points is None:
+        return '1'
+    return f"{points:g}"
+
+
+def render_item(
+    question: Question,
+    compact: bool = False,
+    renderer: str = None,
+    emitter: str = None
+) -> str:
+    """
+    Render a question to serialized item XML.
+    
+    The item is built by the selected item emitter plugin, with markdown
+    rendered by the selected renderer plugin. Pretty-printed items are
+    written with the same indentation they would receive in the whole
+    pretty-printed document.
+    """
+    item = get_emitter(emitter)(question, get_renderer(renderer))
+    if compact:
+        parts = []
+        write_compact(item, parts)
+        return ''.join(parts)
+    
+    item_xml = tostring(item, encoding='unicode')
+    writer = io.StringIO()
+    indent = _ITEM_INDENT if question.group is None else _GROUP_ITEM_INDENT
+    minidom.parseString(item_xml).documentElement.writexml(writer, indent, "  ", "\n")
+    return writer.getvalue()
+
+
+def _render_item_chunk(
+    questions: List[Question],
+    compact: bool = False,
+    renderer: str = None,
+    emitter: str = None,
+    render_one: Callable = render_item
+) -> list:
+    """
+    Render a chunk of questions to serialized item XML in a worker process.
+    
+    Plugins are passed by name and loaded in the worker.
+    """
+    return [render_one(question, compact, renderer, emitter) for question in questions]
+
+
+def render_items_parallel(
+    questions: List[Question],
+    workers: int,
+    chunk_size: int = None,
+    compact: bool = False,
+    renderer: str = None,
+    emitter: str = None,
+    render_one: Callable = render_item
+) -> list:
+    """
+    Render question items in a process pool.
+    
+    Questions are split into contiguous chunks and the rendered items are
+    returned in the original question order.
+    
+    Args:
+        questions: List of Question objects to convert.
+        workers: Number of worker processes.
+        chunk_size: Number of questions per chunk.
+        compact: Whether to use compact output.
+        renderer: Name of the renderer plugin.
+        emitter: Name of the item emitter plugin.
+        render_one: Module-level function rendering one item, called as
+            render_one(question, compact, renderer, emitter). Defaults to
+            rendering a QTI 1.2 item.
+        
+    Returns:
+        A list of the rendered items, one per question.
+    """
+    chunks = split_chunks(questions, workers, chunk_size)
+    count = len(chunks)
+    
+    items = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for rendered in executor.map(_render_item_chunk, chunks, [compact] * count,
+                                     [renderer] * count, [emitter] * count,
+                                     [render_one] * count):
+            items.extend(rendered)
+    return items
+
+
+def split_chunks(questions: List[Question], workers: int, chunk_size: int = None) -> List[list]:
+    """Split questions into contiguous chunks for a process pool."""
+    if chunk_size is None:
+        # A few chunks per worker keeps the pool busy when chunks are uneven
+        chunk_size = max(1, -(-len(questions) // (workers * 4)))
+    return [questions[i:i + chunk_size] for i in range(0, len(questions), chunk_size)]
 
 
 def _add_metadata_field(parent: Element, label: str, value: str):
@@ -169,17 +578,23 @@ def _add_metadata_field(parent: Element, label: str, value: str):
     fieldentry.text = value
 
 
-def _create_question_item(question: Question) -> Element:
+def create_question_item(
+    question: Question,
+    render: Callable[[str], str] = _markdown_to_html
+) -> Element:
     """
     Create a QTI item element for a question.
     
+    This is the built-in "qti12" item emitter.
+    
     Args:
         question: The Question object to convert.
+        render: Function rendering markdown text to HTML.
         
     Returns:
         An Element representing the QTI item.
     """
-    item_id = _generate_identifier()
+    item_id = generate_identifier()
     
     item = Element('item')
     item.set('ident', item_id)
@@ -189,10 +604,11 @@ def _create_question_item(question: Question) -> Element:
     itemmetadata = SubElement(item, 'itemmetadata')
     qtimetadata = SubElement(itemmetadata, 'qtimetadata')
     _add_metadata_field(qtimetadata, 'question_type', 'multiple_choice_question')
-    _add_metadata_field(qtimetadata, 'points_possible', '1')
+    points = question.group.points if question.group is not None else None
+    _add_metadata_field(qtimetadata, 'points_possible', format_points(points))
     _add_metadata_field(qtimetadata, 'original_answer_ids', 
         ','.join([f"{item_id}_{c.letter}" for c in question.choices]))
-    _add_metadata_field(qtimetadata, 'assessment_question_identifierref', _generate_identifier())
+    _add_metadata_field(qtimetadata, 'assessment_question_identifierref', generate_identifier())
     
     # Presentation
     presentation = SubElement(item, 'presentation')
@@ -201,7 +617,7 @@ def _create_question_item(question: Question) -> Element:
     material = SubElement(presentation, 'material')
     mattext = SubElement(material, 'mattext')
     mattext.set('texttype', 'text/html')
-    mattext.text = _markdown_to_html(question.stem)
+    mattext.text = render_html(question.stem, question.stem_html, render)
     
     # Response (answer choices)
     response_lid = SubElement(presentation, 'response_lid')
@@ -218,7 +634,7 @@ def _create_question_item(question: Question) -> Element:
         material = SubElement(response_label, 'material')
         mattext = SubElement(material, 'mattext')
         mattext.set('texttype', 'text/html')
-        mattext.text = _markdown_to_html(choice.text)
+        mattext.text = render_html(choice.text, choice.html, render)
     
     # Response processing
     resprocessing = SubElement(item, 'resprocessing')
@@ -251,7 +667,11 @@ def _create_question_item(question: Question) -> Element:
 def create_qti_package(
     questions: List[Question],
     output_path: str,
-    title: str = "Assessment"
+    title: str = "Assessment",
+    workers: int = 1,
+    compact: bool = False,
+    renderer: str = None,
+    emitter: str = None
 ) -> str:
     """
     Create a QTI package (ZIP file) for import into Canvas LMS.
@@ -260,26 +680,158 @@ def create_qti_package(
         questions: List of Question objects to convert.
         output_path: Path for the output ZIP file.
         title: Title of the assessment.
+        workers: Number of processes used to render question items.
+        compact: Write compact XML with CDATA-wrapped HTML.
+        renderer: Name of the renderer plugin for markdown text.
+        emitter: Name of the item emitter plugin.
         
     Returns:
         Path to the created ZIP file.
     """
-    assessment_id = _generate_identifier()
+    output_path = package_path(output_path)
+    with atomic_write(output_path) as f:
+        write_qti_package(questions, f, title, workers=workers, compact=compact,
+                          renderer=renderer, emitter=emitter)
     
-    # Generate XML content
-    qti_xml = generate_qti_assessment(questions, title, assessment_id)
-    manifest_xml = generate_qti_manifest(assessment_id, title)
-    
-    # Create ZIP file
+    return str(output_path)
+
+
+def package_path(output_path: str) -> Path:
+    """Return the path of a package, adding a .zip suffix if it has none."""
     output_path = Path(output_path)
     if not output_path.suffix:
         output_path = output_path.with_suffix('.zip')
+    return output_path
+
+
+@contextlib.contextmanager
+def atomic_write(path) -> Iterator[BinaryIO]:
+    """
+    Open a binary file that appears at path only once it is complete.
+    
+    The file is written under a temporary name in the same directory and
+    renamed over path when the block ends, so an interrupted write never
+    leaves a truncated file behind, nor replaces a previous one. On an
+    error the temporary file is removed.
+    """
+    path = Path(path)
+    temp_path = path.with_name(f".{path.name}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        with open(temp_path, 'xb') as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(temp_path)
+        raise
+
+
+def write_qti_package(
+    questions: Iterable[Question],
+    output: BinaryIO,
+    title: str = "Assessment",
+    workers: int = 1,
+    compact: bool = False,
+    renderer: str = None,
+    emitter: str = None
+) -> int:
+    """
+    Write a QTI package (ZIP file) to a binary stream.
+    
+    The stream does not need to be seekable: on a pipe the ZIP entries are
+    written with data descriptors. The assessment XML is compressed and
+    written as each question is rendered, so with one worker the package
+    is never held in memory.
     
-    with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+    Args:
+        questions: Question objects to convert, e.g. from iter_markdown_exam.
+        output: Binary stream to write the package to, e.g. sys.stdout.buffer.
+        title: Title of the assessment.
+        workers: Number of processes used to render question items.
+        compact: Write compact XML with CDATA-wrapped HTML.
+        renderer: Name of the renderer plugin for markdown text.
+        emitter: Name of the item emitter plugin.
+        
+    Returns:
+        The number of questions written.
+    """
+    assessment_id = generate_identifier()
+    count = 0
+    
+    def counted():
+        nonlocal count
+        for question in questions:
+            count += 1
+            yield question
+    
+    with open_package(output, assessment_id, title, compact) as writer:
+        for part in iter_qti_assessment(
+                counted(), title, assessment_id, workers=workers, compact=compact,
+                renderer=renderer, emitter=emitter):
+            writer.write(part)
+    
+    return count
+
+
+class _MeasuredEntry(io.BufferedIOBase):
+    """
+    A zip entry's stream that can tell how large the entry is so far.
+    
+    What is written also goes through a compressor of its own, set up as
+    zipfile sets up the entry's, so the compressed size is measured from
+    public zlib calls alone, and measuring never changes the package.
+    """
+    
+    def __init__(self, entry: BinaryIO):
+        self._entry = entry
+        self._compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        # Bytes written, before compression
+        self.size = 0
+        # Bytes the compressor has already returned
+        self._compressed = 0
+    
+    def writable(self):
+        return True
+    
+    def write(self, data) -> int:
+        self._entry.write(data)
+        self.size += len(data)
+        self._compressed += len(self._compressor.compress(data))
+        return len(data)
+    
+    def flush(self):
+        self._entry.flush()
+    
+    def close(self):
+        if not self.closed:
+            super().close()
+            self._entry.close()
+    
+    def held_bytes(self) -> int:
+        """Return the compressed bytes the entry has not written yet, were it ended now."""
+        return len(self._compressor.copy().flush())
+
+
+@contextlib.contextmanager
+def open_package(output: BinaryIO, assessment_id: str, title: str, compact: bool = False,
+                  measure: bool = False):
+    """
+    Start a QTI package on a binary stream.
+    
+    Writes the manifest and yields a text stream for the assessment XML.
+    The package is complete once the context exits. With measure, the
+    text stream's buffer is a _MeasuredEntry, at the cost of compressing
+    the XML twice.
+    """
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as zf:
         # Add manifest
-        zf.writestr('imsmanifest.xml', manifest_xml)
+        zf.writestr('imsmanifest.xml', generate_qti_manifest(assessment_id, title, compact=compact))
         
         # Add assessment XML in subdirectory
-        zf.writestr(f"{assessment_id}/{assessment_id}.xml", qti_xml)
-    
-    return str(output_path)
+        with zf.open(f"{assessment_id}/{assessment_id}.xml", 'w') as entry:
+            if measure:
+                entry = _MeasuredEntry(entry)
+            with io.TextIOWrapper(entry, encoding='utf-8') as writer:
+                yield writer
@@ -0,0 +1,451 @@
+"""
+Markdown to HTML renderer for question stems and answer choices.
+
+Text is processed in one left-to-right pass: fenced code blocks are found
+first, the lines between them are grouped into lists, tables and plain
+text, and inline markup is handled by a single scanner that stops only at
+characters that can start markup. Every construct is matched with forward
+searches, so rendering time is linear in the length of the text no matter
+how it is nested or left unbalanced.
+
+Supported syntax:
+    - fenced code blocks (```lang ... ```) and code spans (`code`)
+    - **bold**, __bold__, *italic*, _italic_
+    - [links](https://example.com) (http, https, mailto and relative URLs)
+    - unordered (-, *, +) and ordered (1. or 1)) lists, nested by indentation
+    - pipe tables with a header separator row
+    - $inline$ and $$display$$ LaTeX math, converted to MathML
+    - backslash escapes for punctuation
+
+All text is HTML-escaped; the only tags in the output are ones generated
+by the renderer. Line breaks in plain text become <br/> tags, as Canvas
+does not apply paragraph spacing to question text.
+"""
+import bisect
+import html
+import re
+from typing import List
+
+from .latex import render_math
+
+# Opening code fence with an optional language, e.g. "```python\n"
+_FENCE_OPEN_PATTERN = re.compile(r'```(\w*)\n')
+
+# List items: indentation, marker and content
+_LIST_ITEM_PATTERN = re.compile(r'( *)([-*+]|\d{1,9}[.)])[ \t]+(.*)')
+
+_BLOCK_START_PATTERN = re.compile(r'(?:^|\n) *(?:[-*+]|\d{1,9}[.)])[ \t]')
+
+# Table separator row, e.g. "| --- | :---: |". Each run of spaces can
+# only be matched one way, so a failed match backtracks in linear time.
+_TABLE_SEPARATOR_PATTERN = re.compile(r' *(?:\| *)?:?-+:? *(?:\| *:?-+:? *)*(?:\| *)?')
+_TABLE_CELL_PATTERN = re.compile(r'(?:\\.?|[^\\|])*')
+
+# Characters that can start inline markup
+_INLINE_SPECIAL_PATTERN = re.compile(r'[\\`*_\[\]\n$]')
+_BACKTICK_RUN_PATTERN = re.compile(r'`+')
+
+# A single $ that can close inline math: not after whitespace or a
+# backslash, and not before a digit, so "$5 and $10" stays text
+_MATH_CLOSE_PATTERN = re.compile(r'(?<![\s\\$])\$(?![\d$])')
+_LINK_DESTINATION_PATTERN = re.compile(r'\(([^\s()<>]*)\)')
+_URL_SCHEME_PATTERN = re.compile(r'([A-Za-z][A-Za-z0-9+.-]*):')
+
+_SAFE_URL_SCHEMES = {'http', 'https', 'mailto'}
+_ASCII_PUNCTUATION = set('!"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~')
+
+
+def find_code_blocks(text: str):
+    """
+    Find fenced code blocks in text, left to right.
+    
+    Each fence is located with a single forward search, so the scan is
+    linear in the length of the text even when fences are unbalanced.
+    
+    Args:
+        text: Markdown text that may contain code blocks.
+    
+    Yields:
+        Tuples of (start, end, language, code) for each code block.
+    """
+    pos = 0
+    while True:
+        start = text.find('```', pos)
+        if start == -1:
+            return
+        match = _FENCE_OPEN_PATTERN.match(text, start)
+        if match is None:
+            pos = start + 1
+            continue
+        close = text.find('```', match.end())
+        if close == -1:
+            # No later fence can be closed either
+            return
+        yield start, close + 3, match.group(1), text[match.end():close]
+        pos = close + 3
+
+
+class _Delimiter:
+    """A run of * or _ that may open or close emphasis."""
+    __slots__ = ('char', 'count', 'can_open', 'can_close', 'open_tags', 'close_tags')
+    
+    def __init__(self, char: str, count: int, can_open: bool, can_close: bool):
+        self.char = char
+        self.count = count
+        self.can_open = can_open
+        self.can_close = can_close
+        self.open_tags = []
+        self.close_tags = []
+    
+    def __str__(self):
+        return ''.join(self.close_tags) + self.char * self.count + ''.join(self.open_tags)
+
+
+def _safe_url(url: str) -> bool:
+    """Only allow http, https, mailto and relative URLs in links."""
+    match = _URL_SCHEME_PATTERN.match(url)
+    if match is None:
+        return True
+    return match.group(1).lower() in _SAFE_URL_SCHEMES
+
+
+def render_inline(text: str) -> str:
+    """
+    Render inline markdown (code spans, emphasis, links, escapes) to HTML.
+    
+    Newlines become <br/> tags.
+    
+    Args:
+        text: Markdown text without block structure.
+    
+    Returns:
+        HTML formatted text.
+    """
+    # Backtick runs by length, so a code span's closing run is found by
+    # binary search instead of rescanning the text. Built on first use.
+    runs = None
+    # Positions that can close inline math, also built on first use
+    math_closers = None
+    display_math = True  # False once no closing $$ remains
+    
+    out = []
+    openers: List[_Delimiter] = []
+    open_counts = {'*': 0, '_': 0}
+    brackets = []  # (index in out, number of openers when opened)
+    length = len(text)
+    pos = 0
+    
+    while pos < length:
+        match = _INLINE_SPECIAL_PATTERN.search(text, pos)
+        if match is None:
+            out.append(html.escape(text[pos:]))
+            break
+        start = match.start()
+        if start > pos:
+            out.append(html.escape(text[pos:start]))
+        char = text[start]
+        
+        if char == '\n':
+            out.append('<br/>\n')
+            pos = start + 1
+        
+        elif char == '\\':
+            following = text[start + 1:start + 2]
+            if following in _ASCII_PUNCTUATION:
+                out.append(html.escape(following))
+                pos = start + 2
+            else:
+                out.append('\\')
+                pos = start + 1
+        
+        elif char == '`':
+            end = start
+            while end < length and text[end] == '`':
+                end += 1
+            count = end - start
+            if runs is None:
+                runs = {}
+                for run in _BACKTICK_RUN_PATTERN.finditer(text):
+                    runs.setdefault(len(run.group(0)), []).append(run.start())
+            starts = runs.get(count, [])
+            index = bisect.bisect_right(starts, start)
+            # The closing run must be a whole run of the same length
+            while index < len(starts) and starts[index] < end:
+                index += 1
+            if index < len(starts):
+                close = starts[index]
+                code = html.escape(text[end:close]).replace('\n', '<br/>\n')
+                out.append(f'<code>{code}</code>')
+                pos = close + count
+            else:
+                out.append(text[start:end])
+                pos = end
+        
+        elif char == '$':
+            end = start
+            while end < length and text[end] == '$':
+                end += 1
+            count = end - start
+            close = -1
+            if count == 2 and display_math:
+                close = text.find('$$', end)
+                if close == -1:
+                    display_math = False
+            elif count == 1 and end < length and not text[end].isspace():
+                if math_closers is None:
+                    math_closers = [m.start() for m in _MATH_CLOSE_PATTERN.finditer(text)]
+                index = bisect.bisect_right(math_closers, start)
+                if index < len(math_closers):
+                    close = math_closers[index]
+            if close > end:
+                out.append(render_math(text[end:close], display=count == 2))
+                pos = close + count
+            else:
+                out.append(text[start:end])
+                pos = end
+        
+        elif char in '*_':
+            end = start
+            while end < length and text[end] == char:
+                end += 1
+            before = text[start - 1] if start > 0 else ' '
+            after = text[end] if end < length else ' '
+            before_space = before.isspace()
+            after_space = after.isspace()
+            before_punct = before in _ASCII_PUNCTUATION
+            after_punct = after in _ASCII_PUNCTUATION
+            left_flanking = not after_space and (
+                not after_punct or before_space or before_punct)
+            right_flanking = not before_space and (
+                not before_punct or after_space or after_punct)
+            if char == '*':
+                can_open, can_close = left_flanking, right_flanking
+            else:
+                # Underscores inside words (snake_case) are not emphasis
+                can_open = left_flanking and (not right_flanking or before_punct)
+                can_close = right_flanking and (not left_flanking or after_punct)
+            
+            delimiter = _Delimiter(char, end - start, can_open, can_close)
+            out.append(delimiter)
+            pos = end
+            
+            if can_close:
+                _close_emphasis(delimiter, openers, open_counts, brackets)
+            if delimiter.count and can_open:
+                openers.append(delimiter)
+                open_counts[char] += 1
+        
+        elif char == '[':
+            brackets.append((len(out), len(openers)))
+            out.append('[')
+            pos = start + 1
+        
+        else:  # ']'
+            pos = start + 1
+            if not brackets:
+                out.append(']')
+                continue
+            slot, opener_count = brackets.pop()
+            destination = _LINK_DESTINATION_PATTERN.match(text, pos)
+            if destination is None or not _safe_url(destination.group(1)):
+                out.append(']')
+                continue
+            url = html.escape(destination.group(1))
+            out[slot] = f'<a href="{url}">'
+            out.append('</a>')
+            pos = destination.end()
+            # Emphasis can't start inside the link text and end outside it,
+            # and links can't be nested
+            while len(openers) > opener_count:
+                open_counts[openers.pop().char] -= 1
+            brackets.clear()
+    
+    return ''.join(str(piece) for piece in out)
+
+
+def _close_emphasis(closer: _Delimiter, openers: List[_Delimiter], open_counts: dict, brackets: list):
+    """Match a closing delimiter run against the open emphasis runs."""
+    # Openers inside an unclosed link bracket can still be matched; the
+    # lowest opener that may be used is the one at the innermost bracket
+    floor = brackets[-1][1] if brackets else 0
+    while closer.count and open_counts[closer.char]:
+        # Openers of the other character between the match and the closer
+        # can no longer be closed without overlapping tags, so drop them
+        while len(openers) > floor and openers[-1].char != closer.char:
+            open_counts[openers.pop().char] -= 1
+        if len(openers) <= floor:
+            return
+        opener = openers[-1]
+        
+        use = 2 if opener.count >= 2 and closer.count >= 2 else 1
+        tag = 'strong' if use == 2 else 'em'
+        opener.count -= use
+        closer.count -= use
+        opener.open_tags.insert(0, f'<{tag}>')
+        closer.close_tags.append(f'</{tag}>')
+        
+        if not opener.count:
+            openers.pop()
+            open_counts[opener.char] -= 1
+
+
+def _split_table_row(line: str) -> List[str]:
+    """Split a table row into its cells, honouring escaped pipes."""
+    line = line.strip()
+    if line.startswith('|'):
+        line = line[1:]
+    if line.endswith('|') and not line.endswith('\\|'):
+        line = line[:-1]
+    cells = []
+    pos = 0
+    while True:
+        match = _TABLE_CELL_PATTERN.match(line, pos)
+        cells.append(match.group(0).strip())
+        pos = match.end() + 1
+        if pos > len(line):
+            return cells
+
+
+def _render_table(header: str, separator: str, rows: List[str]) -> str:
+    """Render a pipe table."""
+    alignments = []
+    for cell in _split_table_row(separator):
+        if cell.startswith(':') and cell.endswith(':'):
+            alignments.append(' style="text-align: center"')
+        elif cell.endswith(':'):
+            alignments.append(' style="text-align: right"')
+        elif cell.startswith(':'):
+            alignments.append(' style="text-align: left"')
+        else:
+            alignments.append('')
+    
+    def render_row(line, tag):
+        cells = _split_table_row(line)
+        cells = (cells + [''] * len(alignments))[:len(alignments)]
+        return '<tr>' + ''.join(
+            f'<{tag}{align}>{render_inline(cell)}</{tag}>'
+            for cell, align in zip(cells, alignments)
+        ) + '</tr>'
+    
+    parts = ['<table>', '<thead>', render_row(header, 'th'), '</thead>']
+    if rows:
+        parts.append('<tbody>')
+        parts.extend(render_row(row, 'td') for row in rows)
+        parts.append('</tbody>')
+    parts.append('</table>')
+    return '\n'.join(parts)
+
+
+def _is_table_start(lines: List[str], index: int) -> bool:
+    if '|' not in lines[index] or index + 1 >= len(lines):
+        return False
+    separator = lines[index + 1]
+    if not _TABLE_SEPARATOR_PATTERN.fullmatch(separator):
+        return False
+    return len(_split_table_row(separator)) == len(_split_table_row(lines[index]))
+
+
+def _render_list(lines: List[str], index: int):
+    """
+    Render the list starting at lines[index].
+    
+    Returns:
+        Tuple of (HTML, index of the first line after the list).
+    """
+    parts = []
+    stack = []  # (indent, closing tag) of open lists
+    
+    while index < len(lines):
+        line = lines[index]
+        match = _LIST_ITEM_PATTERN.fullmatch(line)
+        if match is None:
+            # Indented lines continue the current item
+            if stack and line.strip() and line[:1].isspace():
+                parts.append('<br/>\n' + render_inline(line.strip()))
+                index += 1
+                continue
+            break
+        
+        indent = len(match.group(1))
+        tag = 'ol' if match.group(2)[0].isdigit() else 'ul'
+        
+        while stack and indent < stack[-1][0]:
+            parts.append(f'</li></{stack.pop()[1]}>')
+        if stack and indent == stack[-1][0] and tag != stack[-1][1]:
+            parts.append(f'</li></{stack.pop()[1]}>')
+        
+        if not stack or indent > stack[-1][0]:
+            number = match.group(2)[:-1]
+            start = f' start="{int(number)}"' if tag == 'ol' and int(number) != 1 else ''
+            parts.append(f'<{tag}{start}>\n<li>')
+            stack.append((indent, tag))
+        else:
+            parts.append('</li>\n<li>')
+        parts.append(render_inline(match.group(3)))
+        index += 1
+    
+    while stack:
+        parts.append(f'</li>\n</{stack.pop()[1]}>')
+    return ''.join(parts), index
+
+
+def _render_blocks(text: str) -> str:
+    """Render markdown text outside fenced code blocks."""
+    # Fast path: nothing that can start a list or table
+    if '|' not in text and not _BLOCK_START_PATTERN.search(text):
+        return render_inline(text)
+    
+    lines = text.split('\n')
+    groups = []
+    paragraph = []
+    index = 0
+    
+    while index < len(lines):
+        line = lines[index]
+        if _LIST_ITEM_PATTERN.fullmatch(line):
+            block, index = _render_list(lines, index)
+        elif _is_table_start(lines, index):
+            end = index + 2
+            while end < len(lines) and '|' in lines[end] and lines[end].strip():
+                end += 1
+            block = _render_table(line, lines[index + 1], lines[index + 2:end])
+            index = end
+        else:
+            paragraph.append(line)
+            index += 1
+            continue
+        
+        if paragraph:
+            groups.append(render_inline('\n'.join(paragraph)))
+            paragraph = []
+        groups.append(block)
+    
+    if paragraph or not groups:
+        groups.append(render_inline('\n'.join(paragraph)))
+    
+    return '\n'.join(groups)
+
+
+def markdown_to_html(text: str) -> str:
+    """
+    Convert markdown text to HTML.
+    
+    Args:
+        text: Markdown text that may contain code blocks.
+    
+    Returns:
+        HTML formatted text.
+    """
+    parts = []
+    pos = 0
+    for start, end, lang, code in find_code_blocks(text):
+        parts.append(_render_blocks(text[pos:start]))
+        escaped_code = html.escape(code.rstrip())
+        if lang:
+            parts.append(f'<pre><code class="language-{lang}">{escaped_code}</code></pre>')
+        else:
+            parts.append(f'<pre><code>{escaped_code}</code></pre>')
+        pos = end
+    parts.append(_render_blocks(text[pos:]))
+    
+    return ''.join(parts)
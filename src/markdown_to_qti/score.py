@@ -0,0 +1,407 @@
+"""
+Offline scoring and item analysis of exported student responses.
+
+Responses are a CSV file with one row per student and one column per
+question, headed by the question's number (e.g. "3", "q3" or "Question
+3"), holding the letter of the chosen answer. Blank cells are omitted
+answers. Other columns are ignored, except the one naming the student.
+
+Rows are read in batches and scored a column at a time, without a Python
+loop per student:
+
+- each question's column is encoded as bytes, one choice code per
+  student, so answer frequencies are bytes.count calls;
+- each student's number of correct answers is summed by adding whole
+  columns at once: a column of 0/1 hits is spread into 16-bit lanes of
+  one big integer, and lanes never carry into each other;
+- sums over the students who answered correctly, needed for the
+  point-biserial correlation, are taken with itertools.compress.
+
+Columns of rows without quotes are split out with slices of one list;
+batches with quoted fields fall back to the csv module.
+
+Each question gets its p-value (share of students answering correctly),
+its point-biserial correlation with the number of correct answers, and
+how often each choice was picked. Questions in a group that picks some
+of its questions are analyzed over the students who answered them, as a
+blank there usually means the question wasn't shown.
+"""
+import argparse
+import csv
+import json
+import math
+import re
+import sys
+from array import array
+from dataclasses import asdict, dataclass, field
+from itertools import compress, islice, repeat
+from operator import add, mul
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple
+
+from .parser import Question, parse_markdown_exam
+from .sinks import question_points
+
+# Rows read and scored at a time
+BATCH_ROWS = 65536
+
+_QUESTION_COLUMN = re.compile(r'(?:q(?:uestion)?\s*)?(\d+)', re.IGNORECASE)
+
+# Choice codes: 0 for a blank cell, 1-26 for the letters a-z in either
+# case, and _OTHER for anything else
+_OTHER = 255
+_CODES = {'': 0}
+for _index in range(26):
+    _CODES[chr(ord('a') + _index)] = _CODES[chr(ord('A') + _index)] = _index + 1
+
+# Translates choice codes to 1 for an answer and 0 for a blank
+_ANSWERED = bytes([0]) + bytes([1]) * 255
+
+# Bytes per student in the integers summing correct answers
+_LANE = 2
+
+
+def _code(letter: str) -> int:
+    return _CODES.get(letter, _OTHER)
+
+
+@dataclass
+class ItemStats:
+    """Item analysis of one question."""
+    question: int
+    answer: Optional[str]
+    # Students the question is analyzed over
+    responses: int
+    correct: int
+    p_value: Optional[float]
+    discrimination: Optional[float]
+    # Times each choice letter was picked, plus "omitted" and "other"
+    frequencies: Dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class ScoreReport:
+    """Scores and item analysis of a set of responses."""
+    students: int
+    mean_score: float
+    max_score: float
+    items: List[ItemStats]
+    # Questions of the exam with no column in the responses
+    missing: List[int] = field(default_factory=list)
+
+
+class _Item:
+    """Running sums for one question's column."""
+    
+    def __init__(self, question: Question, column: int):
+        self.question = question
+        self.column = column
+        self.letters = [choice.letter for choice in question.choices]
+        self.key = _code(question.correct_answer) if question.correct_answer else None
+        # Translates choice codes to 1 for the correct answer and 0 otherwise
+        self.hits_table = bytes(int(code == self.key) for code in range(256))
+        # A blank means "not shown" in a group that picks some of its questions
+        group = question.group
+        self.optional = group is not None and group.pick is not None
+        self.points = question_points(question)
+        # Times each choice's code, and a blank's, was found
+        self.counts = dict.fromkeys([0] + [_code(letter) for letter in self.letters], 0)
+        self.rows = 0
+        self.responses = 0
+        self.correct = 0
+        # Sums of the students' totals, and of their squares, over the
+        # students the question is analyzed over and over those correct
+        self.total_sum = 0
+        self.square_sum = 0
+        self.correct_total_sum = 0
+    
+    def stats(self, students: int, total_sum: int, square_sum: int) -> ItemStats:
+        if not self.optional:
+            self.responses, self.total_sum, self.square_sum = students, total_sum, square_sum
+        frequencies = {letter: self.counts[_code(letter)] for letter in self.letters}
+        frequencies['omitted'] = self.counts[0]
+        frequencies['other'] = self.rows - sum(self.counts.values())
+        
+        p_value = discrimination = None
+        if self.key is not None and self.responses:
+            n = self.responses
+            p_value = self.correct / n
+            mean = self.total_sum / n
+            variance = self.square_sum / n - mean * mean
+            if 0 < p_value < 1 and variance > 0:
+                covariance = self.correct_total_sum / n - p_value * mean
+                discrimination = covariance / math.sqrt(p_value * (1 - p_value) * variance)
+        return ItemStats(self.question.number, self.question.correct_answer, self.responses,
+                         self.correct, p_value, discrimination, frequencies)
+
+
+def _question_columns(header: List[str], questions: List[Question]) -> Tuple[List[_Item], List[int]]:
+    """
+    Match the header's question columns to the exam's questions.
+    
+    Returns:
+        The scored items, and the numbers of questions without a column.
+    
+    Raises:
+        ValueError: If two columns are headed by the same question.
+    """
+    by_number = {question.number: question for question in questions}
+    items = {}
+    for column, name in enumerate(header):
+        match = _QUESTION_COLUMN.fullmatch(name.strip())
+        if match is None or int(match.group(1)) not in by_number:
+            continue
+        number = int(match.group(1))
+        if number in items:
+            raise ValueError(f"question {number} has two columns")
+        items[number] = _Item(by_number[number], column)
+    missing = [question.number for question in questions if question.number not in items]
+    return [items[number] for number in sorted(items)], missing
+
+
+def _read_batches(stream: TextIO, width: int, batch_rows: int = BATCH_ROWS) -> Iterator[List[list]]:
+    """
+    Read rows after the header in batches, returned as columns.
+    
+    Raises:
+        ValueError: If a row has more fields than the header.
+    """
+    while True:
+        lines = list(islice(stream, batch_rows))
+        if not lines:
+            return
+        text = ''.join(lines)
+        # A quoted field may hold newlines: read on until quotes are closed
+        while text.count('"') % 2:
+            line = stream.readline()
+            if not line:
+                break
+            lines.append(line)
+            text += line
+        
+        # Unquoted rows of the header's width split in one pass; any other
+        # row, even if the total field count matches, goes to the csv module
+        if '"' not in text and all(line.count(',') == width - 1 for line in lines):
+            text = text.replace('\r\n', '\n')
+            if text.endswith('\n'):
+                text = text[:-1]
+            flat = text.replace('\n', ',').split(',')
+            yield [flat[column::width] for column in range(width)]
+            continue
+        
+        rows = [row for row in csv.reader(lines) if row]
+        for row in rows:
+            if len(row) > width:
+                raise ValueError(f"a row has {len(row)} fields, but the header has {width}")
+            if len(row) < width:
+                row.extend([''] * (width - len(row)))
+        yield [list(column) for column in zip(*rows)] if rows else [[] for _ in range(width)]
+
+
+def _totals(lanes: int, students: int) -> array:
+    """Unpack per-student sums from the lanes of a big integer."""
+    totals = array('H')
+    totals.frombytes(lanes.to_bytes(students * _LANE, 'little'))
+    if sys.byteorder != 'little':
+        totals.byteswap()
+    return totals
+
+
+def score_responses(
+    questions: List[Question],
+    responses: TextIO,
+    scores: TextIO = None,
+    id_column: str = None,
+    batch_rows: int = BATCH_ROWS
+) -> ScoreReport:
+    """
+    Score responses against an exam's answer key and analyze its items.
+    
+    Each correct answer scores the question's points (its group's, or 1).
+    Discrimination is the point-biserial correlation of answering a
+    question correctly with a student's number of correct answers.
+    
+    Args:
+        questions: The exam's questions.
+        responses: The response CSV, with a header row.
+        scores: Where to write a CSV of each student's number of correct
+            answers and score, if anywhere.
+        id_column: Header of the column naming students. By default this
+            is the first column that isn't a question's.
+        batch_rows: Number of rows scored at a time.
+    
+    Returns:
+        The scores and item analysis.
+    
+    Raises:
+        ValueError: If the responses have no question columns or are
+            malformed.
+    """
+    header = next(csv.reader([responses.readline()]), None)
+    if not header:
+        raise ValueError("the responses are empty")
+    items, missing = _question_columns(header, questions)
+    if not items:
+        raise ValueError("no column is headed by a question of the exam")
+    if len(items) >= 1 << (8 * _LANE):
+        raise ValueError(f"at most {(1 << (8 * _LANE)) - 1} questions can be scored")
+    
+    question_columns = {item.column for item in items}
+    if id_column is not None:
+        if id_column not in header:
+            raise ValueError(f"no column is headed '{id_column}'")
+        ids = header.index(id_column)
+    else:
+        ids = next((column for column in range(len(header)) if column not in question_columns), None)
+    
+    scored = [item for item in items if item.key is not None]
+    point_values = sorted({item.points for item in scored})
+    writer = None
+    if scores is not None:
+        writer = csv.writer(scores, lineterminator='\n')
+        writer.writerow(['student', 'correct', 'score'])
+    
+    students = total_sum = square_sum = 0
+    score_sum = 0.0
+    for columns in _read_batches(responses, len(header), batch_rows):
+        count = len(columns[0])
+        codes = {}
+        for item in items:
+            column = bytes(map(_CODES.get, columns[item.column], repeat(_OTHER, count)))
+            codes[item] = column
+            for code in item.counts:
+                item.counts[code] += column.count(code)
+            item.rows += count
+            if item.optional:
+                item.responses += count - column.count(0)
+        
+        # Correct answers per student, by points value, summed in lanes
+        lanes = dict.fromkeys(point_values, 0)
+        hits = {}
+        spread = bytearray(count * _LANE)
+        for item in scored:
+            hits[item] = codes[item].translate(item.hits_table)
+            spread[::_LANE] = hits[item]
+            lanes[item.points] += int.from_bytes(spread, 'little')
+        totals = _totals(sum(lanes.values()), count)
+        squares = array('L', map(mul, totals, totals))
+        students += count
+        total_sum += sum(totals)
+        square_sum += sum(squares)
+        
+        for item in scored:
+            item_hits = hits[item]
+            correct = item_hits.count(1)
+            item.correct += correct
+            score_sum += item.points * correct
+            item.correct_total_sum += sum(compress(totals, item_hits))
+            if item.optional:
+                answered = codes[item].translate(_ANSWERED)
+                item.total_sum += sum(compress(totals, answered))
+                item.square_sum += sum(compress(squares, answered))
+        
+        if writer is not None:
+            names = columns[ids] if ids is not None else range(students - count + 1, students + 1)
+            points = repeat(0, count)
+            for value, lane_sums in lanes.items():
+                points = list(map(add, points, map(mul, repeat(value), _totals(lane_sums, count))))
+            writer.writerows(zip(names, totals, map(_format_score, points)))
+    
+    max_score = sum(item.points for item in scored)
+    return ScoreReport(
+        students=students,
+        mean_score=score_sum / students if students else 0.0,
+        max_score=max_score,
+        items=[item.stats(students, total_sum, square_sum) for item in items],
+        missing=missing
+    )
+
+
+def _format_score(score: float) -> str:
+    return f"{score:g}"
+
+
+def _percent(count: int, total: int) -> str:
+    return f"{count / total:.0%}" if total else "-"
+
+
+def _format_report(report: ScoreReport) -> List[str]:
+    lines = []
+    mean = _percent(report.mean_score, report.max_score) if report.max_score else "-"
+    lines.append(f"Scored {report.students} student(s) on {len(report.items)} question(s); "
+                 f"mean score {report.mean_score:.2f} of {_format_score(report.max_score)} ({mean}).")
+    if report.missing:
+        lines.append(f"No responses for question(s) {', '.join(map(str, report.missing))}.")
+    lines.append('')
+    lines.append(f"{'Question':>8}  {'Answer':>6}  {'p-value':>7}  {'Discrim.':>8}  Choices")
+    for item in report.items:
+        p_value = f"{item.p_value:.2f}" if item.p_value is not None else '-'
+        discrimination = f"{item.discrimination:.2f}" if item.discrimination is not None else '-'
+        choices = '  '.join(f"{letter}{'*' if letter == item.answer else ''} "
+                            f"{_percent(count, item.responses)}"
+                            for letter, count in item.frequencies.items() if count or len(letter) == 1)
+        lines.append(f"{item.question:>8}  {item.answer or '-':>6}  {p_value:>7}  "
+                     f"{discrimination:>8}  {choices}")
+    return lines
+
+
+def main(argv: List[str] = None) -> int:
+    """Entry point for the `score` subcommand."""
+    parser = argparse.ArgumentParser(
+        prog='markdown-to-qti score',
+        description='Score exported student responses against an exam and report '
+                    'p-values, point-biserial discrimination and choice frequencies.'
+    )
+    parser.add_argument('exam', help='Markdown exam file holding the answer key')
+    parser.add_argument(
+        'responses',
+        help='CSV with a row per student and a column per question, headed by its number, '
+             'or - to read from stdin'
+    )
+    parser.add_argument(
+        '--id-column',
+        type=str,
+        default=None,
+        metavar='NAME',
+        help='Header of the column naming students (default: the first non-question column)'
+    )
+    parser.add_argument(
+        '--scores',
+        type=str,
+        default=None,
+        metavar='PATH',
+        help="CSV file to write each student's number of correct answers and score to"
+    )
+    parser.add_argument(
+        '--json',
+        action='store_true',
+        help='Print the report as JSON'
+    )
+    args = parser.parse_args(argv)
+    
+    try:
+        with open(args.exam, 'r', encoding='utf-8') as f:
+            questions = parse_markdown_exam(f.read())
+    except (IOError, ValueError) as e:
+        print(f"Error reading '{args.exam}': {e}", file=sys.stderr)
+        return 1
+    
+    scores = None
+    try:
+        responses = (sys.stdin if args.responses == '-'
+                     else open(args.responses, 'r', encoding='utf-8-sig', newline=''))
+        if args.scores:
+            scores = open(args.scores, 'w', encoding='utf-8', newline='')
+        with responses:
+            report = score_responses(questions, responses, scores, args.id_column)
+    except (IOError, ValueError, csv.Error) as e:
+        print(f"Error scoring '{args.responses}': {e}", file=sys.stderr)
+        return 1
+    finally:
+        if scores is not None:
+            scores.close()
+    
+    if args.json:
+        print(json.dumps(asdict(report), ensure_ascii=False, indent=2))
+    else:
+        print('\n'.join(_format_report(report)))
+    return 0
@@ -0,0 +1,371 @@
+"""
+Sharded conversion of large banks, with a merge into one QTI package.
+
+A bank is split into N contiguous shards of about equal size, moving
+each boundary to the end of a question group so that no group is split.
+The split only depends on the parsed questions, so every node parsing the
+same bank agrees on it, and each node converts its shard to item XML
+independently:
+    
+    markdown-to-qti shard bank.md --shards 4 --index 0 -o bank.shard0.jsonl
+    ...
+    markdown-to-qti merge bank.shard*.jsonl -o bank.zip
+
+Identifiers are derived from a fingerprint of the bank and each
+question's position (see stable_identifiers), so an item gets the same
+identifiers whichever node renders it and however many shards there are,
+and merging the shards of one bank always gives the same package.
+
+A shard file has the IR's layout: JSON lines, gzip-compressed if the
+name ends in ``.gz``.
+
+Header layout:
+    {"format", "version", "bank", "shard", "shards", "start", "end",
+     "questions", "options": {"compact", "renderer", "emitter"},
+     "groups": [[title, pick, points]...]}
+Item line layout:
+    [group, item]
+The group is an index into the header's groups, which are all the
+bank's groups, or null; the item is its serialized XML. The options are
+those the items were rendered with, naming the default plugins rather
+than leaving them out, and must be the same in every shard merged.
+"""
+import argparse
+import hashlib
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator, List, Sequence, Tuple
+
+from .ir import load_ir, open_text
+from .parser import Question, QuestionGroup, parse_markdown_exam
+from .plugins import DEFAULT_EMITTER, DEFAULT_RENDERER
+from .qti_generator import (
+    AssessmentWriter, atomic_write, generate_identifier, open_package, package_path, render_item,
+    split_chunks, stable_identifiers
+)
+
+SHARD_FORMAT = 'markdown-to-qti-shard'
+SHARD_VERSION = 1
+
+
+def partition(questions: Sequence[Question], shards: int) -> List[Tuple[int, int]]:
+    """
+    Split questions into contiguous shards of about equal size.
+    
+    A boundary inside a question group is moved to the group's end, so
+    shards may be uneven or empty.
+    
+    Returns:
+        The (start, end) range of question positions of each shard.
+    """
+    if shards < 1:
+        raise ValueError("the number of shards must be at least 1")
+    count = len(questions)
+    ranges = []
+    start = 0
+    for index in range(1, shards + 1):
+        end = max(start, count * index // shards)
+        while 0 < end < count and questions[end].group is not None \
+                and questions[end].group is questions[end - 1].group:
+            end += 1
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def bank_fingerprint(questions: Sequence[Question]) -> str:
+    """Return a hash of everything in the questions that their items hold."""
+    digest = hashlib.blake2b(digest_size=16)
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+    group_indexes = {}
+    for question in questions:
+        group = question.group
+        if group is not None and id(group) not in group_indexes:
+            group_indexes[id(group)] = len(group_indexes)
+        digest.update(dumps([
+            question.number,
+            question.stem,
+            question.correct_answer,
+            [[c.letter, c.text, c.is_correct] for c in question.choices],
+            [group_indexes[id(group)], group.title, group.pick, group.points]
+            if group is not None else None,
+            question.tags,
+            question.bloom,
+        ]).encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+def _render_shard_items(
+    bank: str,
+    start: int,
+    questions: List[Question],
+    compact: bool = False,
+    renderer: str = None,
+    emitter: str = None
+) -> List[str]:
+    """Render items with identifiers seeded by the bank and their position."""
+    items = []
+    for position, question in enumerate(questions, start):
+        with stable_identifiers(f"{bank}:{position}"):
+            items.append(render_item(question, compact, renderer, emitter))
+    return items
+
+
+def write_shard(
+    questions: List[Question],
+    index: int,
+    shards: int,
+    output_path: str,
+    compact: bool = False,
+    renderer: str = None,
+    emitter: str = None,
+    workers: int = 1
+) -> str:
+    """
+    Convert one shard of a bank to item XML and write it to a shard file.
+    
+    Args:
+        questions: All the bank's questions.
+        index: The shard to convert, from 0 to shards - 1.
+        shards: Number of shards the bank is split into.
+        output_path: Path of the shard file. A ``.gz`` suffix compresses it.
+        compact: Write compact item XML with CDATA-wrapped HTML.
+        renderer: Name of the renderer plugin for markdown text.
+        emitter: Name of the QTI 1.2 item emitter plugin.
+        workers: Number of processes used to render the shard's items.
+    
+    Returns:
+        Path to the written shard file.
+    """
+    if not 0 <= index < shards:
+        raise ValueError(f"shard index must be from 0 to {shards - 1}")
+    start, end = partition(questions, shards)[index]
+    bank = bank_fingerprint(questions)
+    shard = questions[start:end]
+    
+    if workers > 1 and len(shard) > 1:
+        chunks = split_chunks(shard, workers)
+        starts = [start]
+        for chunk in chunks[:-1]:
+            starts.append(starts[-1] + len(chunk))
+        count = len(chunks)
+        items = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for rendered in executor.map(_render_shard_items, [bank] * count, starts, chunks,
+                                         [compact] * count, [renderer] * count, [emitter] * count):
+                items.extend(rendered)
+    else:
+        items = _render_shard_items(bank, start, shard, compact, renderer, emitter)
+    
+    # Groups are indexed across the whole bank, so shards agree on them
+    group_indexes = {}
+    groups = []
+    for question in questions:
+        group = question.group
+        if group is not None and id(group) not in group_indexes:
+            group_indexes[id(group)] = len(groups)
+            groups.append([group.title, group.pick, group.points])
+    
+    output_path = Path(output_path)
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+    with open_text(output_path, 'w') as f:
+        f.write(dumps({
+            'format': SHARD_FORMAT,
+            'version': SHARD_VERSION,
+            'bank': bank,
+            'shard': index,
+            'shards': shards,
+            'start': start,
+            'end': end,
+            'questions': len(questions),
+            'options': {
+                'compact': compact,
+                'renderer': renderer or DEFAULT_RENDERER,
+                'emitter': emitter or DEFAULT_EMITTER,
+            },
+            'groups': groups,
+        }))
+        f.write('\n')
+        for question, item in zip(shard, items):
+            f.write(dumps([group_indexes.get(id(question.group)), item]))
+            f.write('\n')
+    return str(output_path)
+
+
+def _read_header(path: str) -> dict:
+    with open_text(Path(path), 'r') as f:
+        line = f.readline()
+    try:
+        header = json.loads(line)
+    except ValueError:
+        header = None
+    if not isinstance(header, dict) or header.get('format') != SHARD_FORMAT:
+        raise ValueError(f"'{path}' is not a markdown-to-qti shard file")
+    if header.get('version') != SHARD_VERSION:
+        raise ValueError(f"Unsupported shard version {header.get('version')} "
+                         f"(expected {SHARD_VERSION})")
+    return header
+
+
+def _check_shards(headers: List[Tuple[str, dict]]):
+    """
+    Check that shard files are all the shards of one conversion.
+    
+    Raises:
+        ValueError: If shards are missing, repeated or don't belong together.
+    """
+    first_path, first = headers[0]
+    for path, header in headers[1:]:
+        for key, what in (('bank', "a different bank"), ('shards', "a different number of shards")):
+            if header[key] != first[key]:
+                raise ValueError(f"'{path}' is a shard of {what} than '{first_path}'")
+        options = header['options']
+        differing = [key for key in sorted({*options, *first['options']})
+                     if options.get(key) != first['options'].get(key)]
+        if differing:
+            raise ValueError(f"'{path}' was converted with different output options "
+                             f"({', '.join(differing)}) than '{first_path}'")
+    
+    seen = {}
+    for path, header in headers:
+        if header['shard'] in seen:
+            raise ValueError(f"'{path}' and '{seen[header['shard']]}' are both shard {header['shard']}")
+        seen[header['shard']] = path
+    missing = [str(index) for index in range(first['shards']) if index not in seen]
+    if missing:
+        raise ValueError(f"shard(s) {', '.join(missing)} of {first['shards']} are missing")
+
+
+def _shard_items(path: str) -> Iterator[list]:
+    with open_text(Path(path), 'r') as f:
+        f.readline()
+        for line in f:
+            yield json.loads(line)
+
+
+def merge_shards(shard_paths: Sequence[str], output_path: str, title: str = "Assessment") -> str:
+    """
+    Merge the shard files of a bank into one QTI package.
+    
+    Items are copied from the shards in order, one at a time, and the
+    package has a single manifest. The package's own identifiers are
+    derived from the bank's fingerprint.
+    
+    Args:
+        shard_paths: Paths of all the bank's shard files, in any order.
+        output_path: Path for the package, given a .zip suffix if it has none.
+        title: Title of the assessment.
+    
+    Returns:
+        Path to the created package.
+    
+    Raises:
+        ValueError: If the files are not all the shards of one conversion.
+    """
+    if not shard_paths:
+        raise ValueError("no shard files given")
+    headers = sorted(((path, _read_header(path)) for path in shard_paths),
+                     key=lambda pair: pair[1]['shard'])
+    _check_shards(headers)
+    first = headers[0][1]
+    compact = first['options']['compact']
+    groups = [QuestionGroup(*values) for values in first['groups']]
+    
+    output_path = package_path(output_path)
+    with stable_identifiers(f"{first['bank']}:package"), atomic_write(output_path) as f:
+        assessment_id = generate_identifier()
+        with open_package(f, assessment_id, title, compact) as stream:
+            writer = AssessmentWriter(stream.write, title, assessment_id, compact)
+            for path, _ in headers:
+                for group, item in _shard_items(path):
+                    # The writer only looks at the question's group
+                    question = Question(number=0, stem='',
+                                        group=groups[group] if group is not None else None)
+                    writer.add(question, item)
+            writer.close()
+    return str(output_path)
+
+
+def _load_questions(path: str, from_ir: bool, renderer: str = None) -> List[Question]:
+    if from_ir:
+        return load_ir(path, renderer)
+    with open(path, 'r', encoding='utf-8') as f:
+        return parse_markdown_exam(f.read())
+
+
+def shard_main(argv: List[str] = None) -> int:
+    """Entry point for the `shard` subcommand."""
+    parser = argparse.ArgumentParser(
+        prog='markdown-to-qti shard',
+        description='Convert one shard of a large bank to QTI 1.2 item XML. Run once per '
+                    'shard, on any machines, then combine the shards with "markdown-to-qti merge".'
+    )
+    parser.add_argument('input', help='Markdown exam file, or IR file with --from-ir')
+    parser.add_argument('--shards', type=int, required=True, metavar='N',
+                        help='Number of shards the bank is split into')
+    parser.add_argument('--index', type=int, required=True, metavar='K',
+                        help='Shard to convert, from 0 to N - 1')
+    parser.add_argument('-o', '--output', type=str, default=None,
+                        help='Path for the shard file (default: <input>.shard<K>.jsonl); '
+                             'a .gz suffix compresses it')
+    parser.add_argument('--from-ir', action='store_true',
+                        help='Read the bank from an IR file instead of markdown')
+    parser.add_argument('--compact', action='store_true',
+                        help='Write compact XML with CDATA-wrapped HTML')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="Number of processes used to render the shard's items (default: 1)")
+    parser.add_argument('--renderer', type=str, default=None, metavar='NAME',
+                        help='Renderer plugin for markdown text (default: markdown)')
+    parser.add_argument('--emitter', type=str, default=None, metavar='NAME',
+                        help='QTI 1.2 item emitter plugin (default: qti12)')
+    args = parser.parse_args(argv)
+    
+    if args.shards < 1:
+        print("Error: --shards must be at least 1.", file=sys.stderr)
+        return 1
+    if not 0 <= args.index < args.shards:
+        print(f"Error: --index must be from 0 to {args.shards - 1}.", file=sys.stderr)
+        return 1
+    
+    try:
+        questions = _load_questions(args.input, args.from_ir, args.renderer)
+    except (IOError, ValueError) as e:
+        print(f"Error reading '{args.input}': {e}", file=sys.stderr)
+        return 1
+    
+    output = args.output or str(Path(args.input).with_suffix(f'.shard{args.index}.jsonl'))
+    try:
+        path = write_shard(questions, args.index, args.shards, output, args.compact,
+                           args.renderer, args.emitter, args.jobs)
+    except (IOError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    start, end = partition(questions, args.shards)[args.index]
+    print(f"Shard {args.index} of {args.shards}: questions {start + 1}-{end} "
+          f"of {len(questions)} written to {path}")
+    return 0
+
+
+def merge_main(argv: List[str] = None) -> int:
+    """Entry point for the `merge` subcommand."""
+    parser = argparse.ArgumentParser(
+        prog='markdown-to-qti merge',
+        description='Merge the shard files written by "markdown-to-qti shard" into one QTI package.'
+    )
+    parser.add_argument('shards', nargs='+', metavar='SHARD', help='All shard files of the bank')
+    parser.add_argument('-o', '--output', type=str, required=True,
+                        help='Path for the QTI package (ZIP file)')
+    parser.add_argument('-t', '--title', type=str, default='Assessment',
+                        help='Title for the assessment (default: Assessment)')
+    args = parser.parse_args(argv)
+    
+    try:
+        path = merge_shards(args.shards, args.output, args.title)
+    except (IOError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    print(f"Merged {len(args.shards)} shard(s) into {path}")
+    return 0
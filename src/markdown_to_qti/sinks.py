@@ -0,0 +1,642 @@
+"""
+Output sinks fed from a single pass over parsed questions.
+
+A sink receives each question once, in order, and writes one output: a QTI
+package or document, an answer key or a tag report. run_pipeline feeds any
+number of sinks from one iteration, so extra outputs cost little more than
+writing them, and questions streamed from iter_markdown_exam are never
+held in memory.
+
+New outputs subclass Sink and implement add, and start and finish where
+they need setup or have something to write at the end. If the questions
+or a sink raise, every sink started is aborted, and outputs written to a
+path are discarded rather than left incomplete.
+"""
+import contextlib
+import csv
+import io
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, TextIO, Union
+
+from . import qti21
+from .parser import BLOOM_LEVELS, Question
+from .qti_generator import (
+    AssessmentWriter, atomic_write, format_points, generate_identifier,
+    open_package, package_path, prerender_html, render_item, render_items_parallel
+)
+
+# Names of text outputs, or open text streams
+Output = Union[str, Path, TextIO]
+
+
+class Sink:
+    """An output written from a stream of questions."""
+    
+    def start(self):
+        """Prepare the output before the first question."""
+    
+    def add(self, question: Question):
+        """Write or record a question."""
+        raise NotImplementedError
+    
+    def finish(self):
+        """Complete the output after the last question."""
+    
+    def abort(self):
+        """Discard the output after an error, leaving no partial file behind."""
+
+
+class _Aborted(Exception):
+    """Raised into the outputs of an aborted sink, so that they are discarded."""
+
+
+def _abort_stack(stack: Optional[contextlib.ExitStack]):
+    """Close an ExitStack as if an error had been raised inside it."""
+    if stack is None:
+        return
+    try:
+        stack.__exit__(_Aborted, _Aborted(), None)
+    except _Aborted:
+        pass
+
+
+def run_pipeline(questions: Iterable[Question], sinks: Sequence[Sink]) -> int:
+    """
+    Feed questions to every sink in a single pass.
+    
+    Args:
+        questions: Question objects, e.g. from iter_markdown_exam.
+        sinks: Sinks to write.
+    
+    Returns:
+        The number of questions.
+    
+    If the questions or a sink raise, every sink started is aborted before
+    the error propagates.
+    """
+    started = []
+    try:
+        for sink in sinks:
+            started.append(sink)
+            sink.start()
+        count = 0
+        for question in questions:
+            count += 1
+            for sink in sinks:
+                sink.add(question)
+        for sink in sinks:
+            sink.finish()
+    except BaseException:
+        for sink in reversed(started):
+            # The error to report is the one that stopped the pipeline
+            with contextlib.suppress(Exception):
+                sink.abort()
+        raise
+    return count
+
+
+def prerendered(
+    questions: Iterable[Question],
+    renderer: str = None,
+    workers: int = 1
+) -> Iterable[Question]:
+    """
+    Render the HTML of each question once, for sinks that all need it.
+    
+    Every QTI sink reuses HTML stored on a question, so several packages
+    written from one pass cost one rendering pass. With one worker each
+    question is rendered as it arrives; with more the questions are read
+    and rendered in a process pool first.
+    
+    Args:
+        questions: Question objects, e.g. from iter_markdown_exam.
+        renderer: Name of the renderer plugin to use.
+        workers: Number of processes used to render.
+    
+    Returns:
+        The questions, with their HTML rendered.
+    """
+    if workers > 1:
+        return prerender_html(list(questions), renderer, workers)
+    return (prerender_html([question], renderer)[0] for question in questions)
+
+
+def _output_format(output: Output, formats: Sequence[str], format: Optional[str]) -> str:
+    """
+    Choose the format of an output.
+    
+    An explicit format must be one of formats. Otherwise a path ending in
+    .json is JSON, and anything else gets the first format.
+    """
+    if format is not None:
+        if format not in formats:
+            raise ValueError(
+                f"Unknown output format '{format}' (expected one of {', '.join(formats)})")
+        return format
+    if isinstance(output, (str, Path)) and Path(output).suffix.lower() == '.json':
+        return 'json'
+    return formats[0]
+
+
+def _open_output(output: Output, stack: contextlib.ExitStack) -> TextIO:
+    """Open a named output for writing, or return an open stream as is."""
+    if output == '-':
+        return sys.stdout
+    if isinstance(output, (str, Path)):
+        # Written under a temporary name like packages; detaching flushes
+        # the text without closing the file, which is then synced and renamed
+        stream = io.TextIOWrapper(stack.enter_context(atomic_write(output)),
+                                  encoding='utf-8', newline='')
+        stack.callback(stream.detach)
+        return stream
+    return output
+
+
+def question_points(question: Question) -> float:
+    if question.group is not None and question.group.points is not None:
+        return question.group.points
+    return 1
+
+
+class QtiXmlSink(Sink):
+    """
+    Write the QTI assessment XML to a text stream.
+    
+    Items are rendered and written as questions arrive. With more than one
+    worker the questions are held and rendered in a process pool at the end.
+    Renderer and emitter are plugin names, as for generate_qti_assessment.
+    """
+    
+    def __init__(self, output: TextIO, title: str = "Assessment", workers: int = 1,
+                 compact: bool = False, renderer: str = None, emitter: str = None):
+        self.output = output
+        self.title = title
+        self.workers = workers
+        self.compact = compact
+        self.renderer = renderer
+        self.emitter = emitter
+        self.assessment_id = generate_identifier()
+        self._assessment = None
+        self._pending = []
+    
+    def start(self):
+        self._assessment = AssessmentWriter(
+            self.output.write, self.title, self.assessment_id, self.compact)
+    
+    def add(self, question: Question):
+        if self.workers > 1:
+            self._pending.append(question)
+        else:
+            self._assessment.add(question, self._render(question))
+    
+    def finish(self):
+        if len(self._pending) > 1:
+            items = render_items_parallel(
+                self._pending, self.workers, None, self.compact, self.renderer, self.emitter)
+        else:
+            items = [self._render(question) for question in self._pending]
+        for question, item in zip(self._pending, items):
+            self._assessment.add(question, item)
+        self._pending = []
+        self._assessment.close()
+    
+    def _render(self, question: Question) -> str:
+        return render_item(question, self.compact, self.renderer, self.emitter)
+
+
+class QtiPackageSink(QtiXmlSink):
+    """
+    Write a QTI package (ZIP file) to a path or a binary stream.
+    
+    A path without a suffix gets .zip; the path written is in the path
+    attribute. Streams need not be seekable, as with write_qti_package.
+    Set measure_size before start to use unmeasured_bytes and held_bytes.
+    """
+    
+    # Bytes that finishing the package adds per item: none, as each item is
+    # already in the assessment XML
+    close_bytes_per_item = 0
+    
+    def __init__(self, output, title: str = "Assessment", workers: int = 1,
+                 compact: bool = False, renderer: str = None, emitter: str = None):
+        super().__init__(None, title, workers, compact, renderer, emitter)
+        if isinstance(output, (str, Path)):
+            self.path = str(package_path(output))
+            self._stream = None
+        else:
+            self.path = None
+            self._stream = output
+        self._stack = None
+        self.measure_size = False
+        self._measured = 0
+    
+    def start(self):
+        self._stack = contextlib.ExitStack()
+        stream = self._stream
+        if stream is None:
+            stream = self._stack.enter_context(atomic_write(self.path))
+        self.output = self._stack.enter_context(open_package(
+            stream, self.assessment_id, self.title, self.compact, self.measure_size))
+        self._measured = 0
+        super().start()
+    
+    def finish(self):
+        super().finish()
+        self._stack.close()
+    
+    def abort(self):
+        _abort_stack(self._stack)
+    
+    def unmeasured_bytes(self) -> int:
+        """
+        Return the bytes, before compression, added since held_bytes was last called.
+        
+        These are the items written to the package since then, and those
+        held until their group ends. Questions held for rendering with
+        more than one worker are not counted.
+        """
+        self.output.flush()
+        return self.output.buffer.size - self._measured + self._assessment.held_bytes
+    
+    def held_bytes(self) -> int:
+        """
+        Return the bytes that finishing the items added so far will still write.
+        
+        These are the compressed bytes the package's compressor holds, and
+        the items held until their group ends, before compression.
+        """
+        self.output.flush()
+        self._measured = self.output.buffer.size
+        return self.output.buffer.held_bytes() + self._assessment.held_bytes
+
+
+class Qti21PackageSink(Sink):
+    """
+    Write a QTI 2.1 package (ZIP file) for Canvas New Quizzes.
+    
+    Takes the same arguments as QtiPackageSink. The emitter defaults to
+    the built-in qti21 item emitter.
+    """
+    
+    # Bytes that finishing the package adds per item, for its entries in
+    # the test, the manifest and the zip directory (about 145 compressed)
+    close_bytes_per_item = 160
+    
+    def __init__(self, output, title: str = "Assessment", workers: int = 1,
+                 compact: bool = False, renderer: str = None, emitter: str = None):
+        self.title = title
+        self.workers = workers
+        self.compact = compact
+        self.renderer = renderer
+        self.emitter = emitter
+        if isinstance(output, (str, Path)):
+            self.path = str(package_path(output))
+            self._stream = None
+        else:
+            self.path = None
+            self._stream = output
+        self._stack = None
+        self._package = None
+        self._pending = []
+    
+    def start(self):
+        self._stack = contextlib.ExitStack()
+        stream = self._stream
+        if stream is None:
+            stream = self._stack.enter_context(atomic_write(self.path))
+        self._package = self._stack.enter_context(
+            qti21.open_package(stream, self.title, self.compact))
+    
+    def add(self, question: Question):
+        if self.workers > 1:
+            self._pending.append(question)
+        else:
+            self._package.add(question, *qti21.render_item(
+                question, self.compact, self.renderer, self.emitter))
+    
+    def finish(self):
+        for question, (item_id, item) in qti21.render_items(
+                self._pending, self.workers, self.compact, self.renderer, self.emitter):
+            self._package.add(question, item_id, item)
+        self._pending = []
+        self._stack.close()
+    
+    def abort(self):
+        self._pending = []
+        _abort_stack(self._stack)
+    
+    def unmeasured_bytes(self) -> int:
+        """Return 0: each item is a complete zip entry in the stream once added."""
+        return 0
+    
+    def held_bytes(self) -> int:
+        """Return 0, as nothing is held; see QtiPackageSink.held_bytes."""
+        return 0
+
+
+class _CountingStream(io.RawIOBase):
+    """A write-only binary stream counting the bytes written through it."""
+    
+    def __init__(self, stream):
+        self._stream = stream
+        self.count = 0
+    
+    def writable(self):
+        return True
+    
+    def write(self, data):
+        self._stream.write(data)
+        self.count += len(data)
+        return len(data)
+    
+    def flush(self):
+        self._stream.flush()
+
+
+# Room kept in a size-limited package for what finishing it writes: the
+# end of the XML and the zip directory, and whatever the package writer
+# holds. Writers with held_bytes and unmeasured_bytes methods are measured
+# exactly, but only once an upper bound of the size nears the budget, as
+# measuring compresses what the writer holds; for others a share of the
+# budget is kept for data the compressor may still hold.
+# What finishing adds per item depends on the format (QTI 2.1 lists every
+# item again), so it starts from the writer's close_bytes_per_item and
+# grows if packages already written needed more.
+_CLOSE_RESERVE = 2048
+_UNFLUSHED_RESERVE = 64 * 1024
+_SIZE_RESERVE_PER_ITEM = 192
+
+# Room kept for the next question, as a multiple of the largest seen
+_NEXT_QUESTION_FACTOR = 1.5
+
+
+def _deflate_bound(size: int) -> int:
+    """Return the most bytes deflate can turn size bytes into, as zlib's compressBound."""
+    return size + (size >> 12) + (size >> 14) + (size >> 25) + 13
+
+
+class SplitPackageSink(Sink):
+    """
+    Write questions to a series of packages, each within an item or size budget.
+    
+    A package is closed and the next one started once it holds max_items
+    questions, or once the bytes written come within a reserve of
+    max_bytes. Packages are named after the path with a part number, e.g.
+    exam.part001.zip, exam.part002.zip, and titled "Title (part 1)" and so
+    on; each is complete, with its own manifest. The paths written are in
+    the paths attribute.
+    
+    A question group is never split across packages, so a package can
+    exceed the budget when a single group, or a single question, does.
+    Room is kept for the next question from the size of the largest one so
+    far, so a question far larger than those before it can also overrun.
+    
+    Package sizes can only be watched as items are written, so with
+    max_bytes the packages are rendered with one worker; pre-render the
+    questions (see prerendered) to render their HTML in parallel.
+    
+    Args:
+        package_writer: Package writer plugin, e.g. QtiPackageSink.
+        output: Path the package names are derived from.
+        title: Title of the assessment.
+        max_items: Largest number of questions in a package.
+        max_bytes: Largest size of a package file in bytes.
+        **options: Passed on to the package writer, e.g. workers.
+    """
+    
+    def __init__(self, package_writer, output: Union[str, Path], title: str = "Assessment",
+                 max_items: int = None, max_bytes: int = None, **options):
+        self.package_writer = package_writer
+        self.output = package_path(output)
+        self.title = title
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.options = options
+        if max_bytes is not None:
+            self.options['workers'] = 1
+        self.paths = []
+        self._part = None
+        self._stack = None
+        self._stream = None
+        self._items = 0
+        self._group = None
+        self._reserve_per_item = getattr(package_writer, 'close_bytes_per_item',
+                                         _SIZE_RESERVE_PER_ITEM)
+        self._size = 0
+        self._measured_items = 0
+        self._question_bytes = 0
+        self._held = 0
+    
+    def add(self, question: Question):
+        # A new package can only start between question groups
+        boundary = question.group is None or question.group is not self._group
+        if self._part is not None and boundary and self._full():
+            self._close_part()
+        if self._part is None:
+            self._open_part()
+        self._part.add(question)
+        self._items += 1
+        self._group = question.group
+    
+    def finish(self):
+        if not self.paths:
+            self._open_part()
+        if self._part is not None:
+            self._close_part()
+    
+    def abort(self):
+        # Packages already closed are removed too, as the series is incomplete
+        closed = self.paths
+        if self._part is not None:
+            closed = self.paths[:-1]
+            self._part.abort()
+            self._part = None
+        _abort_stack(self._stack)
+        for path in closed:
+            with contextlib.suppress(OSError):
+                os.unlink(path)
+        self.paths = []
+    
+    def _full(self) -> bool:
+        if self.max_items is not None and self._items >= self.max_items:
+            return True
+        if self.max_bytes is None:
+            return False
+        if not hasattr(self._part, 'held_bytes'):
+            reserve = min(_UNFLUSHED_RESERVE, self.max_bytes // 4)
+            return self._measure(self._stream.count, reserve)
+        # What was held at the last measurement may not be written yet
+        bound = self._stream.count + self._held + _deflate_bound(self._part.unmeasured_bytes())
+        if not self._measure(bound, _CLOSE_RESERVE, exact=False):
+            return False
+        self._held = self._part.held_bytes()
+        return self._measure(self._stream.count + self._held, _CLOSE_RESERVE)
+    
+    def _measure(self, size: int, reserve: int, exact: bool = True) -> bool:
+        """Return whether a package of size bytes has no room for another question."""
+        # Learn the largest growth per question from exact sizes, to keep
+        # room for the next
+        if exact and self._items > self._measured_items:
+            growth = (size - self._size) / (self._items - self._measured_items)
+            self._question_bytes = max(self._question_bytes, growth)
+            self._size = size
+            self._measured_items = self._items
+        reserve += self._reserve_per_item * (self._items + 1)
+        reserve += self._question_bytes * _NEXT_QUESTION_FACTOR
+        return size + reserve > self.max_bytes
+    
+    def _open_part(self):
+        number = len(self.paths) + 1
+        path = self.output.with_name(f"{self.output.stem}.part{number:03d}{self.output.suffix}")
+        self._stack = contextlib.ExitStack()
+        self._stream = _CountingStream(self._stack.enter_context(atomic_write(path)))
+        part = self.package_writer(self._stream, f"{self.title} (part {number})", **self.options)
+        if self.max_bytes is not None and hasattr(part, 'measure_size'):
+            part.measure_size = True
+        part.start()
+        self._part = part
+        self.paths.append(str(path))
+        self._items = 0
+        self._group = None
+        self._size = self._stream.count
+        self._measured_items = 0
+        self._held = 0
+    
+    def _close_part(self):
+        written = self._size
+        self._part.finish()
+        self._stack.close()
+        self._part = None
+        if self._items and self._measured_items == self._items:
+            # Keep a quarter more per item than finishing this package took
+            closing = self._stream.count - written - _CLOSE_RESERVE
+            self._reserve_per_item = max(self._reserve_per_item,
+                                         max(0, closing) * 1.25 / self._items)
+
+
+class AnswerKeySink(Sink):
+    """
+    Write an answer key with the correct answer, points and tags of each question.
+    
+    CSV keys have a header row and one row per question; tags are separated
+    by semicolons. JSON keys are an array with one object per question.
+    Both are written as questions arrive.
+    """
+    
+    FORMATS = ('csv', 'json')
+    _FIELDS = ['question', 'answer', 'points', 'group', 'tags', 'bloom']
+    
+    def __init__(self, output: Output, format: str = None):
+        self.output = output
+        self.format = _output_format(output, self.FORMATS, format)
+        self._stack = None
+        self._stream = None
+        self._writer = None
+        self._count = 0
+    
+    def start(self):
+        self._stack = contextlib.ExitStack()
+        self._stream = _open_output(self.output, self._stack)
+        if self.format == 'csv':
+            self._writer = csv.writer(self._stream, lineterminator='\n')
+            self._writer.writerow(self._FIELDS)
+        else:
+            self._stream.write('[')
+    
+    def add(self, question: Question):
+        group = question.group.title if question.group is not None else None
+        if self.format == 'csv':
+            self._writer.writerow([
+                question.number,
+                question.correct_answer or '',
+                format_points(question_points(question)),
+                group or '',
+                ';'.join(question.tags),
+                question.bloom or '',
+            ])
+        else:
+            self._stream.write(',\n' if self._count else '\n')
+            self._stream.write(json.dumps(dict(zip(self._FIELDS, [
+                question.number,
+                question.correct_answer,
+                question_points(question),
+                group,
+                question.tags,
+                question.bloom,
+            ])), ensure_ascii=False))
+        self._count += 1
+    
+    def finish(self):
+        if self.format == 'json':
+            self._stream.write('\n]\n' if self._count else ']\n')
+        self._stream.flush()
+        self._stack.close()
+    
+    def abort(self):
+        _abort_stack(self._stack)
+
+
+class TagReportSink(Sink):
+    """
+    Write how many questions have each tag and each Bloom level.
+    
+    The report is a Markdown table by default, or JSON. Every Bloom level
+    is listed, so levels with no questions stand out.
+    """
+    
+    FORMATS = ('markdown', 'json')
+    
+    def __init__(self, output: Output, format: str = None):
+        self.output = output
+        self.format = _output_format(output, self.FORMATS, format)
+        self.questions = 0
+        self.tags = {}
+        self.untagged = 0
+        self.bloom = dict.fromkeys(BLOOM_LEVELS, 0)
+        self.no_bloom = 0
+    
+    def add(self, question: Question):
+        self.questions += 1
+        for tag in question.tags:
+            self.tags[tag] = self.tags.get(tag, 0) + 1
+        if not question.tags:
+            self.untagged += 1
+        if question.bloom is None:
+            self.no_bloom += 1
+        else:
+            self.bloom[question.bloom] = self.bloom.get(question.bloom, 0) + 1
+    
+    def finish(self):
+        # Most used tags first
+        tags = dict(sorted(self.tags.items(), key=lambda entry: (-entry[1], entry[0])))
+        with contextlib.ExitStack() as stack:
+            stream = _open_output(self.output, stack)
+            if self.format == 'json':
+                json.dump({
+                    'questions': self.questions,
+                    'tags': tags,
+                    'untagged': self.untagged,
+                    'bloom': self.bloom,
+                    'no_bloom': self.no_bloom,
+                }, stream, ensure_ascii=False, indent=2)
+                stream.write('\n')
+            else:
+                stream.write(f"Questions: {self.questions}\n\n")
+                stream.write(_markdown_table(
+                    'Tag', [*tags.items(), ('(untagged)', self.untagged)]))
+                stream.write('\n')
+                stream.write(_markdown_table(
+                    'Bloom level', [*self.bloom.items(), ('(none)', self.no_bloom)]))
+            stream.flush()
+
+
+def _markdown_table(heading: str, rows: List[tuple]) -> str:
+    """Format name and count pairs as a Markdown table."""
+    lines = [f"| {heading} | Questions |", "|---|---|"]
+    for name, count in rows:
+        name = name.replace('|', '\\|')
+        lines.append(f"| {name} | {count} |")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,325 @@
+"""
+Verification of written QTI packages against their source questions.
+
+A package is reopened and its manifest and assessment XML are streamed
+with iterparse. Each item is checked against the question it was
+generated from and then dropped, so a package of any size is verified in
+bounded memory. The checks catch packages that are well-formed but would
+import wrongly:
+
+- every item has as many choices as its question, with distinct ids
+- a QTI 1.2 item's original_answer_ids are its choice ids, in order
+- the correct answer (varequal, or correctResponse in QTI 2.1) refers to
+  an existing choice, the one marked in the question, and items of
+  questions without a marked answer have none
+- a question group does not pick more items than it holds
+- the package has one item per question, and the manifest refers only
+  to files in the package
+
+QTI 1.2 and QTI 2.1 packages are told apart by their manifest.
+"""
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterable, Iterator, List, Optional, Sequence, Union
+from xml.etree.ElementTree import Element, ParseError, fromstring, iterparse
+
+from .parser import Question
+from .sinks import Sink
+
+# Verification stops after this many problems
+MAX_PROBLEMS = 100
+
+# Manifest resource types of the documents holding the items
+QTI12_ASSESSMENT = 'imsqti_xmlv1p2'
+QTI21_TEST = 'imsqti_test_xmlv2p1'
+
+Package = Union[str, Path, BinaryIO]
+
+
+@dataclass
+class ExpectedItem:
+    """What the item generated from a question must hold."""
+    number: int
+    letters: str
+    correct: Optional[str] = None
+    
+    @classmethod
+    def from_question(cls, question: Question) -> 'ExpectedItem':
+        letters = ''.join(choice.letter for choice in question.choices)
+        return cls(question.number, letters, question.correct_answer)
+
+
+class ExpectationSink(Sink):
+    """
+    Record what each question's item must hold, for verifying the package.
+    
+    Fed alongside the package sinks, so questions streamed through
+    run_pipeline can be verified without being kept.
+    """
+    
+    def __init__(self):
+        self.items = []
+    
+    def add(self, question: Question):
+        self.items.append(ExpectedItem.from_question(question))
+
+
+class _TooManyProblems(Exception):
+    pass
+
+
+class _Report:
+    """Problems found in the packages, up to a limit."""
+    
+    def __init__(self, limit: int):
+        self.problems = []
+        self.limit = limit
+        self.package = None
+    
+    def __call__(self, message: str):
+        self.problems.append(f"{self.package}: {message}")
+        if len(self.problems) >= self.limit:
+            self.problems.append(f"Stopped after {self.limit} problems.")
+            raise _TooManyProblems()
+
+
+def local_name(tag: str) -> str:
+    """Return a tag without its namespace."""
+    return tag.rsplit('}', 1)[-1]
+
+
+def tag_namespace(elem: Element) -> str:
+    """Return the namespace prefix of an element's tag, e.g. "{uri}"."""
+    return elem.tag[:elem.tag.find('}') + 1]
+
+
+def iter_elements(stream: BinaryIO) -> Iterator[tuple]:
+    """
+    Stream the elements of a document as they end.
+    
+    Yields each element with its parent, which is None for the root. The
+    caller removes elements it is done with from their parent, so the
+    document is never held in memory.
+    """
+    ancestors = []
+    for event, elem in iterparse(stream, events=('start', 'end')):
+        if event == 'start':
+            ancestors.append(elem)
+        else:
+            ancestors.pop()
+            yield elem, ancestors[-1] if ancestors else None
+
+
+def verify_package(
+    package: Package,
+    questions: Iterable[Union[Question, ExpectedItem]],
+    max_problems: int = MAX_PROBLEMS
+) -> List[str]:
+    """
+    Check a written package against the questions it was generated from.
+    
+    Args:
+        package: Path or binary stream of the package.
+        questions: The source questions in order, or the ExpectedItems an
+            ExpectationSink recorded from them.
+        max_problems: Number of problems after which checking stops.
+    
+    Returns:
+        A list of problem messages, empty if the package is correct.
+    """
+    return verify_packages([package], questions, max_problems)
+
+
+def verify_packages(
+    packages: Sequence[Package],
+    questions: Iterable[Union[Question, ExpectedItem]],
+    max_problems: int = MAX_PROBLEMS
+) -> List[str]:
+    """
+    Check packages holding consecutive runs of questions, e.g. split parts.
+    
+    Args:
+        packages: Paths or binary streams of the packages, in order.
+        questions: The source questions in order, or ExpectedItems.
+        max_problems: Number of problems after which checking stops.
+    
+    Returns:
+        A list of problem messages, empty if the packages are correct.
+    """
+    expected = (item if isinstance(item, ExpectedItem) else ExpectedItem.from_question(item)
+                for item in questions)
+    report = _Report(max_problems)
+    try:
+        for index, package in enumerate(packages):
+            report.package = package if isinstance(package, (str, Path)) else f"package {index + 1}"
+            _verify_package(package, expected, report)
+        missing = sum(1 for _ in expected)
+        if missing:
+            report(f"{missing} question(s) have no item")
+    except _TooManyProblems:
+        pass
+    return report.problems
+
+
+def _verify_package(package: Package, expected: Iterator[ExpectedItem], report: _Report):
+    try:
+        with zipfile.ZipFile(package) as zf:
+            with zf.open('imsmanifest.xml') as stream:
+                kind, href = _verify_manifest(stream, zf, report)
+            # A missing assessment file is reported with the manifest
+            if kind is None:
+                report("the manifest has no QTI 1.2 assessment or QTI 2.1 test")
+            elif kind == QTI12_ASSESSMENT and _exists(zf, href):
+                with zf.open(href) as stream:
+                    _verify_qti12(stream, expected, report)
+            elif _exists(zf, href):
+                _verify_qti21(zf, href, expected, report)
+    except (zipfile.BadZipFile, KeyError, ParseError, OSError) as e:
+        report(f"cannot be read: {e}")
+
+
+def _exists(zf: zipfile.ZipFile, name: str) -> bool:
+    try:
+        zf.getinfo(name)
+    except KeyError:
+        return False
+    return True
+
+
+def _verify_manifest(stream: BinaryIO, zf: zipfile.ZipFile, report: _Report) -> tuple:
+    """Check the manifest's files and return the type and path of the assessment."""
+    kind = href = None
+    for elem, parent in iter_elements(stream):
+        if local_name(elem.tag) != 'resource':
+            continue
+        if elem.get('type') in (QTI12_ASSESSMENT, QTI21_TEST):
+            kind, href = elem.get('type'), elem.get('href')
+        for file_elem in elem.iter(f"{tag_namespace(elem)}file"):
+            if not _exists(zf, file_elem.get('href')):
+                report(f"the manifest refers to missing file {file_elem.get('href')}")
+        parent.remove(elem)
+    return kind, href
+
+
+def _next_expected(expected: Iterator[ExpectedItem], report: _Report) -> Optional[ExpectedItem]:
+    item = next(expected, None)
+    if item is None:
+        report("has more items than there are questions")
+    return item
+
+
+def _check_answers(
+    choice_ids: List[str],
+    correct_ids: List[str],
+    expected: ExpectedItem,
+    report: Callable[[str], None]
+):
+    """Check an item's choices and correct answer against its question."""
+    if len(choice_ids) != len(expected.letters):
+        report(f"{len(choice_ids)} choice(s), expected {len(expected.letters)}")
+    if len(set(choice_ids)) != len(choice_ids):
+        report("duplicate choice ids")
+    for correct_id in correct_ids:
+        if correct_id not in choice_ids:
+            report(f"correct answer {correct_id} is not a choice")
+    
+    if expected.correct is None:
+        if correct_ids:
+            report("has a correct answer, but the question has none")
+        return
+    position = expected.letters.find(expected.correct)
+    if position >= len(choice_ids) or correct_ids != [choice_ids[position]]:
+        report(f"correct answer is not choice {expected.correct}")
+
+
+def _verify_qti12(stream: BinaryIO, expected: Iterator[ExpectedItem], report: _Report):
+    """Stream a QTI 1.2 assessment and check its items and group sections."""
+    # This is the bulk of the work, so the loop is kept tight: tags are
+    # compared whole, and parents are tracked only for sections
+    sections = []
+    section_items = []
+    item_tag = section_tag = None
+    for event, elem in iterparse(stream, events=('start', 'end')):
+        if event == 'start':
+            if item_tag is None:
+                ns = tag_namespace(elem)
+                item_tag, section_tag = f"{ns}item", f"{ns}section"
+            elif elem.tag == section_tag:
+                sections.append(elem)
+                section_items.append(0)
+        elif elem.tag == item_tag:
+            question = _next_expected(expected, report)
+            if question is not None:
+                _check_qti12_item(elem, question, report)
+            if sections:
+                section_items[-1] += 1
+                sections[-1].remove(elem)
+        elif elem.tag == section_tag:
+            sections.pop()
+            count = section_items.pop()
+            ns = tag_namespace(elem)
+            selection = elem.find(f"{ns}selection_ordering/{ns}selection/{ns}selection_number")
+            if selection is not None and int(selection.text) > count:
+                report(f"section '{elem.get('title')}' picks {selection.text} of {count} item(s)")
+            if sections:
+                sections[-1].remove(elem)
+
+
+def _check_qti12_item(item: Element, expected: ExpectedItem, report: _Report):
+    ns = tag_namespace(item)
+    
+    def item_report(message):
+        report(f"question {expected.number}: {message}")
+    
+    choice_ids = [label.get('ident') for label in item.iter(f"{ns}response_label")]
+    correct_ids = [varequal.text for varequal in item.iter(f"{ns}varequal")]
+    _check_answers(choice_ids, correct_ids, expected, item_report)
+    
+    answer_ids = None
+    for field in item.iter(f"{ns}qtimetadatafield"):
+        if field.findtext(f"{ns}fieldlabel") == 'original_answer_ids':
+            answer_ids = field.findtext(f"{ns}fieldentry") or ''
+    if answer_ids is None:
+        item_report("no original_answer_ids")
+    elif answer_ids.split(',') != choice_ids:
+        item_report("original_answer_ids do not match the choices")
+
+
+def _verify_qti21(
+    zf: zipfile.ZipFile,
+    href: str,
+    expected: Iterator[ExpectedItem],
+    report: _Report
+):
+    """Stream a QTI 2.1 test and check each item it refers to."""
+    # Items seen in each open section, by the section's element
+    section_items = {}
+    with zf.open(href) as stream:
+        for elem, parent in iter_elements(stream):
+            tag = local_name(elem.tag)
+            if tag == 'assessmentItemRef':
+                section_items[id(parent)] = section_items.get(id(parent), 0) + 1
+                question = _next_expected(expected, report)
+                item_href = elem.get('href')
+                if not _exists(zf, item_href):
+                    report(f"the test refers to missing item {item_href}")
+                elif question is not None:
+                    _check_qti21_item(fromstring(zf.read(item_href)), question, report)
+                parent.remove(elem)
+            elif tag == 'assessmentSection':
+                count = section_items.pop(id(elem), 0)
+                selection = elem.find(f"{tag_namespace(elem)}selection")
+                if selection is not None and int(selection.get('select')) > count:
+                    report(f"section '{elem.get('title')}' picks {selection.get('select')} "
+                           f"of {count} item(s)")
+                parent.remove(elem)
+
+
+def _check_qti21_item(item: Element, expected: ExpectedItem, report: _Report):
+    ns = tag_namespace(item)
+    choice_ids = [choice.get('identifier') for choice in item.iter(f"{ns}simpleChoice")]
+    correct_ids = [value.text for value in item.iterfind(
+        f"{ns}responseDeclaration/{ns}correctResponse/{ns}value")]
+    _check_answers(choice_ids, correct_ids, expected,
+                   lambda message: report(f"question {expected.number}: {message}"))
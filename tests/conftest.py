@@ -0,0 +1,13 @@
+"""
+Shared fixtures for the test suite.
+"""
+import pytest
+
+from markdown_to_qti import latex
+
+
+@pytest.fixture(autouse=True)
+def memory_only_math_cache(monkeypatch):
+    """Keep rendered math out of the user's cache directory."""
+    monkeypatch.setenv(latex.MATH_CACHE_ENV, '')
+    monkeypatch.setattr(latex, '_cache', None)
@@ -0,0 +1,174 @@
+"""
+Adversarial and property-based tests for parsing and rendering.
+
+Hostile or malformed input must not make parsing or rendering slower than
+linear, use more than linear memory, or raise.
+"""
+import html
+import random
+import time
+import tracemalloc
+from xml.etree import ElementTree
+
+import pytest
+
+from markdown_to_qti import latex
+from markdown_to_qti.parser import parse_markdown_exam
+from markdown_to_qti.qti_generator import _markdown_to_html, generate_qti_assessment
+
+
+# Linear work grows 4x when the input grows 4x; quadratic work grows 16x
+SCALE = 4
+MAX_GROWTH = 10
+
+# Peak allocation allowed per input character. Tiny questions expand to a
+# full QTI item, so this is well above the size of the output per character.
+MAX_BYTES_PER_CHAR = 1000
+
+
+def _best_time(func, arg, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(arg)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _peak(func, arg):
+    tracemalloc.start()
+    try:
+        func(arg)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def _pipeline(markdown):
+    questions = parse_markdown_exam(markdown)
+    return generate_qti_assessment(questions, "Adversarial", compact=True)
+
+
+ADVERSARIAL_INPUTS = {
+    'many_backticks': lambda n: "1. Q " + "`" * n + "\n*a. A\n",
+    'unclosed_fences': lambda n: "1. Q\n" + "```x\n" + "``\n" * (n // 3) + "*a. A\n",
+    'fence_without_newline': lambda n: "1. Q ```" + "a" * n + "\n*a. A\n",
+    'many_code_blocks': lambda n: "1. Q\n" + "```\nx\n```\n" * (n // 10) + "*a. A\n",
+    'choice_like_lines': lambda n: "1. Q\n" + "a. x\n" * (n // 5),
+    'huge_single_line_stem': lambda n: "1. " + "word " * (n // 5) + "\n*a. A\n",
+    'huge_question_number': lambda n: "9" * n + ". Q\n*a. A\n",
+    'many_questions': lambda n: "".join(f"{i}. Q\n*a. A\n" for i in range(n // 12)),
+    'unclosed_inline_code': lambda n: "1. `" + "x" * n + "\n*a. `" + "y" * n + "\n",
+    'backtick_runs_of_every_length': lambda n: "1. " + " ".join("`" * (i % 50 + 1) for i in range(n // 25)) + "\n*a. A\n",
+    'unclosed_emphasis': lambda n: "1. " + "*a _b " * (n // 6) + "\n*a. A\n",
+    'unclosed_brackets': lambda n: "1. " + "[" * n + "\n*a. A\n",
+    'brackets_without_links': lambda n: "1. " + "[a *b](" * (n // 7) + "\n*a. A\n",
+    'alternating_list_indents': lambda n: "1. Q\n" + "- x\n    - y\n" * (n // 12) + "*a. A\n",
+    'long_table': lambda n: "1. Q\n| a | b |\n|---|---|\n" + "| 1 | 2 |\n" * (n // 10) + "*a. A\n",
+    'spaces_under_table_row': lambda n: "1. Q\na | b\n" + " " * n + "x\n*a. A\n",
+    'unclosed_math': lambda n: "1. " + "$a " * (n // 3) + "$$b " * (n // 4) + "\n*a. A\n",
+    'many_math_spans': lambda n: "1. " + "$x^2$ " * (n // 6) + "\n*a. A\n",
+    'deeply_nested_math': lambda n: "1. $" + "{" * n + "x" + "}" * n + "$\n*a. A\n",
+    'unbraced_nested_math': lambda n: "1. $" + "\\sqrt\\hat\\frac" * (n // 15) + " x$\n*a. A\n",
+    'spaced_group_heading': lambda n: "## Group: a" + " " * n + "b (" + " " * n + "\n1. Q\n*a. A\n",
+    'many_group_headings': lambda n: "".join(f"## Group\n{i}. Q\n*a. A\n" for i in range(1, n // 20)),
+    'long_math_expression': lambda n: "1. $$" + "\\frac{a}{b} + " * (n // 15) + "1$$\n*a. A\n",
+    'unclosed_metadata': lambda n: "1. Q\n<!--" + " " * n + "\n*a. A\n",
+    'many_tags': lambda n: "1. Q\n<!-- tags: " + "".join(f"t{i}, " for i in range(n // 6)) + "-->\n*a. A\n",
+}
+
+
+class TestAdversarialInputs:
+    """Worst-case inputs stay linear in time and memory."""
+    
+    @pytest.mark.parametrize('name', sorted(ADVERSARIAL_INPUTS))
+    def test_linear_time(self, name):
+        """Test that time grows linearly with input size."""
+        make_input = ADVERSARIAL_INPUTS[name]
+        small = _best_time(_pipeline, make_input(20_000))
+        large = _best_time(_pipeline, make_input(20_000 * SCALE))
+        
+        # Ignore timings too small to measure reliably
+        assert large <= max(small, 0.005) * MAX_GROWTH, (
+            f"{name}: {small:.4f}s -> {large:.4f}s for {SCALE}x input")
+    
+    @pytest.mark.parametrize('name', sorted(ADVERSARIAL_INPUTS))
+    def test_linear_memory(self, name):
+        """Test that peak memory grows linearly and stays proportional to input size."""
+        make_input = ADVERSARIAL_INPUTS[name]
+        small = _peak(_pipeline, make_input(10_000))
+        markdown = make_input(10_000 * SCALE)
+        large = _peak(_pipeline, markdown)
+        
+        assert large <= small * MAX_GROWTH
+        assert large <= MAX_BYTES_PER_CHAR * len(markdown)
+    
+    def test_huge_question_number_is_not_a_question(self):
+        """Test that an oversized question number doesn't raise."""
+        questions = parse_markdown_exam("9" * 5000 + ". Q\n*a. A\n\n2. R\n*a. B\n")
+        
+        assert [q.number for q in questions] == [2]
+    
+    @pytest.mark.parametrize('command', ['\\sqrt', '\\hat', '\\frac', '\\left(\\sqrt'])
+    def test_unbraced_nesting_is_limited(self, command):
+        """Test that arguments nested without braces are shown as source, not raised."""
+        expression = command * 2000 + " x"
+        
+        with pytest.raises(latex.LatexError, match="nested too deeply"):
+            latex.latex_to_mathml(expression)
+        assert latex.render_math(expression) == html.escape(f"${expression}$")
+        assert latex.render_math("\\sqrt" * 20 + " x").startswith("<math")
+    
+    @pytest.mark.parametrize('opening, closing', [
+        ('x^{', '}'), ('x_{', '}'), ('{', '}'), ('\\frac{', '}{y}'), ('\\sqrt[', ']x'),
+        ('\\left(', '\\right)'),
+    ])
+    @pytest.mark.parametrize('depth', [51, 5000])
+    def test_braced_nesting_is_limited(self, opening, closing, depth):
+        """Test that groups nested past the limit are shown as source, not raised."""
+        expression = opening * depth + "x" + closing * depth
+        
+        with pytest.raises(latex.LatexError, match="nested too deeply"):
+            latex.latex_to_mathml(expression)
+        assert latex.render_math(expression) == html.escape(f"${expression}$")
+        assert latex.render_math(opening * 20 + "x" + closing * 20).startswith("<math")
+    
+    def test_placeholder_text_is_preserved(self):
+        """Test that text resembling internal placeholders is left alone."""
+        result = _markdown_to_html("\\_\\_CODE\\_BLOCK\\_0\\_\\_\n```\nx\n```")
+        
+        assert result.startswith("__CODE_BLOCK_0__<br/>")
+        assert result.count("<pre>") == 1
+
+
+# Fragments that exercise question, choice, fence and inline code handling
+FRAGMENTS = [
+    '1. ', '2. ', '10.', 'a. ', '*b. ', 'C. ', '```', '```python', '`', '``',
+    '<', '&', ']]>', '"', 'x', ' ', '\t', '\n', '\n\n', '__CODE_BLOCK_0__',
+    '**', '_', '[', '](', ')', 'https://x', '- ', '  - ', '| ', '|---', '\\',
+    '$', '$$', '\\frac{', '{', '}', '^', '\\alpha', '## Group', ' (pick 1)', '## End group',
+    '<!--', '-->', ' tags: ', 'bloom:', ';', ',',
+]
+
+
+class TestRandomDocuments:
+    """Property-based checks over random documents."""
+    
+    @pytest.mark.parametrize('seed', range(200))
+    def test_pipeline_properties(self, seed):
+        """Test that random documents parse and render to well-formed XML."""
+        rng = random.Random(seed)
+        markdown = ''.join(rng.choice(FRAGMENTS) for _ in range(rng.randrange(1, 200)))
+        
+        questions = parse_markdown_exam(markdown)
+        for question in questions:
+            assert question.choices
+            letters = [c.letter for c in question.choices]
+            assert question.correct_answer is None or question.correct_answer in letters
+        
+        for compact in (False, True):
+            xml_output = generate_qti_assessment(questions, "Random", compact=compact)
+            root = ElementTree.fromstring(xml_output)
+            items = root.findall('.//{http://www.imsglobal.org/xsd/ims_qtiasiv1p2}item')
+            assert len(items) == len(questions)
@@ -0,0 +1,243 @@
+"""
+Tests for resumable batch conversion.
+"""
+import json
+import os
+import zipfile
+
+import pytest
+
+from markdown_to_qti import batch
+from markdown_to_qti.batch import (
+    JOURNAL_NAME, _convert, convert_batch, file_digest, main, read_journal
+)
+from markdown_to_qti.parser import parse_markdown_exam
+from markdown_to_qti.qti_generator import atomic_write, create_qti_package
+from markdown_to_qti.verify import verify_package
+
+
+def _exam(name):
+    return f"1. Which exam is this?\n*a. {name}\nb. Another\n\n2. Is this a question?\n*a. Yes\nb. No\n"
+
+
+@pytest.fixture
+def exams(tmp_path):
+    paths = []
+    for name in ("alpha", "beta", "gamma"):
+        path = tmp_path / f"{name}.md"
+        path.write_text(_exam(name), encoding='utf-8')
+        paths.append(str(path))
+    return paths
+
+
+def _options(title, format='qti12'):
+    return {'format': format, 'title': title, 'compact': False, 'renderer': None, 'emitter': None}
+
+
+def _crash_on_beta(source, *args):
+    """Convert an input in a worker process, which dies on beta.md."""
+    if source.endswith("beta.md"):
+        os._exit(1)
+    return _convert(source, *args)
+
+
+def _journal_lines(out):
+    return (out / JOURNAL_NAME).read_text(encoding='utf-8').splitlines()
+
+
+class TestAtomicWrite:
+    """Tests for writing a file under a temporary name."""
+    
+    def test_error_keeps_previous_file(self, tmp_path):
+        """Test that a failed write leaves the old file and no temporary file."""
+        path = tmp_path / "exam.zip"
+        path.write_bytes(b"old")
+        
+        with pytest.raises(RuntimeError):
+            with atomic_write(path) as f:
+                f.write(b"partial")
+                raise RuntimeError("crash")
+        
+        assert path.read_bytes() == b"old"
+        assert os.listdir(tmp_path) == ["exam.zip"]
+    
+    def test_package_replaced_when_complete(self, tmp_path):
+        """Test that a package is renamed into place once written."""
+        questions = parse_markdown_exam(_exam("alpha"))
+        path = create_qti_package(questions, str(tmp_path / "exam"))
+        
+        assert os.listdir(tmp_path) == ["exam.zip"]
+        assert verify_package(path, questions) == []
+
+
+class TestConvertBatch:
+    """Tests for converting and resuming a batch."""
+    
+    def test_converts_and_journals(self, exams, tmp_path):
+        """Test that each input is converted and journaled with its hashes."""
+        out = tmp_path / "out"
+        
+        report = convert_batch(exams, str(out))
+        
+        assert report.converted == exams
+        entries = read_journal(out / JOURNAL_NAME)
+        entry = entries[exams[0]]
+        assert entry['output'] == str(out / "alpha.zip")
+        assert entry['source_hash'] == file_digest(exams[0])
+        assert entry['output_hash'] == file_digest(out / "alpha.zip")
+        assert entry['options']['title'] == "alpha"
+        assert verify_package(entry['output'], parse_markdown_exam(_exam("alpha"))) == []
+    
+    def test_restart_skips_completed_work(self, exams, tmp_path):
+        """Test that a second run converts nothing and writes nothing."""
+        out = tmp_path / "out"
+        convert_batch(exams, str(out))
+        modified = os.stat(out / "beta.zip").st_mtime_ns
+        
+        report = convert_batch(exams, str(out))
+        
+        assert report.skipped == exams
+        assert report.converted == report.verified == report.failed == []
+        assert os.stat(out / "beta.zip").st_mtime_ns == modified
+        assert len(_journal_lines(out)) == 3
+    
+    def test_redoes_only_what_changed(self, exams, tmp_path):
+        """Test that changed sources and missing or altered packages are converted again."""
+        out = tmp_path / "out"
+        convert_batch(exams, str(out))
+        with open(exams[0], 'a', encoding='utf-8') as f:
+            f.write("\n3. New question\n*a. Yes\n")
+        (out / "beta.zip").unlink()
+        
+        report = convert_batch(exams, str(out))
+        
+        assert report.converted == exams[:2]
+        assert report.skipped == exams[2:]
+        assert convert_batch(exams, str(out)).skipped == exams
+        
+        (out / "gamma.zip").write_bytes(b"altered")
+        assert convert_batch(exams, str(out)).converted == exams[2:]
+    
+    def test_changed_options_convert_again(self, exams, tmp_path):
+        """Test that packages written with other options are not skipped."""
+        out = tmp_path / "out"
+        convert_batch(exams, str(out))
+        
+        assert convert_batch(exams, str(out), compact=True).converted == exams
+        assert convert_batch(exams, str(out), title="Quiz").converted == exams
+    
+    def test_unjournaled_package_is_verified(self, exams, tmp_path):
+        """Test that a package completed before a crash is kept, and a broken one redone."""
+        out = tmp_path / "out"
+        out.mkdir()
+        for source in exams[:2]:
+            name = os.path.basename(source)[:-3]
+            _convert(source, str(out / f"{name}.zip"), _options(name), adopt=False)
+        with zipfile.ZipFile(out / "beta.zip", 'a') as zf:
+            zf.writestr('extra.txt', "altered")
+        
+        report = convert_batch(exams, str(out))
+        
+        assert report.verified == exams[:1]
+        assert report.converted == exams[1:]
+        assert read_journal(out / JOURNAL_NAME)[exams[0]]['output_hash'] == file_digest(out / "alpha.zip")
+        assert set(os.listdir(out)) == {"alpha.zip", "beta.zip", "gamma.zip", JOURNAL_NAME}
+    
+    def test_package_from_other_options_is_not_adopted(self, exams, tmp_path):
+        """Test that an unjournaled package is only kept if written with the same options."""
+        out = tmp_path / "out"
+        out.mkdir()
+        create_qti_package(parse_markdown_exam(_exam("alpha")), str(out / "alpha.zip"))
+        _convert(exams[1], str(out / "beta.zip"), _options("beta"), adopt=False)
+        
+        report = convert_batch(exams[:2], str(out), format='qti21')
+        
+        assert report.converted == exams[:2]
+        assert report.verified == []
+        with zipfile.ZipFile(out / "beta.zip") as zf:
+            assert any(name.startswith('items/') for name in zf.namelist())
+    
+    def test_torn_journal_line(self, exams, tmp_path):
+        """Test that a journal line cut short by a crash is ignored and not appended to."""
+        out = tmp_path / "out"
+        convert_batch(exams[:2], str(out))
+        lines = _journal_lines(out)
+        (out / JOURNAL_NAME).write_text(lines[0] + "\n" + lines[1][:40], encoding='utf-8')
+        
+        report = convert_batch(exams, str(out))
+        
+        assert report.skipped == exams[:1]
+        assert report.converted == exams[1:]
+        lines = _journal_lines(out)
+        assert len(lines) == 4
+        assert [json.loads(line)['source'] for line in lines[2:]] == exams[1:]
+    
+    def test_failures_are_reported_and_retried(self, exams, tmp_path):
+        """Test that an input without questions fails without stopping the others."""
+        out = tmp_path / "out"
+        with open(exams[1], 'w', encoding='utf-8') as f:
+            f.write("No questions here.\n")
+        
+        report = convert_batch(exams, str(out))
+        
+        assert report.failed == [(exams[1], "no questions found")]
+        assert report.converted == [exams[0], exams[2]]
+        assert not (out / "beta.zip").exists()
+        
+        with open(exams[1], 'w', encoding='utf-8') as f:
+            f.write(_exam("beta"))
+        assert convert_batch(exams, str(out)).converted == exams[1:2]
+    
+    def test_workers(self, exams, tmp_path):
+        """Test that inputs are converted in several processes and all journaled."""
+        report = convert_batch(exams, str(tmp_path / "two"), workers=2)
+        
+        assert sorted(report.converted) == exams
+        assert sorted(read_journal(tmp_path / "two" / JOURNAL_NAME)) == exams
+        for name in ("alpha", "beta", "gamma"):
+            with zipfile.ZipFile(tmp_path / "two" / f"{name}.zip") as zf:
+                assert len(zf.namelist()) == 2
+    
+    def test_dead_worker_fails_its_input(self, exams, tmp_path, monkeypatch):
+        """Test that a worker process that dies fails the input, not the batch."""
+        monkeypatch.setattr(batch, '_convert', _crash_on_beta)
+        
+        report = convert_batch(exams, str(tmp_path / "out"), workers=2)
+        
+        assert exams[1] in [source for source, _ in report.failed]
+        assert "worker process" in report.failed[0][1]
+        assert set(report.converted) | {source for source, _ in report.failed} == set(exams)
+    
+    def test_same_output_name(self, exams, tmp_path):
+        """Test that inputs that would write the same package are refused."""
+        other = tmp_path / "other"
+        other.mkdir()
+        (other / "alpha.md").write_text(_exam("alpha"), encoding='utf-8')
+        
+        with pytest.raises(ValueError, match="would both be written to"):
+            convert_batch([exams[0], str(other / "alpha.md")], str(tmp_path / "out"))
+
+
+class TestMain:
+    """Tests for the batch command."""
+    
+    def test_run_and_resume(self, exams, tmp_path, capsys):
+        """Test the summary of a run and of its restart."""
+        journal = tmp_path / "journal.jsonl"
+        argv = [*exams, '-o', str(tmp_path / "out"), '--journal', str(journal), '--format', 'qti21']
+        
+        assert main(argv) == 0
+        assert main(argv) == 0
+        
+        output = capsys.readouterr().out.splitlines()
+        assert output[3] == "3 converted, 0 up to date, 0 verified, 0 failed."
+        assert output[-1] == "0 converted, 3 up to date, 0 verified, 0 failed."
+        assert len(journal.read_text(encoding='utf-8').splitlines()) == 3
+    
+    def test_failed_input(self, exams, tmp_path, capsys):
+        """Test that a missing input is reported and exits with 1."""
+        assert main([exams[0], str(tmp_path / "missing.md"), '-o', str(tmp_path / "out")]) == 1
+        
+        captured = capsys.readouterr()
+        assert "1 converted, 0 up to date, 0 verified, 1 failed." in captured.out
+        assert "missing.md: cannot be read" in captured.err
@@ -1,13 +1,17 @@
 """
 Tests for the CLI module.
 """
+import io
 import os
+import subprocess
 import sys
 import tempfile
+import zipfile
 import pytest
 from unittest.mock import patch
 
-from markdown_to_qti.cli import main
+from markdown_to_qti.cli import COMMANDS, main
+from markdown_to_qti.plugins import resolve_reference
 
 
 class TestCli:
@@ -20,6 +24,18 @@ class TestCli:
                 main()
             assert excinfo.value.code == 0
     
+    def test_subcommands_imported_when_run(self):
+        """Test that a conversion imports no subcommand module, and each command resolves."""
+        code = ("import sys, markdown_to_qti.cli; "
+                "print(sorted(set(sys.modules) & {'markdown_to_qti.' + name for name in "
+                "('batch', 'dedupe', 'diff', 'lsp', 'preview', 'score', 'shards')}))")
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                env={**os.environ, 'PYTHONPATH': os.pathsep.join(sys.path)})
+        
+        assert result.stdout == "[]\n"
+        for reference in COMMANDS.values():
+            assert callable(resolve_reference(reference))
+    
     def test_missing_input_file(self):
         """Test error handling for missing input file."""
         with patch.object(sys, 'argv', ['markdown-to-qti', 'nonexistent.md']):
@@ -95,3 +111,283 @@ class TestCli:
                 with pytest.raises(SystemExit) as excinfo:
                     main()
                 assert excinfo.value.code == 1
+    
+    def test_jobs_option(self):
+        """Test converting with several worker processes."""
+        markdown_content = """
+1. Q1
+   *a. A
+   b. B
+
+2. Q2
+   a. A
+   *b. B
+"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            input_path = os.path.join(tmpdir, "test.md")
+            output_path = os.path.join(tmpdir, "test.zip")
+            
+            with open(input_path, 'w') as f:
+                f.write(markdown_content)
+            
+            with patch.object(sys, 'argv', ['markdown-to-qti', input_path, '-o', output_path, '-j', '2']):
+                main()
+            
+            assert os.path.exists(output_path)
+    
+    def test_invalid_jobs_option(self):
+        """Test error when --jobs is less than 1."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            input_path = os.path.join(tmpdir, "test.md")
+            
+            with open(input_path, 'w') as f:
+                f.write("1. Q1\n*a. A\n")
+            
+            with patch.object(sys, 'argv', ['markdown-to-qti', input_path, '-j', '0']):
+                with pytest.raises(SystemExit) as excinfo:
+                    main()
+                assert excinfo.value.code == 1
+    
+    def test_emit_and_load_ir(self):
+        """Test writing an IR file and converting from it."""
+        markdown_content = """
+1. Q1
+   *a. A
+   b. B
+"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            input_path = os.path.join(tmpdir, "test.md")
+            ir_path = os.path.join(tmpdir, "test.qir")
+            output_path = os.path.join(tmpdir, "out.zip")
+            
+            with open(input_path, 'w') as f:
+                f.write(markdown_content)
+            
+            with patch.object(sys, 'argv', ['markdown-to-qti', input_path, '--emit-ir', ir_path, '--ir-html']):
+                main()
+            
+            assert os.path.exists(ir_path)
+            assert not os.path.exists(os.path.join(tmpdir, "test.zip"))
+            
+            with patch.object(sys, 'argv', ['markdown-to-qti', ir_path, '--from-ir', '-o', output_path]):
+                main()
+            
+            assert os.path.exists(output_path)
+    
+    def test_answer_key_and_report(self):
+        """Test that the package, answer key and report come from one run."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            input_path = os.path.join(tmpdir, "test.md")
+            key_path = os.path.join(tmpdir, "key.csv")
+            report_path = os.path.join(tmpdir, "report.json")
+            output_path = os.path.join(tmpdir, "out.zip")
+            
+            with open(input_path, 'w') as f:
+                f.write("1. Q1\n<!-- tags: loops -->\n*a. A\nb. B\n")
+            
+            with patch.object(sys, 'argv', ['markdown-to-qti', input_path, '-o', output_path,
+                                            '--answer-key', key_path, '--report', report_path]):
+                main()
+            
+            assert zipfile.is_zipfile(output_path)
+            with open(key_path) as f:
+                assert f.read().splitlines()[1] == '1,a,1,,loops,'
+            with open(report_path) as f:
+                assert '"loops": 1' in f.read()
+    
+    def test_several_formats(self):
+        """Test that --format writes a package per format, named after it."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            input_path = os.path.join(tmpdir, "test.md")
+            
+            with open(input_path, 'w') as f:
+                f.write("1. Q1\n*a. A\nb. B\n")
+            
+            with patch.object(sys, 'argv', ['markdown-to-qti', input_path,
+                                            '--format', 'qti12,qti21']):
+                main()
+            
+            with zipfile.ZipFile(os.path.join(tmpdir, "test.qti12.zip")) as zf:
+                assert len(zf.namelist()) == 2
+            with zipfile.ZipFile(os.path.join(tmpdir, "test.qti21.zip")) as zf:
+                assert 'imsmanifest.xml' in zf.namelist()
+                assert sum(name.startswith('items/') for name in zf.namelist()) == 1
+    
+    def test_max_items(self, capsys):
+        """Test that --max-items splits the output into numbered packages."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            input_path = os.path.join(tmpdir, "test.md")
+            output_path = os.path.join(tmpdir, "out.zip")
+            
+            with open(input_path, 'w') as f:
+                f.write("1. Q1\n*a. A\n\n2. Q2\n*a. A\n\n3. Q3\n*a. A\n")
+            
+            with patch.object(sys, 'argv', ['markdown-to-qti', input_path, '-o', output_path,
+                                            '--max-items', '2']):
+                main()
+            
+            assert sorted(os.listdir(tmpdir)) == ["out.part001.zip", "out.part002.zip", "test.md"]
+        assert capsys.readouterr().err.count("QTI package created:") == 2
+    
+    @pytest.mark.parametrize('size', ['0', 'big', '-1M'])
+    def test_invalid_package_size(self, size):
+        """Test that an invalid --max-package-size is rejected."""
+        with patch.object(sys, 'argv', ['markdown-to-qti', 'test.md', '--max-package-size', size]):
+            with pytest.raises(SystemExit) as excinfo:
+                main()
+        assert excinfo.value.code == 2
+    
+    def test_split_to_stdout(self, capsys):
+        """Test that split packages can't be written to stdout."""
+        with patch.object(sys, 'argv', ['markdown-to-qti', 'test.md', '-o', '-', '--max-items', '5']):
+            with pytest.raises(SystemExit) as excinfo:
+                main()
+        assert excinfo.value.code == 1
+        assert "stdout" in capsys.readouterr().err
+    
+    @pytest.mark.parametrize('option', [['--xml-only'], ['-o', '-'], ['--emitter', 'qti12']])
+    def test_several_formats_errors(self, option, capsys):
+        """Test options that can't be used with several formats."""
+        with patch.object(sys, 'argv', ['markdown-to-qti', 'test.md',
+                                        '--format', 'qti12,qti21', *option]):
+            with pytest.raises(SystemExit) as excinfo:
+                main()
+        assert excinfo.value.code == 1
+        assert "Error:" in capsys.readouterr().err
+    
+    def test_answer_key_only(self):
+        """Test that an answer key alone does not create a package."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            input_path = os.path.join(tmpdir, "test.md")
+            key_path = os.path.join(tmpdir, "key.json")
+            
+            with open(input_path, 'w') as f:
+                f.write("1. Q1\n*a. A\n")
+            
+            with patch.object(sys, 'argv', ['markdown-to-qti', input_path, '--answer-key', key_path]):
+                main()
+            
+            assert os.path.exists(key_path)
+            assert not os.path.exists(os.path.join(tmpdir, "test.zip"))
+    
+    def test_one_output_on_stdout(self, capsys):
+        """Test that only one output can go to stdout."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            input_path = os.path.join(tmpdir, "test.md")
+            
+            with open(input_path, 'w') as f:
+                f.write("1. Q1\n*a. A\n")
+            
+            with patch.object(sys, 'argv', ['markdown-to-qti', input_path, '--xml-only',
+                                            '--report', '-']):
+                with pytest.raises(SystemExit) as excinfo:
+                    main()
+                assert excinfo.value.code == 1
+        assert "stdout" in capsys.readouterr().err
+    
+    def test_from_ir_rejects_markdown(self):
+        """Test error when --from-ir is given a markdown file."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            input_path = os.path.join(tmpdir, "test.md")
+            
+            with open(input_path, 'w') as f:
+                f.write("1. Q1\n*a. A\n")
+            
+            with patch.object(sys, 'argv', ['markdown-to-qti', input_path, '--from-ir']):
+                with pytest.raises(SystemExit) as excinfo:
+                    main()
+                assert excinfo.value.code == 1
+
+
+class _Pipe(io.RawIOBase):
+    """A write-only, non-seekable binary stream, like a pipe."""
+    
+    def __init__(self):
+        self.data = bytearray()
+    
+    def writable(self):
+        return True
+    
+    def write(self, data):
+        self.data += data
+        return len(data)
+
+
+class TestCliStreaming:
+    """Tests for reading from stdin and writing to stdout."""
+    
+    MARKDOWN = "1. Q1\n   *a. A\n   b. B\n\n2. Q2\n   a. A\n   *b. B\n"
+    
+    def _run(self, args, stdin_text):
+        pipe = _Pipe()
+        stdout = io.TextIOWrapper(pipe, encoding='utf-8')
+        with patch.object(sys, 'argv', ['markdown-to-qti', *args]), \
+                patch.object(sys, 'stdin', io.StringIO(stdin_text)), \
+                patch.object(sys, 'stdout', stdout):
+            main()
+            stdout.flush()
+        return bytes(pipe.data)
+    
+    def test_stdin_to_zip_on_stdout(self):
+        """Test that - and -o - stream a valid package through pipes."""
+        data = self._run(['-', '-o', '-'], self.MARKDOWN)
+        
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            assert zf.testzip() is None
+            names = zf.namelist()
+            assert names[0] == 'imsmanifest.xml'
+            xml_output = zf.read(names[1]).decode('utf-8')
+            # Sizes follow each entry in a data descriptor
+            assert all(info.flag_bits & 0x08 for info in zf.infolist())
+        assert xml_output.count('<item ') == 2
+    
+    def test_stdin_to_file(self):
+        """Test that stdin input can be written to a package file."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_path = os.path.join(tmpdir, "out.zip")
+            self._run(['-', '-o', output_path], self.MARKDOWN)
+            
+            with zipfile.ZipFile(output_path) as zf:
+                assert zf.testzip() is None
+    
+    def test_stdin_xml_only(self):
+        """Test that stdin input can be converted to XML on stdout."""
+        data = self._run(['-', '--xml-only'], self.MARKDOWN)
+        
+        assert data.startswith(b'<?xml')
+        assert data.count(b'<item ') == 2
+    
+    def test_stdin_requires_output(self, capsys):
+        """Test that reading stdin without an output option is an error."""
+        with pytest.raises(SystemExit) as excinfo:
+            self._run(['-'], self.MARKDOWN)
+        
+        assert excinfo.value.code == 1
+        assert "-o -" in capsys.readouterr().err
+    
+    def test_stdin_answer_key_on_stdout(self):
+        """Test that stdin input can be turned into just an answer key."""
+        data = self._run(['-', '--answer-key', '-'], self.MARKDOWN)
+        
+        assert data.decode('utf-8').splitlines() == [
+            'question,answer,points,group,tags,bloom', '1,a,1,,,', '2,b,1,,,']
+    
+    def test_stdin_error_leaves_no_files(self, tmp_path, capsys):
+        """Test that an error found while streaming leaves no package or answer key."""
+        markdown = self.MARKDOWN + "\n## Group: G (pick 3)\n\n3. Q3\n   *a. A\n   b. B\n"
+        
+        with pytest.raises(SystemExit) as excinfo:
+            self._run(['-', '-o', str(tmp_path / "out.zip"),
+                       '--answer-key', str(tmp_path / "key.csv")], markdown)
+        
+        assert excinfo.value.code == 1
+        assert "picks 3 of 1" in capsys.readouterr().err
+        assert os.listdir(tmp_path) == []
+    
+    def test_empty_stdin(self):
+        """Test that empty input is reported before anything is written."""
+        with pytest.raises(SystemExit) as excinfo:
+            self._run(['-', '-o', '-'], "no questions here\n")
+        
+        assert excinfo.value.code == 1
+
@@ -0,0 +1,178 @@
+"""
+Tests for the near-duplicate detection module.
+"""
+import json
+import sqlite3
+
+import pytest
+
+from markdown_to_qti.dedupe import (
+    DedupeIndex, main, shingles, signature, similarity
+)
+from markdown_to_qti.parser import parse_markdown_exam
+
+LOOPS = """
+1. How many times does the loop `for i in range(10): print(i)` print a value?
+a. 9
+*b. 10
+c. 11
+d. It never stops
+
+2. Which keyword defines a function in Python?
+a. function
+*b. def
+c. fun
+d. lambda
+"""
+
+# Question 1 again with a different number, and an unrelated question
+LOOPS_AGAIN = """
+1. What is the capital of France?
+*a. Paris
+b. Lyon
+
+2. How many times does the loop `for i in range(12): print(i)` print a value?
+a. 11
+*b. 12
+c. 13
+d. It never stops
+"""
+
+
+def _signature(markdown):
+    return signature(shingles(parse_markdown_exam(markdown)[0]))
+
+
+class TestSignatures:
+    """Tests for shingles, signatures and similarity."""
+    
+    def test_case_and_whitespace_are_ignored(self):
+        """Test that shingles ignore case and runs of whitespace."""
+        assert (shingles(parse_markdown_exam("1. Hello   World\n*a. A\n")[0])
+                == shingles(parse_markdown_exam("1. hello world\n*a.  a\n")[0]))
+    
+    def test_identical_questions(self):
+        """Test that identical questions have identical signatures."""
+        assert similarity(_signature(LOOPS), _signature(LOOPS)) == 1.0
+    
+    def test_near_duplicates_are_similar(self):
+        """Test that a changed number keeps questions similar."""
+        first = _signature(LOOPS)
+        second = signature(shingles(parse_markdown_exam(LOOPS_AGAIN)[1]))
+        
+        assert similarity(first, second) >= 0.6
+    
+    def test_unrelated_questions_are_not(self):
+        """Test that different questions are dissimilar."""
+        first = _signature(LOOPS)
+        second = _signature(LOOPS_AGAIN)
+        
+        assert similarity(first, second) < 0.2
+    
+    def test_short_question(self):
+        """Test that very short questions still get a full signature."""
+        assert len(_signature("1. Q\n*a. A\n")) == 128
+
+
+class TestDedupeIndex:
+    """Tests for the DedupeIndex class."""
+    
+    def test_clusters(self):
+        """Test that near-duplicates across files form a cluster."""
+        index = DedupeIndex()
+        index.add('a.md', parse_markdown_exam(LOOPS))
+        index.add('b.md', parse_markdown_exam(LOOPS_AGAIN))
+        
+        clusters = index.clusters(threshold=0.6)
+        
+        assert len(clusters) == 1
+        assert [(q.source, q.number, q.line) for q in clusters[0]] == [
+            ('a.md', 1, 2), ('b.md', 2, 6)]
+        assert clusters[0][0].excerpt.startswith("How many times does the loop")
+        assert clusters[0][0].excerpt.endswith("...")
+    
+    def test_readding_replaces(self):
+        """Test that adding a file again replaces its questions."""
+        index = DedupeIndex()
+        index.add('a.md', parse_markdown_exam(LOOPS))
+        index.add('a.md', parse_markdown_exam(LOOPS))
+        
+        assert len(index) == 2
+        assert index.clusters() == []
+    
+    def test_matches_while_adding(self):
+        """Test that questions duplicating indexed ones are returned."""
+        index = DedupeIndex()
+        assert index.add('a.md', parse_markdown_exam(LOOPS), threshold=0.6) == []
+        
+        matches = index.add('b.md', parse_markdown_exam(LOOPS_AGAIN), threshold=0.6)
+        
+        assert len(matches) == 1
+        assert matches[0].question.number == 2
+        assert matches[0].duplicate_of.source == 'a.md'
+        assert 0.6 <= matches[0].similarity < 1
+    
+    def test_index_file(self, tmp_path):
+        """Test that an index file keeps questions between runs."""
+        path = str(tmp_path / "bank.sqlite3")
+        index = DedupeIndex(path)
+        index.add('a.md', parse_markdown_exam(LOOPS))
+        index.close()
+        
+        index = DedupeIndex(path)
+        index.add('b.md', parse_markdown_exam(LOOPS_AGAIN))
+        
+        assert len(index) == 4
+        assert len(index.clusters(threshold=0.6)) == 1
+        index.close()
+    
+    def test_index_with_other_settings(self, tmp_path):
+        """Test that an index built with other settings is rejected."""
+        path = str(tmp_path / "bank.sqlite3")
+        DedupeIndex(path).close()
+        connection = sqlite3.connect(path)
+        with connection:
+            connection.execute("UPDATE meta SET value = 64 WHERE key = 'signature_size'")
+        connection.close()
+        
+        with pytest.raises(ValueError, match="different settings"):
+            DedupeIndex(path)
+
+
+class TestDedupeCommand:
+    """Tests for the dedupe command."""
+    
+    def _write(self, tmp_path):
+        first = tmp_path / "a.md"
+        second = tmp_path / "b.md"
+        first.write_text(LOOPS)
+        second.write_text(LOOPS_AGAIN)
+        return str(first), str(second)
+    
+    def test_report(self, tmp_path, capsys):
+        """Test the text report and duplicate warnings."""
+        first, second = self._write(tmp_path)
+        
+        assert main([first, second, '--threshold', '0.6', '--warn']) == 0
+        
+        captured = capsys.readouterr()
+        assert captured.out.startswith("2 of 4 question(s) in 1 cluster(s) of near-duplicates.")
+        assert f"  {first}:2  Question 1: How many times" in captured.out
+        assert f"{second}:6: Question 2 is a near-duplicate of {first}:2 Question 1" in captured.err
+    
+    def test_json_with_index(self, tmp_path, capsys):
+        """Test updating an index in two runs and the JSON report."""
+        first, second = self._write(tmp_path)
+        index_path = str(tmp_path / "bank.sqlite3")
+        
+        assert main([first, '--index', index_path]) == 0
+        capsys.readouterr()
+        assert main([second, '--index', index_path, '--threshold', '0.6', '--json']) == 0
+        
+        clusters = json.loads(capsys.readouterr().out)
+        assert [[q['source'] for q in cluster] for cluster in clusters] == [[first, second]]
+    
+    def test_requires_input(self, capsys):
+        """Test that a file or an index is required."""
+        assert main([]) == 1
+        assert "--index" in capsys.readouterr().err
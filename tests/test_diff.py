@@ -0,0 +1,193 @@
+"""
+Tests for the exam diff module.
+"""
+import json
+import zipfile
+
+import pytest
+
+from markdown_to_qti.diff import MARKDOWN, QTI12, QTI21, diff_questions, load_questions, main
+from markdown_to_qti.parser import parse_markdown_exam
+from markdown_to_qti.qti21 import create_qti21_package
+from markdown_to_qti.qti_generator import create_qti_package
+
+
+def _exam(*numbers, edits=None):
+    """Return an exam of numbered questions, with some question texts replaced."""
+    edits = edits or {}
+    blocks = []
+    for position, number in enumerate(numbers, 1):
+        blocks.append(edits.get(number, (
+            f"{position}. Which value does variable number {number} hold?\n"
+            f"a. The value {number}\n"
+            f"*b. Twice {number}, i.e. `{number * 2}`\n"
+            f"c. Nothing"
+        )).replace("{position}", str(position)))
+    return '\n\n'.join(blocks) + '\n'
+
+
+def _diff(old, new):
+    return diff_questions(parse_markdown_exam(old), parse_markdown_exam(new))
+
+
+class TestDiffQuestions:
+    """Tests for aligning and comparing two versions of an exam."""
+    
+    def test_identical(self):
+        """Test that the same exam has no differences."""
+        assert _diff(_exam(1, 2, 3), _exam(1, 2, 3)) == []
+    
+    def test_added_and_removed(self):
+        """Test that inserted and deleted questions are reported where they are."""
+        changes = _diff(_exam(1, 2, 3, 4), _exam(1, 9, 2, 4))
+        
+        assert [(change.kind, change.old, change.new) for change in changes] == [
+            ('added', None, 2),
+            ('removed', 3, None),
+        ]
+        assert changes[0].excerpt == "Which value does variable number 9 hold?"
+    
+    def test_moved(self):
+        """Test that only the question that moved is reported, not those it shifted."""
+        changes = _diff(_exam(1, 2, 3, 4, 5), _exam(2, 3, 4, 1, 5))
+        
+        assert [(change.kind, change.old, change.new, change.changes) for change in changes] == [
+            ('moved', 1, 4, ["moved"]),
+        ]
+    
+    def test_changed_fields(self):
+        """Test that changes to the stem, a choice and the answer are reported."""
+        edits = {
+            2: "{position}. Which value does variable number 2 hold now?\n"
+               "a. The value 2\n*b. Twice 2, i.e. `4`\nc. Nothing",
+            3: "{position}. Which value does variable number 3 hold?\n"
+               "*a. The value 3\nb. Twice 3, i.e. `6`\nc. Nothing",
+            4: "{position}. Which value does variable number 4 hold?\n"
+               "a. The value 4\n*b. Twice 4, i.e. `8`\nc. Nothing at all\nd. Infinity",
+        }
+        changes = _diff(_exam(1, 2, 3, 4), _exam(1, 2, 3, 4, edits=edits))
+        
+        assert [(change.kind, change.new, change.changes) for change in changes] == [
+            ('changed', 2, ["stem"]),
+            ('changed', 3, ["correct answer b -> a"]),
+            ('changed', 4, ["choice c", "choice d added"]),
+        ]
+    
+    def test_rewritten_question_in_place(self):
+        """Test that a question with a changed stem and choices is paired if similar."""
+        edits = {2: "{position}. Which value does variable number 2 hold, if any?\n"
+                    "a. The value 2\n*b. Twice 2, i.e. `4`\nc. No value"}
+        changes = _diff(_exam(1, 2, 3), _exam(1, 2, 3, edits=edits))
+        
+        assert [(change.kind, change.old, change.new, change.changes) for change in changes] == [
+            ('changed', 2, 2, ["stem", "choice c"]),
+        ]
+    
+    def test_replaced_question(self):
+        """Test that an unrelated question in the same place is added, not changed."""
+        edits = {2: "{position}. What is the capital of France?\n*a. Paris\nb. Lyon"}
+        changes = _diff(_exam(1, 2, 3), _exam(1, 2, 3, edits=edits))
+        
+        assert [(change.kind, change.old, change.new) for change in changes] == [
+            ('removed', 2, None),
+            ('added', None, 2),
+        ]
+    
+    def test_duplicate_questions(self):
+        """Test that repeated identical questions are paired one to one."""
+        changes = _diff(_exam(1, 1, 2), _exam(1, 2))
+        
+        assert [(change.kind, change.old, change.new) for change in changes] == [
+            ('removed', 2, None),
+        ]
+
+
+class TestLoadQuestions:
+    """Tests for reading questions back from packages."""
+    
+    @pytest.fixture
+    def exam(self, tmp_path):
+        path = tmp_path / "exam.md"
+        path.write_text(_exam(1, 2, 3) + "\n4. Solve $x^2 = 4$\n*a. $x = \\pm 2$\nb. $x = 2$\n",
+                        encoding='utf-8')
+        return path
+    
+    def test_markdown(self, exam):
+        """Test that a markdown file is parsed."""
+        questions, kind = load_questions(str(exam))
+        
+        assert kind == MARKDOWN
+        assert len(questions) == 4
+    
+    @pytest.mark.parametrize('create, expected_kind', [
+        (create_qti_package, QTI12),
+        (create_qti21_package, QTI21),
+    ])
+    def test_package(self, exam, tmp_path, create, expected_kind):
+        """Test that a package's questions match the markdown they came from."""
+        questions = parse_markdown_exam(exam.read_text(encoding='utf-8'))
+        package = create(questions, str(tmp_path / "exam.zip"))
+        
+        loaded, kind = load_questions(package)
+        
+        assert kind == expected_kind
+        assert [question.number for question in loaded] == [1, 2, 3, 4]
+        assert [question.correct_answer for question in loaded] == ['b', 'b', 'b', 'a']
+        assert [choice.letter for choice in loaded[3].choices] == ['a', 'b']
+        assert "<code>4</code>" in loaded[1].choices[1].html
+    
+    def test_not_a_package(self, tmp_path):
+        """Test that a zip file without a QTI manifest is reported."""
+        path = tmp_path / "other.zip"
+        with zipfile.ZipFile(path, 'w') as zf:
+            zf.writestr('readme.txt', 'Hello')
+        
+        with pytest.raises(ValueError, match="cannot read the package"):
+            load_questions(str(path))
+
+
+class TestMain:
+    """Tests for the diff command."""
+    
+    def test_report(self, tmp_path, capsys):
+        """Test that differences are summarized and listed, exiting with 1."""
+        old = tmp_path / "old.md"
+        new = tmp_path / "new.md"
+        old.write_text(_exam(1, 2, 3, 4), encoding='utf-8')
+        edits = {5: "{position}. What is the capital of France?\n*a. Paris\nb. Lyon"}
+        new.write_text(_exam(2, 3, 1, 5, edits=edits), encoding='utf-8')
+        
+        assert main([str(old), str(new)]) == 1
+        
+        output = capsys.readouterr().out.splitlines()
+        assert output[1] == "0 changed, 1 added, 1 removed, 1 moved, 2 unchanged."
+        assert output[2:] == [
+            "  Question 4 (old): removed: Which value does variable number 4 hold?",
+            "  Question 3 (was 1): moved",
+            "  Question 4: added: What is the capital of France?",
+        ]
+    
+    @pytest.mark.parametrize('create', [create_qti_package, create_qti21_package])
+    def test_markdown_against_package(self, tmp_path, capsys, create):
+        """Test that a package compares equal to its markdown, and sees a change."""
+        source = _exam(1, 2, 3) + "\n4. Solve $x^2 = 4$\n*a. $x = \\pm 2$\nb. $x = 2$\n"
+        package = create(parse_markdown_exam(source), str(tmp_path / "exam.zip"))
+        old = tmp_path / "old.md"
+        new = tmp_path / "new.md"
+        old.write_text(source, encoding='utf-8')
+        new.write_text(source.replace("*a. $x", "a. $x").replace("b. $x = 2", "*b. $x = 2"),
+                       encoding='utf-8')
+        
+        assert main([str(old), package]) == 0
+        assert main([package, str(new), '--json']) == 1
+        
+        output = capsys.readouterr().out
+        changes = json.loads(output[output.index('['):])
+        assert [(change['kind'], change['new'], change['changes']) for change in changes] == [
+            ('changed', 4, ["correct answer a -> b"]),
+        ]
+    
+    def test_missing_file(self, tmp_path, capsys):
+        """Test that an unreadable version exits with 2."""
+        assert main([str(tmp_path / "missing.md"), str(tmp_path / "missing.md")]) == 2
+        assert "Error reading" in capsys.readouterr().err
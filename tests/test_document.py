@@ -0,0 +1,168 @@
+"""
+Tests for the incremental document model and authoring diagnostics.
+"""
+import random
+from dataclasses import asdict
+
+import pytest
+
+from markdown_to_qti.diagnostics import ERROR, WARNING
+from markdown_to_qti.document import ExamDocument, check_markdown_exam
+from markdown_to_qti.parser import SourceSpan, parse_markdown_exam
+
+
+SAMPLE = """# Quiz
+
+1. What is 2 + 2?
+   a. 3
+   *b. 4
+
+2. Which is a keyword?
+
+```python
+def f():
+    pass
+```
+
+   *a. def
+   b. func
+"""
+
+
+def _snapshot(document):
+    return (
+        [asdict(q) for q in document.questions()],
+        [asdict(d) for d in document.diagnostics()],
+    )
+
+
+class TestExamDocument:
+    """Tests for ExamDocument."""
+    
+    def test_matches_parser(self):
+        """Test that a fresh document parses like parse_markdown_exam."""
+        document = ExamDocument(SAMPLE)
+        
+        expected = [asdict(q) for q in parse_markdown_exam(SAMPLE)]
+        assert [asdict(q) for q in document.questions()] == expected
+    
+    def test_edit_within_question(self):
+        """Test editing a choice updates only that question."""
+        document = ExamDocument(SAMPLE)
+        document.apply_change(4, 7, 4, 8, "5")
+        
+        questions = document.questions()
+        assert questions[0].choices[1].text == "5"
+        assert questions[1].choices[0].text == "def"
+    
+    def test_inserted_lines_shift_later_questions(self):
+        """Test that later spans move when lines are inserted above them."""
+        document = ExamDocument(SAMPLE)
+        document.apply_change(2, 0, 2, 0, "\n\n")
+        
+        assert document.questions()[1].span.start_line == 8
+    
+    def test_removing_question_start_merges_blocks(self):
+        """Test that deleting a question number merges it into the previous block."""
+        document = ExamDocument(SAMPLE)
+        document.apply_change(6, 0, 6, 3, "")
+        
+        assert len(document.questions()) == 1
+        assert _snapshot(document) == _snapshot(ExamDocument(document.text))
+    
+    def test_group_heading_ends_question(self):
+        """Test that group headings end questions as in the parser."""
+        markdown = "1. Q\n*a. A\n\n## Group: G\n2. R\n*a. B\n"
+        document = ExamDocument(markdown)
+        
+        questions = document.questions()
+        expected = parse_markdown_exam(markdown)
+        assert questions == expected
+        assert [q.span for q in questions] == [q.span for q in expected]
+        assert [c.span for q in questions for c in q.choices] == [
+            c.span for q in expected for c in q.choices]
+    
+    def test_group_heading_in_code_block(self):
+        """Test that a heading-like line in fenced code stays in the question."""
+        markdown = "1. Q\n```python\n## group the rows\n```\n*a. A\n\n## Group: G\n2. R\n*a. B\n"
+        document = ExamDocument(markdown)
+        
+        questions = document.questions()
+        assert questions == parse_markdown_exam(markdown)
+        assert "## group the rows" in questions[0].stem
+        assert [c.text for c in questions[0].choices] == ["A"]
+    
+    def test_random_edits_match_full_reparse(self):
+        """Test that incremental reparsing agrees with parsing from scratch."""
+        rng = random.Random(0)
+        fragments = ['\n', '1. ', 'a. ', '*b. ', '```', 'x', '\n3.', '\n\n', ' ', '\n## Group\n']
+        document = ExamDocument(SAMPLE * 3)
+        
+        for _ in range(500):
+            lines = document.lines
+            start_line = rng.randrange(len(lines))
+            start_column = rng.randrange(len(lines[start_line]) + 1)
+            end_line = min(len(lines) - 1, start_line + rng.choice([0, 0, 1, 3]))
+            end_column = rng.randrange(len(lines[end_line]) + 1)
+            if end_line == start_line:
+                end_column = max(end_column, start_column)
+            text = ''.join(rng.choice(fragments) for _ in range(rng.randrange(4)))
+            
+            document.apply_change(start_line, start_column, end_line, end_column, text)
+            
+            assert _snapshot(document) == _snapshot(ExamDocument(document.text))
+
+
+class TestDiagnostics:
+    """Tests for check_markdown_exam."""
+    
+    def test_clean_exam_has_no_diagnostics(self):
+        """Test that a valid exam produces no diagnostics."""
+        assert check_markdown_exam(SAMPLE) == []
+    
+    def test_missing_correct_answer(self):
+        """Test that a question without a marked answer is reported."""
+        diagnostics = check_markdown_exam("1. Q\na. A\nb. B\n")
+        
+        assert len(diagnostics) == 1
+        assert diagnostics[0].severity == ERROR
+        assert diagnostics[0].span == SourceSpan(0, 0, 0, 4)
+        assert "no correct answer" in diagnostics[0].message
+    
+    def test_duplicate_letters(self):
+        """Test that a repeated choice letter is reported at the repeat."""
+        diagnostics = check_markdown_exam("1. Q\n*a. A\nb. B\nb. C\n")
+        
+        assert len(diagnostics) == 1
+        assert diagnostics[0].span == SourceSpan(3, 0, 3, 4)
+        assert "Duplicate choice letter 'b'" in diagnostics[0].message
+    
+    def test_unbalanced_fence(self):
+        """Test that an unclosed code fence is reported."""
+        diagnostics = check_markdown_exam("1. Q\n```python\nx = 1\n*a. A\n")
+        
+        messages = [d.message for d in diagnostics]
+        assert any("Unbalanced code fence" in m for m in messages)
+        fence = next(d for d in diagnostics if "Unbalanced" in d.message)
+        assert fence.span == SourceSpan(1, 0, 1, 3)
+    
+    def test_multiple_correct_answers_warning(self):
+        """Test that extra correct answers produce a warning."""
+        diagnostics = check_markdown_exam("1. Q\n*a. A\n*b. B\n")
+        
+        assert [d.severity for d in diagnostics] == [WARNING]
+    
+    def test_unknown_bloom_level_warning(self):
+        """Test that a Bloom level outside the taxonomy produces a warning."""
+        diagnostics = check_markdown_exam("1. Q\n<!-- bloom: memorize -->\n*a. A\n")
+        
+        assert [d.severity for d in diagnostics] == [WARNING]
+        assert "Unknown Bloom level 'memorize'" in diagnostics[0].message
+        assert check_markdown_exam("1. Q\n<!-- bloom: Apply -->\n*a. A\n") == []
+    
+    def test_question_without_choices(self):
+        """Test that a question with no choices is reported."""
+        diagnostics = check_markdown_exam("1. Q\n\n2. R\n*a. A\n")
+        
+        assert len(diagnostics) == 1
+        assert "no answer choices" in diagnostics[0].message
@@ -0,0 +1,147 @@
+"""
+Tests for the intermediate representation module.
+"""
+import json
+import os
+import tempfile
+from dataclasses import asdict
+
+import pytest
+
+from markdown_to_qti.ir import IR_VERSION, load_ir, save_ir
+from markdown_to_qti.parser import parse_markdown_exam
+from markdown_to_qti.qti_generator import _markdown_to_html, generate_qti_assessment
+
+
+MARKDOWN = """
+1. What does this print?
+
+```python
+print("<hi>")
+```
+
+   a. `<hi>`
+   *b. <hi>
+   c. Nothing
+
+2. Unicode: café ✓
+   *a. ✓
+   b. ✗
+"""
+
+
+class TestIr:
+    """Tests for save_ir and load_ir."""
+    
+    def test_round_trip(self):
+        """Test that questions, choices and spans survive a round trip."""
+        questions = parse_markdown_exam(MARKDOWN)
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = save_ir(questions, os.path.join(tmpdir, "exam.qir"))
+            loaded = load_ir(path)
+        
+        assert [asdict(q) for q in loaded] == [asdict(q) for q in questions]
+    
+    def test_gzip_round_trip(self):
+        """Test that a .gz path is compressed and loads back."""
+        questions = parse_markdown_exam(MARKDOWN)
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = save_ir(questions, os.path.join(tmpdir, "exam.qir.gz"))
+            with open(path, 'rb') as f:
+                assert f.read(2) == b'\x1f\x8b'
+            loaded = load_ir(path)
+        
+        assert loaded == questions
+    
+    def test_include_html(self):
+        """Test that pre-rendered HTML is stored and used by the generator."""
+        questions = parse_markdown_exam(MARKDOWN)
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = save_ir(questions, os.path.join(tmpdir, "exam.qir"), include_html=True)
+            loaded = load_ir(path)
+        
+        assert loaded[0].stem_html == _markdown_to_html(questions[0].stem)
+        assert loaded[0].choices[0].html == _markdown_to_html("`<hi>`")
+        
+        loaded[0].stem_html = "<p>prerendered</p>"
+        xml_output = generate_qti_assessment(loaded, "Test")
+        assert "&lt;p&gt;prerendered&lt;/p&gt;" in xml_output
+    
+    def test_groups_round_trip(self):
+        """Test that question groups survive a round trip and stay shared."""
+        questions = parse_markdown_exam(
+            "## Group: G (pick 1, 2 points)\n1. Q\n*a. A\n2. R\n*a. B\n## End group\n3. S\n*a. C\n")
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = save_ir(questions, os.path.join(tmpdir, "exam.qir"))
+            loaded = load_ir(path)
+        
+        assert [asdict(q) for q in loaded] == [asdict(q) for q in questions]
+        assert loaded[0].group is loaded[1].group
+        assert loaded[2].group is None
+    
+    def test_tags_round_trip(self):
+        """Test that tags and Bloom levels survive a round trip."""
+        questions = parse_markdown_exam(
+            "1. Q\n<!-- tags: loops, sets; bloom: apply -->\n*a. A\n2. R\n*a. B\n")
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = save_ir(questions, os.path.join(tmpdir, "exam.qir"))
+            loaded = load_ir(path)
+        
+        assert loaded == questions
+        assert loaded[0].tags == ['loops', 'sets']
+        assert loaded[1].bloom is None
+    
+    def test_html_from_other_renderer_is_dropped(self):
+        """Test that stored HTML is only kept for the renderer that produced it."""
+        questions = parse_markdown_exam(MARKDOWN)
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = save_ir(questions, os.path.join(tmpdir, "exam.qir"), include_html=True)
+            with open(path) as f:
+                assert json.loads(f.readline())['renderer'] == 'markdown'
+            kept = load_ir(path, 'markdown')
+            dropped = load_ir(path, 'commonmark')
+        
+        assert kept[0].stem_html is not None
+        assert dropped[0].stem_html is None
+        assert all(choice.html is None for choice in dropped[0].choices)
+        assert dropped[0].stem == questions[0].stem
+    
+    def test_rejects_non_ir_file(self):
+        """Test that loading a markdown file raises ValueError."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "exam.md")
+            with open(path, 'w') as f:
+                f.write(MARKDOWN)
+            
+            with pytest.raises(ValueError):
+                load_ir(path)
+    
+    def test_rejects_unknown_version(self):
+        """Test that an IR file from a newer version is rejected."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "exam.qir")
+            with open(path, 'w') as f:
+                f.write(json.dumps({'format': 'markdown-to-qti-ir', 'version': IR_VERSION + 1}))
+            
+            with pytest.raises(ValueError, match="Unsupported IR version"):
+                load_ir(path)
+    
+    def test_rejects_truncated_file(self):
+        """Test that a file missing questions is rejected."""
+        questions = parse_markdown_exam(MARKDOWN)
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = save_ir(questions, os.path.join(tmpdir, "exam.qir"))
+            with open(path) as f:
+                lines = f.readlines()
+            with open(path, 'w') as f:
+                f.writelines(lines[:-1])
+            
+            with pytest.raises(ValueError, match="truncated"):
+                load_ir(path)
@@ -0,0 +1,205 @@
+"""
+Tests for the LaTeX math module.
+"""
+import sqlite3
+from xml.etree import ElementTree
+
+import pytest
+
+from markdown_to_qti import latex
+from markdown_to_qti.latex import (
+    LatexError, MathCache, configure_math_cache, latex_to_mathml, render_math
+)
+from markdown_to_qti.renderer import render_inline
+
+
+@pytest.fixture(autouse=True)
+def math_cache_file(tmp_path, monkeypatch):
+    """Point the persistent math cache at a temporary file."""
+    path = tmp_path / 'math.sqlite3'
+    monkeypatch.setenv(latex.MATH_CACHE_ENV, str(path))
+    monkeypatch.setattr(latex, '_cache', None)
+    yield path
+    if latex._cache is not None:
+        latex._cache.close()
+
+
+def _body(markup):
+    """Return the presentation markup inside <semantics>."""
+    root = ElementTree.fromstring(markup)
+    semantics = root[0]
+    return ElementTree.tostring(semantics[0], encoding='unicode').replace(
+        ' xmlns:ns0="http://www.w3.org/1998/Math/MathML"', '').replace('ns0:', '')
+
+
+class TestLatexToMathml:
+    """Tests for latex_to_mathml function."""
+    
+    def test_superscript(self):
+        """Test identifiers, numbers and scripts."""
+        assert _body(latex_to_mathml('x^2')) == '<msup><mi>x</mi><mn>2</mn></msup>'
+    
+    def test_subscript_and_superscript(self):
+        """Test that both scripts combine in either order."""
+        expected = '<msubsup><mi>x</mi><mi>i</mi><mn>2</mn></msubsup>'
+        
+        assert _body(latex_to_mathml('x_i^2')) == expected
+        assert _body(latex_to_mathml('x^2_i')) == expected
+    
+    def test_fraction_and_root(self):
+        """Test fractions, square roots and nth roots."""
+        assert _body(latex_to_mathml(r'\frac{1}{2}')) == '<mfrac><mn>1</mn><mn>2</mn></mfrac>'
+        assert _body(latex_to_mathml(r'\sqrt{x}')) == '<msqrt><mi>x</mi></msqrt>'
+        assert _body(latex_to_mathml(r'\sqrt[3]{x}')) == '<mroot><mi>x</mi><mn>3</mn></mroot>'
+    
+    def test_symbols(self):
+        """Test Greek letters, operators and relations."""
+        body = _body(latex_to_mathml(r'\alpha \leq \pi \times 2'))
+        
+        assert body == '<mrow><mi>α</mi><mo>≤</mo><mi>π</mi><mo>×</mo><mn>2</mn></mrow>'
+    
+    def test_big_operator_limits(self):
+        """Test that sums put their limits above and below."""
+        body = _body(latex_to_mathml(r'\sum_{i=1}^{n} i'))
+        
+        assert body.startswith('<mrow><munderover><mo')
+        assert '∑' in body
+    
+    def test_text_keeps_spaces(self):
+        """Test that \\text arguments keep their spacing."""
+        assert '<mtext>if x is odd</mtext>' in latex_to_mathml(r'\text{if x is odd}')
+    
+    def test_delimiters(self):
+        """Test \\left and \\right delimiters."""
+        body = _body(latex_to_mathml(r'\left( x \right]'))
+        
+        assert body.count('fence="true"') == 2
+        assert '>]</mo>' in body
+    
+    def test_display_and_annotation(self):
+        """Test the display mode and the TeX source annotation."""
+        markup = latex_to_mathml('a < b', display=True)
+        
+        assert 'display="block"' in markup
+        assert '<annotation encoding="application/x-tex">a &lt; b</annotation>' in markup
+        ElementTree.fromstring(markup)
+    
+    @pytest.mark.parametrize('expression', [
+        r'\unknown{x}', '{x', 'x}', '^2', r'\frac{1}', '{' * 100 + '}' * 100,
+    ])
+    def test_invalid_expressions(self, expression):
+        """Test that unsupported or malformed input raises LatexError."""
+        with pytest.raises(LatexError):
+            latex_to_mathml(expression)
+
+
+class TestRenderMath:
+    """Tests for render_math and the math cache."""
+    
+    def test_invalid_expression_is_kept_as_text(self):
+        """Test that unconvertible math falls back to its source."""
+        assert render_math(r'\unknown<x>') == r'$\unknown&lt;x&gt;$'
+        assert render_math('{', display=True) == '$${$$'
+    
+    def test_cache_is_written_to_file(self, math_cache_file):
+        """Test that rendered math is written to the cache file and reused."""
+        markup = render_math(r'\frac{a}{b}')
+        latex._cache.close()
+        
+        connection = sqlite3.connect(str(math_cache_file))
+        rows = connection.execute('SELECT key, markup FROM math').fetchall()
+        connection.close()
+        assert rows == [(MathCache.key(r'\frac{a}{b}', False), markup)]
+        
+        cache = MathCache(math_cache_file)
+        assert cache.get(r'\frac{a}{b}', False) == markup
+        assert cache.get(r'\frac{a}{b}', True) is None
+        cache.close()
+    
+    def test_cached_markup_is_reused(self, math_cache_file):
+        """Test that a cache hit skips conversion."""
+        cache = MathCache(math_cache_file)
+        cache.put('x', False, '<b>cached</b>')
+        cache.close()
+        
+        assert render_math('x') == '<b>cached</b>'
+    
+    def test_key_depends_on_converter_version(self, monkeypatch):
+        """Test that a converter change invalidates old entries."""
+        key = MathCache.key('x', False)
+        monkeypatch.setattr(latex, 'CONVERTER_VERSION', latex.CONVERTER_VERSION + 1)
+        
+        assert MathCache.key('x', False) != key
+    
+    def test_disabled_cache(self, math_cache_file):
+        """Test that the persistent cache can be turned off."""
+        configure_math_cache(None)
+        render_math('x')
+        
+        assert latex.get_math_cache().path is None
+        assert not math_cache_file.exists()
+    
+    def test_no_file_by_default(self, tmp_path, monkeypatch):
+        """Test that nothing is written to disk unless a cache file is chosen."""
+        monkeypatch.delenv(latex.MATH_CACHE_ENV)
+        monkeypatch.setenv('HOME', str(tmp_path))
+        monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+        render_math('x')
+        
+        assert latex.get_math_cache().path is None
+        assert list(tmp_path.iterdir()) == []
+    
+    def test_memory_is_bounded(self, monkeypatch):
+        """Test that the least recently used expressions are dropped."""
+        monkeypatch.setattr(latex, 'MEMORY_ENTRIES', 2)
+        cache = MathCache()
+        cache.put('a', False, '<a/>')
+        cache.put('b', False, '<b/>')
+        assert cache.get('a', False) == '<a/>'
+        cache.put('c', False, '<c/>')
+        
+        assert cache.get('a', False) == '<a/>'
+        assert cache.get('b', False) is None
+        assert cache.get('c', False) == '<c/>'
+    
+    def test_unwritable_cache_directory(self, tmp_path):
+        """Test that an unusable cache location falls back to memory."""
+        blocker = tmp_path / 'file'
+        blocker.write_text('')
+        configure_math_cache(str(blocker / 'math.sqlite3'))
+        
+        assert render_math('x').startswith('<math')
+
+
+class TestMathInMarkdown:
+    """Tests for math in rendered markdown."""
+    
+    def test_inline_math(self):
+        """Test that $...$ is rendered as inline MathML."""
+        result = render_inline('Solve $x^2 = 4$ now')
+        
+        assert result.startswith('Solve <math ')
+        assert 'display="inline"' in result
+        assert result.endswith('</math> now')
+    
+    def test_display_math(self):
+        """Test that $$...$$ is rendered as display MathML."""
+        assert 'display="block"' in render_inline(r'$$\frac{1}{2}$$')
+    
+    @pytest.mark.parametrize('text', [
+        'costs $5 and $10', 'a $ b $ c', r'\$x\$', 'unclosed $x', 'unclosed $$x',
+    ])
+    def test_dollar_signs_that_are_not_math(self, text):
+        """Test that prices, spaced and escaped dollars stay text."""
+        assert '<math' not in render_inline(text)
+    
+    def test_code_span_protects_math(self):
+        """Test that dollars inside code spans are literal."""
+        assert render_inline('`$x$`') == '<code>$x$</code>'
+    
+    def test_math_protects_markup(self):
+        """Test that emphasis characters inside math are not markdown."""
+        result = render_inline('$a_1 * b_2 * c$')
+        
+        assert '<em>' not in result
+        assert '<msub>' in result
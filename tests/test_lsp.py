@@ -0,0 +1,136 @@
+"""
+Tests for the language server.
+"""
+import io
+import json
+
+from markdown_to_qti.lsp import LanguageServer
+
+
+def _frame(message):
+    body = json.dumps(message).encode('utf-8')
+    return f"Content-Length: {len(body)}\r\n\r\n".encode('ascii') + body
+
+
+def _read_all(data):
+    stream = io.BytesIO(data)
+    messages = []
+    while True:
+        header = stream.readline()
+        if not header:
+            return messages
+        length = int(header.split(b':')[1])
+        stream.readline()
+        messages.append(json.loads(stream.read(length)))
+
+
+def _run(*messages):
+    reader = io.BytesIO(b''.join(_frame(m) for m in messages))
+    writer = io.BytesIO()
+    server = LanguageServer(reader, writer)
+    exit_code = server.serve()
+    return exit_code, _read_all(writer.getvalue())
+
+
+URI = 'file:///exam.md'
+
+
+class TestLanguageServer:
+    """Tests for LanguageServer."""
+    
+    def test_initialize_and_shutdown(self):
+        """Test the initialize/shutdown/exit handshake."""
+        exit_code, responses = _run(
+            {'jsonrpc': '2.0', 'id': 1, 'method': 'initialize', 'params': {'capabilities': {}}},
+            {'jsonrpc': '2.0', 'method': 'initialized', 'params': {}},
+            {'jsonrpc': '2.0', 'id': 2, 'method': 'shutdown'},
+            {'jsonrpc': '2.0', 'method': 'exit'},
+        )
+        
+        assert exit_code == 0
+        assert responses[0]['result']['capabilities']['textDocumentSync']['change'] == 2
+        assert responses[1] == {'jsonrpc': '2.0', 'id': 2, 'result': None}
+    
+    def test_publishes_diagnostics_on_open_and_change(self):
+        """Test that diagnostics follow incremental edits."""
+        _, responses = _run(
+            {'jsonrpc': '2.0', 'id': 1, 'method': 'initialize', 'params': {}},
+            {'jsonrpc': '2.0', 'method': 'textDocument/didOpen', 'params': {
+                'textDocument': {'uri': URI, 'languageId': 'markdown', 'version': 1,
+                                 'text': '1. Q\na. A\nb. B\n'}}},
+            {'jsonrpc': '2.0', 'method': 'textDocument/didChange', 'params': {
+                'textDocument': {'uri': URI, 'version': 2},
+                'contentChanges': [{'range': {'start': {'line': 1, 'character': 0},
+                                              'end': {'line': 1, 'character': 0}},
+                                    'text': '*'}]}},
+        )
+        
+        published = [r['params'] for r in responses if r.get('method') == 'textDocument/publishDiagnostics']
+        assert len(published) == 2
+        assert published[0]['diagnostics'][0]['range']['start'] == {'line': 0, 'character': 0}
+        assert 'no correct answer' in published[0]['diagnostics'][0]['message']
+        assert published[1]['diagnostics'] == []
+    
+    def test_utf16_positions(self):
+        """Test that UTF-16 character offsets are converted."""
+        _, responses = _run(
+            {'jsonrpc': '2.0', 'method': 'textDocument/didOpen', 'params': {
+                'textDocument': {'uri': URI, 'text': '1. \U0001F600 Q\n*a. A\nb. B\nb. C\n'}}},
+            {'jsonrpc': '2.0', 'method': 'textDocument/didChange', 'params': {
+                'textDocument': {'uri': URI},
+                'contentChanges': [{'range': {'start': {'line': 0, 'character': 6},
+                                              'end': {'line': 0, 'character': 7}},
+                                    'text': 'R'}]}},
+        )
+        
+        assert responses[-1]['params']['diagnostics'][0]['range']['start'] == {'line': 3, 'character': 0}
+    
+    def test_unknown_request(self):
+        """Test that unknown requests return a MethodNotFound error."""
+        _, responses = _run({'jsonrpc': '2.0', 'id': 7, 'method': 'textDocument/hover', 'params': {}})
+        
+        assert responses[0]['error']['code'] == -32601
+    
+    def test_null_general_capabilities(self):
+        """Test that initialize accepts a null general capability."""
+        _, responses = _run({'jsonrpc': '2.0', 'id': 1, 'method': 'initialize',
+                             'params': {'capabilities': {'general': None}}})
+        
+        assert responses[0]['result']['capabilities']['positionEncoding'] == 'utf-16'
+    
+    def test_failed_request_keeps_serving(self):
+        """Test that a failing handler answers with an internal error."""
+        exit_code, responses = _run(
+            {'jsonrpc': '2.0', 'id': 1, 'method': 'initialize', 'params': {'capabilities': ['general']}},
+            {'jsonrpc': '2.0', 'id': 2, 'method': 'shutdown'},
+            {'jsonrpc': '2.0', 'method': 'exit'},
+        )
+        
+        assert exit_code == 0
+        assert responses[0]['id'] == 1
+        assert responses[0]['error']['code'] == -32603
+        assert responses[1] == {'jsonrpc': '2.0', 'id': 2, 'result': None}
+    
+    def test_failed_notification_is_logged(self, capsys):
+        """Test that a malformed notification is logged and skipped."""
+        _, responses = _run(
+            {'jsonrpc': '2.0', 'method': 'textDocument/didOpen', 'params': {'textDocument': {}}},
+            {'jsonrpc': '2.0', 'method': 'textDocument/didOpen', 'params': {
+                'textDocument': {'uri': URI, 'text': '1. Q\n*a. A\nb. B\n'}}},
+        )
+        
+        assert 'textDocument/didOpen failed: KeyError' in capsys.readouterr().err
+        assert [r['params']['uri'] for r in responses] == [URI]
+    
+    def test_invalid_json(self):
+        """Test that a message that isn't JSON gets a parse error."""
+        body = b'{not json'
+        reader = io.BytesIO(f"Content-Length: {len(body)}\r\n\r\n".encode('ascii') + body
+                            + _frame({'jsonrpc': '2.0', 'id': 2, 'method': 'shutdown'}))
+        writer = io.BytesIO()
+        LanguageServer(reader, writer).serve()
+        responses = _read_all(writer.getvalue())
+        
+        assert responses[0]['id'] is None
+        assert responses[0]['error']['code'] == -32700
+        assert responses[1] == {'jsonrpc': '2.0', 'id': 2, 'result': None}
@@ -0,0 +1,158 @@
+"""
+Peak-memory regression tests for large exams.
+
+Each stage of the pipeline (parse, generate, package) is run under
+tracemalloc and its peak allocation is checked against a per-question
+budget. Streaming from markdown lines to a package, and verifying a
+package, have fixed budgets. The 1,000 question exam always runs; set
+MARKDOWN_TO_QTI_LARGE_TESTS=1 to also run the 10,000 and 50,000 question
+exams.
+"""
+import io
+import os
+import tempfile
+import tracemalloc
+
+import pytest
+
+from markdown_to_qti.parser import iter_markdown_exam, parse_markdown_exam
+from markdown_to_qti.qti_generator import (
+    create_qti_package, generate_qti_assessment, write_qti_package
+)
+from markdown_to_qti.verify import verify_package
+
+
+# Peak bytes allocated per question, for each stage
+BUDGETS = {
+    'parse': 5_000,
+    'generate': 12_000,
+    'generate_compact': 8_000,
+    'package': 3_000,
+}
+
+# Peak bytes for streaming markdown to a package, whatever the exam size
+STREAM_BUDGET = 4_000_000
+
+# Peak bytes for verifying a package against streamed questions
+VERIFY_BUDGET = 2_000_000
+
+_large = pytest.mark.skipif(
+    not os.environ.get('MARKDOWN_TO_QTI_LARGE_TESTS'),
+    reason="set MARKDOWN_TO_QTI_LARGE_TESTS=1 to run large exams"
+)
+
+SIZES = [
+    1_000,
+    pytest.param(10_000, marks=_large),
+    pytest.param(50_000, marks=_large),
+]
+
+
+def build_exam(count):
+    """Build a synthetic exam with a code block in every stem."""
+    return "\n".join(
+        f"{i}. What does this print?\n\n"
+        f"```python\nx = {i}\nprint(x * 2)\n```\n\n"
+        f"*a. `{2 * i}`\nb. `{i}`\nc. Error\nd. None\n"
+        for i in range(1, count + 1)
+    )
+
+
+def _peak(func, *args, **kwargs):
+    """Run func under tracemalloc and return its result and peak allocation."""
+    tracemalloc.start()
+    try:
+        result = func(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak
+
+
+@pytest.fixture(scope='module', params=SIZES)
+def exam(request):
+    count = request.param
+    return count, build_exam(count)
+
+
+def _check(stage, count, peak, record_property):
+    per_question = peak / count
+    record_property(f'{stage}_peak_bytes_per_question', round(per_question))
+    assert per_question <= BUDGETS[stage], (
+        f"{stage} peaked at {per_question:.0f} bytes/question for {count} questions "
+        f"(budget {BUDGETS[stage]})"
+    )
+
+
+class TestPeakMemory:
+    """Per-stage peak memory budgets."""
+    
+    def test_parse(self, exam, record_property):
+        """Test peak memory of parsing."""
+        count, markdown = exam
+        questions, peak = _peak(parse_markdown_exam, markdown)
+        
+        assert len(questions) == count
+        _check('parse', count, peak, record_property)
+    
+    def test_generate(self, exam, record_property):
+        """Test peak memory of generating pretty-printed XML."""
+        count, markdown = exam
+        questions = parse_markdown_exam(markdown)
+        _, peak = _peak(generate_qti_assessment, questions, "Memory")
+        
+        _check('generate', count, peak, record_property)
+    
+    def test_generate_compact(self, exam, record_property):
+        """Test peak memory of generating compact XML."""
+        count, markdown = exam
+        questions = parse_markdown_exam(markdown)
+        _, peak = _peak(generate_qti_assessment, questions, "Memory", compact=True)
+        
+        _check('generate_compact', count, peak, record_property)
+    
+    def test_package(self, exam, record_property):
+        """Test peak memory of writing a QTI package."""
+        count, markdown = exam
+        questions = parse_markdown_exam(markdown)
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _, peak = _peak(create_qti_package, questions, os.path.join(tmpdir, "exam.zip"), "Memory")
+        
+        _check('package', count, peak, record_property)
+    
+    def test_stream(self, exam, record_property):
+        """Test that streaming markdown to a package uses constant memory."""
+        count, markdown = exam
+        lines = io.StringIO(markdown)
+        
+        written, peak = _peak(write_qti_package, iter_markdown_exam(lines), _NullStream(), "Memory")
+        
+        assert written == count
+        record_property('stream_peak_bytes', peak)
+        assert peak <= STREAM_BUDGET, (
+            f"streaming peaked at {peak} bytes for {count} questions (budget {STREAM_BUDGET})")
+    
+    def test_verify(self, exam, record_property):
+        """Test that verifying a package streams it in constant memory."""
+        count, markdown = exam
+        package = io.BytesIO()
+        write_qti_package(parse_markdown_exam(markdown), package, "Memory")
+        
+        problems, peak = _peak(verify_package, package, iter_markdown_exam(io.StringIO(markdown)))
+        
+        assert problems == []
+        record_property('verify_peak_bytes', peak)
+        assert peak <= VERIFY_BUDGET, (
+            f"verifying peaked at {peak} bytes for {count} questions (budget {VERIFY_BUDGET})")
+
+
+class _NullStream(io.RawIOBase):
+    """A non-seekable stream that discards what is written."""
+    
+    def writable(self):
+        return True
+    
+    def write(self, data):
+        return len(data)
+
@@ -2,7 +2,11 @@
 Tests for the markdown parser module.
 """
 import pytest
-from markdown_to_qti.parser import parse_markdown_exam, Question, Choice
+from dataclasses import asdict
+
+from markdown_to_qti.parser import (
+    iter_markdown_exam, parse_markdown_exam, Question, Choice, QuestionGroup, SourceSpan
+)
 
 
 class TestParseMarkdownExam:
@@ -33,7 +37,7 @@ class TestParseMarkdownExam:
         assert questions[0].choices[1].letter == "b"
         assert questions[0].choices[1].text == "4"
         assert questions[0].choices[1].is_correct
-
+    
     def test_multiple_questions(self):
         """Test parsing multiple questions."""
         markdown = """
@@ -52,7 +56,7 @@ class TestParseMarkdownExam:
         assert questions[0].correct_answer == "b"
         assert questions[1].number == 2
         assert questions[1].correct_answer == "a"
-
+    
     def test_question_with_code_block_in_stem(self):
         """Test parsing a question with a code block in the stem."""
         markdown = """
@@ -61,7 +65,7 @@ class TestParseMarkdownExam:
    ```python
    print("Hello")
    ```
-
+   
    a. Hello
    *b. "Hello"
    c. Error
@@ -73,7 +77,7 @@ class TestParseMarkdownExam:
         assert 'print("Hello")' in questions[0].stem
         assert "```" in questions[0].stem
         assert len(questions[0].choices) == 3
-
+    
     def test_question_with_code_block_in_choice(self):
         """Test parsing a question with code blocks in choices."""
         markdown = """
@@ -95,7 +99,7 @@ class TestParseMarkdownExam:
         assert len(questions[0].choices) == 3
         assert "echo" in questions[0].choices[0].text
         assert questions[0].choices[1].is_correct
-
+    
     def test_question_with_code_block_on_separate_line_in_choice(self):
         """Test parsing a question with code blocks on separate lines in choices."""
         markdown = """
@@ -135,7 +139,7 @@ define my_function():
         assert "function my_function" in questions[0].choices[1].text
         assert "func my_function" in questions[0].choices[2].text
         assert "define my_function" in questions[0].choices[3].text
-
+    
     def test_question_with_code_block_inline_in_choice(self):
         """Test parsing choices where code block starts on same line as choice marker."""
         markdown = """
@@ -157,7 +161,7 @@ define my_function():
         assert questions[0].correct_answer == "a"
         assert "def foo" in questions[0].choices[0].text
         assert "function foo" in questions[0].choices[1].text
-
+    
     def test_question_with_inline_code(self):
         """Test parsing a question with inline code."""
         markdown = """
@@ -170,7 +174,7 @@ define my_function():
         
         assert len(questions) == 1
         assert "`len([1,2,3])`" in questions[0].stem
-
+    
     def test_multiline_question_stem(self):
         """Test parsing a question with a multiline stem."""
         markdown = """
@@ -186,7 +190,7 @@ define my_function():
         assert len(questions) == 1
         assert "Consider the following scenario:" in questions[0].stem
         assert "A user wants to sort a list." in questions[0].stem
-
+    
     def test_no_correct_answer_marked(self):
         """Test parsing when no correct answer is marked."""
         markdown = """
@@ -198,12 +202,12 @@ define my_function():
         
         assert len(questions) == 1
         assert questions[0].correct_answer is None
-
+    
     def test_empty_input(self):
         """Test parsing empty input."""
         questions = parse_markdown_exam("")
         assert len(questions) == 0
-
+    
     def test_no_questions_found(self):
         """Test input without properly formatted questions."""
         markdown = "This is just some text without any questions."
@@ -249,3 +253,217 @@ class TestChoiceDataclass:
         choice = Choice(letter="b", text="Another option")
         
         assert choice.is_correct is False
+
+
+class TestSourceSpans:
+    """Tests for source positions recorded by the parser."""
+    
+    def test_question_and_choice_spans(self):
+        """Test that questions and choices record line/column spans."""
+        markdown = """# Quiz
+
+1. What is 2 + 2?
+   a. 3
+   *b. 4
+"""
+        questions = parse_markdown_exam(markdown)
+        
+        assert questions[0].span == SourceSpan(2, 0, 4, 8)
+        assert questions[0].choices[0].span == SourceSpan(3, 3, 3, 7)
+        assert questions[0].choices[1].span == SourceSpan(4, 3, 4, 8)
+    
+    def test_multiline_choice_span(self):
+        """Test that a choice span ends on its last non-blank line."""
+        markdown = """1. Pick one
+*a. ```python
+    pass
+    ```
+
+b. other
+"""
+        questions = parse_markdown_exam(markdown)
+        
+        assert questions[0].choices[0].span == SourceSpan(1, 0, 3, 7)
+        assert questions[0].choices[1].span == SourceSpan(5, 0, 5, 8)
+    
+    def test_spans_ignored_in_equality(self):
+        """Test that spans do not affect question equality."""
+        questions = parse_markdown_exam("1. Q\n*a. A\n")
+        expected = Question(
+            number=1,
+            stem="Q",
+            choices=[Choice(letter="a", text="A", is_correct=True)],
+            correct_answer="a"
+        )
+        
+        assert questions[0] == expected
+
+
+GROUPED_EXAM = """1. Ungrouped
+   *a. A
+
+## Group: Loops (pick 1, 2.5 points)
+
+2. First loop question
+   *a. A
+   b. B
+3. Second loop question
+   *a. A
+
+## End group
+
+4. Ungrouped again
+   *a. A
+"""
+
+
+CODE_HEADING_EXAM = """1. What does this print?
+
+```python
+rows = [1, 2, 3]
+## group the rows
+print(len(rows))
+```
+
+a. 1
+*b. 3
+
+2. Which keyword defines a function?
+a. fun
+*b. def
+"""
+
+
+class TestQuestionGroups:
+    """Tests for question group headings."""
+    
+    def test_group_membership(self):
+        """Test that questions between headings share a group."""
+        questions = parse_markdown_exam(GROUPED_EXAM)
+        
+        assert [q.group is None for q in questions] == [True, False, False, True]
+        assert questions[1].group is questions[2].group
+        assert questions[1].group == QuestionGroup(title="Loops", pick=1, points=2.5)
+    
+    def test_heading_ends_question(self):
+        """Test that a heading is not part of the previous question's text."""
+        questions = parse_markdown_exam(GROUPED_EXAM)
+        
+        assert questions[0].choices[0].text == "A"
+        assert questions[2].choices[0].text == "A"
+        assert questions[2].span == SourceSpan(8, 0, 9, 8)
+    
+    @pytest.mark.parametrize('heading, expected', [
+        ("## Group", QuestionGroup("Group 1")),
+        ("## group: Recursion", QuestionGroup("Recursion")),
+        ("## Group: Sets (pick 2)", QuestionGroup("Sets", pick=2)),
+        ("## Group: Sets (3 points each, pick 1)", QuestionGroup("Sets", pick=1, points=3.0)),
+        ("## Group: Sets (advanced)", QuestionGroup("Sets (advanced)")),
+    ])
+    def test_heading_options(self, heading, expected):
+        """Test titles and the pick and points options."""
+        markdown = f"{heading}\n1. Q\n*a. A\n2. R\n*a. B\n3. S\n*a. C\n"
+        
+        assert parse_markdown_exam(markdown)[0].group == expected
+    
+    def test_next_heading_starts_new_group(self):
+        """Test that consecutive groups are separate."""
+        markdown = "## Group\n1. Q\n*a. A\n## Group\n2. R\n*a. B\n"
+        questions = parse_markdown_exam(markdown)
+        
+        assert questions[0].group is not questions[1].group
+        assert questions[1].group.title == "Group 2"
+    
+    def test_heading_in_code_block_is_code(self):
+        """Test that a heading-like line in fenced code is part of the question."""
+        questions = parse_markdown_exam(CODE_HEADING_EXAM)
+        
+        assert [q.number for q in questions] == [1, 2]
+        assert [q.group for q in questions] == [None, None]
+        assert "## group the rows" in questions[0].stem
+        assert questions[0].correct_answer == 'b'
+    
+    @pytest.mark.parametrize('pick', [0, 3])
+    def test_pick_must_fit_group(self, pick):
+        """Test that a group can't pick more questions than it has, or none."""
+        markdown = f"## Group: G (pick {pick})\n1. Q\n*a. A\n2. R\n*a. B\n"
+        
+        with pytest.raises(ValueError, match="picks"):
+            parse_markdown_exam(markdown)
+
+
+class TestQuestionMetadata:
+    """Tests for tags and Bloom levels in metadata comments."""
+    
+    def test_tags_and_bloom(self):
+        """Test that a metadata comment sets tags and the Bloom level."""
+        questions = parse_markdown_exam(
+            "1. Q\n<!-- tags: loops, recursion; bloom: Apply -->\n*a. A\nb. B\n")
+        
+        assert questions[0].stem == "Q"
+        assert questions[0].tags == ['loops', 'recursion']
+        assert questions[0].bloom == 'apply'
+    
+    def test_metadata_among_choices(self):
+        """Test that metadata after the choices is not part of the last choice."""
+        questions = parse_markdown_exam(
+            "1. Q\n<!-- tags: a, b -->\n*a. A\nb. B\n  <!-- tags: b, c -->\n")
+        
+        assert questions[0].choices[1].text == "B"
+        assert questions[0].tags == ['a', 'b', 'c']
+    
+    def test_other_comments_are_text(self):
+        """Test that comments without metadata keys stay in the stem."""
+        questions = parse_markdown_exam("1. Q\n<!-- note: check -->\n*a. A\n")
+        
+        assert questions[0].stem == "Q\n<!-- note: check -->"
+        assert questions[0].tags == []
+    
+    def test_metadata_in_code_block(self):
+        """Test that metadata comments inside code blocks are code."""
+        questions = parse_markdown_exam("1. Q\n```\n<!-- tags: x -->\n```\n*a. A\n")
+        
+        assert "<!-- tags: x -->" in questions[0].stem
+        assert questions[0].tags == []
+
+
+class TestIterMarkdownExam:
+    """Tests for parsing an exam as it is read."""
+    
+    @pytest.mark.parametrize('markdown', [
+        GROUPED_EXAM,
+        "# Title\n\n1. Q\n```\n2. not a question? it is\n```\n*a. A\n12.",
+        "1. Q\n*a. A\n## Group: G (pick 1)\n## Group: H\n2. R\n*a. B\n",
+        CODE_HEADING_EXAM,
+        "1. Q\n```\n## Group: G\n2. R\n*a. A\n## Group: H\n3. S\n*a. B\n",
+    ])
+    def test_matches_parse_markdown_exam(self, markdown):
+        """Test that streaming gives the same questions, spans and groups."""
+        expected = [asdict(q) for q in parse_markdown_exam(markdown)]
+        
+        assert [asdict(q) for q in iter_markdown_exam(markdown.splitlines(True))] == expected
+    
+    def test_questions_yielded_as_input_arrives(self):
+        """Test that a question is yielded before later input is read."""
+        read = []
+        
+        def lines():
+            for line in GROUPED_EXAM.splitlines(True):
+                read.append(line)
+                yield line
+        
+        questions = iter_markdown_exam(lines())
+        first = next(questions)
+        
+        assert first.stem == "Ungrouped"
+        assert len(read) < len(GROUPED_EXAM.splitlines())
+    
+    def test_group_pick_checked_when_group_ends(self):
+        """Test that an oversized pick raises once its group is complete."""
+        markdown = "## Group: G (pick 3)\n1. Q\n*a. A\n## End group\n2. R\n*a. B\n"
+        questions = iter_markdown_exam(markdown.splitlines(True))
+        
+        assert next(questions).number == 1
+        with pytest.raises(ValueError, match="picks 3 of 1"):
+            next(questions)
+
@@ -0,0 +1,135 @@
+"""
+Tests for the plugin registries.
+"""
+import io
+import sys
+from importlib.metadata import EntryPoint
+from unittest.mock import patch
+from xml.etree.ElementTree import Element
+
+import pytest
+
+from markdown_to_qti import plugins
+from markdown_to_qti.cli import main
+from markdown_to_qti.parser import parse_markdown_exam
+from markdown_to_qti.plugins import PluginRegistry
+from markdown_to_qti.qti_generator import generate_qti_assessment
+
+
+def _emit_title_only(question, render):
+    """An item emitter that writes only the rendered stem."""
+    item = Element('item')
+    item.set('title', render(question.stem))
+    return item
+
+
+@pytest.fixture
+def installed(monkeypatch):
+    """Install fake entry points into the global registries."""
+    entry_points = {
+        'markdown_to_qti.renderers': [
+            EntryPoint('escape', 'html:escape', 'markdown_to_qti.renderers'),
+            EntryPoint('broken', 'no_such_module_for_tests:render', 'markdown_to_qti.renderers'),
+            EntryPoint('markdown', 'html:escape', 'markdown_to_qti.renderers'),
+        ],
+        'markdown_to_qti.item_emitters': [
+            EntryPoint('title', f'{__name__}:_emit_title_only', 'markdown_to_qti.item_emitters'),
+        ],
+    }
+    monkeypatch.setattr(plugins, '_entry_points', lambda group: entry_points.get(group, []))
+    for registry in plugins.REGISTRIES:
+        monkeypatch.setattr(registry, '_entry_points', None)
+        monkeypatch.setattr(registry, '_loaded', {})
+
+
+class TestPluginRegistry:
+    """Tests for the PluginRegistry class."""
+    
+    def test_builtins_skip_metadata(self, monkeypatch):
+        """Test that built-ins load without reading installed metadata."""
+        def fail(group):
+            raise AssertionError("metadata was read")
+        monkeypatch.setattr(plugins, '_entry_points', fail)
+        registry = PluginRegistry('group', 'renderer', {'escape': 'html:escape'})
+        
+        from html import escape
+        assert registry.load('escape') is escape
+    
+    def test_builtin_emitters_are_public(self):
+        """Test that the built-in item emitters are public functions."""
+        from markdown_to_qti import qti21, qti_generator
+        assert plugins.get_emitter('qti12') is qti_generator.create_question_item
+        assert plugins.get_emitter('qti21') is qti21.create_assessment_item
+    
+    def test_lists_plugins_without_importing(self, installed):
+        """Test that plugins are listed from metadata without importing them."""
+        assert plugins.RENDERERS.names() == ['markdown', 'broken', 'escape']
+        assert 'no_such_module_for_tests' not in sys.modules
+    
+    def test_plugin_cannot_replace_builtin(self, installed):
+        """Test that a plugin with a built-in's name is ignored."""
+        from markdown_to_qti.renderer import markdown_to_html
+        assert plugins.get_renderer('markdown') is markdown_to_html
+    
+    def test_unknown_plugin(self, installed):
+        """Test that an unknown name lists the available plugins."""
+        with pytest.raises(ValueError, match=r"Unknown renderer 'nope' \(available: markdown, "):
+            plugins.get_renderer('nope')
+    
+    def test_broken_plugin(self, installed):
+        """Test that a plugin that fails to import raises ValueError."""
+        with pytest.raises(ValueError, match="Could not load renderer 'broken'"):
+            plugins.get_renderer('broken')
+
+
+class TestSelectedPlugins:
+    """Tests for converting with selected plugins."""
+    
+    def test_renderer(self, installed):
+        """Test that a renderer plugin renders the stems and choices."""
+        xml_output = generate_qti_assessment(
+            parse_markdown_exam("1. Use **bold**\n*a. <b>\n"), renderer='escape')
+        
+        assert 'Use **bold**' in xml_output
+        assert '&amp;lt;b&amp;gt;' in xml_output
+        assert '<strong>' not in xml_output
+    
+    def test_emitter(self, installed):
+        """Test that an item emitter plugin builds the items."""
+        xml_output = generate_qti_assessment(
+            parse_markdown_exam("1. Use **bold**\n*a. A\n"), emitter='title')
+        
+        assert '<item title="Use &lt;strong&gt;bold&lt;/strong&gt;"/>' in xml_output
+    
+    def test_cli_options(self, installed, tmp_path):
+        """Test selecting plugins on the command line."""
+        input_path = tmp_path / "test.md"
+        input_path.write_text("1. Use **bold**\n*a. A\n")
+        stdout = io.StringIO()
+        
+        with patch.object(sys, 'argv', ['markdown-to-qti', str(input_path), '--xml-only',
+                                        '--renderer', 'escape']), \
+                patch.object(sys, 'stdout', stdout):
+            main()
+        
+        assert 'Use **bold**' in stdout.getvalue()
+    
+    def test_cli_unknown_plugin(self, installed, tmp_path, capsys):
+        """Test that an unknown plugin name is reported as an error."""
+        input_path = tmp_path / "test.md"
+        input_path.write_text("1. Q\n*a. A\n")
+        
+        with patch.object(sys, 'argv', ['markdown-to-qti', str(input_path), '--format', 'qti99']):
+            with pytest.raises(SystemExit) as excinfo:
+                main()
+        
+        assert excinfo.value.code == 1
+        assert "Unknown package writer 'qti99'" in capsys.readouterr().err
+    
+    def test_plugins_command(self, installed, capsys):
+        """Test that the plugins command lists every registry."""
+        assert plugins.main([]) == 0
+        
+        output = capsys.readouterr().out
+        assert "  markdown (built-in)\n  broken\n  escape\n" in output
+        assert "  title\n" in output
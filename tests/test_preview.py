@@ -0,0 +1,161 @@
+"""
+Tests for the HTML preview module.
+"""
+import json
+import threading
+import urllib.request
+
+import pytest
+
+from markdown_to_qti import preview
+from markdown_to_qti.preview import ExamPreview, PreviewServer, main
+
+EXAM = """
+1. What does `len("abc")` return?
+<!-- tags: strings; bloom: remember -->
+a. 2
+*b. 3
+c. 4
+
+## Group: Loops (pick 1, 2 points)
+
+2. First <loop> question
+*a. A
+b. B
+
+3. Second loop question
+a. A
+*b. B
+
+## End group
+
+4. Unanswered question
+a. A
+b. B
+"""
+
+
+@pytest.fixture
+def parse_calls(monkeypatch):
+    """Count the question blocks parsed by the preview."""
+    calls = []
+    original = preview.parse_markdown_exam
+    
+    def counting(text):
+        calls.append(text)
+        return original(text)
+    monkeypatch.setattr(preview, 'parse_markdown_exam', counting)
+    return calls
+
+
+class TestExamPreview:
+    """Tests for the ExamPreview class."""
+    
+    def test_page(self):
+        """Test the questions, answers and groups on the page."""
+        page = ExamPreview("Quiz <1>").render(EXAM)
+        
+        assert page.startswith('<!DOCTYPE html>')
+        assert '<title>Quiz &lt;1&gt;</title>' in page
+        assert '<p class="summary">4 question(s)</p>' in page
+        assert '<li class="correct"><span class="letter">b.</span><div>3</div></li>' in page
+        assert '<code>len(&quot;abc&quot;)</code>' in page
+        assert '<span class="badge">strings</span><span class="badge bloom">remember</span>' in page
+        assert '<h2>Loops <span>(pick 1 of 2)</span></h2>' in page
+        assert page.count('2 points</span>') == 2
+        assert 'First &lt;loop&gt; question' in page
+        assert 'No correct answer is marked.' in page
+        assert '<script>' not in page
+    
+    def test_live_page_has_script(self):
+        """Test that the live-reload script is only added for the server."""
+        page = ExamPreview().render(EXAM, live_version=3)
+        
+        assert 'var version = 3;' in page
+    
+    def test_group_problems(self):
+        """Test that a group picking too many questions is reported on the page."""
+        page = ExamPreview().render(EXAM.replace('pick 1', 'pick 3'))
+        
+        assert '<ul class="problems"><li>Group &#x27;Loops&#x27; picks 3 of 2 question(s)</li></ul>' in page
+    
+    def test_only_changed_questions_are_rendered(self, parse_calls):
+        """Test that a refresh parses only the blocks that changed."""
+        exam_preview = ExamPreview()
+        first = exam_preview.render_content(EXAM)
+        assert len(parse_calls) == 4
+        
+        second = exam_preview.render_content(EXAM.replace('Second loop', 'Other loop'))
+        
+        assert len(parse_calls) == 5
+        assert 'Other loop question' in second
+        assert first.replace('Second loop', 'Other loop') == second
+    
+    def test_group_change_rerenders_its_questions(self, parse_calls):
+        """Test that changing a group's points renders its questions again."""
+        exam_preview = ExamPreview()
+        exam_preview.render_content(EXAM)
+        
+        content = exam_preview.render_content(EXAM.replace('2 points', '3 points'))
+        
+        assert len(parse_calls) == 6
+        assert content.count('3 points</span>') == 2
+
+
+class TestPreviewServer:
+    """Tests for the live-reload server."""
+    
+    def test_serves_updates(self, tmp_path):
+        """Test that the page is served and updates reach waiting clients."""
+        path = tmp_path / "exam.md"
+        path.write_text(EXAM)
+        server = PreviewServer(str(path), "Quiz", port=0, interval=60)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            with urllib.request.urlopen(server.url) as response:
+                page = response.read().decode('utf-8')
+            assert 'var version = 1;' in page
+            assert 'Second loop question' in page
+            
+            path.write_text(EXAM.replace('Second loop', 'Changed loop'))
+            assert server.refresh()
+            assert not server.refresh()
+            
+            with urllib.request.urlopen(server.url + 'content?version=1') as response:
+                data = json.loads(response.read().decode('utf-8'))
+            assert data['version'] == 2
+            assert 'Changed loop question' in data['html']
+        finally:
+            server.shutdown()
+            thread.join()
+    
+    def test_missing_file(self, tmp_path):
+        """Test that an unreadable file is shown as a problem."""
+        path = tmp_path / "exam.md"
+        path.write_text(EXAM)
+        server = PreviewServer(str(path), port=0)
+        path.unlink()
+        
+        assert server.refresh()
+        assert 'class="problems"' in server.content
+        server.httpd.server_close()
+
+
+class TestPreviewCommand:
+    """Tests for the preview command."""
+    
+    def test_writes_html(self, tmp_path, capsys):
+        """Test that the page is written next to the input by default."""
+        path = tmp_path / "exam.md"
+        path.write_text(EXAM)
+        
+        assert main([str(path)]) == 0
+        
+        page = (tmp_path / "exam.html").read_text(encoding='utf-8')
+        assert '<title>exam.md</title>' in page
+        assert "Preview created" in capsys.readouterr().err
+    
+    def test_missing_input(self, tmp_path):
+        """Test that a missing input file is an error."""
+        assert main([str(tmp_path / "missing.md")]) == 1
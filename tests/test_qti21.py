@@ -0,0 +1,216 @@
+"""
+Tests for the QTI 2.1 generator module.
+"""
+import io
+import itertools
+import zipfile
+from xml.etree import ElementTree
+
+import pytest
+
+from markdown_to_qti import qti21, qti_generator
+from markdown_to_qti.parser import Choice, Question, QuestionGroup
+from markdown_to_qti.qti21 import create_qti21_package, generate_qti21_manifest, write_qti21_package
+
+QTI = '{http://www.imsglobal.org/xsd/imsqti_v2p1}'
+CP = '{http://www.imsglobal.org/xsd/imscp_v1p1}'
+MATHML = '{http://www.w3.org/1998/Math/MathML}'
+
+
+def _questions():
+    loops = QuestionGroup(title="Loops", pick=1, points=2)
+    return [
+        Question(
+            number=1,
+            stem="What does this print?\n\n```python\nif a < b:\n    print('&')\n```",
+            choices=[
+                Choice(letter="a", text="`&`", is_correct=True),
+                Choice(letter="b", text="**Nothing**", is_correct=False),
+            ],
+            correct_answer="a"
+        ),
+        Question(
+            number=2,
+            stem="Solve $x^2 = 4$",
+            choices=[
+                Choice(letter="a", text="$x = 2$", is_correct=False),
+                Choice(letter="b", text="$x = \\pm 2$", is_correct=True),
+            ],
+            correct_answer="b",
+            group=loops
+        ),
+        Question(
+            number=3,
+            stem="Unanswered",
+            choices=[Choice(letter="a", text="A", is_correct=False)],
+            correct_answer=None,
+            group=loops
+        ),
+    ]
+
+
+def _item(question, compact=False):
+    _, xml = qti21.render_item(question, compact)
+    return ElementTree.fromstring(xml)
+
+
+def _canonical(elem):
+    """Return a comparable form of an element tree, ignoring indentation."""
+    text = elem.text if elem.text and elem.text.strip() else None
+    tail = elem.tail if elem.tail and elem.tail.strip() else None
+    return (elem.tag, sorted(elem.attrib.items()), text, tail, [_canonical(child) for child in elem])
+
+
+def _read_package(data):
+    """Return the manifest, test and items of a QTI 2.1 package."""
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
+        manifest = ElementTree.fromstring(zf.read('imsmanifest.xml'))
+        resources = manifest.findall(f'{CP}resources/{CP}resource')
+        test = ElementTree.fromstring(zf.read(resources[0].get('href')))
+        items = [ElementTree.fromstring(zf.read(resource.get('href')))
+                 for resource in resources[1:]]
+    return manifest, test, items
+
+
+class TestAssessmentItem:
+    """Tests for QTI 2.1 assessment items."""
+    
+    def test_correct_response_is_a_choice(self):
+        """Test that the correct response identifies one of the choices."""
+        item = _item(_questions()[0])
+        
+        correct = item.find(f'{QTI}responseDeclaration/{QTI}correctResponse/{QTI}value').text
+        choices = [choice.get('identifier') for choice in item.iter(f'{QTI}simpleChoice')]
+        assert correct == f"{item.get('identifier')}_a"
+        assert choices == [f"{item.get('identifier')}_a", f"{item.get('identifier')}_b"]
+        assert item.find(f'{QTI}responseProcessing') is not None
+    
+    def test_html_is_markup(self):
+        """Test that rendered HTML is written as elements, keeping code verbatim."""
+        item = _item(_questions()[0])
+        
+        stem = item.find(f'{QTI}itemBody/{QTI}div')
+        assert stem.text == "What does this print?"
+        code = stem.find(f'{QTI}pre/{QTI}code')
+        assert code.text == "if a < b:\n    print('&')"
+        assert item.find(f'.//{QTI}simpleChoice/{QTI}code').text == '&'
+        assert item.find(f'.//{QTI}simpleChoice/{QTI}strong').text == 'Nothing'
+    
+    def test_math_keeps_its_namespace(self):
+        """Test that MathML stays in the MathML namespace."""
+        item = _item(_questions()[1])
+        
+        stem = item.find(f'{QTI}itemBody/{QTI}div')
+        assert stem.text == "Solve "
+        assert stem.find(f'{MATHML}math') is not None
+        assert len(item.findall(f'.//{QTI}simpleChoice/{MATHML}math')) == 2
+    
+    def test_points(self):
+        """Test that the item's maximum score is its group's points."""
+        for question, points in zip(_questions(), ['1', '2']):
+            item = _item(question)
+            for outcome in item.findall(f'{QTI}outcomeDeclaration'):
+                if outcome.get('identifier') == 'MAXSCORE':
+                    assert outcome.find(f'{QTI}defaultValue/{QTI}value').text == points
+    
+    def test_no_correct_answer(self):
+        """Test that an item without a correct answer has no scoring."""
+        item = _item(_questions()[2])
+        
+        assert item.find(f'{QTI}responseDeclaration/{QTI}correctResponse') is None
+        assert item.find(f'{QTI}responseProcessing') is None
+    
+    def test_compact_matches_pretty(self, monkeypatch):
+        """Test that compact items parse to the same document as pretty items."""
+        def render(compact):
+            counter = itertools.count()
+            monkeypatch.setattr(qti21, 'generate_identifier', lambda: f"g{next(counter):024x}")
+            return [_item(question, compact) for question in _questions()]
+        
+        pretty = render(False)
+        compact = render(True)
+        
+        assert [_canonical(item) for item in compact] == [_canonical(item) for item in pretty]
+    
+    def test_uses_prerendered_html(self):
+        """Test that HTML stored on a question is used instead of rendering again."""
+        question = _questions()[0]
+        question.stem_html = '<em>Stored</em>'
+        
+        item = _item(question)
+        
+        assert item.find(f'{QTI}itemBody/{QTI}div/{QTI}em').text == 'Stored'
+    
+    def test_malformed_html(self):
+        """Test that HTML that is not well-formed XML is reported."""
+        question = _questions()[0]
+        question.stem_html = 'One<br>Two'
+        
+        with pytest.raises(ValueError, match="well-formed XHTML"):
+            _item(question)
+
+
+class TestQti21Package:
+    """Tests for QTI 2.1 packages."""
+    
+    def test_package(self):
+        """Test that the manifest and test refer to every item."""
+        output = io.BytesIO()
+        count = write_qti21_package(_questions(), output, "Quiz")
+        
+        manifest, test, items = _read_package(output.getvalue())
+        assert count == 3
+        assert len(items) == 3
+        item_ids = [item.get('identifier') for item in items]
+        dependencies = manifest.findall(f'{CP}resources/{CP}resource/{CP}dependency')
+        assert [dependency.get('identifierref') for dependency in dependencies] == item_ids
+        
+        assert test.get('title') == "Quiz"
+        root_section = test.find(f'{QTI}testPart/{QTI}assessmentSection')
+        refs = [ref.get('identifier') for ref in root_section.iter(f'{QTI}assessmentItemRef')]
+        assert refs == item_ids
+    
+    def test_group_section(self):
+        """Test that a question group is a nested section with a selection."""
+        output = io.BytesIO()
+        write_qti21_package(_questions(), output)
+        
+        _, test, _ = _read_package(output.getvalue())
+        root_section = test.find(f'{QTI}testPart/{QTI}assessmentSection')
+        assert len(root_section.findall(f'{QTI}assessmentItemRef')) == 1
+        group = root_section.find(f'{QTI}assessmentSection')
+        assert group.get('title') == "Loops"
+        assert group.find(f'{QTI}selection').get('select') == '1'
+        assert len(group.findall(f'{QTI}assessmentItemRef')) == 2
+    
+    @pytest.mark.parametrize('workers', [1, 2])
+    def test_create_package(self, tmp_path, workers):
+        """Test that a package path without a suffix gets .zip."""
+        path = create_qti21_package(_questions() * 2, str(tmp_path / "exam"), workers=workers)
+        
+        assert path == str(tmp_path / "exam.zip")
+        with open(path, 'rb') as f:
+            _, _, items = _read_package(f.read())
+        titles = [item.get('title') for item in items]
+        assert titles == ["Question 1", "Question 2", "Question 3"] * 2
+    
+    def test_compact_manifest(self):
+        """Test that the compact manifest matches the pretty manifest."""
+        pretty = generate_qti21_manifest("test_id", ["item1", "item2"])
+        compact = generate_qti21_manifest("test_id", ["item1", "item2"], compact=True)
+        
+        assert _canonical(ElementTree.fromstring(compact)) == _canonical(ElementTree.fromstring(pretty))
+        assert "\n" not in compact
+    
+    def test_same_html_as_qti12(self):
+        """Test that both formats hold the same rendered HTML."""
+        questions = qti_generator.prerender_html(_questions())
+        output = io.BytesIO()
+        write_qti21_package(questions, output)
+        qti12 = qti_generator.generate_qti_assessment(questions, compact=True)
+        
+        _, _, items = _read_package(output.getvalue())
+        stem = items[0].find(f'{QTI}itemBody/{QTI}div')
+        assert questions[0].stem_html.startswith(stem.text)
+        assert qti_generator._cdata(questions[0].stem_html) in qti12
@@ -1,17 +1,25 @@
 """
 Tests for the QTI generator module.
 """
+import io
+import itertools
 import os
+import random
+import re
 import tempfile
 import zipfile
 import pytest
 from xml.etree import ElementTree
 
-from markdown_to_qti.parser import Question, Choice
+from markdown_to_qti import qti_generator
+from markdown_to_qti.parser import Question, Choice, QuestionGroup
 from markdown_to_qti.qti_generator import (
     generate_qti_assessment,
     generate_qti_manifest,
     create_qti_package,
+    iter_qti_assessment,
+    write_qti_package,
+    _MeasuredEntry,
     _markdown_to_html,
 )
 
@@ -261,3 +269,314 @@ class TestCreateQtiPackage:
             
             assert result_path.endswith('.zip')
             assert os.path.exists(result_path)
+
+
+def _normalize_identifiers(xml_output):
+    """Replace generated identifiers with stable placeholders in order of appearance."""
+    seen = {}
+    
+    def replace(match):
+        return seen.setdefault(match.group(0), f"ID{len(seen)}")
+    
+    return re.sub(r'g[0-9a-f]{24}', replace, xml_output)
+
+
+class TestParallelRendering:
+    """Tests for rendering question items in a process pool."""
+    
+    def _questions(self, count):
+        return [
+            Question(
+                number=i,
+                stem=f"Question {i}\n\n```python\nprint({i})\n```",
+                choices=[
+                    Choice(letter="a", text=f"`{i}`", is_correct=True),
+                    Choice(letter="b", text="Error", is_correct=False),
+                ],
+                correct_answer="a"
+            )
+            for i in range(1, count + 1)
+        ]
+    
+    def test_parallel_output_matches_serial(self):
+        """Test that parallel rendering produces the same document as serial rendering."""
+        questions = self._questions(25)
+        
+        serial = generate_qti_assessment(questions, "Test", "assessment1")
+        parallel = generate_qti_assessment(questions, "Test", "assessment1", workers=2, chunk_size=4)
+        
+        assert _normalize_identifiers(parallel) == _normalize_identifiers(serial)
+    
+    def test_parallel_preserves_question_order(self):
+        """Test that items are reassembled in their original order."""
+        questions = self._questions(10)
+        
+        xml_output = generate_qti_assessment(questions, "Test", workers=3, chunk_size=1)
+        root = ElementTree.fromstring(xml_output)
+        
+        items = root.findall('.//{http://www.imsglobal.org/xsd/ims_qtiasiv1p2}item')
+        assert [item.get('title') for item in items] == [f"Question {i}" for i in range(1, 11)]
+    
+    def test_create_package_with_workers(self):
+        """Test that a package can be created with several workers."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_path = os.path.join(tmpdir, "test_output.zip")
+            result_path = create_qti_package(self._questions(5), output_path, "Test", workers=2)
+            
+            assert os.path.exists(result_path)
+
+
+def _canonical(elem):
+    """Reduce an element to a comparable form, ignoring formatting whitespace."""
+    text = elem.text or ''
+    if len(elem):
+        text = text.strip()
+    return (elem.tag, dict(elem.attrib), text, [_canonical(child) for child in elem])
+
+
+class TestCompactOutput:
+    """Tests for compact XML output with CDATA-wrapped HTML."""
+    
+    def _questions(self):
+        return [
+            Question(
+                number=1,
+                stem="What does this print?\n\n```python\nprint('<a> & ]]>')\n```",
+                choices=[
+                    Choice(letter="a", text="`<a> & ]]>`", is_correct=True),
+                    Choice(letter="b", text="Nothing", is_correct=False),
+                ],
+                correct_answer="a"
+            ),
+            Question(
+                number=2,
+                stem='Title with "quotes"\nand a second line',
+                choices=[Choice(letter="a", text="A", is_correct=False)],
+                correct_answer=None
+            ),
+        ]
+    
+    def _generate(self, monkeypatch, **kwargs):
+        counter = itertools.count()
+        monkeypatch.setattr(qti_generator, 'generate_identifier', lambda: f"g{next(counter):024x}")
+        return generate_qti_assessment(self._questions(), 'Quiz "<1>"', "assessment1", **kwargs)
+    
+    def test_semantically_equivalent_to_pretty_output(self, monkeypatch):
+        """Test that compact output parses to the same document as pretty output."""
+        pretty = self._generate(monkeypatch)
+        compact = self._generate(monkeypatch, compact=True)
+        
+        assert _canonical(ElementTree.fromstring(compact)) == _canonical(ElementTree.fromstring(pretty))
+    
+    def test_html_in_cdata(self):
+        """Test that mattext HTML is written as CDATA instead of escaped text."""
+        xml_output = generate_qti_assessment(self._questions(), "Test", compact=True)
+        
+        assert '<mattext texttype="text/html"><![CDATA[What does this print?' in xml_output
+        assert '<pre><code class="language-python">' in xml_output
+        assert "&lt;pre&gt;" not in xml_output
+    
+    def test_compact_is_smaller(self):
+        """Test that compact output is smaller than pretty output."""
+        pretty = generate_qti_assessment(self._questions(), "Test")
+        compact = generate_qti_assessment(self._questions(), "Test", compact=True)
+        
+        assert len(compact) < len(pretty)
+    
+    def test_parallel_compact_matches_serial(self):
+        """Test that compact output is the same with several workers."""
+        questions = self._questions() * 5
+        
+        serial = generate_qti_assessment(questions, "Test", "assessment1", compact=True)
+        parallel = generate_qti_assessment(questions, "Test", "assessment1", workers=2, compact=True)
+        
+        assert _normalize_identifiers(parallel) == _normalize_identifiers(serial)
+    
+    def test_compact_manifest(self):
+        """Test that the compact manifest matches the pretty manifest."""
+        pretty = generate_qti_manifest("test_id", "Test")
+        compact = generate_qti_manifest("test_id", "Test", compact=True)
+        
+        assert _canonical(ElementTree.fromstring(compact)) == _canonical(ElementTree.fromstring(pretty))
+        assert "\n" not in compact
+
+
+QTI = '{http://www.imsglobal.org/xsd/ims_qtiasiv1p2}'
+
+
+def _points(item):
+    """Return the points_possible metadata of an item."""
+    for field in item.iter(f'{QTI}qtimetadatafield'):
+        if field.find(f'{QTI}fieldlabel').text == 'points_possible':
+            return field.find(f'{QTI}fieldentry').text
+
+
+class TestQuestionGroups:
+    """Tests for question groups drawn by Canvas at delivery time."""
+    
+    def _questions(self):
+        loops = QuestionGroup(title="Loops", pick=2, points=1.5)
+        sets = QuestionGroup(title="Sets")
+        groups = [None, loops, loops, loops, None, sets]
+        return [
+            Question(
+                number=i,
+                stem=f"Question {i}",
+                choices=[Choice(letter="a", text="A", is_correct=True)],
+                correct_answer="a",
+                group=group
+            )
+            for i, group in enumerate(groups, 1)
+        ]
+    
+    def test_group_sections(self):
+        """Test that grouped items are nested in sections with a selection."""
+        xml_output = generate_qti_assessment(self._questions(), "Test")
+        root = ElementTree.fromstring(xml_output)
+        
+        root_section = root.find(f'{QTI}assessment/{QTI}section')
+        children = [(child.tag.replace(QTI, ''), child.get('title')) for child in root_section]
+        assert children == [
+            ('item', 'Question 1'), ('section', 'Loops'), ('item', 'Question 5'), ('section', 'Sets'),
+        ]
+        
+        loops = root_section.findall(f'{QTI}section')[0]
+        assert loops.findtext(f'{QTI}selection_ordering/{QTI}selection/{QTI}selection_number') == '2'
+        assert loops.findtext(f'.//{QTI}points_per_item') == '1.5'
+        assert [item.get('title') for item in loops.findall(f'{QTI}item')] == [
+            'Question 2', 'Question 3', 'Question 4']
+        
+        sets = root_section.findall(f'{QTI}section')[1]
+        assert sets.findtext(f'.//{QTI}selection_number') == '1'
+        assert sets.findtext(f'.//{QTI}points_per_item') == '1'
+    
+    def test_item_points(self):
+        """Test that grouped items carry the group's points."""
+        root = ElementTree.fromstring(generate_qti_assessment(self._questions(), "Test"))
+        
+        points = {item.get('title'): _points(item) for item in root.iter(f'{QTI}item')}
+        assert points['Question 1'] == '1'
+        assert points['Question 2'] == '1.5'
+        assert points['Question 6'] == '1'
+    
+    def test_grouped_items_are_indented(self):
+        """Test that pretty-printed items in groups are indented one level deeper."""
+        xml_output = generate_qti_assessment(self._questions(), "Test")
+        
+        item_lines = [line for line in xml_output.split('\n') if '<item ' in line]
+        assert [len(line) - len(line.lstrip()) for line in item_lines] == [6, 8, 8, 8, 6, 8]
+    
+    def test_compact_matches_pretty(self, monkeypatch):
+        """Test that compact grouped output is the same document."""
+        def generate(**kwargs):
+            counter = itertools.count()
+            monkeypatch.setattr(qti_generator, 'generate_identifier', lambda: f"g{next(counter):024x}")
+            return generate_qti_assessment(self._questions(), "Test", "assessment1", **kwargs)
+        
+        pretty = generate()
+        compact = generate(compact=True)
+        
+        assert _canonical(ElementTree.fromstring(compact)) == _canonical(ElementTree.fromstring(pretty))
+    
+    @pytest.mark.parametrize('compact', [False, True])
+    def test_parallel_matches_serial(self, compact):
+        """Test that grouped output is the same with several workers."""
+        questions = self._questions() * 3
+        
+        serial = generate_qti_assessment(questions, "Test", "assessment1", compact=compact)
+        parallel = generate_qti_assessment(
+            questions, "Test", "assessment1", workers=2, chunk_size=4, compact=compact)
+        
+        assert _normalize_identifiers(parallel) == _normalize_identifiers(serial)
+
+
+class _Unseekable(io.RawIOBase):
+    """A write-only stream that can't seek or tell, like a pipe."""
+    
+    def __init__(self):
+        self.data = bytearray()
+    
+    def writable(self):
+        return True
+    
+    def write(self, data):
+        self.data += data
+        return len(data)
+
+
+class TestStreamingOutput:
+    """Tests for generating output as questions arrive."""
+    
+    def _questions(self):
+        return TestQuestionGroups()._questions()
+    
+    def test_pieces_join_to_document(self, monkeypatch):
+        """Test that the streamed pieces are the generated document."""
+        def generate(function, **kwargs):
+            counter = itertools.count()
+            monkeypatch.setattr(qti_generator, 'generate_identifier', lambda: f"g{next(counter):024x}")
+            return function(self._questions(), "Test", "assessment1", **kwargs)
+        
+        for compact in (False, True):
+            pieces = generate(iter_qti_assessment, compact=compact)
+            assert ''.join(pieces) == generate(generate_qti_assessment, compact=compact)
+    
+    def test_questions_consumed_lazily(self):
+        """Test that the first item is produced before later questions are read."""
+        consumed = []
+        
+        def questions():
+            for question in self._questions()[:1] + self._questions()[4:5]:
+                consumed.append(question.number)
+                yield question
+        
+        pieces = iter_qti_assessment(questions(), "Test")
+        next(pieces)
+        item = next(pieces)
+        
+        assert 'title="Question 1"' in item
+        assert consumed == [1]
+    
+    def test_write_package_to_unseekable_stream(self):
+        """Test that a valid package is written to a stream that can't seek."""
+        stream = _Unseekable()
+        count = write_qti_package(iter(self._questions()), stream, "Test")
+        
+        assert count == 6
+        with zipfile.ZipFile(io.BytesIO(bytes(stream.data))) as zf:
+            assert zf.testzip() is None
+            names = zf.namelist()
+            assert names[0] == 'imsmanifest.xml'
+            root = ElementTree.fromstring(zf.read(names[1]))
+        assert len(root.findall(f'.//{QTI}item')) == 6
+    
+    def test_measured_entry_size(self):
+        """Test that a measured entry predicts its compressed size without changing it."""
+        rng = random.Random(5)
+        data = [f"<item ident=\"{rng.random()}\">{'x' * rng.randint(0, 300)}</item>\n".encode()
+                for _ in range(3000)]
+        
+        def write(measure):
+            output = io.BytesIO()
+            info = zipfile.ZipInfo('entry.xml', (2020, 1, 1, 0, 0, 0))
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with zipfile.ZipFile(output, 'w') as zf:
+                with zf.open(info, 'w') as entry:
+                    start = output.tell()
+                    stream = _MeasuredEntry(entry) if measure else entry
+                    predicted = []
+                    for index, line in enumerate(data):
+                        stream.write(line)
+                        if measure and index % 500 == 0:
+                            predicted.append(output.tell() - start + stream.held_bytes())
+                    if measure:
+                        assert stream.size == sum(map(len, data))
+                        predicted.append(output.tell() - start + stream.held_bytes())
+                compressed = zf.getinfo('entry.xml').compress_size
+            return output.getvalue(), predicted, compressed
+        
+        package, predicted, compressed = write(measure=True)
+        
+        assert predicted[-1] == compressed
+        assert predicted == sorted(predicted)
+        assert package == write(measure=False)[0]
@@ -0,0 +1,112 @@
+"""
+Tests for the markdown renderer module.
+"""
+import pytest
+
+from markdown_to_qti.renderer import markdown_to_html, render_inline
+
+
+class TestRenderInline:
+    """Tests for render_inline function."""
+    
+    def test_bold_and_italic(self):
+        """Test strong and emphasis with both delimiter characters."""
+        result = render_inline("**bold** __also__ *it* _em_")
+        assert result == "<strong>bold</strong> <strong>also</strong> <em>it</em> <em>em</em>"
+    
+    def test_nested_emphasis(self):
+        """Test that a triple delimiter produces nested tags."""
+        assert render_inline("***both***") == "<em><strong>both</strong></em>"
+    
+    def test_snake_case_is_not_emphasis(self):
+        """Test that underscores inside words are left alone."""
+        assert render_inline("use my_var_name here") == "use my_var_name here"
+    
+    def test_spaced_asterisks_are_literal(self):
+        """Test that arithmetic is not treated as emphasis."""
+        assert render_inline("2 * 3 * 4") == "2 * 3 * 4"
+    
+    def test_unclosed_emphasis_is_literal(self):
+        """Test that unmatched delimiters are kept as text."""
+        assert render_inline("**not closed") == "**not closed"
+    
+    def test_code_span_protects_markup(self):
+        """Test that markup inside code spans is not interpreted."""
+        assert render_inline("a `x *y* <z>` b") == "a <code>x *y* &lt;z&gt;</code> b"
+    
+    def test_double_backtick_code_span(self):
+        """Test that code spans can contain single backticks."""
+        assert render_inline("``a ` b``") == "<code>a ` b</code>"
+    
+    def test_link(self):
+        """Test converting a link."""
+        result = render_inline("see [the docs](https://example.com/a?b=1&c=2)")
+        assert result == 'see <a href="https://example.com/a?b=1&amp;c=2">the docs</a>'
+    
+    def test_link_with_emphasis(self):
+        """Test emphasis inside link text."""
+        assert render_inline("[*x*](a.html)") == '<a href="a.html"><em>x</em></a>'
+    
+    @pytest.mark.parametrize('url', ["javascript:alert", "data:text/html,x", "JaVaScRiPt:x"])
+    def test_unsafe_link_is_literal(self, url):
+        """Test that links with unsafe schemes are not created."""
+        result = render_inline(f"[x]({url})")
+        assert "<a" not in result
+    
+    def test_backslash_escapes(self):
+        """Test that escaped punctuation is literal."""
+        assert render_inline(r"\*a\* \[b\] \\ \n") == r"*a* [b] \ \n"
+    
+    def test_html_is_escaped(self):
+        """Test that raw HTML is escaped."""
+        assert render_inline('<script>"x"</script>') == "&lt;script&gt;&quot;x&quot;&lt;/script&gt;"
+    
+    def test_newlines(self):
+        """Test that newlines become <br/> tags."""
+        assert render_inline("a\nb") == "a<br/>\nb"
+
+
+class TestMarkdownToHtml:
+    """Tests for block-level rendering in markdown_to_html."""
+    
+    def test_unordered_list(self):
+        """Test converting an unordered list."""
+        result = markdown_to_html("Pick:\n- one\n- **two**")
+        assert result == "Pick:\n<ul>\n<li>one</li>\n<li><strong>two</strong></li>\n</ul>"
+    
+    def test_ordered_list_start(self):
+        """Test that ordered lists keep their starting number."""
+        result = markdown_to_html("3) c\n4) d")
+        assert result.startswith('<ol start="3">')
+        assert result.count("<li>") == 2
+    
+    def test_nested_list(self):
+        """Test that indentation nests lists."""
+        result = markdown_to_html("- a\n  1. b\n- c")
+        assert result == "<ul>\n<li>a<ol>\n<li>b</li></ol></li>\n<li>c</li>\n</ul>"
+    
+    def test_table(self):
+        """Test converting a pipe table with alignment."""
+        result = markdown_to_html("| x | y |\n|:-:|--:|\n| `1` | 2 \\| 3 |")
+        
+        assert '<th style="text-align: center">x</th>' in result
+        assert '<td style="text-align: right">2 | 3</td>' in result
+        assert '<td style="text-align: center"><code>1</code></td>' in result
+    
+    def test_pipe_without_separator_is_text(self):
+        """Test that a line with a pipe alone is not a table."""
+        assert markdown_to_html("a | b\nc") == "a | b<br/>\nc"
+    
+    def test_code_block_is_not_interpreted(self):
+        """Test that markup inside fenced code is left alone."""
+        result = markdown_to_html("```\n- *x*\n| a |\n```")
+        assert result == "<pre><code>- *x*\n| a |</code></pre>"
+    
+    def test_plain_text_unchanged(self):
+        """Test that text without markup renders as before."""
+        result = markdown_to_html("Here is code:\n\n```python\nx = 1\n```\nDone")
+        assert result == (
+            'Here is code:<br/>\n<br/>\n'
+            '<pre><code class="language-python">x = 1</code></pre>'
+            '<br/>\nDone'
+        )
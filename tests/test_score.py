@@ -0,0 +1,198 @@
+"""
+Tests for the scoring and item analysis module.
+"""
+import io
+import json
+import math
+import random
+
+import pytest
+
+from markdown_to_qti.parser import parse_markdown_exam
+from markdown_to_qti.score import main, score_responses
+
+EXAM = """
+1. Which keyword defines a function?
+a. function
+*b. def
+c. fun
+
+2. What is 2 + 2?
+*a. 4
+b. 5
+c. 22
+
+## Group: Loops (pick 1, 2 points)
+
+3. How many times does `range(3)` loop?
+a. 2
+*b. 3
+
+4. Which loop runs at least once?
+*a. None in Python
+b. while
+
+## End group
+
+5. Unanswered survey question
+a. Yes
+b. No
+"""
+
+RESPONSES = """student,Q1,q2,Question 3,4,5,notes
+ann,b,a,b,,a,
+bob,a,a,,a,b,late
+cy,b,c,a,,,
+dee,c,A,,b,x,
+"""
+
+
+def _report(responses=RESPONSES, **options):
+    return score_responses(parse_markdown_exam(EXAM), io.StringIO(responses), **options)
+
+
+def _pearson(xs, ys):
+    n = len(xs)
+    mean_x, mean_y = sum(xs) / n, sum(ys) / n
+    covariance = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / n
+    return covariance / math.sqrt(sum((x - mean_x) ** 2 for x in xs) / n
+                                  * sum((y - mean_y) ** 2 for y in ys) / n)
+
+
+class TestScoreResponses:
+    """Tests for scoring a response CSV."""
+    
+    def test_item_statistics(self):
+        """Test p-values and choice frequencies, with letters in either case."""
+        report = _report()
+        
+        assert report.students == 4
+        items = {item.question: item for item in report.items}
+        assert items[1].p_value == 0.5
+        assert items[1].frequencies == {'a': 1, 'b': 2, 'c': 1, 'omitted': 0, 'other': 0}
+        assert items[2].p_value == 0.75
+        assert items[5].p_value is None
+        assert items[5].frequencies == {'a': 1, 'b': 1, 'omitted': 1, 'other': 1}
+    
+    def test_group_blanks_are_not_shown(self):
+        """Test that a picked group's questions are analyzed over students who answered."""
+        items = {item.question: item for item in _report().items}
+        
+        assert (items[3].responses, items[3].correct) == (2, 1)
+        assert (items[4].responses, items[4].correct) == (2, 1)
+        assert items[3].frequencies['omitted'] == 2
+    
+    def test_scores(self):
+        """Test each student's number of correct answers and points."""
+        scores = io.StringIO()
+        report = _report(scores=scores)
+        
+        assert scores.getvalue().splitlines() == [
+            "student,correct,score",
+            "ann,3,4",
+            "bob,2,3",
+            "cy,1,1",
+            "dee,1,1",
+        ]
+        assert report.max_score == 6
+        assert report.mean_score == 9 / 4
+    
+    def test_id_column(self):
+        """Test that students can be named by another column, or numbered."""
+        scores = io.StringIO()
+        _report(scores=scores, id_column='notes')
+        assert scores.getvalue().splitlines()[2] == "late,2,3"
+        
+        scores = io.StringIO()
+        _report("1,2\nb,a\nc,a\n", scores=scores)
+        assert scores.getvalue().splitlines()[1:] == ["1,2,2", "2,1,1"]
+    
+    @pytest.mark.parametrize('quoted', [False, True])
+    def test_discrimination_across_batches(self, quoted):
+        """Test the point-biserial correlation against a per-student computation."""
+        rng = random.Random(7)
+        rows = []
+        for _ in range(200):
+            ability = rng.random()
+            rows.append([rng.choice('ab') if rng.random() > ability else 'b',
+                         'a' if rng.random() < ability else rng.choice(['b', 'c', '']),
+                         rng.choice('ab'), rng.choice('ab'), ''])
+        lines = ["student,1,2,3,4,5"]
+        lines += [f"s{index}," + ','.join(row) for index, row in enumerate(rows)]
+        if quoted:
+            lines[5] = 's4,"b","a",a,b,"a\nmultiline"'
+            rows[4] = ['b', 'a', 'a', 'b', 'a\nmultiline']
+        
+        report = _report('\n'.join(lines) + '\n', batch_rows=16)
+        
+        key = ['b', 'a', 'b', 'a']
+        hits = [[int(row[index] == key[index]) for row in rows] for index in range(4)]
+        totals = [sum(column[student] for column in hits) for student in range(len(rows))]
+        items = {item.question: item for item in report.items}
+        assert report.students == len(rows)
+        for index in range(2):
+            assert items[index + 1].discrimination == pytest.approx(_pearson(hits[index], totals))
+            assert items[index + 1].correct == sum(hits[index])
+        assert items[5].frequencies['other'] == (1 if quoted else 0)
+    
+    def test_short_rows(self):
+        """Test that a row with fewer fields than the header is padded, not misaligned."""
+        report = _report("student,1,2\nann,b\nbob,b,a\n")
+        
+        assert report.students == 2
+        assert [item.correct for item in report.items] == [2, 1]
+    
+    def test_missing_questions(self):
+        """Test that questions without a column are listed."""
+        report = _report("student,1,3\nann,b,b\n")
+        
+        assert [item.question for item in report.items] == [1, 3]
+        assert report.missing == [2, 4, 5]
+    
+    @pytest.mark.parametrize('responses, message', [
+        ("", "empty"),
+        ("student,name\nann,Ann\n", "no column"),
+        ("1,q1\nb,b\n", "question 1 has two columns"),
+        ("student,1\nann,b,c\n", "3 fields"),
+        ("student,1,2\ns1,b\ns2,b,a,c\n", "4 fields"),
+    ])
+    def test_errors(self, responses, message):
+        """Test that unusable responses are reported."""
+        with pytest.raises(ValueError, match=message):
+            _report(responses)
+
+
+class TestMain:
+    """Tests for the score command."""
+    
+    @pytest.fixture
+    def files(self, tmp_path):
+        exam = tmp_path / "exam.md"
+        exam.write_text(EXAM, encoding='utf-8')
+        responses = tmp_path / "responses.csv"
+        responses.write_text(RESPONSES, encoding='utf-8')
+        return str(exam), str(responses)
+    
+    def test_report(self, files, capsys):
+        """Test that the report lists each question's statistics."""
+        assert main(list(files)) == 0
+        
+        output = capsys.readouterr().out.splitlines()
+        assert output[0] == "Scored 4 student(s) on 5 question(s); mean score 2.25 of 6 (38%)."
+        assert output[3].split() == ['1', 'b', '0.50', '0.30', 'a', '25%', 'b*', '50%', 'c', '25%']
+    
+    def test_json_and_scores(self, files, tmp_path, capsys):
+        """Test JSON output and writing the students' scores."""
+        scores = tmp_path / "scores.csv"
+        
+        assert main([*files, '--json', '--scores', str(scores)]) == 0
+        
+        report = json.loads(capsys.readouterr().out)
+        assert report['students'] == 4
+        assert report['items'][0]['frequencies']['b'] == 2
+        assert scores.read_text(encoding='utf-8').startswith("student,correct,score\nann,3,4\n")
+    
+    def test_unknown_id_column(self, files, capsys):
+        """Test that a missing --id-column is reported."""
+        assert main([*files, '--id-column', 'name']) == 1
+        assert "no column is headed 'name'" in capsys.readouterr().err
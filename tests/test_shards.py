@@ -0,0 +1,192 @@
+"""
+Tests for sharded conversion and merging.
+"""
+import json
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from markdown_to_qti import qti_generator
+from markdown_to_qti.parser import parse_markdown_exam
+from markdown_to_qti.qti_generator import stable_identifiers
+from markdown_to_qti.shards import (
+    bank_fingerprint, merge_main, merge_shards, partition, shard_main, write_shard
+)
+from markdown_to_qti.verify import verify_package
+
+
+def _bank():
+    lines = []
+    for number in range(1, 5):
+        lines.append(f"{number}. Plain question {number}?\na. No\n*b. Yes\n")
+    lines.append("## Group: Loops (pick 2, 1.5 points)\n")
+    for number in range(5, 10):
+        lines.append(f"{number}. Loop question {number}?\n*a. `for`\nb. `if`\n")
+    lines.append("## End group\n")
+    for number in range(10, 13):
+        lines.append(f"{number}. Question {number} with $x^2$?\n*a. Yes\nb. No\n")
+    return '\n'.join(lines)
+
+
+def _package_files(path):
+    with zipfile.ZipFile(path) as zf:
+        return {name: zf.read(name) for name in zf.namelist()}
+
+
+class TestPartition:
+    """Tests for splitting a bank into shards."""
+    
+    def test_covers_questions_in_order(self):
+        """Test that shards are contiguous, cover every question and are about even."""
+        questions = parse_markdown_exam("\n".join(f"{n}. Q{n}\n*a. A\n" for n in range(1, 11)))
+        
+        assert partition(questions, 3) == [(0, 3), (3, 6), (6, 10)]
+        assert partition(questions, 1) == [(0, 10)]
+    
+    def test_groups_are_not_split(self):
+        """Test that a boundary inside a group moves to the group's end."""
+        questions = parse_markdown_exam(_bank())
+        
+        ranges = partition(questions, 3)
+        
+        assert ranges == [(0, 4), (4, 9), (9, 12)]
+        for start, end in ranges[1:]:
+            assert questions[start].group is None or questions[start].group is not questions[start - 1].group
+    
+    def test_more_shards_than_questions(self):
+        """Test that extra shards are empty."""
+        questions = parse_markdown_exam("1. Only\n*a. A\n")
+        
+        assert partition(questions, 3) == [(0, 0), (0, 0), (0, 1)]
+
+
+class TestStableIdentifiers:
+    """Tests for identifiers derived from a seed."""
+    
+    def test_reproducible(self):
+        """Test that a seed gives the same identifiers, and other seeds others."""
+        def generate(seed):
+            with stable_identifiers(seed):
+                return [qti_generator.generate_identifier() for _ in range(3)]
+        
+        first = generate("bank:1")
+        
+        assert generate("bank:1") == first
+        assert len(set(first)) == 3
+        assert set(generate("bank:2")).isdisjoint(first)
+        assert all(len(identifier) == 25 and identifier[0] == 'g' for identifier in first)
+        assert qti_generator.generate_identifier() not in first
+
+
+class TestShards:
+    """Tests for writing and merging shards."""
+    
+    @pytest.mark.parametrize('compact', [False, True])
+    def test_merge_matches_any_shard_count(self, tmp_path, compact):
+        """Test that merged packages are identical however the bank was sharded."""
+        questions = parse_markdown_exam(_bank())
+        
+        packages = []
+        for shards in (1, 3, 5):
+            paths = [write_shard(questions, index, shards, str(tmp_path / f"{shards}.{index}.jsonl"),
+                                 compact=compact)
+                     for index in range(shards)]
+            packages.append(merge_shards(paths[::-1], str(tmp_path / f"merged{shards}"), "Bank"))
+        
+        assert packages[0] == str(tmp_path / "merged1.zip")
+        assert _package_files(packages[1]) == _package_files(packages[0])
+        assert _package_files(packages[2]) == _package_files(packages[0])
+        assert verify_package(packages[0], questions) == []
+    
+    def test_same_items_as_package(self, tmp_path):
+        """Test that the merged assessment has the items and sections of one written in one go."""
+        questions = parse_markdown_exam(_bank())
+        path = write_shard(questions, 0, 1, str(tmp_path / "bank.jsonl.gz"))
+        merged = _package_files(merge_shards([path], str(tmp_path / "merged.zip")))
+        
+        with stable_identifiers("package"):
+            single = qti_generator.generate_qti_assessment(questions)
+        
+        assessment = next(data for name, data in merged.items() if name != 'imsmanifest.xml')
+        assert assessment.decode('utf-8').count('<item ') == single.count('<item ') == 12
+        assert assessment.decode('utf-8').count('<section ') == single.count('<section ') == 2
+    
+    def test_shard_file(self, tmp_path):
+        """Test the shard file's header and item lines."""
+        questions = parse_markdown_exam(_bank())
+        path = write_shard(questions, 1, 3, str(tmp_path / "shard.jsonl"))
+        
+        with open(path, encoding='utf-8') as f:
+            lines = [json.loads(line) for line in f]
+        
+        header = lines[0]
+        assert header['bank'] == bank_fingerprint(questions)
+        assert (header['shard'], header['shards'], header['start'], header['end']) == (1, 3, 4, 9)
+        assert header['groups'] == [["Loops", 2, 1.5]]
+        assert [group for group, _ in lines[1:]] == [0] * 5
+    
+    def test_merge_errors(self, tmp_path):
+        """Test that missing, repeated and unrelated shards are refused."""
+        questions = parse_markdown_exam(_bank())
+        paths = [write_shard(questions, index, 3, str(tmp_path / f"s{index}.jsonl"))
+                 for index in range(3)]
+        other = write_shard(questions[:5], 2, 3, str(tmp_path / "other.jsonl"))
+        compact = write_shard(questions, 2, 3, str(tmp_path / "compact.jsonl"), compact=True)
+        # The default renderer and emitter named or left out are the same options
+        named = write_shard(questions, 2, 3, str(tmp_path / "named.jsonl"),
+                            renderer='markdown', emitter='qti12')
+        renderer = str(tmp_path / "renderer.jsonl")
+        with open(named, encoding='utf-8') as f:
+            header, *lines = f.readlines()
+        header = json.loads(header)
+        header['options']['renderer'] = 'commonmark'
+        with open(renderer, 'w', encoding='utf-8') as f:
+            f.writelines([json.dumps(header) + '\n', *lines])
+        
+        merge_shards(paths[:2] + [named], str(tmp_path / "out.zip"))
+        for shard_paths, message in [
+            (paths[:2], "shard\\(s\\) 2 of 3 are missing"),
+            (paths + [paths[0]], "both shard 0"),
+            (paths[:2] + [other], "a different bank"),
+            (paths[:2] + [compact], "different output options \\(compact\\)"),
+            (paths[:2] + [renderer], "different output options \\(renderer\\)"),
+            ([str(tmp_path / "s0.jsonl"), __file__], "not a markdown-to-qti shard file"),
+        ]:
+            with pytest.raises(ValueError, match=message):
+                merge_shards(shard_paths, str(tmp_path / "out.zip"))
+
+
+class TestMain:
+    """Tests for the shard and merge commands."""
+    
+    def test_processes_as_nodes(self, tmp_path, capsys):
+        """Test shards converted in separate processes, then merged."""
+        bank = tmp_path / "bank.md"
+        bank.write_text(_bank(), encoding='utf-8')
+        argvs = [[str(bank), '--shards', '3', '--index', str(index)] for index in range(3)]
+        
+        with ProcessPoolExecutor(max_workers=3) as executor:
+            assert list(executor.map(shard_main, argvs)) == [0, 0, 0]
+        paths = [str(tmp_path / f"bank.shard{index}.jsonl") for index in range(3)]
+        assert merge_main([*paths, '-o', str(tmp_path / "bank.zip"), '-t', "Bank"]) == 0
+        
+        assert "Merged 3 shard(s)" in capsys.readouterr().out
+        questions = parse_markdown_exam(_bank())
+        assert verify_package(str(tmp_path / "bank.zip"), questions) == []
+    
+    def test_jobs(self, tmp_path):
+        """Test that rendering a shard in worker processes gives the same items."""
+        bank = tmp_path / "bank.md"
+        bank.write_text(_bank(), encoding='utf-8')
+        
+        assert shard_main([str(bank), '--shards', '1', '--index', '0', '-o', str(tmp_path / "a.jsonl")]) == 0
+        assert shard_main([str(bank), '--shards', '1', '--index', '0', '-o', str(tmp_path / "b.jsonl"),
+                           '-j', '2']) == 0
+        
+        assert (tmp_path / "a.jsonl").read_text() == (tmp_path / "b.jsonl").read_text()
+    
+    def test_invalid_index(self, tmp_path, capsys):
+        """Test that a shard index out of range is reported."""
+        assert shard_main([str(tmp_path / "bank.md"), '--shards', '2', '--index', '2']) == 1
+        assert "--index must be from 0 to 1" in capsys.readouterr().err
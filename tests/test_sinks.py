@@ -0,0 +1,357 @@
+"""
+Tests for the output sinks module.
+"""
+import csv
+import gc
+import io
+import json
+import os
+import random
+import sys
+import zipfile
+
+import pytest
+
+from markdown_to_qti import plugins
+from markdown_to_qti.parser import parse_markdown_exam
+from markdown_to_qti.renderer import markdown_to_html
+from markdown_to_qti.sinks import (
+    AnswerKeySink, Qti21PackageSink, QtiPackageSink, QtiXmlSink, Sink, SplitPackageSink,
+    TagReportSink, prerendered, run_pipeline
+)
+from markdown_to_qti.verify import verify_package
+
+MARKDOWN = """
+1. First
+<!-- tags: loops, syntax; bloom: remember -->
+*a. A
+b. B
+
+## Group: Sets (pick 1, 2 points)
+
+2. Second
+<!-- tags: sets; bloom: apply -->
+a. A
+*b. B
+
+3. Third
+<!-- tags: loops; bloom: apply -->
+a. A
+*b. B
+
+## End group
+
+4. Fourth
+a. A
+b. B
+"""
+
+
+class _Recorder(Sink):
+    """A sink that records the calls it receives."""
+    
+    def __init__(self):
+        self.calls = []
+    
+    def start(self):
+        self.calls.append('start')
+    
+    def add(self, question):
+        self.calls.append(question.number)
+    
+    def finish(self):
+        self.calls.append('finish')
+    
+    def abort(self):
+        self.calls.append('abort')
+
+
+class _Failing(_Recorder):
+    """A sink that fails on its second question."""
+    
+    def add(self, question):
+        if len(self.calls) > 1:
+            raise RuntimeError("sink failed")
+        super().add(question)
+
+
+class TestRunPipeline:
+    """Tests for run_pipeline function."""
+    
+    def test_single_pass(self):
+        """Test that every sink sees each question from one iteration."""
+        consumed = []
+        
+        def questions():
+            for question in parse_markdown_exam(MARKDOWN):
+                consumed.append(question.number)
+                yield question
+        
+        sinks = [_Recorder(), _Recorder()]
+        count = run_pipeline(questions(), sinks)
+        
+        assert count == 4
+        assert consumed == [1, 2, 3, 4]
+        for sink in sinks:
+            assert sink.calls == ['start', 1, 2, 3, 4, 'finish']
+    
+    def test_no_questions(self):
+        """Test that sinks are still started and finished without questions."""
+        sink = _Recorder()
+        
+        assert run_pipeline([], [sink]) == 0
+        assert sink.calls == ['start', 'finish']
+    
+    def test_sink_error_aborts_sinks(self):
+        """Test that an error in one sink aborts every sink started."""
+        sinks = [_Recorder(), _Failing(), _Recorder()]
+        
+        with pytest.raises(RuntimeError, match="sink failed"):
+            run_pipeline(parse_markdown_exam(MARKDOWN), sinks)
+        
+        assert sinks[0].calls == ['start', 1, 2, 'abort']
+        assert sinks[1].calls == ['start', 1, 'abort']
+        assert sinks[2].calls == ['start', 1, 'abort']
+    
+    def test_question_error_leaves_no_files(self, tmp_path, monkeypatch):
+        """Test that outputs are discarded, and an earlier answer key kept, on an error."""
+        unraisable = []
+        monkeypatch.setattr(sys, 'unraisablehook', unraisable.append)
+        (tmp_path / "key.csv").write_text("old", encoding='utf-8')
+        
+        def questions():
+            yield from parse_markdown_exam(MARKDOWN)
+            raise ValueError("Group 'G' picks 3 of 2 question(s)")
+        
+        sinks = [
+            QtiPackageSink(str(tmp_path / "exam.zip")),
+            Qti21PackageSink(str(tmp_path / "exam21.zip")),
+            SplitPackageSink(QtiPackageSink, tmp_path / "split.zip", max_items=1),
+            AnswerKeySink(str(tmp_path / "key.csv")),
+            AnswerKeySink(str(tmp_path / "key.json")),
+            TagReportSink(str(tmp_path / "report.md")),
+        ]
+        with pytest.raises(ValueError, match="picks"):
+            run_pipeline(questions(), sinks)
+        gc.collect()
+        
+        assert os.listdir(tmp_path) == ["key.csv"]
+        assert (tmp_path / "key.csv").read_text(encoding='utf-8') == "old"
+        assert unraisable == []
+
+
+class TestQtiSinks:
+    """Tests for the QTI sinks."""
+    
+    def test_package_sink(self):
+        """Test that the package sink writes a valid package."""
+        output = io.BytesIO()
+        run_pipeline(parse_markdown_exam(MARKDOWN), [QtiPackageSink(output, "Quiz")])
+        
+        with zipfile.ZipFile(output) as zf:
+            assert zf.testzip() is None
+            names = zf.namelist()
+            xml_output = zf.read(names[1]).decode('utf-8')
+        assert names[0] == 'imsmanifest.xml'
+        assert xml_output.count('<item ') == 4
+        assert '<selection_number>1</selection_number>' in xml_output
+    
+    def test_package_path(self, tmp_path):
+        """Test that a package path without a suffix gets .zip."""
+        sink = QtiPackageSink(str(tmp_path / "exam"))
+        run_pipeline(parse_markdown_exam(MARKDOWN), [sink])
+        
+        assert sink.path == str(tmp_path / "exam.zip")
+        assert zipfile.is_zipfile(sink.path)
+    
+    @pytest.mark.parametrize('workers', [1, 2])
+    def test_xml_sink(self, workers):
+        """Test that the XML sink writes the same document with any worker count."""
+        output = io.StringIO()
+        run_pipeline(parse_markdown_exam(MARKDOWN), [QtiXmlSink(output, workers=workers)])
+        
+        xml_output = output.getvalue()
+        assert xml_output.startswith('<?xml')
+        assert xml_output.count('<item ') == 4
+        assert xml_output.rstrip().endswith('</questestinterop>')
+
+
+class TestQti21PackageSink:
+    """Tests for the Qti21PackageSink class."""
+    
+    @pytest.mark.parametrize('workers', [1, 2])
+    def test_package(self, workers):
+        """Test that the sink writes every item, the test and the manifest."""
+        output = io.BytesIO()
+        run_pipeline(parse_markdown_exam(MARKDOWN), [Qti21PackageSink(output, workers=workers)])
+        
+        with zipfile.ZipFile(output) as zf:
+            assert zf.testzip() is None
+            names = zf.namelist()
+        assert sum(name.startswith('items/') for name in names) == 4
+        assert names[-1] == 'imsmanifest.xml'
+    
+    def test_formats_share_rendering(self, monkeypatch):
+        """Test that both formats are written from one rendering of each question."""
+        rendered = []
+        
+        def render(text):
+            rendered.append(text)
+            return markdown_to_html(text)
+        monkeypatch.setitem(plugins.RENDERERS._loaded, 'counting', render)
+        
+        sinks = [QtiPackageSink(io.BytesIO(), renderer='counting'),
+                 Qti21PackageSink(io.BytesIO(), renderer='counting')]
+        run_pipeline(prerendered(parse_markdown_exam(MARKDOWN), 'counting'), sinks)
+        
+        # One stem and two choices for each of the four questions
+        assert len(rendered) == 12
+
+
+def _package_titles(path):
+    """Return the assessment title and item titles of a QTI 1.2 package."""
+    with zipfile.ZipFile(path) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist()[0] == 'imsmanifest.xml'
+        xml_output = zf.read(zf.namelist()[1]).decode('utf-8')
+    title = xml_output.split('<assessment ', 1)[1].split('title="', 1)[1].split('"', 1)[0]
+    return title, xml_output.count('<item ')
+
+
+def _large_bank():
+    """Return 1000 questions of random words, which compress like real text."""
+    rng = random.Random(0)
+    words = [''.join(rng.choice('abcdefghij') for _ in range(6)) for _ in range(2000)]
+    return ''.join(
+        f"{number}. {' '.join(rng.choice(words) for _ in range(30))}\n*a. A\nb. B\n\n"
+        for number in range(1, 1001))
+
+
+GROUPED_BANK = "## Group: Last (pick 2)\n" + "".join(
+    f"{number}. Grouped question {number}\n*a. A\nb. B\n\n" for number in range(1001, 1011))
+
+
+class TestSplitPackageSink:
+    """Tests for the SplitPackageSink class."""
+    
+    def test_max_items(self, tmp_path):
+        """Test that packages roll over by item count, keeping groups whole."""
+        sink = SplitPackageSink(QtiPackageSink, str(tmp_path / "exam"), "Quiz", max_items=1)
+        run_pipeline(parse_markdown_exam(MARKDOWN), [sink])
+        
+        assert [os.path.basename(path) for path in sink.paths] == [
+            "exam.part001.zip", "exam.part002.zip", "exam.part003.zip"]
+        assert [_package_titles(path) for path in sink.paths] == [
+            ("Quiz (part 1)", 1), ("Quiz (part 2)", 2), ("Quiz (part 3)", 1)]
+    
+    @pytest.mark.parametrize('package_writer', [QtiPackageSink, Qti21PackageSink])
+    @pytest.mark.parametrize('max_bytes', [20_000, 100_000])
+    def test_max_bytes(self, tmp_path, package_writer, max_bytes):
+        """Test that packages stay within the size budget and come close to it."""
+        sink = SplitPackageSink(package_writer, str(tmp_path / "exam.zip"),
+                                max_bytes=max_bytes, compact=True, workers=2)
+        count = run_pipeline(parse_markdown_exam(_large_bank()), [sink])
+        
+        assert count == 1000
+        assert len(sink.paths) > 1
+        sizes = [os.path.getsize(path) for path in sink.paths]
+        assert max(sizes) <= max_bytes
+        assert min(sizes[:-1]) >= 0.75 * max_bytes
+        for path in sink.paths:
+            assert zipfile.ZipFile(path).testzip() is None
+    
+    @pytest.mark.parametrize('package_writer', [QtiPackageSink, Qti21PackageSink])
+    def test_bank_within_budget_is_not_split(self, tmp_path, package_writer):
+        """Test that a bank whose single package fits the budget stays whole."""
+        questions = parse_markdown_exam(_large_bank() + GROUPED_BANK)
+        whole = package_writer(str(tmp_path / "whole.zip"))
+        run_pipeline(questions, [whole])
+        max_bytes = int(os.path.getsize(whole.path) * 1.05)
+        
+        sink = SplitPackageSink(package_writer, str(tmp_path / "exam.zip"), max_bytes=max_bytes)
+        run_pipeline(questions, [sink])
+        
+        assert len(sink.paths) == 1
+        assert os.path.getsize(sink.paths[0]) <= max_bytes
+        assert verify_package(sink.paths[0], questions) == []
+    
+    def test_no_questions(self, tmp_path):
+        """Test that one empty package is written without questions."""
+        sink = SplitPackageSink(QtiPackageSink, str(tmp_path / "exam.zip"), max_items=10)
+        run_pipeline([], [sink])
+        
+        assert sink.paths == [str(tmp_path / "exam.part001.zip")]
+        assert zipfile.is_zipfile(sink.paths[0])
+
+
+class TestAnswerKeySink:
+    """Tests for the AnswerKeySink class."""
+    
+    def test_csv(self):
+        """Test the CSV answer key."""
+        output = io.StringIO()
+        run_pipeline(parse_markdown_exam(MARKDOWN), [AnswerKeySink(output)])
+        
+        rows = list(csv.reader(io.StringIO(output.getvalue())))
+        assert rows == [
+            ['question', 'answer', 'points', 'group', 'tags', 'bloom'],
+            ['1', 'a', '1', '', 'loops;syntax', 'remember'],
+            ['2', 'b', '2', 'Sets', 'sets', 'apply'],
+            ['3', 'b', '2', 'Sets', 'loops', 'apply'],
+            ['4', '', '1', '', '', ''],
+        ]
+    
+    def test_json(self, tmp_path):
+        """Test that a .json path writes a JSON answer key."""
+        path = tmp_path / "key.json"
+        run_pipeline(parse_markdown_exam(MARKDOWN), [AnswerKeySink(str(path))])
+        
+        key = json.loads(path.read_text(encoding='utf-8'))
+        assert key[1] == {
+            'question': 2, 'answer': 'b', 'points': 2.0, 'group': 'Sets',
+            'tags': ['sets'], 'bloom': 'apply',
+        }
+        assert key[3]['answer'] is None
+    
+    def test_empty_json(self):
+        """Test that an empty JSON answer key is an empty array."""
+        output = io.StringIO()
+        run_pipeline([], [AnswerKeySink(output, 'json')])
+        
+        assert json.loads(output.getvalue()) == []
+    
+    def test_unknown_format(self):
+        """Test that an unknown format is rejected."""
+        with pytest.raises(ValueError, match="Unknown output format"):
+            AnswerKeySink(io.StringIO(), 'xlsx')
+
+
+class TestTagReportSink:
+    """Tests for the TagReportSink class."""
+    
+    def test_json(self):
+        """Test the counts in the JSON report."""
+        output = io.StringIO()
+        run_pipeline(parse_markdown_exam(MARKDOWN), [TagReportSink(output, 'json')])
+        
+        report = json.loads(output.getvalue())
+        assert report['questions'] == 4
+        assert list(report['tags'].items()) == [('loops', 2), ('sets', 1), ('syntax', 1)]
+        assert report['untagged'] == 1
+        assert report['bloom'] == {
+            'remember': 1, 'understand': 0, 'apply': 2,
+            'analyze': 0, 'evaluate': 0, 'create': 0,
+        }
+        assert report['no_bloom'] == 1
+    
+    def test_markdown(self):
+        """Test the Markdown report tables."""
+        output = io.StringIO()
+        run_pipeline(parse_markdown_exam(MARKDOWN), [TagReportSink(output)])
+        
+        report = output.getvalue()
+        assert report.startswith("Questions: 4\n")
+        assert "| Tag | Questions |\n|---|---|\n| loops | 2 |\n" in report
+        assert "| (untagged) | 1 |" in report
+        assert "| understand | 0 |" in report
+        assert "| (none) | 1 |" in report
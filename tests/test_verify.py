@@ -0,0 +1,279 @@
+"""
+Tests for the package verification module.
+"""
+import io
+import os
+import sys
+import zipfile
+from unittest.mock import patch
+
+import pytest
+
+from markdown_to_qti.cli import main
+from markdown_to_qti.parser import Choice, Question, QuestionGroup
+from markdown_to_qti.qti21 import write_qti21_package
+from markdown_to_qti.qti_generator import write_qti_package
+from markdown_to_qti.sinks import QtiPackageSink, SplitPackageSink, run_pipeline
+from markdown_to_qti.verify import ExpectationSink, verify_package, verify_packages
+
+
+def _questions(pick=None):
+    group = QuestionGroup(title="Sets", pick=pick)
+    return [
+        Question(
+            number=1,
+            stem="First",
+            choices=[
+                Choice(letter="a", text="A", is_correct=True),
+                Choice(letter="b", text="B", is_correct=False),
+                Choice(letter="c", text="C", is_correct=False),
+            ],
+            correct_answer="a"
+        ),
+        Question(
+            number=2,
+            stem="Second",
+            choices=[
+                Choice(letter="a", text="A", is_correct=False),
+                Choice(letter="b", text="B", is_correct=True),
+            ],
+            correct_answer="b",
+            group=group
+        ),
+        Question(
+            number=3,
+            stem="Unanswered",
+            choices=[Choice(letter="a", text="A", is_correct=False)],
+            correct_answer=None,
+            group=group
+        ),
+    ]
+
+
+def _package(write=write_qti_package, questions=None, **kwargs):
+    output = io.BytesIO()
+    write(questions or _questions(), output, **kwargs)
+    return output.getvalue()
+
+
+def _rewrite(data, replace):
+    """Return a package with each entry's content passed through replace(name, content)."""
+    output = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(data)) as source, zipfile.ZipFile(output, 'w') as target:
+        for name in source.namelist():
+            content = replace(name, source.read(name).decode('utf-8'))
+            if content is not None:
+                target.writestr(name, content)
+    return output.getvalue()
+
+
+def _assessment(replace):
+    """Apply a replacement to the QTI 1.2 assessment entry only."""
+    return lambda name, content: content if name == 'imsmanifest.xml' else replace(content)
+
+
+def _verify(data, questions=None):
+    return verify_package(io.BytesIO(data), questions or _questions())
+
+
+class TestVerifyQti12:
+    """Tests for verifying QTI 1.2 packages."""
+    
+    @pytest.mark.parametrize('compact', [False, True])
+    def test_valid_package(self, compact):
+        """Test that a written package has no problems."""
+        assert _verify(_package(compact=compact)) == []
+    
+    def test_correct_answer_not_a_choice(self):
+        """Test that a varequal pointing at no response_label is reported."""
+        data = _rewrite(_package(), _assessment(
+            lambda content: content.replace('_a</varequal>', '_z</varequal>', 1)))
+        
+        problems = _verify(data)
+        
+        assert any("question 1: correct answer" in problem and "is not a choice" in problem
+                   for problem in problems)
+        assert any("question 1: correct answer is not choice a" in problem for problem in problems)
+    
+    def test_wrong_correct_answer(self):
+        """Test that an item marking another choice correct is reported."""
+        questions = _questions()
+        questions[1].correct_answer = 'a'
+        
+        problems = _verify(_package(), questions)
+        
+        assert len(problems) == 1
+        assert problems[0].endswith("question 2: correct answer is not choice a")
+    
+    def test_original_answer_ids(self):
+        """Test that original_answer_ids that don't match the choices are reported."""
+        def replace(content):
+            start = content.index('original_answer_ids')
+            end = content.index(',', start)
+            return content[:end] + ',extra' + content[end:]
+        
+        problems = _verify(_rewrite(_package(), _assessment(replace)))
+        
+        assert problems == [
+            "package 1: question 1: original_answer_ids do not match the choices"]
+    
+    def test_choice_count(self):
+        """Test that an item with a different number of choices is reported."""
+        questions = _questions()
+        questions[0].choices.append(Choice(letter="d", text="D", is_correct=False))
+        
+        problems = _verify(_package(), questions)
+        
+        assert problems == ["package 1: question 1: 3 choice(s), expected 4"]
+    
+    def test_unexpected_correct_answer(self):
+        """Test that a correct answer on an item of an unanswered question is reported."""
+        questions = _questions()
+        questions[1].correct_answer = None
+        
+        assert _verify(_package(), questions) == [
+            "package 1: question 2: has a correct answer, but the question has none"]
+    
+    def test_item_count(self):
+        """Test that missing and extra items are reported."""
+        questions = _questions()
+        
+        assert _verify(_package(questions=questions[:2]), questions) == [
+            "package 1: 1 question(s) have no item"]
+        assert _verify(_package(), questions[:2]) == [
+            "package 1: has more items than there are questions"]
+    
+    def test_group_pick(self):
+        """Test that a group picking more questions than it holds is reported."""
+        problems = _verify(_package(questions=_questions(pick=3)), _questions(pick=3))
+        
+        assert problems == ["package 1: section 'Sets' picks 3 of 2 item(s)"]
+    
+    def test_missing_file(self):
+        """Test that a manifest referring to a missing file is reported."""
+        data = _rewrite(_package(), lambda name, content:
+                        content if name == 'imsmanifest.xml' else None)
+        
+        problems = _verify(data)
+        
+        assert len(problems) == 2
+        assert "the manifest refers to missing file" in problems[0]
+        assert problems[1] == "package 1: 3 question(s) have no item"
+    
+    def test_unreadable(self, tmp_path):
+        """Test that a file that is not a package is reported with its path."""
+        path = tmp_path / "broken.zip"
+        path.write_bytes(b"not a zip")
+        
+        problems = verify_package(str(path), _questions())
+        
+        assert problems[0].startswith(f"{path}: cannot be read")
+    
+    def test_problem_limit(self):
+        """Test that verification stops after the problem limit."""
+        questions = [Question(number=n, stem="Q", choices=[], correct_answer=None)
+                     for n in range(10)]
+        
+        problems = verify_package(io.BytesIO(_package()), questions, max_problems=2)
+        
+        assert len(problems) == 3
+        assert problems[-1] == "Stopped after 2 problems."
+
+
+class TestVerifyQti21:
+    """Tests for verifying QTI 2.1 packages."""
+    
+    @pytest.mark.parametrize('compact', [False, True])
+    def test_valid_package(self, compact):
+        """Test that a written package has no problems."""
+        assert _verify(_package(write_qti21_package, compact=compact)) == []
+    
+    def test_correct_response_not_a_choice(self):
+        """Test that a correct response naming no simpleChoice is reported."""
+        data = _rewrite(_package(write_qti21_package), lambda name, content:
+                        content.replace('_b</value>', '_q</value>'))
+        
+        problems = _verify(data)
+        
+        assert len(problems) == 2
+        assert "question 2: correct answer" in problems[0]
+        assert "is not a choice" in problems[0]
+    
+    def test_group_pick(self):
+        """Test that a section selecting more items than it holds is reported."""
+        data = _package(write_qti21_package, questions=_questions(pick=5))
+        
+        assert _verify(data, _questions(pick=5)) == [
+            "package 1: section 'Sets' picks 5 of 2 item(s)"]
+    
+    def test_missing_item(self):
+        """Test that a test referring to a missing item is reported."""
+        removed = []
+        
+        def replace(name, content):
+            if name.startswith('items/') and not removed:
+                removed.append(name)
+                return None
+            return content
+        
+        problems = _verify(_rewrite(_package(write_qti21_package), replace))
+        
+        assert f"package 1: the manifest refers to missing file {removed[0]}" in problems
+        assert f"package 1: the test refers to missing item {removed[0]}" in problems
+
+
+class TestVerifyPackages:
+    """Tests for verifying packages written from a stream of questions."""
+    
+    def test_split_parts(self, tmp_path):
+        """Test that split parts are verified against consecutive questions."""
+        questions = _questions() * 3
+        expectations = ExpectationSink()
+        sink = SplitPackageSink(QtiPackageSink, str(tmp_path / "exam.zip"), max_items=2)
+        run_pipeline(questions, [sink, expectations])
+        
+        # Each part holds a question and a whole group
+        assert len(sink.paths) == 3
+        assert verify_packages(sink.paths, expectations.items) == []
+        assert verify_packages(sink.paths[:-1], expectations.items) == [
+            f"{sink.paths[1]}: 3 question(s) have no item"]
+
+
+class TestVerifyCommand:
+    """Tests for the --verify option."""
+    
+    def test_verify(self, tmp_path, capsys):
+        """Test that the written packages are verified."""
+        input_path = tmp_path / "exam.md"
+        input_path.write_text("1. Q1\n*a. A\nb. B\n\n2. Q2\na. A\n*b. B\n")
+        
+        with patch.object(sys, 'argv', ['markdown-to-qti', str(input_path), '--verify',
+                                        '--format', 'qti12,qti21']):
+            main()
+        
+        assert "Verified 2 package(s)." in capsys.readouterr().err
+        assert os.path.exists(tmp_path / "exam.qti21.zip")
+    
+    def test_verify_failure(self, tmp_path, capsys, monkeypatch):
+        """Test that a package that doesn't match its questions fails the run."""
+        input_path = tmp_path / "exam.md"
+        input_path.write_text("1. Q1\n*a. A\nb. B\n")
+        monkeypatch.setattr('markdown_to_qti.verify.ExpectedItem.from_question',
+                            classmethod(lambda cls, question: cls(question.number, 'ab', 'b')))
+        
+        with patch.object(sys, 'argv', ['markdown-to-qti', str(input_path), '--verify']):
+            with pytest.raises(SystemExit) as excinfo:
+                main()
+        
+        assert excinfo.value.code == 1
+        err = capsys.readouterr().err
+        assert "Verification failed" in err
+        assert "question 1: correct answer is not choice b" in err
+    
+    def test_verify_stdout(self, capsys):
+        """Test that --verify needs a package file."""
+        with patch.object(sys, 'argv', ['markdown-to-qti', 'exam.md', '-o', '-', '--verify']):
+            with pytest.raises(SystemExit) as excinfo:
+                main()
+        assert excinfo.value.code == 1
+        assert "--verify" in capsys.readouterr().err